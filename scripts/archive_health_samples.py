@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+原始样本冷归档脚本
+把早于保留月数的整月原始样本导出为Parquet文件（按月份和用户哈希桶分文件）并从数据库删除，
+查询时归档文件与数据库合并读取。需要安装pyarrow，适合每月定时运行，可重复运行
+"""
+import sys
+import os
+import argparse
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.db.configs.global_config import ARCHIVE_CONFIG
+from src.services.archive_service import HealthArchiveService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把早于保留月数的原始样本归档为Parquet文件")
+    parser.add_argument("--keep-months", type=int, default=ARCHIVE_CONFIG.keep_months,
+                        help=f"数据库中保留的最近月数（不含当月） (默认: {ARCHIVE_CONFIG.keep_months})")
+    parser.add_argument("--month", default=None, help="只归档该月，格式YYYY-MM (默认: 所有早于保留期的月份)")
+    parser.add_argument("--directory", default=ARCHIVE_CONFIG.directory,
+                        help=f"归档目录 (默认: {ARCHIVE_CONFIG.directory})")
+
+    args = parser.parse_args()
+    service = HealthArchiveService(args.directory)
+
+    try:
+        if args.month:
+            files, rows = service.archive_month(datetime.strptime(args.month, "%Y-%m").date())
+            report = {"months": 1 if rows else 0, "files": files, "rows": rows}
+        else:
+            report = service.run(args.keep_months)
+    except Exception as e:
+        print(f"❌ 归档失败（已归档的月份不受影响，失败的月份已回滚）: {e}")
+        sys.exit(1)
+
+    print(f"\n归档完成: {report['months']}个月, 写入文件{report['files']}个, 归档样本{report['rows']}条")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+高频样本压缩脚本
+把超过保留天数的心率、环境音量等原始样本压缩为每分钟或每5分钟的时间桶（min/max/avg/count），
+按用户日分块删除原始样本。适合每天定时运行，可重复运行
+"""
+import sys
+import os
+import argparse
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.db.configs.global_config import RETENTION_CONFIG
+from src.services.retention_service import HealthRetentionService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="压缩超过保留天数的高频原始样本")
+    parser.add_argument("--raw-days", type=int, default=RETENTION_CONFIG.raw_days,
+                        help=f"原始样本保留的天数 (默认: {RETENTION_CONFIG.raw_days})")
+    parser.add_argument("--user-id", default=None, help="只处理该用户 (默认: 全部用户)")
+    parser.add_argument("--now", default=None, help="按该日期计算保留期，格式YYYY-MM-DD (默认: 今天)")
+    parser.add_argument("--sleep", type=float, default=RETENTION_CONFIG.pause_seconds, help="每个用户日之间停顿的秒数")
+
+    args = parser.parse_args()
+    now = datetime.strptime(args.now, "%Y-%m-%d") if args.now else None
+
+    try:
+        report = HealthRetentionService(args.raw_days, pause_seconds=args.sleep).run(now, args.user_id)
+    except Exception as e:
+        print(f"❌ 压缩失败（已压缩的用户日不受影响，重新运行会继续）: {e}")
+        sys.exit(1)
+
+    print(f"\n压缩完成: {report['days']}个用户日, 删除原始样本{report['samples']}条, 写入时间桶{report['buckets']}个")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,12 @@ COMMENT ON COLUMN users.level IS 'User tier level: BRONZE, SILVER, GOLD, PLATINU
 ALTER TABLE users ADD COLUMN IF NOT EXISTS total_points INTEGER DEFAULT 0;
 COMMENT ON COLUMN users.total_points IS 'Total accumulated points';
 
+-- Add heart rate zone columns if not exists
+ALTER TABLE users ADD COLUMN IF NOT EXISTS birth_year INTEGER;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS max_heart_rate INTEGER;
+COMMENT ON COLUMN users.birth_year IS 'Birth year, used to estimate max heart rate (220 - age)';
+COMMENT ON COLUMN users.max_heart_rate IS 'Max heart rate for heart rate zones, overrides the age-based estimate';
+
 -- =============================================
 -- 2. Create user_scores table
 -- =============================================
@@ -21,7 +27,7 @@ CREATE TABLE IF NOT EXISTS user_scores (
     user_id VARCHAR(255) NOT NULL,           -- User ID
     score_date DATE NOT NULL,                -- Score date
     dimension VARCHAR(50) NOT NULL,          -- Score dimension: sleep, exercise, diet, mental, etc
-    difficulty VARCHAR(20) NOT NULL,         -- Difficulty level: easy, medium, hard, super_hard
+    difficulty VARCHAR(20) NOT NULL,         -- Difficulty level: easy, medium, hard, super_hard, recovery (chain penalty recovery points)
     score INTEGER NOT NULL,                  -- Score value
     details JSONB,                          -- Score details in JSON format
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,  -- Creation timestamp
@@ -38,7 +44,7 @@ COMMENT ON COLUMN user_scores.id IS 'Record ID';
 COMMENT ON COLUMN user_scores.user_id IS 'User ID';
 COMMENT ON COLUMN user_scores.score_date IS 'Score date';
 COMMENT ON COLUMN user_scores.dimension IS 'Score dimension: sleep, exercise, diet, mental, environment, social, cognition, prevention';
-COMMENT ON COLUMN user_scores.difficulty IS 'Difficulty level: easy, medium, hard, super_hard';
+COMMENT ON COLUMN user_scores.difficulty IS 'Difficulty level: easy, medium, hard, super_hard, recovery (chain penalty recovery points)';
 COMMENT ON COLUMN user_scores.score IS 'Score value';
 COMMENT ON COLUMN user_scores.details IS 'Score calculation details';
 COMMENT ON COLUMN user_scores.created_at IS 'Record creation timestamp';
@@ -72,8 +78,535 @@ CREATE INDEX IF NOT EXISTS idx_user_scores_valid
     ON user_scores(user_id, is_expired, expire_date);
 COMMENT ON INDEX idx_user_scores_valid IS 'Index for valid score queries';
 
+CREATE INDEX IF NOT EXISTS idx_user_scores_user_created 
+    ON user_scores(user_id, created_at DESC);
+COMMENT ON INDEX idx_user_scores_user_created IS 'Index for latest score record per user (tier fallback lookup)';
+
+-- =============================================
+-- 4. Score dirty days queue
+-- =============================================
+CREATE TABLE IF NOT EXISTS score_dirty_days (
+    user_id VARCHAR(255) NOT NULL,           -- User ID
+    score_date DATE NOT NULL,                -- Day whose inputs changed
+    queued_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,  -- Last time the day was marked dirty
+    PRIMARY KEY (user_id, score_date)
+);
+
+COMMENT ON TABLE score_dirty_days IS 'Days whose health data changed since they were last scored';
+COMMENT ON COLUMN score_dirty_days.user_id IS 'User ID';
+COMMENT ON COLUMN score_dirty_days.score_date IS 'Day whose inputs changed';
+COMMENT ON COLUMN score_dirty_days.queued_at IS 'Ingest watermark: last time the day was marked dirty';
+
+CREATE INDEX IF NOT EXISTS idx_score_dirty_days_queued 
+    ON score_dirty_days(queued_at);
+COMMENT ON INDEX idx_score_dirty_days_queued IS 'Index for claiming the oldest dirty days first';
+
+-- =============================================
+-- 5. User streak state table
+-- =============================================
+CREATE TABLE IF NOT EXISTS user_streaks (
+    user_id VARCHAR(255) NOT NULL,           -- User ID
+    dimension VARCHAR(50) NOT NULL,          -- Score dimension: sleep, exercise, ...
+    rule VARCHAR(50) NOT NULL DEFAULT 'super_hard',  -- Streak rule name
+    current_length INTEGER DEFAULT 0,        -- Consecutive qualifying days as of last_scored_date
+    last_qualifying_date DATE,               -- Last day that met the rule
+    last_scored_date DATE,                   -- Last day the state was advanced
+    unlocked BOOLEAN DEFAULT FALSE,          -- Whether the streak reached its required length
+    context JSONB,                           -- Rolling context needed by the rule
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, dimension, rule)
+);
+
+COMMENT ON TABLE user_streaks IS 'Per-user streak state for super_hard tiers, advanced once per scored day';
+COMMENT ON COLUMN user_streaks.current_length IS 'Consecutive qualifying days as of last_scored_date';
+COMMENT ON COLUMN user_streaks.last_qualifying_date IS 'Last day that met the streak rule';
+COMMENT ON COLUMN user_streaks.last_scored_date IS 'Last day the state was advanced';
+COMMENT ON COLUMN user_streaks.unlocked IS 'Whether the streak reached the required number of days';
+COMMENT ON COLUMN user_streaks.context IS 'Rolling context needed by the rule (e.g. recent workout types)';
+
+-- =============================================
+-- 6. User chain penalty counter table
+-- =============================================
+CREATE TABLE IF NOT EXISTS user_chain_counters (
+    user_id VARCHAR(255) NOT NULL,           -- User ID
+    rule VARCHAR(50) NOT NULL,               -- Chain rule name: sleep_deficit, inactive, hrv_low, ...
+    dimension VARCHAR(50) NOT NULL,          -- Dimension that evaluates the rule
+    trigger_length INTEGER DEFAULT 0,        -- Consecutive days meeting the trigger condition
+    recovery_length INTEGER DEFAULT 0,       -- Consecutive recovery days while the penalty is active
+    active BOOLEAN DEFAULT FALSE,            -- Whether the penalty/reminder is in effect
+    window_mask BIGINT DEFAULT 0,            -- Bitmap of triggered days in the rolling window (bit 0 = last_scored_date)
+    last_scored_date DATE,                   -- Last day the counter was advanced
+    blocked BOOLEAN DEFAULT FALSE,           -- Whether affected dimensions were blocked on last_scored_date
+    recovered_points INTEGER DEFAULT 0,      -- Points recovered on last_scored_date
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, rule)
+);
+
+COMMENT ON TABLE user_chain_counters IS 'Per-user rolling counters for chain punishment and recovery rules, advanced once per scored day';
+COMMENT ON COLUMN user_chain_counters.trigger_length IS 'Consecutive days meeting the trigger condition as of last_scored_date';
+COMMENT ON COLUMN user_chain_counters.recovery_length IS 'Consecutive days meeting the recovery condition while active';
+COMMENT ON COLUMN user_chain_counters.window_mask IS 'Bitmap of triggered days in the rolling window, bit 0 is last_scored_date';
+COMMENT ON COLUMN user_chain_counters.blocked IS 'Whether affected dimensions were blocked on last_scored_date';
+
+-- =============================================
+-- 7. User HRV baseline table
+-- =============================================
+
+CREATE TABLE IF NOT EXISTS user_hrv_baselines (
+    user_id VARCHAR(255) PRIMARY KEY,        -- User ID
+    ewma DOUBLE PRECISION,                   -- Exponentially weighted moving average of daily HRV
+    window_values JSONB DEFAULT '[]',        -- Daily HRV values in the rolling window (oldest first)
+    sample_days INTEGER DEFAULT 0,           -- Number of days with HRV data folded into the baseline
+    last_scored_date DATE,                   -- Last day the baseline was advanced
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE user_hrv_baselines IS 'Per-user rolling HRV baseline, updated incrementally once per scored day';
+COMMENT ON COLUMN user_hrv_baselines.ewma IS 'EWMA of daily HRV; used as the baseline once sample_days reaches the configured minimum';
+COMMENT ON COLUMN user_hrv_baselines.window_values IS 'Recent daily HRV values whose median clamps outliers before they enter the EWMA';
+
+-- =============================================
+-- 8. Daily health rollup table
+-- =============================================
+
+CREATE TABLE IF NOT EXISTS daily_health_rollup (
+    user_id VARCHAR(255) NOT NULL,           -- User ID
+    rollup_date DATE NOT NULL,               -- Day the values were computed for
+    rollup_version INTEGER DEFAULT 1,        -- Rows older than the service's version are recomputed
+    heart_rate_samples INTEGER DEFAULT 0,    -- Number of heart rate samples on the day
+    max_heart_rate INTEGER,                  -- Max heart rate used for the zones
+    zone_minutes JSONB DEFAULT '[]',         -- Minutes in heart rate zones 1-5
+    zone2_minutes INTEGER,                   -- Minutes in zone 2, NULL when there are no samples
+    steps INTEGER,                           -- Steps with overlapping sources deduplicated by priority, NULL without samples
+    active_energy REAL,                      -- Active energy (kcal), deduplicated the same way
+    water_ml REAL,                           -- Dietary water (ml), deduplicated the same way
+    non_workout_steps INTEGER,               -- Steps outside workouts, NULL when there are no step samples
+    workout_types JSONB,                     -- Types of workouts started on the day, NULL for users without workouts
+    activity_mask INTEGER,                   -- Bitmask of the activity categories of those workouts
+    strength_minutes INTEGER,                -- Minutes of strength workouts started on the day, NULL for users without workouts
+    stand_bitmap INTEGER,                    -- Bit h set when the user stood during hour h, NULL without stand data
+    water_bitmap INTEGER,                    -- Bit h set when water was logged during hour h, NULL without water data
+    active_bitmap INTEGER,                   -- Bit h set when hour h reached the active step count or had exercise time
+    computed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, rollup_date)
+);
+
+COMMENT ON TABLE daily_health_rollup IS 'Per-day values computed from raw samples, cached for scoring; rows are deleted when new samples for the day are ingested';
+COMMENT ON COLUMN daily_health_rollup.zone_minutes IS 'Minutes in heart rate zones 1-5; each sample lasts until the next one, capped';
+COMMENT ON COLUMN daily_health_rollup.zone2_minutes IS 'Minutes in zone 2 used by the exercise medium level';
+COMMENT ON COLUMN daily_health_rollup.strength_minutes IS 'Added to zone 2 minutes by the exercise medium level, since strength workouts rarely reach zone 2';
+COMMENT ON COLUMN daily_health_rollup.steps IS 'Per time slice only the highest-priority source counts (src/core/source_priority.py), so iPhone and Watch steps are not added up';
+COMMENT ON COLUMN daily_health_rollup.non_workout_steps IS 'Steps excluding workout periods (overlapping samples prorated), used by the exercise easy level';
+COMMENT ON COLUMN daily_health_rollup.activity_mask IS 'One bit per activity category (src/core/activity_masks.py), used by the exercise hard level and streaks';
+COMMENT ON COLUMN daily_health_rollup.stand_bitmap IS '24-bit hourly bitmap; stand hours are its popcount, the sedentary rule uses it with active_bitmap';
+
+-- Columns added after the table was first created
+ALTER TABLE daily_health_rollup ADD COLUMN IF NOT EXISTS rollup_version INTEGER DEFAULT 1;
+ALTER TABLE daily_health_rollup ADD COLUMN IF NOT EXISTS non_workout_steps INTEGER;
+ALTER TABLE daily_health_rollup ADD COLUMN IF NOT EXISTS workout_types JSONB;
+ALTER TABLE daily_health_rollup ADD COLUMN IF NOT EXISTS activity_mask INTEGER;
+ALTER TABLE daily_health_rollup ADD COLUMN IF NOT EXISTS strength_minutes INTEGER;
+ALTER TABLE daily_health_rollup ADD COLUMN IF NOT EXISTS stand_bitmap INTEGER;
+ALTER TABLE daily_health_rollup ADD COLUMN IF NOT EXISTS water_bitmap INTEGER;
+ALTER TABLE daily_health_rollup ADD COLUMN IF NOT EXISTS active_bitmap INTEGER;
+ALTER TABLE daily_health_rollup ADD COLUMN IF NOT EXISTS steps INTEGER;
+ALTER TABLE daily_health_rollup ADD COLUMN IF NOT EXISTS active_energy REAL;
+ALTER TABLE daily_health_rollup ADD COLUMN IF NOT EXISTS water_ml REAL;
+
+-- =============================================
+-- 9. Workouts table
+-- =============================================
+
+CREATE TABLE IF NOT EXISTS workouts (
+    id BIGSERIAL PRIMARY KEY,
+    user_id VARCHAR(255) NOT NULL,           -- User ID
+    activity_type VARCHAR(100) NOT NULL,     -- HKWorkoutActivityType, e.g. HKWorkoutActivityTypeRunning
+    start_date TIMESTAMP WITH TIME ZONE NOT NULL,
+    end_date TIMESTAMP WITH TIME ZONE NOT NULL,
+    duration_minutes REAL,                   -- Duration in minutes
+    total_energy_kcal REAL,                  -- Active energy burned
+    total_distance_km REAL,                  -- Distance in kilometers
+    avg_heart_rate REAL,                     -- Heart rate statistics of the workout
+    min_heart_rate REAL,
+    max_heart_rate REAL,
+    source_name VARCHAR(255),                -- App or device that recorded the workout
+    device TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(user_id, activity_type, start_date, end_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_workouts_user_start ON workouts(user_id, start_date);
+
+COMMENT ON TABLE workouts IS 'HKWorkout records; re-importing the same workout updates it in place';
+COMMENT ON COLUMN workouts.activity_type IS 'Mapped to an activity category bit by src/core/activity_masks.py';
+
+-- =============================================
+-- 10. CSV import progress tables
+-- =============================================
+
+CREATE TABLE IF NOT EXISTS csv_imports (
+    import_id VARCHAR(64) PRIMARY KEY,       -- Derived from the file path, size and mtime
+    source_path TEXT,                        -- CSV file that was imported
+    chunk_size INTEGER NOT NULL,             -- Rows per chunk; a resumed import keeps the original value
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    merged_at TIMESTAMP WITH TIME ZONE       -- Set when the staging tables were merged into health_metric
+);
+
+CREATE TABLE IF NOT EXISTS csv_import_chunks (
+    import_id VARCHAR(64) NOT NULL,          -- csv_imports.import_id
+    chunk_index INTEGER NOT NULL,            -- Chunk number; the chunk starts at row chunk_index * chunk_size
+    row_offset BIGINT NOT NULL,              -- First data row of the chunk
+    row_count INTEGER NOT NULL,              -- Rows staged after normalization
+    staging_table VARCHAR(128) NOT NULL,     -- Per-worker staging table holding the rows until the merge
+    staged_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (import_id, chunk_index)
+);
+
+COMMENT ON TABLE csv_imports IS 'Parallel CSV imports; an import is resumed from its unstaged chunks until merged_at is set';
+COMMENT ON TABLE csv_import_chunks IS 'Chunks copied into staging tables, committed together with the COPY so that restarts skip them';
+
+-- =============================================
+-- 11. Health metric natural key (ingest dedup)
+-- =============================================
+
+-- Stable hash of the fields identifying a sample; timestamps are hashed as epoch seconds so that
+-- the key does not depend on the session time zone or on the offset the sample was written with
+CREATE OR REPLACE FUNCTION health_metric_natural_key(
+    p_user_id TEXT, p_type TEXT, p_source_name TEXT,
+    p_start_date TIMESTAMP WITH TIME ZONE, p_end_date TIMESTAMP WITH TIME ZONE, p_value TEXT
+)
+RETURNS UUID AS $$
+    SELECT md5(concat_ws(E'\x1f',
+        COALESCE(p_user_id, ''), COALESCE(p_type, ''), COALESCE(p_source_name, ''),
+        COALESCE(EXTRACT(EPOCH FROM p_start_date)::TEXT, ''), COALESCE(EXTRACT(EPOCH FROM p_end_date)::TEXT, ''),
+        COALESCE(p_value, '')
+    ))::UUID
+$$ LANGUAGE sql IMMUTABLE;
+
+-- health_samples.natural_key (section 14) is unique, so re-imported samples are skipped
+-- by the ON CONFLICT DO NOTHING of every writer instead of inflating daily sums.
+
+-- =============================================
+-- 12. Health sample upload staging
+-- =============================================
+
+-- Samples posted to /lsp/api/v1/health/records are COPYed here and acknowledged immediately.
+-- The table is UNLOGGED: writes skip the WAL, and its contents are truncated after a crash
+-- (the affected batches are then marked 'lost' and the client uploads them again).
+CREATE UNLOGGED TABLE IF NOT EXISTS health_metric_upload (
+    batch_id UUID NOT NULL,                  -- health_metric_uploads.batch_id
+    type VARCHAR(255),
+    source_name VARCHAR(255),
+    source_version VARCHAR(50),
+    unit VARCHAR(50),
+    creation_date TIMESTAMP WITH TIME ZONE,
+    start_date TIMESTAMP WITH TIME ZONE,
+    end_date TIMESTAMP WITH TIME ZONE,
+    value VARCHAR(255),
+    device VARCHAR(255),
+    user_id VARCHAR(255)
+);
+
+CREATE INDEX IF NOT EXISTS idx_health_metric_upload_batch ON health_metric_upload(batch_id);
+
+CREATE TABLE IF NOT EXISTS health_metric_uploads (
+    batch_id UUID PRIMARY KEY,
+    user_id VARCHAR(255) NOT NULL,
+    sample_count INTEGER NOT NULL,           -- Samples staged for the batch
+    rejected_count INTEGER NOT NULL DEFAULT 0, -- Samples that failed validation and were not staged
+    status VARCHAR(16) NOT NULL DEFAULT 'pending', -- pending, merged or lost
+    inserted_count INTEGER,                  -- New health_metric rows; the rest were duplicates
+    received_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    merged_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS idx_health_metric_uploads_pending
+ON health_metric_uploads(received_at) WHERE status = 'pending';
+
+COMMENT ON TABLE health_metric_upload IS 'Unlogged staging for uploaded samples; rows are deleted when their batch is merged';
+COMMENT ON TABLE health_metric_uploads IS 'Upload batches; the background merger claims pending batches with FOR UPDATE SKIP LOCKED';
+
+-- =============================================
+-- 13. HealthKit anchored sync
+-- =============================================
+
+CREATE TABLE IF NOT EXISTS health_sync_anchors (
+    user_id VARCHAR(255) NOT NULL,
+    source_name VARCHAR(255) NOT NULL,       -- Device or app the anchored query is scoped to
+    type VARCHAR(255) NOT NULL,              -- HealthKit sample type
+    anchor TEXT,                             -- Opaque HKQueryAnchor (serialized by the client) of the last applied delta
+    samples_added BIGINT NOT NULL DEFAULT 0, -- New health_metric rows written by deltas
+    samples_deleted BIGINT NOT NULL DEFAULT 0, -- Rows removed by tombstones
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, source_name, type)
+);
+
+COMMENT ON TABLE health_sync_anchors IS 'Per-(user, source, type) sync anchors; a delta is applied only if it starts from the stored anchor';
+
+-- =============================================
+-- 14. Dictionary-encoded health samples
+-- =============================================
+
+-- Sample types and sources repeat on every row of a multi-million-row table; they are stored once
+-- in lookup tables and health_samples references them by id. health_metric is a view with the
+-- original columns, so existing scripts and ad-hoc queries keep working (writes go through an
+-- INSTEAD OF trigger). Existing installations move their rows with
+-- scripts/migrate_health_metric_dictionary.py.
+CREATE TABLE IF NOT EXISTS health_metric_types (
+    id SMALLSERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL UNIQUE        -- HealthKit type identifier, e.g. HKQuantityTypeIdentifierStepCount
+);
+
+-- Source names include the user's device names ("Alice's Apple Watch"), so the id is an INTEGER
+CREATE TABLE IF NOT EXISTS health_metric_sources (
+    id SERIAL PRIMARY KEY,
+    source_name VARCHAR(255),
+    source_version VARCHAR(50),
+    device VARCHAR(255)
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_health_metric_sources
+ON health_metric_sources ((COALESCE(source_name, '')), (COALESCE(source_version, '')), (COALESCE(device, '')));
+
+CREATE TABLE IF NOT EXISTS health_samples (
+    id BIGSERIAL PRIMARY KEY,
+    user_id VARCHAR(255) DEFAULT 'default_user',
+    type_id SMALLINT NOT NULL REFERENCES health_metric_types(id),
+    source_id INTEGER REFERENCES health_metric_sources(id),
+    unit VARCHAR(50),
+    creation_date TIMESTAMP WITH TIME ZONE,
+    start_date TIMESTAMP WITH TIME ZONE,
+    end_date TIMESTAMP WITH TIME ZONE,
+    value VARCHAR(255),
+    natural_key UUID,                        -- health_metric_natural_key() of the decoded row
+    sample_uuid UUID,                        -- HealthKit sample UUID, set for samples received through /lsp/api/v1/health/sync
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_health_samples_user_type_start ON health_samples(user_id, type_id, start_date);
+CREATE INDEX IF NOT EXISTS idx_health_samples_user_start ON health_samples(user_id, start_date);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_health_samples_natural_key ON health_samples(natural_key);
+CREATE INDEX IF NOT EXISTS idx_health_samples_user_sample_uuid
+ON health_samples(user_id, sample_uuid) WHERE sample_uuid IS NOT NULL;
+
+-- Id of a type name, added on first use
+CREATE OR REPLACE FUNCTION health_metric_type_id(p_name TEXT)
+RETURNS SMALLINT AS $$
+DECLARE
+    v_id SMALLINT;
+BEGIN
+    SELECT id INTO v_id FROM health_metric_types WHERE name = p_name;
+    IF v_id IS NULL THEN
+        INSERT INTO health_metric_types (name) VALUES (p_name) ON CONFLICT DO NOTHING RETURNING id INTO v_id;
+        IF v_id IS NULL THEN
+            SELECT id INTO v_id FROM health_metric_types WHERE name = p_name;
+        END IF;
+    END IF;
+    RETURN v_id;
+END;
+$$ language 'plpgsql';
+
+-- Id of a (source_name, source_version, device) combination, added on first use
+CREATE OR REPLACE FUNCTION health_metric_source_id(p_source_name TEXT, p_source_version TEXT, p_device TEXT)
+RETURNS INTEGER AS $$
+DECLARE
+    v_id INTEGER;
+BEGIN
+    SELECT id INTO v_id FROM health_metric_sources
+    WHERE COALESCE(source_name, '') = COALESCE(p_source_name, '')
+      AND COALESCE(source_version, '') = COALESCE(p_source_version, '')
+      AND COALESCE(device, '') = COALESCE(p_device, '');
+    IF v_id IS NULL THEN
+        INSERT INTO health_metric_sources (source_name, source_version, device)
+        VALUES (p_source_name, p_source_version, p_device)
+        ON CONFLICT DO NOTHING RETURNING id INTO v_id;
+        IF v_id IS NULL THEN
+            SELECT id INTO v_id FROM health_metric_sources
+            WHERE COALESCE(source_name, '') = COALESCE(p_source_name, '')
+              AND COALESCE(source_version, '') = COALESCE(p_source_version, '')
+              AND COALESCE(device, '') = COALESCE(p_device, '');
+        END IF;
+    END IF;
+    RETURN v_id;
+END;
+$$ language 'plpgsql';
+
+-- Bulk writers compute natural_key from the staged strings; this covers rows written by id
+CREATE OR REPLACE FUNCTION set_health_samples_natural_key()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' OR NEW.natural_key IS NULL THEN
+        NEW.natural_key = health_metric_natural_key(
+            NEW.user_id,
+            (SELECT name FROM health_metric_types WHERE id = NEW.type_id),
+            (SELECT source_name FROM health_metric_sources WHERE id = NEW.source_id),
+            NEW.start_date, NEW.end_date, NEW.value
+        );
+    END IF;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS set_health_samples_natural_key ON health_samples;
+CREATE TRIGGER set_health_samples_natural_key
+    BEFORE INSERT OR UPDATE OF user_id, type_id, source_id, start_date, end_date, value ON health_samples
+    FOR EACH ROW
+    EXECUTE FUNCTION set_health_samples_natural_key();
+
+-- Writes to the health_metric view: names are encoded through the lookup tables,
+-- and inserts of samples that already exist are skipped (as ON CONFLICT DO NOTHING)
+CREATE OR REPLACE FUNCTION write_health_metric_view()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_id BIGINT;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM health_samples WHERE id = OLD.id;
+        RETURN OLD;
+    END IF;
+    IF TG_OP = 'UPDATE' THEN
+        UPDATE health_samples SET
+            user_id = NEW.user_id,
+            type_id = health_metric_type_id(NEW.type),
+            source_id = health_metric_source_id(NEW.source_name, NEW.source_version, NEW.device),
+            unit = NEW.unit,
+            creation_date = NEW.creation_date,
+            start_date = NEW.start_date,
+            end_date = NEW.end_date,
+            value = NEW.value,
+            sample_uuid = NEW.sample_uuid
+        WHERE id = OLD.id;
+        RETURN NEW;
+    END IF;
+    INSERT INTO health_samples (
+        id, user_id, type_id, source_id, unit, creation_date, start_date, end_date, value, sample_uuid, created_at
+    )
+    VALUES (
+        COALESCE(NEW.id, nextval(pg_get_serial_sequence('health_samples', 'id'))),
+        COALESCE(NEW.user_id, 'default_user'),
+        health_metric_type_id(NEW.type),
+        health_metric_source_id(NEW.source_name, NEW.source_version, NEW.device),
+        NEW.unit, NEW.creation_date, NEW.start_date, NEW.end_date, NEW.value, NEW.sample_uuid,
+        COALESCE(NEW.created_at, CURRENT_TIMESTAMP)
+    )
+    ON CONFLICT DO NOTHING
+    RETURNING id INTO v_id;
+    IF v_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+    NEW.id = v_id;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+-- (Re)creates the health_metric view; column order matches the original table
+CREATE OR REPLACE FUNCTION create_health_metric_view()
+RETURNS VOID AS $$
+BEGIN
+    CREATE OR REPLACE VIEW health_metric AS
+    SELECT s.id, t.name AS type, src.source_name, src.source_version, s.unit, s.creation_date,
+           s.start_date, s.end_date, s.value, src.device, s.created_at, s.user_id, s.natural_key, s.sample_uuid
+    FROM health_samples s
+    JOIN health_metric_types t ON t.id = s.type_id
+    LEFT JOIN health_metric_sources src ON src.id = s.source_id;
+
+    DROP TRIGGER IF EXISTS write_health_metric_view ON health_metric;
+    CREATE TRIGGER write_health_metric_view
+        INSTEAD OF INSERT OR UPDATE OR DELETE ON health_metric
+        FOR EACH ROW
+        EXECUTE FUNCTION write_health_metric_view();
+END;
+$$ language 'plpgsql';
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass('health_metric') AND relkind = 'r') THEN
+        RAISE NOTICE 'health_metric is still a table; run scripts/migrate_health_metric_dictionary.py to move it to health_samples';
+    ELSE
+        PERFORM create_health_metric_view();
+    END IF;
+END;
+$$;
+
+COMMENT ON TABLE health_samples IS 'Raw HealthKit samples with dictionary-encoded type and source; read through the health_metric view or by type_id';
+COMMENT ON COLUMN health_samples.natural_key IS 'md5 of (user_id, type, source_name, start_date, end_date, value); duplicates are skipped on insert';
+
+-- =============================================
+-- 15. Health sample retention tiers
+-- =============================================
+
+-- High-frequency types (heart rate, audio exposure) are kept raw for RETENTION_RAW_DAYS days.
+-- scripts/compact_health_samples.py then folds older samples into per-source time buckets and deletes
+-- the raw rows; readers union both tiers.
+CREATE TABLE IF NOT EXISTS health_samples_compacted (
+    user_id VARCHAR(255) NOT NULL,
+    type_id SMALLINT NOT NULL REFERENCES health_metric_types(id),
+    source_id INTEGER REFERENCES health_metric_sources(id),
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL, -- Aligned to bucket_seconds since the epoch
+    bucket_end TIMESTAMP WITH TIME ZONE NOT NULL,   -- Latest end_date of the bucket's samples
+    bucket_seconds INTEGER NOT NULL,
+    unit VARCHAR(50),
+    sample_count INTEGER NOT NULL,
+    min_value DOUBLE PRECISION,
+    max_value DOUBLE PRECISION,
+    sum_value DOUBLE PRECISION,                     -- Kept instead of the mean so buckets can be merged
+    avg_value DOUBLE PRECISION GENERATED ALWAYS AS (sum_value / NULLIF(sample_count, 0)) STORED,
+    compacted_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_health_samples_compacted
+ON health_samples_compacted(user_id, type_id, bucket_start, (COALESCE(source_id, 0)));
+
+-- How far each user's samples of a type have been compacted
+CREATE TABLE IF NOT EXISTS health_retention_state (
+    user_id VARCHAR(255) NOT NULL,
+    type_id SMALLINT NOT NULL REFERENCES health_metric_types(id),
+    compacted_before TIMESTAMP WITH TIME ZONE NOT NULL, -- Raw samples starting earlier have been compacted
+    bucket_seconds INTEGER NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, type_id)
+);
+
+COMMENT ON TABLE health_samples_compacted IS 'Per-source min/max/sum/count buckets of raw samples older than the retention window';
+COMMENT ON TABLE health_retention_state IS 'Compaction watermark per (user, type); re-imported samples falling into an existing bucket before it are skipped';
+
+-- =============================================
+-- 16. Cold archive of raw samples
+-- =============================================
+
+-- Closed months older than ARCHIVE_KEEP_MONTHS are exported by scripts/archive_health_samples.py to
+-- Parquet files (one per month and user-hash bucket, sorted by user and time) and deleted from health_samples.
+-- The bucket of a user is health_archive_bucket(user_id, user_buckets). Archived months are closed:
+-- re-imported samples of an archived month and bucket are skipped on insert (see db/health_dictionary.py),
+-- except for kept_types, which are never archived because the sleep readers only query the database.
+CREATE TABLE IF NOT EXISTS health_archive_files (
+    id SERIAL PRIMARY KEY,
+    month DATE NOT NULL,                     -- First day of the archived month
+    bucket SMALLINT NOT NULL,
+    user_buckets SMALLINT NOT NULL,          -- Bucket count used for this file
+    path TEXT NOT NULL UNIQUE,               -- Relative to ARCHIVE_DIRECTORY
+    row_count BIGINT NOT NULL,
+    size_bytes BIGINT,
+    min_start TIMESTAMP WITH TIME ZONE,
+    max_start TIMESTAMP WITH TIME ZONE,
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    kept_types TEXT[] DEFAULT '{}'           -- Types left in health_samples (sleep), still accepted on insert
+);
+
+-- Columns added after the table was first created
+ALTER TABLE health_archive_files ADD COLUMN IF NOT EXISTS kept_types TEXT[] DEFAULT '{}';
+
+CREATE INDEX IF NOT EXISTS idx_health_archive_files_month ON health_archive_files(month, bucket);
+
+CREATE OR REPLACE FUNCTION health_archive_bucket(p_user_id TEXT, p_buckets INTEGER)
+RETURNS INTEGER AS $$
+    SELECT get_byte(decode(md5(p_user_id), 'hex'), 0) % p_buckets;
+$$ LANGUAGE sql IMMUTABLE;
+
+COMMENT ON TABLE health_archive_files IS 'Parquet files holding archived health_samples rows; readers union them with the database';
+
 -- =============================================
--- 4. Sample queries
+-- 17. Sample queries
 -- =============================================
 
 /*
@@ -112,4 +645,5 @@ ORDER BY dimension, difficulty;
 -- LSP tables setup completed!
 -- - Added level and total_points columns to users table
 -- - Created user_scores table with all necessary fields and indexes
+-- - Created score_dirty_days queue for incremental rescoring
 -- - No foreign key constraints added for easier maintenance
\ No newline at end of file
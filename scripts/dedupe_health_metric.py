@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+健康数据去重脚本
+为已有的health_metric补算自然键、按块删除重复样本并在线创建自然键唯一索引，
+运行期间不锁表，可重复运行（唯一索引已存在时直接退出）
+"""
+import sys
+import os
+import argparse
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.dedup_service import HealthMetricDedupService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在线删除health_metric中的重复样本并创建自然键唯一索引")
+    parser.add_argument("--batch-size", type=int, default=50000, help="每块（事务）的id范围大小 (默认: 50000)")
+    parser.add_argument("--sleep", type=float, default=0.0, help="每块之间停顿的秒数 (默认: 0)")
+    parser.add_argument("--max-attempts", type=int, default=3, help="创建唯一索引的最大尝试次数 (默认: 3)")
+
+    args = parser.parse_args()
+
+    try:
+        report = HealthMetricDedupService(args.batch_size, args.sleep).run(args.max_attempts)
+    except Exception as e:
+        print(f"❌ 去重失败: {e}")
+        sys.exit(1)
+
+    print(f"\n去重完成: 补算自然键{report['backfilled']}条, 删除重复样本{report['deleted']}条, "
+          f"唯一索引{'已创建' if report['unique_index'] else '未创建'}")
+    if not report["unique_index"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
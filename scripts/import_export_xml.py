@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+HealthKit导出文件导入脚本
+直接读取Apple健康导出的zip（或export.xml），流式解析并通过COPY写入数据库，内存占用与文件大小无关
+"""
+import sys
+import os
+import argparse
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.export_import_service import ExportImportService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式导入Apple健康导出文件（export.zip或export.xml）")
+    parser.add_argument("--file", required=True, help="导出的zip或export.xml路径")
+    parser.add_argument("--user-id", default="default_user", help="导入到的用户ID (默认: default_user)")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="每个COPY事务的样本数 (默认: 50000)")
+
+    args = parser.parse_args()
+
+    try:
+        stats = ExportImportService().import_export(args.file, args.user_id, chunk_size=args.chunk_size)
+    except Exception as e:
+        print(f"❌ 导入失败: {e}")
+        sys.exit(1)
+
+    print(f"\n导入完成: 样本{stats['records']}条（新增{stats['inserted']}条，其余已存在）, "
+          f"运动记录{stats['workouts']}条, 跳过{stats['skipped']}条")
+    print(f"耗时{stats['seconds']:.1f}秒, {stats['records_per_second']:.0f}条/秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -39,44 +39,30 @@ def import_sleep_stages_from_csv():
     batch_size = 100
     inserted_count = 0
     
+    columns = ['type', 'source_name', 'source_version', 'unit',
+               'creation_date', 'start_date', 'end_date', 'value',
+               'device', 'user_id']
+
     for i in range(0, len(sleep_records), batch_size):
         batch = sleep_records[i:i+batch_size]
+        # 整批写入，重复的样本（自然键相同）由ON CONFLICT DO NOTHING跳过
+        values = [
+            (record['type'], record['source_name'], record['source_version'],
+             record['unit'], record['creation_date'], record['start_date'],
+             record['end_date'], record['value'], record.get('device', ''),
+             'default_user')  # 默认用户
+            for record in batch
+        ]
+
+        try:
+            POSTGRES_POOL.bulk_insert_data('health_metric', columns, values)
+            inserted_count += len(values)
+        except Exception as e:
+            logger.error(f"插入记录失败: {e}")
         
-        for record in batch:
-            try:
-                # 准备数据
-                data = {
-                    'type': record['type'],
-                    'source_name': record['source_name'],
-                    'source_version': record['source_version'],
-                    'unit': record['unit'],
-                    'creation_date': record['creation_date'],
-                    'start_date': record['start_date'],
-                    'end_date': record['end_date'],
-                    'value': record['value'],
-                    'device': record.get('device', ''),
-                    'user_id': 'default_user'  # 默认用户
-                }
-                
-                # 插入数据
-                POSTGRES_POOL.insert_data(
-                    table_name='health_metric',
-                    columns=['type', 'source_name', 'source_version', 'unit', 
-                            'creation_date', 'start_date', 'end_date', 'value', 
-                            'device', 'user_id'],
-                    values=(data['type'], data['source_name'], data['source_version'],
-                           data['unit'], data['creation_date'], data['start_date'],
-                           data['end_date'], data['value'], data['device'], data['user_id']),
-                    on_conflict='ON CONFLICT (type, start_date, end_date, user_id) DO NOTHING'
-                )
-                inserted_count += 1
-                
-            except Exception as e:
-                logger.error(f"插入记录失败: {e}")
-        
-        logger.info(f"已插入 {inserted_count}/{len(sleep_records)} 条记录")
+        logger.info(f"已处理 {inserted_count}/{len(sleep_records)} 条记录")
     
-    logger.info(f"导入完成！共插入 {inserted_count} 条睡眠阶段记录")
+    logger.info(f"导入完成！共处理 {inserted_count} 条睡眠阶段记录")
     
     # 验证导入结果
     verify_imported_data()
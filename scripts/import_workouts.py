@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+运动记录导入脚本
+从HealthKit导出文件（zip或export.xml）中流式读取Workout元素并写入workouts表，重复导入同一文件不会产生重复记录
+"""
+import sys
+import os
+import argparse
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.workout import Workout
+from src.services.workout_service import WorkoutService
+from src.services.export_import_service import open_export, iter_export_elements
+from src.utils.logger import logger
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从HealthKit导出文件导入运动记录")
+    parser.add_argument("--xml", required=True, help="导出的zip或export.xml路径")
+    parser.add_argument("--user-id", default="default_user", help="导入到的用户ID (默认: default_user)")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批写入的记录数 (默认: 500)")
+
+    args = parser.parse_args()
+
+    service = WorkoutService()
+    batch = []
+    parsed = 0
+    saved = 0
+    skipped = 0
+
+    with open_export(args.xml) as stream:
+        for element in iter_export_elements(stream):
+            if element.tag != "Workout":
+                continue
+
+            try:
+                batch.append(Workout.from_export_element(element, args.user_id))
+                parsed += 1
+            except Exception as e:
+                logger.warning(f"跳过无法解析的运动记录: {e}")
+                skipped += 1
+
+            if len(batch) >= args.batch_size:
+                saved += service.save_workouts(batch)
+                batch = []
+
+    saved += service.save_workouts(batch)
+    print(f"\n导入完成: 解析{parsed}条, 保存{saved}条, 跳过{skipped}条")
+
+
+if __name__ == "__main__":
+    main()
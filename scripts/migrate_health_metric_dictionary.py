@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+健康样本字典编码迁移脚本
+把旧的health_metric表按块在线复制到health_samples（类型和来源存储为字典id），
+再在一个事务中把health_metric替换为兼容视图，可重复运行（已是视图时直接退出）
+"""
+import sys
+import os
+import argparse
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.dictionary_migration_service import HealthMetricDictionaryMigration, LEGACY_TABLE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把health_metric迁移到字典编码的health_samples并替换为兼容视图")
+    parser.add_argument("--batch-size", type=int, default=100000, help="每块（事务）的id范围大小 (默认: 100000)")
+    parser.add_argument("--sleep", type=float, default=0.0, help="每块之间停顿的秒数 (默认: 0)")
+    parser.add_argument("--start-id", type=int, default=None, help="从该id开始复制，用于中断后续传 (默认: 从头开始)")
+    parser.add_argument("--drop-legacy", action="store_true", help=f"切换后删除旧表{LEGACY_TABLE}")
+
+    args = parser.parse_args()
+
+    try:
+        report = HealthMetricDictionaryMigration(args.batch_size, args.sleep).run(args.start_id, args.drop_legacy)
+    except Exception as e:
+        print(f"❌ 迁移失败（重新运行会跳过已复制的样本）: {e}")
+        sys.exit(1)
+
+    print(f"\n迁移完成: 复制样本{report['copied']}条, 跳过重复样本{report['skipped']}条, "
+          f"{'已' if report['switched'] else '未'}切换为视图"
+          f"{f', 已删除{LEGACY_TABLE}' if report['dropped'] else ''}")
+    if not report["switched"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
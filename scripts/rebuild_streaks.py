@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+连续达标状态重建脚本
+状态表丢失或连续达标规则变化时，从已保存的每日积分记录重建user_streaks
+"""
+import sys
+import os
+import argparse
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.score_engine import build_calculators
+from src.core.batch_score_engine import BatchScoreEngine
+from src.services.streak_service import StreakService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从每日积分记录重建连续达标状态")
+    parser.add_argument("--user-id", default=None, help="只重建指定用户 (默认: 所有有健康数据的用户)")
+
+    args = parser.parse_args()
+
+    user_ids = [args.user_id] if args.user_id else BatchScoreEngine(max_workers=1).get_all_user_ids()
+    calculators = build_calculators()
+    service = StreakService()
+
+    rebuilt = 0
+    for user_id in user_ids:
+        states = service.rebuild(user_id, calculators)
+        rebuilt += len(states)
+        for state in states.values():
+            print(f"  {user_id} {state.dimension}: 连续{state.current_length}天, "
+                  f"{'已解锁' if state.unlocked else '未解锁'} (截至{state.last_scored_date})")
+
+    print(f"\n重建完成: {len(user_ids)}个用户, {rebuilt}个状态")
+
+
+if __name__ == "__main__":
+    main()
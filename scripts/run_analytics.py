@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+离线分析脚本
+用嵌入式DuckDB在冷归档文件和数据库快照上运行按人群的统计，分析查询不访问线上数据库。
+需要安装duckdb
+
+用法:
+    python scripts/run_analytics.py snapshot                       # 生成user_scores和daily_health_rollup的快照（定时运行）
+    python scripts/run_analytics.py reports                        # 列出内置报表
+    python scripts/run_analytics.py report dimension_by_tier --start 2026-07-01 --end 2026-09-30
+    python scripts/run_analytics.py query "SELECT COUNT(*) FROM samples"
+"""
+import sys
+import os
+import argparse
+from datetime import date, datetime, timedelta
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.analytics_service import REPORTS, SNAPSHOT_TABLES, AnalyticsEngine, AnalyticsSnapshotService
+
+
+def parse_date(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def print_frame(frame, output: str = None):
+    if output:
+        frame.to_csv(output, index=False)
+        print(f"已写入 {output} ({len(frame)}行)")
+    elif frame.empty:
+        print("(无结果)")
+    else:
+        print(frame.to_string(index=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在归档文件和快照上运行离线分析")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    snapshot = subparsers.add_parser("snapshot", help="把分析用到的表导出为Parquet快照")
+    snapshot.add_argument("--tables", nargs="+", choices=list(SNAPSHOT_TABLES), default=None,
+                          help="只导出这些表 (默认: 全部)")
+
+    subparsers.add_parser("reports", help="列出内置报表")
+
+    report = subparsers.add_parser("report", help="运行一个内置报表")
+    report.add_argument("name", choices=list(REPORTS), help="报表名称")
+    report.add_argument("--start", type=parse_date, default=None, help="开始日期YYYY-MM-DD (默认: 90天前)")
+    report.add_argument("--end", type=parse_date, default=None, help="结束日期YYYY-MM-DD，含 (默认: 昨天)")
+    report.add_argument("--dimension", default="sleep", help="按维度统计的报表使用的维度 (默认: sleep)")
+    report.add_argument("--output", default=None, help="结果写入该CSV文件")
+
+    query = subparsers.add_parser("query", help="执行一条SQL（可用的表: samples, user_scores, daily_health_rollup）")
+    query.add_argument("sql", help="SQL语句")
+    query.add_argument("--output", default=None, help="结果写入该CSV文件")
+
+    args = parser.parse_args()
+
+    if args.command == "reports":
+        for name, (description, _) in REPORTS.items():
+            print(f"{name:<24} {description}")
+        return
+
+    try:
+        if args.command == "snapshot":
+            for table, rows in AnalyticsSnapshotService().run(args.tables).items():
+                print(f"✅ {table}: {rows}行")
+            return
+
+        engine = AnalyticsEngine()
+        try:
+            if args.command == "report":
+                end = args.end or date.today() - timedelta(days=1)
+                start = args.start or end - timedelta(days=89)
+                print(f"{args.name}: {start} ~ {end}\n")
+                print_frame(engine.report(args.name, start, end, dimension=args.dimension), args.output)
+            else:
+                print_frame(engine.query(args.sql), args.output)
+        finally:
+            engine.close()
+    except Exception as e:
+        print(f"❌ 分析失败: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+增量积分重算脚本
+只重算待重算队列（score_dirty_days）中的日期及其后7天，适合定时运行
+"""
+import sys
+import os
+import argparse
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.score_engine import ScoreEngine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="增量重算待重算队列中的积分")
+    parser.add_argument("--limit", type=int, default=None, help="本次最多处理的队列记录数 (默认: 全部)")
+    parser.add_argument("--user-id", default=None, help="只处理指定用户 (默认: 所有用户)")
+
+    args = parser.parse_args()
+
+    engine = ScoreEngine(auto_save=True)
+    pending = engine.dirty_days_service.get_pending_count()
+    print(f"待重算队列中有 {pending} 个用户日")
+    if pending == 0:
+        return
+
+    report = engine.rescore_dirty_days(limit=args.limit, user_id=args.user_id)
+
+    print("\n重算完成:")
+    print(f"  队列记录: {report['claimed']}")
+    print(f"  用户数: {report['users']}")
+    print(f"  重算天数: {report['rescored_days']}")
+    print(f"  失败天数: {report['failed_days']}")
+    print(f"  已确认: {report['acknowledged']}")
+    print(f"  耗时: {report['elapsed_seconds']}秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+夜间批量积分计算脚本
+默认为所有用户计算昨天的积分
+"""
+import sys
+import os
+import argparse
+from datetime import datetime, timedelta
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.batch_score_engine import BatchScoreEngine
+
+
+def main():
+    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+
+    parser = argparse.ArgumentParser(description="批量计算用户每日积分")
+    parser.add_argument("--start-date", default=yesterday, help=f"开始日期 YYYY-MM-DD (默认: 昨天 {yesterday})")
+    parser.add_argument("--end-date", default=None, help="结束日期 YYYY-MM-DD (默认: 与开始日期相同)")
+    parser.add_argument("--user-id", action="append", dest="user_ids", help="只计算指定用户，可重复指定 (默认: 所有用户)")
+    parser.add_argument("--workers", type=int, default=None, help="计算进程数 (默认: 使用配置)")
+    parser.add_argument("--chunk-size", type=int, default=None, help="每批用户数 (默认: 使用配置)")
+    parser.add_argument("--dry-run", action="store_true", help="只计算不保存")
+
+    args = parser.parse_args()
+
+    start_date = datetime.strptime(args.start_date, "%Y-%m-%d")
+    end_date = datetime.strptime(args.end_date, "%Y-%m-%d") if args.end_date else start_date
+
+    engine = BatchScoreEngine(max_workers=args.workers, chunk_size=args.chunk_size)
+    user_ids = args.user_ids or engine.get_all_user_ids()
+    if not user_ids:
+        print("❌ 没有需要计算的用户")
+        return
+
+    print(f"开始计算 {len(user_ids)} 个用户 {start_date.date()} ~ {end_date.date()} 的积分...")
+    report = engine.score_users(user_ids, start_date, end_date, save_to_db=not args.dry_run)
+
+    print("\n计算完成:")
+    print(f"  用户数: {report['users']}")
+    print(f"  用户日: {report['user_days']}")
+    print(f"  已保存: {report['saved']}")
+    print(f"  失败: {report['failed']}")
+    print(f"  耗时: {report['elapsed_seconds']}秒")
+    print(f"  吞吐量: {report['users_per_second']} 用户/秒, {report['user_days_per_second']} 用户日/秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,15 +4,19 @@
 """
 
 from datetime import datetime, date
-from typing import Optional, List
-from fastapi import APIRouter, HTTPException, Query, Depends
+import json
+from typing import Any, Optional, List
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from ..services.health_data_service import HealthDataService
+from ..services.upload_service import HealthRecordUploadService, decode_body
+from ..services.sync_service import HealthSyncService
 from ..core.score_engine import ScoreEngine
 from ..models.health_data import HealthDataQuery, DailyHealthSummary
 from ..utils.logger import logger
-from ..db.configs.global_config import API_CONFIG
+from ..db.configs.global_config import API_CONFIG, UPLOAD_CONFIG
 from .auth_middleware import get_current_user, security, get_user_id
 
 
@@ -21,6 +25,8 @@ router = APIRouter(prefix="/lsp/api/v1", tags=["health-data"])
 # 初始化服务
 health_service = HealthDataService()
 score_engine = ScoreEngine()
+upload_service = HealthRecordUploadService()
+sync_service = HealthSyncService()
 
 
 # get_user_id函数已移至auth_middleware.py
@@ -44,13 +50,171 @@ class HealthSummaryResponse(BaseModel):
     date: str
     sleep_hours: Optional[float]
     steps: Optional[int]
+    non_workout_steps: Optional[int] = None
     active_energy: Optional[float]
     exercise_minutes: Optional[int]
+    zone2_minutes: Optional[int] = None
+    workout_types: Optional[List[str]] = None
     stand_hours: Optional[int]
+    sedentary_hours: Optional[int] = None
     avg_heart_rate: Optional[float]
     resting_heart_rate: Optional[float]
     hrv: Optional[float]
     water_ml: Optional[float]
+    water_hours: Optional[int] = None
+
+
+class UploadResponse(BaseModel):
+    """样本上传响应"""
+
+    batch_id: str
+    accepted: int
+    rejected: int
+    status: str
+
+
+class UploadStatusResponse(BaseModel):
+    """上传批次状态"""
+
+    batch_id: str
+    sample_count: int
+    rejected_count: int
+    status: str
+    inserted_count: Optional[int] = None
+    received_at: Optional[str] = None
+    merged_at: Optional[str] = None
+
+
+@router.post("/health/records", response_model=UploadResponse, status_code=202)
+async def upload_health_records(request: Request, user_id: str = Depends(get_user_id)):
+    """
+    批量上传HealthKit样本
+
+    请求体为NDJSON（Content-Type: application/x-ndjson）或按列的JSON（application/json），
+    可用Content-Encoding: gzip压缩。样本暂存后立即返回，由后台合并到健康数据（重复样本被跳过）
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > UPLOAD_CONFIG.max_body_bytes:
+        raise HTTPException(status_code=413, detail=f"请求体不能超过{UPLOAD_CONFIG.max_body_bytes}字节")
+    body = await request.body()
+    if len(body) > UPLOAD_CONFIG.max_body_bytes:
+        raise HTTPException(status_code=413, detail=f"请求体不能超过{UPLOAD_CONFIG.max_body_bytes}字节")
+
+    try:
+        result = await run_in_threadpool(
+            upload_service.receive, user_id, body,
+            request.headers.get("content-type"), request.headers.get("content-encoding")
+        )
+        return UploadResponse(**result)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"暂存上传的健康数据失败: {e}")
+        # 返回可重试的状态码，设备稍后重新上传同一批（重复样本在合并时被跳过）
+        raise HTTPException(status_code=503, detail="暂存健康数据失败，请稍后重试")
+
+
+@router.get("/health/records/{batch_id}", response_model=UploadStatusResponse)
+async def get_upload_status(batch_id: str, user_id: str = Depends(get_user_id)):
+    """
+    查询上传批次的合并状态（pending、merged或lost）
+    """
+    batch = await run_in_threadpool(upload_service.get_batch, user_id, batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="上传批次不存在")
+    return UploadStatusResponse(
+        batch_id=str(batch["batch_id"]),
+        sample_count=batch["sample_count"],
+        rejected_count=batch["rejected_count"],
+        status=batch["status"],
+        inserted_count=batch["inserted_count"],
+        received_at=batch["received_at"].isoformat() if batch["received_at"] else None,
+        merged_at=batch["merged_at"].isoformat() if batch["merged_at"] else None,
+    )
+
+
+class SyncDeltaRequest(BaseModel):
+    """同步增量：从since_anchor到anchor之间新增的样本和删除的对象"""
+
+    source_name: str
+    type: str
+    since_anchor: Optional[str] = None
+    anchor: str
+    samples: Any = None
+    deleted: List[str] = []
+
+
+class SyncDeltaResponse(BaseModel):
+    """同步增量应用结果"""
+
+    status: str
+    anchor: Optional[str]
+    received: int
+    inserted: int
+    rejected: int
+    deleted: int
+
+
+class SyncAnchorResponse(BaseModel):
+    """同步锚点"""
+
+    source_name: str
+    type: str
+    anchor: Optional[str]
+    samples_added: int
+    samples_deleted: int
+    updated_at: Optional[str] = None
+
+
+@router.get("/health/sync/anchors", response_model=List[SyncAnchorResponse])
+async def get_sync_anchors(
+    source_name: Optional[str] = Query(default=None, description="只返回该来源的锚点"),
+    type: Optional[str] = Query(default=None, description="只返回该样本类型的锚点"),
+    user_id: str = Depends(get_user_id),
+):
+    """
+    获取服务端保存的同步锚点，客户端从这些锚点开始查询增量
+    """
+    anchors = await run_in_threadpool(sync_service.get_anchors, user_id, source_name, type)
+    return [
+        SyncAnchorResponse(**{**anchor, "updated_at": anchor["updated_at"].isoformat() if anchor["updated_at"] else None})
+        for anchor in anchors
+    ]
+
+
+def _apply_sync_body(user_id: str, body: bytes, content_encoding: Optional[str]) -> dict:
+    """解压、解析并应用一个同步增量（在线程池中运行，解压和JSON解析不阻塞事件循环）"""
+    # 数字按原始文本解析，与批量上传一致
+    payload = json.loads(decode_body(body, content_encoding), parse_float=str, parse_int=str)
+    delta = SyncDeltaRequest(**payload) if isinstance(payload, dict) else None
+    if delta is None:
+        raise ValueError("请求体必须是JSON对象")
+    return sync_service.apply_delta(
+        user_id, delta.source_name, delta.type, delta.since_anchor, delta.anchor, delta.samples, delta.deleted
+    )
+
+
+@router.post("/health/sync", response_model=SyncDeltaResponse)
+async def apply_sync_delta(request: Request, user_id: str = Depends(get_user_id)):
+    """
+    提交一个同步增量（可用Content-Encoding: gzip压缩）
+
+    since_anchor必须等于服务端保存的锚点，否则返回409和当前锚点；重复提交已应用的增量返回already_applied
+    """
+    body = await request.body()
+    if len(body) > UPLOAD_CONFIG.max_body_bytes:
+        raise HTTPException(status_code=413, detail=f"请求体不能超过{UPLOAD_CONFIG.max_body_bytes}字节")
+    try:
+        result = await run_in_threadpool(_apply_sync_body, user_id, body, request.headers.get("content-encoding"))
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"应用同步增量失败: {e}")
+        raise HTTPException(status_code=503, detail="应用同步增量失败，请稍后重试")
+
+    if result["status"] == "conflict":
+        raise HTTPException(status_code=409, detail={"message": "起始锚点与服务端不一致", "anchor": result["anchor"]})
+    return SyncDeltaResponse(**result)
 
 
 @router.get("/health/daily-summary", response_model=HealthSummaryResponse)
@@ -62,19 +226,25 @@ async def get_daily_health_summary(
     """
     try:
         query_date = datetime.combine(date or datetime.now().date(), datetime.min.time())
-        summary = health_service.get_daily_summary(user_id, query_date)
+        # 在线程池中执行，使并发请求可以合并同一用户同一天的计算
+        summary = await run_in_threadpool(health_service.get_daily_summary, user_id, query_date)
 
         return HealthSummaryResponse(
             date=query_date.strftime("%Y-%m-%d"),
             sleep_hours=summary.sleep_hours,
             steps=summary.steps,
+            non_workout_steps=summary.non_workout_steps,
             active_energy=summary.active_energy,
             exercise_minutes=summary.exercise_minutes,
+            zone2_minutes=summary.zone2_minutes,
+            workout_types=summary.workout_types,
             stand_hours=summary.stand_hours,
+            sedentary_hours=summary.sedentary_hours,
             avg_heart_rate=summary.avg_heart_rate,
             resting_heart_rate=summary.resting_heart_rate,
             hrv=summary.hrv,
             water_ml=summary.water_ml,
+            water_hours=summary.water_hours,
         )
     except Exception as e:
         logger.error(f"获取健康数据汇总失败: {e}")
@@ -83,14 +253,20 @@ async def get_daily_health_summary(
 
 @router.get("/score/daily", response_model=ScoreResponse)
 async def calculate_daily_score(
-    date: date = Query(default=None, description="计算日期，默认为今天"), user_id: str = Depends(get_user_id)
+    date: date = Query(default=None, description="计算日期，默认为今天"),
+    force_recalculate: bool = Query(default=False, description="是否忽略已保存的积分强制重新计算"),
+    user_id: str = Depends(get_user_id),
 ):
     """
     计算指定日期的积分
+
+    已结束的日期优先返回已保存的积分，只有当天、数据有更新或强制重算时才重新计算
     """
     try:
         query_date = datetime.combine(date or datetime.now().date(), datetime.min.time())
-        score_result = score_engine.calculate_daily_score(user_id, query_date)
+        score_result = await run_in_threadpool(
+            score_engine.get_daily_score, user_id, query_date, force_recalculate=force_recalculate
+        )
 
         return ScoreResponse(**score_result)
     except Exception as e:
@@ -6,6 +6,7 @@
 from datetime import datetime, date, timedelta
 from typing import Optional, List
 from fastapi import APIRouter, HTTPException, Query, Path, Depends
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from ..services.score_persistence_service import ScorePersistenceService
 from ..utils.logger import logger
@@ -95,7 +96,7 @@ async def get_valid_scores(
     """
     try:
         as_of = datetime.combine(as_of_date, datetime.min.time()) if as_of_date else datetime.now()
-        result = persistence_service.get_user_valid_scores(user_id, as_of)
+        result = await run_in_threadpool(persistence_service.get_user_valid_scores, user_id, as_of)
 
         if "error" in result:
             logger.error(f"获取有效积分失败: {result['error']}")
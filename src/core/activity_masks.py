@@ -0,0 +1,127 @@
+"""
+运动类别位图
+每天完成的运动按类别记为一个整数位图（每个类别一位），
+"每周包含有氧、力量和柔韧运动"和"与前2天的运动不同"等规则只需对最近几天的位图做位运算
+
+最近几天的位图作为运动维度连续达标规则的滚动上下文保存：
+{'as_of': 'YYYY-MM-DD', 'masks': [当天, 前1天, ..., 前(RECENT_DAYS-1)天]}
+"""
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+
+# 运动类别及其位
+ACTIVITY_CATEGORIES = {
+    'running': 1 << 0,
+    'walking': 1 << 1,
+    'cycling': 1 << 2,
+    'swimming': 1 << 3,
+    'rowing': 1 << 4,
+    'cardio_machine': 1 << 5,
+    'hiit': 1 << 6,
+    'dance': 1 << 7,
+    'sports': 1 << 8,
+    'strength': 1 << 9,
+    'core': 1 << 10,
+    'yoga': 1 << 11,
+    'pilates': 1 << 12,
+    'flexibility': 1 << 13,
+    'mind_body': 1 << 14,
+    'other': 1 << 15,
+}
+
+# 每周多样性规则中的三大类
+AEROBIC_MASK = sum(ACTIVITY_CATEGORIES[name] for name in [
+    'running', 'walking', 'cycling', 'swimming', 'rowing', 'cardio_machine', 'hiit', 'dance', 'sports'
+])
+STRENGTH_MASK = ACTIVITY_CATEGORIES['strength'] | ACTIVITY_CATEGORIES['core']
+FLEXIBILITY_MASK = sum(ACTIVITY_CATEGORIES[name] for name in ['yoga', 'pilates', 'flexibility', 'mind_body'])
+GROUP_MASKS = {'aerobic': AEROBIC_MASK, 'strength': STRENGTH_MASK, 'flexibility': FLEXIBILITY_MASK}
+
+# HKWorkoutActivityType到类别的映射，未列出的类型记为other
+WORKOUT_TYPE_CATEGORIES = {
+    'HKWorkoutActivityTypeRunning': 'running',
+    'HKWorkoutActivityTypeWalking': 'walking',
+    'HKWorkoutActivityTypeHiking': 'walking',
+    'HKWorkoutActivityTypeCycling': 'cycling',
+    'HKWorkoutActivityTypeHandCycling': 'cycling',
+    'HKWorkoutActivityTypeSwimming': 'swimming',
+    'HKWorkoutActivityTypeWaterFitness': 'swimming',
+    'HKWorkoutActivityTypeRowing': 'rowing',
+    'HKWorkoutActivityTypePaddleSports': 'rowing',
+    'HKWorkoutActivityTypeElliptical': 'cardio_machine',
+    'HKWorkoutActivityTypeStairClimbing': 'cardio_machine',
+    'HKWorkoutActivityTypeStairs': 'cardio_machine',
+    'HKWorkoutActivityTypeStepTraining': 'cardio_machine',
+    'HKWorkoutActivityTypeMixedCardio': 'cardio_machine',
+    'HKWorkoutActivityTypeJumpRope': 'cardio_machine',
+    'HKWorkoutActivityTypeHighIntensityIntervalTraining': 'hiit',
+    'HKWorkoutActivityTypeCrossTraining': 'hiit',
+    'HKWorkoutActivityTypeKickboxing': 'hiit',
+    'HKWorkoutActivityTypeBoxing': 'hiit',
+    'HKWorkoutActivityTypeMartialArts': 'hiit',
+    'HKWorkoutActivityTypeDance': 'dance',
+    'HKWorkoutActivityTypeSocialDance': 'dance',
+    'HKWorkoutActivityTypeCardioDance': 'dance',
+    'HKWorkoutActivityTypeBasketball': 'sports',
+    'HKWorkoutActivityTypeSoccer': 'sports',
+    'HKWorkoutActivityTypeTennis': 'sports',
+    'HKWorkoutActivityTypeBadminton': 'sports',
+    'HKWorkoutActivityTypeTableTennis': 'sports',
+    'HKWorkoutActivityTypeVolleyball': 'sports',
+    'HKWorkoutActivityTypeTraditionalStrengthTraining': 'strength',
+    'HKWorkoutActivityTypeFunctionalStrengthTraining': 'strength',
+    'HKWorkoutActivityTypeCoreTraining': 'core',
+    'HKWorkoutActivityTypeYoga': 'yoga',
+    'HKWorkoutActivityTypePilates': 'pilates',
+    'HKWorkoutActivityTypeFlexibility': 'flexibility',
+    'HKWorkoutActivityTypeCooldown': 'flexibility',
+    'HKWorkoutActivityTypeMindAndBody': 'mind_body',
+    'HKWorkoutActivityTypeTaiChi': 'mind_body',
+}
+
+# 上下文中保存的天数（包括当天），满足每周规则需要7天
+RECENT_DAYS = 7
+
+
+def activity_mask(workout_types: Iterable[str]) -> int:
+    """将一天的运动类型列表转换为类别位图"""
+    mask = 0
+    for workout_type in workout_types:
+        mask |= ACTIVITY_CATEGORIES[WORKOUT_TYPE_CATEGORIES.get(workout_type, 'other')]
+    return mask
+
+
+def previous_masks(context: Optional[Dict], day: date) -> List[int]:
+    """
+    从前一天结束时的上下文得到day之前各天的位图
+
+    Args:
+        context: 前一天（或更早）结束时的上下文，没有时视为前几天都没有运动
+        day: 当天日期
+
+    Returns:
+        [前1天, 前2天, ..., 前(RECENT_DAYS-1)天] 的位图列表
+    """
+    masks = [0] * (RECENT_DAYS - 1)
+    if not context or not context.get('as_of'):
+        return masks
+    gap = (day - date.fromisoformat(context['as_of'])).days
+    if gap < 1:
+        return masks
+    # 上下文第i项是as_of之前i天，即day之前gap + i天
+    for i, mask in enumerate(context.get('masks', [])):
+        offset = gap + i - 1
+        if offset < len(masks):
+            masks[offset] = mask
+    return masks
+
+
+def next_context(previous: List[int], day: date, today_mask: int) -> Dict:
+    """得到当天结束时的上下文"""
+    return {'as_of': day.isoformat(), 'masks': [today_mask] + previous[:RECENT_DAYS - 1]}
+
+
+def covers_groups(mask: int, groups: Iterable[str]) -> bool:
+    """位图是否包含每一个大类中的至少一种运动"""
+    return all(mask & GROUP_MASKS[group] for group in groups)
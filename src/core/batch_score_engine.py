@@ -0,0 +1,328 @@
+"""
+批量积分计算引擎
+按用户分批预取数据，在进程池中并行运行各维度计算器，并批量写回积分
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from ..models.health_data import DailyHealthSummary
+from ..models.rolling_state import RollingStates
+from ..services.health_data_service import HealthDataService
+from ..services.score_persistence_service import ScorePersistenceService
+from ..services.sleep_analysis_service import SleepAnalysisService
+from ..services.rolling_state_service import RollingStateService
+from ..services.dirty_days_service import DirtyDaysService
+from .calculators.sleep_calculator import SleepCalculator
+from .score_engine import build_calculators, score_dimensions, has_rolling_state
+from ..utils.cache import TIER_CACHE
+from ..utils.logger import logger
+from ..db.postgresql import POSTGRES_POOL
+from ..db.configs.global_config import BATCH_SCORING_CONFIG, CACHE_CONFIG
+
+
+# 计算进程内复用的计算器（由进程池初始化函数创建）
+_WORKER_CALCULATORS = None
+
+
+def _init_worker():
+    """进程池初始化：每个计算进程只创建一次计算器"""
+    global _WORKER_CALCULATORS
+    _WORKER_CALCULATORS = build_calculators()
+
+
+def _score_tasks(tasks: List[Dict]) -> List[Dict]:
+    """
+    计算一组用户日的积分（在计算进程中运行，不访问数据库）
+
+    Args:
+        tasks: 任务列表，每项包含user_id、date、summary、history、sleep_analysis和tier_level；
+               每个用户的第一天还包含rolling_states（前一天结束时的连续达标、连锁规则计数器和个人HRV基线），
+               同一用户之后的日期按顺序沿用前一天计算出的状态
+
+    Returns:
+        结果列表，失败的任务带有error字段
+    """
+    global _WORKER_CALCULATORS
+    if _WORKER_CALCULATORS is None:
+        _init_worker()
+
+    results = []
+    rolling_states: Dict[str, RollingStates] = {}
+    for task in tasks:
+        user_id = task['user_id']
+        if task.get('rolling_states') is not None:
+            rolling_states[user_id] = task['rolling_states']
+        try:
+            dimension_scores, total_score = score_dimensions(
+                _WORKER_CALCULATORS, task['summary'], task['history'],
+                user_id, task['date'], task['tier_level'],
+                sleep_analysis=task['sleep_analysis'],
+                rolling_states=rolling_states.setdefault(user_id, RollingStates())
+            )
+            rolling_states[user_id] = RollingStates.from_scores(dimension_scores, task['date'].date())
+            results.append({
+                'user_id': task['user_id'],
+                'date': task['date'],
+                'dimension_scores': dimension_scores,
+                'total_score': total_score,
+                'tier_level': task['tier_level'],
+                'health_summary': task['summary'].model_dump(mode='json'),
+                'rolling_states': rolling_states[user_id],
+                'latest_scored': task.get('latest_scored')
+            })
+        except Exception as e:
+            results.append({'user_id': task['user_id'], 'date': task['date'], 'error': str(e)})
+    return results
+
+
+class BatchScoreEngine:
+    """多用户批量积分计算引擎"""
+
+    def __init__(self, max_workers: Optional[int] = None, chunk_size: Optional[int] = None):
+        """
+        初始化批量积分引擎
+
+        Args:
+            max_workers: 计算进程数，None时使用配置（0表示CPU核数），1表示在当前进程内计算
+            chunk_size: 每批预取和计算的用户数，None时使用配置
+        """
+        self.health_service = HealthDataService()
+        self.sleep_service = SleepAnalysisService()
+        self.persistence_service = ScorePersistenceService()
+        self.rolling_state_service = RollingStateService()
+        self.dirty_days_service = DirtyDaysService()
+
+        max_workers = BATCH_SCORING_CONFIG.max_workers if max_workers is None else max_workers
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size or BATCH_SCORING_CONFIG.chunk_size
+        self.history_days = BATCH_SCORING_CONFIG.history_days
+
+    def score_users(self, user_ids: List[str], start_date: datetime,
+                    end_date: Optional[datetime] = None, save_to_db: bool = True) -> Dict:
+        """
+        计算多个用户在日期或日期范围内的积分
+
+        Args:
+            user_ids: 用户ID列表
+            start_date: 开始日期
+            end_date: 结束日期（含），None时只计算start_date当天
+            save_to_db: 是否批量保存到数据库（与单用户计算一致，总积分为0的日期只覆盖已有的记录）
+
+        Returns:
+            吞吐量报告
+        """
+        start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        end_date = (end_date or start_date).replace(hour=0, minute=0, second=0, microsecond=0)
+        user_ids = list(dict.fromkeys(user_ids))
+        chunks = [user_ids[i:i + self.chunk_size] for i in range(0, len(user_ids), self.chunk_size)]
+
+        report = {
+            'users': len(user_ids),
+            'days': (end_date - start_date).days + 1,
+            'user_days': 0,
+            'saved': 0,
+            'failed': 0,
+            'workers': self.max_workers,
+            'chunks': len(chunks)
+        }
+        started = time.perf_counter()
+
+        if self.max_workers <= 1:
+            for chunk in chunks:
+                tasks = self._prefetch_chunk(chunk, start_date, end_date)
+                self._collect(_score_tasks(tasks), end_date, save_to_db, report)
+        elif chunks:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context,
+                                     initializer=_init_worker) as executor:
+                # 计算当前批次的同时预取下一批次
+                pending = self._submit(executor, self._prefetch_chunk(chunks[0], start_date, end_date))
+                for next_chunk in chunks[1:] + [None]:
+                    next_tasks = self._prefetch_chunk(next_chunk, start_date, end_date) if next_chunk else None
+                    results = []
+                    for future in pending:
+                        results.extend(future.result())
+                    self._collect(results, end_date, save_to_db, report)
+                    pending = self._submit(executor, next_tasks) if next_tasks else []
+
+        elapsed = time.perf_counter() - started
+        report['elapsed_seconds'] = round(elapsed, 3)
+        report['users_per_second'] = round(report['users'] / elapsed, 2) if elapsed > 0 else 0.0
+        report['user_days_per_second'] = round(report['user_days'] / elapsed, 2) if elapsed > 0 else 0.0
+
+        logger.info(
+            f"批量积分计算完成: {report['users']}个用户, {report['user_days']}个用户日, "
+            f"保存{report['saved']}, 失败{report['failed']}, 耗时{report['elapsed_seconds']}秒, "
+            f"{report['users_per_second']}用户/秒"
+        )
+        return report
+
+    def _submit(self, executor: ProcessPoolExecutor, tasks: List[Dict]) -> List[Future]:
+        """将一批任务均分给各计算进程（同一用户的日期不拆开，以便按顺序推进连续达标状态）"""
+        size = max(1, -(-len(tasks) // self.max_workers))
+        futures = []
+        start = 0
+        while start < len(tasks):
+            end = min(start + size, len(tasks))
+            while end < len(tasks) and tasks[end]['user_id'] == tasks[end - 1]['user_id']:
+                end += 1
+            futures.append(executor.submit(_score_tasks, tasks[start:end]))
+            start = end
+        return futures
+
+    def _collect(self, results: List[Dict], end_date: datetime, save_to_db: bool, report: Dict):
+        """
+        汇总一批计算结果并批量保存
+
+        计算失败的用户日没有保存积分，之后的日期也沿用了失败前的滚动状态，
+        从每个用户第一个失败的日期到范围结束都加入待重算队列
+        """
+        to_save = []
+        rolling_states = {}
+        backfilled = {}
+        failed = {}
+        for result in results:
+            report['user_days'] += 1
+            if 'error' in result:
+                report['failed'] += 1
+                logger.error(f"计算用户{result['user_id']}在{result['date'].date()}的积分失败: {result['error']}")
+                failed.setdefault(result['user_id'], result['date'])
+                continue
+            # 结果按日期顺序排列，保留每个用户最后一天的状态
+            rolling_states[result['user_id']] = result['rolling_states']
+            latest_scored = result['latest_scored']
+            if latest_scored and latest_scored > result['date'].date():
+                backfilled[result['user_id']] = (result['date'] + timedelta(days=1), latest_scored)
+            else:
+                backfilled.pop(result['user_id'], None)
+            if result['total_score'] > 0 or has_rolling_state(result['dimension_scores']):
+                to_save.append(result)
+            else:
+                # 没有积分的日期只覆盖已有的记录
+                to_save.append({**result, 'update_only': True})
+
+        if save_to_db and to_save:
+            report['saved'] += self.persistence_service.save_daily_scores_batch(to_save)
+        if save_to_db and rolling_states:
+            self.rolling_state_service.save_states_bulk(rolling_states)
+            # 补算早于最新计算日期的范围时，之后已计算的日期需要按新的状态重算
+            for user_id, (start, end) in backfilled.items():
+                self.dirty_days_service.mark_dirty(user_id, start, end)
+        if save_to_db:
+            for user_id, start in failed.items():
+                self.dirty_days_service.mark_dirty(user_id, start, end_date)
+
+    def _prefetch_chunk(self, user_ids: List[str], start_date: datetime, end_date: datetime) -> List[Dict]:
+        """
+        用集合查询预取一批用户计算所需的全部数据
+
+        Args:
+            user_ids: 本批用户ID
+            start_date: 开始日期
+            end_date: 结束日期（含）
+
+        Returns:
+            每个用户日一项的计算任务
+        """
+        previous_states = self.rolling_state_service.get_previous_states(user_ids, start_date.date())
+
+        # 只有没有连锁规则计数器的用户需要用之前几天的数据得到初始状态
+        needs_history = {user_id for user_id in user_ids if not previous_states[user_id].chains}
+        history_start = start_date - timedelta(days=self.history_days) if needs_history else start_date
+        summaries = self.health_service.get_daily_summaries_bulk(user_ids, history_start, end_date)
+        # 未指定睡眠数据源时需要逐晚自动选择数据源，交由睡眠计算器自行查询
+        sleep_analyses = {}
+        if SleepCalculator.SLEEP_STAGE_SOURCE:
+            sleep_analyses = self.sleep_service.analyze_sleep_stages_bulk(
+                user_ids, start_date, end_date, SleepCalculator.SLEEP_STAGE_SOURCE
+            )
+        tiers = self._get_user_tiers(user_ids)
+
+        tasks = []
+        for user_id in user_ids:
+            previous = previous_states[user_id]
+            current = start_date
+            while current <= end_date:
+                key = current.strftime('%Y-%m-%d')
+                history = {}
+                if current == start_date and user_id in needs_history:
+                    for i in range(1, self.history_days + 1):
+                        past_date = current - timedelta(days=i)
+                        past_key = past_date.strftime('%Y-%m-%d')
+                        history[past_key] = summaries.get((user_id, past_key), DailyHealthSummary(date=past_date))
+                tasks.append({
+                    'user_id': user_id,
+                    'date': current,
+                    'summary': summaries.get((user_id, key), DailyHealthSummary(date=current)),
+                    'history': history,
+                    'sleep_analysis': sleep_analyses.get((user_id, key)),
+                    'tier_level': tiers.get(user_id, 'Bronze'),
+                    'rolling_states': previous if current == start_date else None,
+                    'latest_scored': previous.latest_scored_date
+                })
+                current += timedelta(days=1)
+        return tasks
+
+    def _get_user_tiers(self, user_ids: List[str]) -> Dict[str, str]:
+        """
+        批量获取用户等级，口径与ScoreEngine._query_user_tier一致
+
+        Args:
+            user_ids: 用户ID列表
+
+        Returns:
+            用户ID到等级的字典，缺失的用户默认为Bronze
+        """
+        tiers = {}
+        missing = []
+        for user_id in user_ids:
+            tier = TIER_CACHE.get(user_id) if CACHE_CONFIG.enabled else None
+            if tier is not None:
+                tiers[user_id] = tier
+            else:
+                missing.append(user_id)
+
+        if missing:
+            try:
+                rows = POSTGRES_POOL._execute_query(
+                    "SELECT user_id, level FROM users WHERE user_id = ANY(%s)", (missing,), fetch_all=True
+                ) or []
+                queried = {row['user_id']: row['level'] for row in rows if row['level']}
+
+                # users表没有记录的用户，从最新的积分记录获取
+                fallback = [user_id for user_id in missing if user_id not in queried]
+                if fallback:
+                    rows = POSTGRES_POOL._execute_query("""
+                        SELECT DISTINCT ON (user_id) user_id, tier_level
+                        FROM user_scores
+                        WHERE user_id = ANY(%s)
+                        ORDER BY user_id, created_at DESC
+                    """, (fallback,), fetch_all=True) or []
+                    queried.update({row['user_id']: row['tier_level'] for row in rows if row['tier_level']})
+            except Exception as e:
+                logger.error(f"批量获取用户等级失败: {e}")
+                queried = {}
+
+            for user_id in missing:
+                tier = queried.get(user_id, 'Bronze')
+                tiers[user_id] = tier
+                if CACHE_CONFIG.enabled:
+                    TIER_CACHE.set(user_id, tier, CACHE_CONFIG.tier_ttl_seconds)
+
+        return tiers
+
+    def get_all_user_ids(self) -> List[str]:
+        """获取所有有健康数据的用户ID"""
+        try:
+            rows = POSTGRES_POOL._execute_query(
+                "SELECT DISTINCT user_id FROM health_samples WHERE user_id IS NOT NULL ORDER BY user_id",
+                fetch_all=True
+            ) or []
+            return [row['user_id'] for row in rows]
+        except Exception as e:
+            logger.error(f"获取用户列表失败: {e}")
+            return []
@@ -2,14 +2,24 @@
 积分计算器基类
 """
 from abc import ABC, abstractmethod
-from typing import Dict, Optional
-from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from datetime import date, datetime
 from ...models.health_data import DailyHealthSummary, ScoreDimension
 
 
 class DimensionCalculator(ABC):
     """维度计算器抽象基类"""
     
+    # 用户等级积分倍数
+    LEVEL_MULTIPLIERS = {
+        'BRONZE': 1.0,
+        'SILVER': 1.2,
+        'GOLD': 1.5,
+        'PLATINUM': 2.0,
+        'DIAMOND': 3.0,
+        'AMBASSADOR': 5.0
+    }
+    
     def __init__(self):
         self.dimension = None
         self.rules = self.get_rules()
@@ -44,19 +54,63 @@ class DimensionCalculator(ABC):
         """
         pass
     
-    def check_chain_punishment(self, history_data: Dict[str, DailyHealthSummary]) -> Optional[Dict]:
+    def get_chain_rules(self) -> List[Dict]:
+        """
+        获取该维度负责判断的连锁失去反应规则
+        
+        Returns:
+            规则配置列表，每项包含：
+            rule: 规则名（所有维度中唯一）
+            kind: same_day / consecutive / reminder（见 core/chain_penalties.py）
+            trigger_days: 触发所需天数（reminder为窗口内累计天数）
+            window_days: reminder的窗口天数
+            recovery_days: consecutive修复所需连续天数
+            recovery_points: 修复后挽回的积分
+            affects: 触发后屏蔽的维度列表
+            recovery_dimension: 挽回积分记入的维度，默认为该维度
+            message / recovery_condition: 说明
+        """
+        return []
+    
+    def check_chain_conditions(self, rule: str, health_data: DailyHealthSummary) -> Tuple[bool, bool]:
         """
-        检查连锁惩罚
+        判断当天是否满足某条连锁规则的触发条件和修复条件
         
         Args:
-            history_data: 历史数据（日期字符串到汇总的映射）
+            rule: 规则名
+            health_data: 当天健康数据汇总
             
         Returns:
-            惩罚信息或None
+            (是否满足触发条件, 是否满足修复条件)
+        """
+        return False, False
+    
+    def get_streak_rule(self) -> Optional[Dict]:
+        """
+        获取超难级别的连续达标规则
+        
+        Returns:
+            {'rule': 规则名, 'continuous_days': 解锁所需连续天数, 'base_points': 解锁后每天的积分}，
+            None表示该维度没有连续达标规则
         """
-        # 子类可以重写此方法实现连锁惩罚逻辑
         return None
     
+    def check_streak_qualification(self, scores: Dict[str, int], health_data: Optional[DailyHealthSummary],
+                                   day: date, context: Dict) -> Tuple[bool, Dict]:
+        """
+        判断当天是否满足连续达标规则
+        
+        Args:
+            scores: 当天该维度的易、中、难积分
+            health_data: 当天健康数据汇总（从历史记录重建时可能为None）
+            day: 当天日期
+            context: 前一天结束时规则的滚动上下文
+            
+        Returns:
+            (是否达标, 当天结束时的滚动上下文)
+        """
+        return False, context
+    
     def apply_level_multiplier(self, base_score: int, user_level: str) -> int:
         """
         应用等级倍数
@@ -68,14 +122,5 @@ class DimensionCalculator(ABC):
         Returns:
             应用倍数后的积分
         """
-        multipliers = {
-            'BRONZE': 1.0,
-            'SILVER': 1.2,
-            'GOLD': 1.5,
-            'PLATINUM': 2.0,
-            'DIAMOND': 3.0,
-            'AMBASSADOR': 5.0
-        }
-        
-        multiplier = multipliers.get(user_level, 1.0)
+        multiplier = self.LEVEL_MULTIPLIERS.get(user_level, 1.0)
         return int(base_score * multiplier)
\ No newline at end of file
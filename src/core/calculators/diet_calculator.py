@@ -55,13 +55,19 @@ class DietCalculator(DimensionCalculator):
     
     def _calculate_easy(self, health_data: DailyHealthSummary) -> int:
         """计算易难度积分（喝水）"""
+        rules = self.rules['easy']['water']
+        
+        # 有每小时饮水位图时按实际有饮水记录的小时数计分
+        if health_data.water_hours is not None:
+            hours = min(health_data.water_hours, rules['max_hours'])
+            score = hours * rules['points_per_hour']
+            logger.info(f"饮水{health_data.water_ml}ml，分布在{health_data.water_hours}个小时，获得{score}分")
+            return score
+        
         if not health_data.water_ml:
             return 0
         
-        rules = self.rules['easy']['water']
-        
-        # 估算喝水的小时数（假设每次记录至少100ml）
-        # 这是一个简化的计算，实际应该基于详细的时间记录
+        # 没有位图时估算喝水的小时数（假设每次记录至少100ml）
         estimated_hours = min(int(health_data.water_ml / rules['min_ml_per_hour']), rules['max_hours'])
         score = estimated_hours * rules['points_per_hour']
         
@@ -1,8 +1,12 @@
 """
 运动维度积分计算器
 """
-from typing import Dict, Optional
+import threading
+from datetime import date
+from typing import Dict, List, Optional, Tuple
 from .base import DimensionCalculator
+from ..activity_masks import STRENGTH_MASK, activity_mask, covers_groups, next_context, previous_masks
+from ..hourly_bitmaps import stood_every_waking_hour
 from ...models.health_data import DailyHealthSummary, ScoreDimension
 from ...utils.logger import logger
 
@@ -13,6 +17,28 @@ class ExerciseCalculator(DimensionCalculator):
     def __init__(self):
         super().__init__()
         self.dimension = ScoreDimension.EXERCISE
+        # 当前计算的上下文（线程局部，计算器在线程池中共享）
+        self._context = threading.local()
+    
+    @property
+    def recent_activity_masks(self) -> List[int]:
+        """当前计算的前几天的运动类别位图（计算时传入，未传入时视为没有运动）"""
+        return getattr(self._context, 'recent_activity_masks', None) or []
+    
+    @recent_activity_masks.setter
+    def recent_activity_masks(self, value: Optional[List[int]]):
+        self._context.recent_activity_masks = value
+    
+    @staticmethod
+    def _activity_mask(health_data: Optional[DailyHealthSummary]) -> Optional[int]:
+        """当天的运动类别位图，没有运动类型数据时为None"""
+        if health_data is None:
+            return None
+        if health_data.activity_mask is not None:
+            return health_data.activity_mask
+        if health_data.workout_types is not None:
+            return activity_mask(health_data.workout_types)
+        return None
     
     def get_rules(self) -> Dict:
         """获取运动维度规则"""
@@ -47,11 +73,58 @@ class ExerciseCalculator(DimensionCalculator):
                     'continuous_days': 28,
                     'daily_points': 12000
                 }
-            }
+            },
+            'chain_punishment': [
+                {
+                    'rule': 'inactive',
+                    'kind': 'consecutive',
+                    'trigger_days': 5,
+                    'affects': ['exercise', 'cognition', 'mental', 'prevention'],
+                    'recovery_days': 3,
+                    'recovery_points': 3000,
+                    'message': '连续5天没有达到3000步或运动',
+                    'recovery_condition': '连续3天回归运动'
+                },
+                {
+                    'rule': 'inactive_2weeks',
+                    'kind': 'reminder',
+                    'trigger_days': 12,
+                    'window_days': 14,
+                    'affects': [],
+                    'message': '2周内累积12天没有达到3000步或运动，有代谢功能失调的风险'
+                },
+                {
+                    'rule': 'sedentary',
+                    'kind': 'same_day',
+                    'sedentary_hours': 10,
+                    'affects': ['exercise'],
+                    'recovery_points': 400,
+                    'message': '当天久坐超过10小时',
+                    'recovery_condition': '下一天清醒时段每小时都站起来1次'
+                },
+                {
+                    'rule': 'no_strength_10days',
+                    'kind': 'reminder',
+                    'trigger_days': 10,
+                    'window_days': 10,
+                    'affects': [],
+                    'message': '连续10天没有做力量运动，有肌肉和骨质疏松的风险'
+                }
+            ]
         }
     
-    def calculate(self, health_data: DailyHealthSummary) -> Dict[str, int]:
-        """计算运动积分"""
+    def calculate(self, health_data: DailyHealthSummary,
+                  recent_activity_masks: Optional[List[int]] = None) -> Dict[str, int]:
+        """
+        计算运动积分
+        
+        Args:
+            health_data: 当日健康数据汇总
+            recent_activity_masks: 前1天、前2天……的运动类别位图（见core/activity_masks.py的previous_masks），
+                                   None时每周多样性只看当天
+        """
+        self.recent_activity_masks = recent_activity_masks
+        
         scores = {
             'easy': 0,
             'medium': 0,
@@ -66,11 +139,10 @@ class ExerciseCalculator(DimensionCalculator):
         # 中：Zone 2/力量运动/其他运动
         scores['medium'] = self._calculate_medium(health_data)
         
-        # 难：每周包含3类运动
-        # TODO: 需要一周的数据
+        # 难：最近一周包含有氧、力量和柔韧3类运动
+        scores['hard'] = self._calculate_hard(health_data)
         
-        # 超难：每天都做与前2天不一样的运动并持续28天
-        # TODO: 需要历史数据
+        # 超难：每天都做与前2天不一样的运动并持续28天，由积分引擎根据连续达标状态计算
         
         # 计算总分
         scores['total'] = sum([scores[k] for k in ['easy', 'medium', 'hard', 'super_hard']])
@@ -81,13 +153,14 @@ class ExerciseCalculator(DimensionCalculator):
         """计算易难度积分"""
         total_score = 0
         
-        # 步数积分
-        if health_data.steps:
+        # 步数积分：运动期间的步数不计入（没有每日汇总缓存时使用总步数）
+        counted_steps = health_data.non_workout_steps if health_data.non_workout_steps is not None else health_data.steps
+        if counted_steps:
             step_rules = self.rules['easy']['steps']
-            steps = min(health_data.steps, step_rules['max_steps'])
+            steps = min(counted_steps, step_rules['max_steps'])
             step_score = int(steps * step_rules['points_per_step'])
             total_score += step_score
-            logger.info(f"步数{health_data.steps}，获得{step_score}分")
+            logger.info(f"步数{counted_steps}（总步数{health_data.steps}），获得{step_score}分")
         
         # 站立积分
         if health_data.stand_hours:
@@ -101,42 +174,88 @@ class ExerciseCalculator(DimensionCalculator):
     
     def _calculate_medium(self, health_data: DailyHealthSummary) -> int:
         """计算中难度积分"""
-        if not health_data.exercise_minutes:
+        # 有心率样本时按实际处于区间2的时长加力量类运动的时长计分（力量训练的心率很少处于区间2），
+        # 没有时回退到运动时间
+        if health_data.zone2_minutes is not None:
+            minutes = health_data.zone2_minutes + (health_data.strength_minutes or 0)
+        else:
+            minutes = health_data.exercise_minutes
+        if not minutes:
             return 0
         
         rules = self.rules['medium']['zone2_or_strength']
         
         # 将运动分钟数转换为30分钟的块数
-        blocks = min(health_data.exercise_minutes // 30, 4)  # 最多2小时
+        blocks = min(minutes // 30, 4)  # 最多2小时
         score = blocks * rules['points_per_30min']
         
-        logger.info(f"运动{health_data.exercise_minutes}分钟，获得{score}分")
+        if health_data.zone2_minutes is not None:
+            logger.info(f"Zone 2 {health_data.zone2_minutes}分钟、力量运动{health_data.strength_minutes or 0}分钟，获得{score}分")
+        else:
+            logger.info(f"运动{minutes}分钟，获得{score}分")
         return score
     
-    def check_chain_punishment(self, history_data: Dict[str, DailyHealthSummary]) -> Optional[Dict]:
-        """检查连锁惩罚"""
-        if len(history_data) < 5:
-            return None
+    def _calculate_hard(self, health_data: DailyHealthSummary) -> int:
+        """计算难难度积分：当天有运动，且包括当天在内的7天的位图之或覆盖所有要求的大类"""
+        today_mask = self._activity_mask(health_data)
+        if not today_mask:
+            return 0
+        
+        rules = self.rules['hard']['weekly_variety']
+        week_mask = today_mask
+        for mask in self.recent_activity_masks[:6]:
+            week_mask |= mask
+        if not covers_groups(week_mask, rules['required_types']):
+            return 0
+        
+        logger.info(f"最近7天包含{'、'.join(rules['required_types'])}运动，获得{rules['daily_points']}分")
+        return rules['daily_points']
+    
+    def get_streak_rule(self) -> Optional[Dict]:
+        """超难：每天都做与前2天不一样的运动并持续28天，之后每天持续达标都有积分"""
+        rules = self.rules['super_hard']['different_exercise_28days']
+        return {
+            'rule': 'super_hard',
+            'continuous_days': rules['continuous_days'],
+            'base_points': rules['daily_points']
+        }
+    
+    def check_streak_qualification(self, scores: Dict[str, int], health_data: Optional[DailyHealthSummary],
+                                   day: date, context: Dict) -> Tuple[bool, Dict]:
+        """
+        当天至少有一个运动类别没有在前2天出现过才算达标
+        
+        上下文中保存最近7天的运动类别位图（也用于难级别的每周多样性），没有运动类型数据的日期记为0
+        """
+        previous = previous_masks(context, day)
+        today_mask = self._activity_mask(health_data) or 0
+        qualified = bool(today_mask & ~(previous[0] | previous[1]))
+        return qualified, next_context(previous, day, today_mask)
+    
+    def get_chain_rules(self) -> List[Dict]:
+        """久坐不动和缺少力量运动相关的连锁规则"""
+        return self.rules['chain_punishment']
+    
+    def check_chain_conditions(self, rule: str, health_data: DailyHealthSummary) -> Tuple[bool, bool]:
+        """
+        不活动：步数不足3000且没有运动时间（修复条件为回归运动，没有步数和运动数据时不判断）；
+        久坐：清醒时段中既没有站立也不活跃的小时超过10个（修复条件为每小时都站立，没有站立和活动数据时不判断）；
+        缺少力量运动：当天的运动类型中没有力量训练（没有运动类型数据时不判断）
+        """
+        if rule == 'sedentary':
+            if health_data.sedentary_hours is None:
+                return False, False
+            threshold = next(r for r in self.get_chain_rules() if r['rule'] == rule)['sedentary_hours']
+            return health_data.sedentary_hours > threshold, stood_every_waking_hour(health_data.stand_bitmap)
+        
+        if rule == 'no_strength_10days':
+            mask = self._activity_mask(health_data)
+            if mask is None:
+                return False, False
+            has_strength = bool(mask & STRENGTH_MASK)
+            return not has_strength, has_strength
         
-        # 检查最近5天是否都没有达到3000步或运动
-        recent_dates = sorted(history_data.keys())[-5:]
-        inactive_days = 0
-        
-        for date in recent_dates:
-            summary = history_data[date]
-            steps = summary.steps or 0
-            exercise = summary.exercise_minutes or 0
-            
-            if steps < 3000 and exercise == 0:
-                inactive_days += 1
-        
-        if inactive_days >= 5:
-            return {
-                'type': 'inactive',
-                'message': '连续5天没有达到3000步或运动',
-                'affects': ['exercise', 'cognition', 'mental', 'prevention'],
-                'recovery_condition': '连续3天回归运动',
-                'recovery_points': 3000
-            }
-        
-        return None
\ No newline at end of file
+        if health_data.steps is None and health_data.exercise_minutes is None:
+            return False, False
+        inactive = (health_data.steps or 0) < 3000 and (health_data.exercise_minutes or 0) == 0
+        return inactive, not inactive
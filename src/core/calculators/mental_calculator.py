@@ -1,10 +1,12 @@
 """
 心理维度积分计算器
 """
-from typing import Dict, Optional
+import threading
+from typing import Dict, List, Optional, Tuple
 from .base import DimensionCalculator
 from ...models.health_data import DailyHealthSummary, ScoreDimension
 from ...utils.logger import logger
+from ...db.configs.global_config import HRV_BASELINE_CONFIG
 
 
 class MentalCalculator(DimensionCalculator):
@@ -13,7 +15,17 @@ class MentalCalculator(DimensionCalculator):
     def __init__(self):
         super().__init__()
         self.dimension = ScoreDimension.MENTAL
-        self.baseline_hrv = None  # 应该从用户历史数据计算
+        # 计算时的上下文按线程隔离，同一个计算器实例可被API线程池并发使用
+        self._context = threading.local()
+    
+    @property
+    def baseline_hrv(self) -> float:
+        """当前计算的用户HRV基线（计算时传入，未传入时为默认基线）"""
+        return getattr(self._context, 'baseline_hrv', None) or HRV_BASELINE_CONFIG.default_hrv
+    
+    @baseline_hrv.setter
+    def baseline_hrv(self, value: Optional[float]):
+        self._context.baseline_hrv = value
     
     def get_rules(self) -> Dict:
         """获取心理维度规则"""
@@ -28,11 +40,52 @@ class MentalCalculator(DimensionCalculator):
                 'hrv': {
                     'points': 3000  # HRV >= 平均值时获得
                 }
-            }
+            },
+            'chain_punishment': [
+                {
+                    'rule': 'hrv_drop',
+                    'kind': 'same_day',
+                    'baseline_ratio': 0.7,
+                    'affects': ['exercise'],
+                    'recovery_dimension': 'exercise',
+                    'recovery_sleep_hours': 7.5,
+                    'recovery_points': 600,
+                    'message': 'HRV低于基线的70%',
+                    'recovery_condition': '当晚睡够7.5小时'
+                },
+                {
+                    'rule': 'hrv_low',
+                    'kind': 'consecutive',
+                    'baseline_ratio': 0.6,
+                    'trigger_days': 7,
+                    'affects': ['mental', 'prevention'],
+                    'recovery_days': 7,
+                    'recovery_points': 5000,
+                    'message': '持续1周HRV低于基线的60%',
+                    'recovery_condition': '连续7天HRV回到基线的60%以上'
+                },
+                {
+                    'rule': 'hrv_low_6weeks',
+                    'kind': 'reminder',
+                    'baseline_ratio': 0.6,
+                    'trigger_days': 35,
+                    'window_days': 42,
+                    'affects': [],
+                    'message': '6周内累积35天HRV低于基线的60%，有衰老加速风险'
+                }
+            ]
         }
     
-    def calculate(self, health_data: DailyHealthSummary) -> Dict[str, int]:
-        """计算心理积分"""
+    def calculate(self, health_data: DailyHealthSummary, baseline_hrv: Optional[float] = None) -> Dict[str, int]:
+        """
+        计算心理积分
+        
+        Args:
+            health_data: 每日健康数据汇总
+            baseline_hrv: 用户的个人HRV基线（见 core/hrv_baseline.py），None时使用默认基线
+        """
+        self.baseline_hrv = baseline_hrv
+        
         scores = {
             'easy': 0,
             'medium': 0,
@@ -57,15 +110,30 @@ class MentalCalculator(DimensionCalculator):
         if not health_data.hrv:
             return 0
         
-        # TODO: 应该基于用户的历史HRV平均值
-        # 暂时使用固定值作为示例
-        if not self.baseline_hrv:
-            self.baseline_hrv = 50  # 毫秒，一般成年人的平均值
-        
         if health_data.hrv >= self.baseline_hrv:
             score = self.rules['medium']['hrv']['points']
             logger.info(f"HRV {health_data.hrv}ms >= 基线 {self.baseline_hrv}ms，获得{score}分")
             return score
         else:
             logger.info(f"HRV {health_data.hrv}ms < 基线 {self.baseline_hrv}ms，无积分")
-            return 0
\ No newline at end of file
+            return 0
+    
+    def get_chain_rules(self) -> List[Dict]:
+        """HRV低于基线相关的连锁规则"""
+        return self.rules['chain_punishment']
+    
+    def check_chain_conditions(self, rule: str, health_data: DailyHealthSummary) -> Tuple[bool, bool]:
+        """
+        触发条件为HRV低于基线的一定比例（没有HRV数据时不判断）；
+        hrv_drop的修复条件为当晚睡够7.5小时，其他规则为HRV回到该比例以上
+        """
+        config = next(item for item in self.rules['chain_punishment'] if item['rule'] == rule)
+        low = None
+        if health_data.hrv:
+            low = health_data.hrv < self.baseline_hrv * config['baseline_ratio']
+        
+        if 'recovery_sleep_hours' in config:
+            return bool(low), (health_data.sleep_hours or 0) >= config['recovery_sleep_hours']
+        if low is None:
+            return False, False
+        return low, not low
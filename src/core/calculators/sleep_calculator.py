@@ -1,8 +1,9 @@
 """
 睡眠维度积分计算器
 """
-from typing import Dict, Optional
-from datetime import datetime, timedelta, time
+import threading
+from typing import Dict, List, Optional, Tuple
+from datetime import date, datetime, timedelta, time
 from .base import DimensionCalculator
 from ...models.health_data import DailyHealthSummary, ScoreDimension
 from ...services.sleep_analysis_service import SleepAnalysisService
@@ -12,12 +13,42 @@ from ...utils.logger import logger
 class SleepCalculator(DimensionCalculator):
     """睡眠维度计算器"""
     
+    # 睡眠阶段数据源，可以改为None来使用所有数据源
+    SLEEP_STAGE_SOURCE = 'Oura'
+    
     def __init__(self):
         super().__init__()
         self.dimension = ScoreDimension.SLEEP
         self.sleep_service = SleepAnalysisService()
-        self.user_id = None  # 将在计算时设置
-        self.current_date = None  # 将在计算时设置
+        # 计算时的上下文按线程隔离，同一个计算器实例可被API线程池并发使用
+        self._context = threading.local()
+    
+    @property
+    def user_id(self) -> Optional[str]:
+        """当前计算的用户ID（将在计算时设置）"""
+        return getattr(self._context, 'user_id', None)
+    
+    @user_id.setter
+    def user_id(self, value: Optional[str]):
+        self._context.user_id = value
+    
+    @property
+    def current_date(self) -> Optional[datetime]:
+        """当前计算的日期（将在计算时设置）"""
+        return getattr(self._context, 'current_date', None)
+    
+    @current_date.setter
+    def current_date(self, value: Optional[datetime]):
+        self._context.current_date = value
+    
+    @property
+    def sleep_analysis(self) -> Optional[Dict]:
+        """当前计算的睡眠阶段分析（预先传入或首次查询后缓存）"""
+        return getattr(self._context, 'sleep_analysis', None)
+    
+    @sleep_analysis.setter
+    def sleep_analysis(self, value: Optional[Dict]):
+        self._context.sleep_analysis = value
     
     def get_rules(self) -> Dict:
         """获取睡眠维度规则"""
@@ -43,15 +74,38 @@ class SleepCalculator(DimensionCalculator):
                 'continuous_days': 15,
                 'base_points': 10000
             },
-            'chain_punishment': {
-                'condition': 'sleep_hours < 6 for 3 days',
-                'affects': ['sleep', 'exercise', 'cognition'],
-                'recovery': 'sleep_hours >= 7.5 for 6 days',
-                'recovery_points': 5000
-            }
+            'chain_punishment': [
+                {
+                    'rule': 'sleep_short',
+                    'kind': 'same_day',
+                    'affects': ['sleep'],
+                    'recovery_points': 500,
+                    'message': '当天睡眠不足6小时',
+                    'recovery_condition': '当晚睡够7.5小时'
+                },
+                {
+                    'rule': 'sleep_deficit',
+                    'kind': 'consecutive',
+                    'trigger_days': 3,
+                    'affects': ['sleep', 'exercise', 'cognition'],
+                    'recovery_days': 6,
+                    'recovery_points': 5000,
+                    'message': '连续3天睡眠不足6小时',
+                    'recovery_condition': '连续6天睡够7.5小时'
+                },
+                {
+                    'rule': 'sleep_deficit_4weeks',
+                    'kind': 'reminder',
+                    'trigger_days': 20,
+                    'window_days': 28,
+                    'affects': [],
+                    'message': '4周内累积20天睡眠不足6小时，有衰老加速风险'
+                }
+            ]
         }
     
-    def calculate(self, health_data: DailyHealthSummary, user_id: str = None, date: datetime = None) -> Dict[str, int]:
+    def calculate(self, health_data: DailyHealthSummary, user_id: str = None, date: datetime = None,
+                  sleep_analysis: Optional[Dict] = None) -> Dict[str, int]:
         """
         计算睡眠积分
         
@@ -59,10 +113,12 @@ class SleepCalculator(DimensionCalculator):
             health_data: 每日健康数据汇总
             user_id: 用户ID（用于查询睡眠阶段数据）
             date: 日期（用于查询睡眠阶段数据）
+            sleep_analysis: 预先取得的睡眠阶段分析结果（批量计算时传入，避免逐日查询）
         """
         # 设置用户ID和日期
         self.user_id = user_id or 'default_user'
         self.current_date = date or datetime.now()
+        self.sleep_analysis = sleep_analysis
         
         scores = {
             'easy': 0,
@@ -82,8 +138,7 @@ class SleepCalculator(DimensionCalculator):
         if scores['easy'] > 0 and scores['medium'] > 0:
             scores['hard'] = self._calculate_hard_with_time_limits()
         
-        # 超难：易中难持续15天
-        # TODO: 需要历史数据支持
+        # 超难：易中难持续15天，由积分引擎根据连续达标状态计算
         
         # 计算总分
         scores['total'] = sum([scores[k] for k in ['easy', 'medium', 'hard', 'super_hard']])
@@ -127,11 +182,7 @@ class SleepCalculator(DimensionCalculator):
         
         # 获取睡眠阶段分析
         # 优先使用Oura数据，因为它有完整的睡眠阶段信息
-        analysis = self.sleep_service.analyze_sleep_stages(
-            self.user_id, 
-            self.current_date,
-            source_filter='Oura'  # 可以改为None来使用所有数据源
-        )
+        analysis = self._get_sleep_analysis()
         
         if not analysis['has_data']:
             logger.info("没有睡眠阶段数据，中级别积分为0")
@@ -164,6 +215,17 @@ class SleepCalculator(DimensionCalculator):
             logger.info("深度睡眠和REM睡眠都未达标，中级别积分为0")
             return 0
     
+    def _get_sleep_analysis(self) -> Dict:
+        """获取当前用户和日期的睡眠阶段分析（优先使用预先传入的结果）"""
+        if self.sleep_analysis is None:
+            # 中、难两个级别共用同一次查询结果
+            self.sleep_analysis = self.sleep_service.analyze_sleep_stages(
+                self.user_id,
+                self.current_date,
+                source_filter=self.SLEEP_STAGE_SOURCE
+            )
+        return self.sleep_analysis
+    
     def _calculate_hard_with_time_limits(self) -> int:
         """
         计算难难度积分（入睡和起床时间限制）
@@ -173,11 +235,7 @@ class SleepCalculator(DimensionCalculator):
             return 0
         
         # 获取睡眠时间详情
-        time_details = self.sleep_service.get_sleep_time_details(
-            self.user_id,
-            self.current_date,
-            source_filter='Oura'  # 可以改为None来使用所有数据源
-        )
+        time_details = self.sleep_service.evaluate_sleep_time_targets(self._get_sleep_analysis())
         
         if not time_details['has_data']:
             logger.info("没有睡眠时间数据，难级别积分为0")
@@ -214,6 +272,20 @@ class SleepCalculator(DimensionCalculator):
             logger.info("入睡和起床时间都未达标，难级别积分为0")
             return 0
     
+    def get_streak_rule(self) -> Optional[Dict]:
+        """超难：易中难持续15天，之后每天持续达标都有积分"""
+        rules = self.rules['super_hard']
+        return {
+            'rule': 'super_hard',
+            'continuous_days': rules['continuous_days'],
+            'base_points': rules['base_points']
+        }
+    
+    def check_streak_qualification(self, scores: Dict[str, int], health_data: Optional[DailyHealthSummary],
+                                   day: date, context: Dict) -> Tuple[bool, Dict]:
+        """易、中、难三个级别当天都获得积分才算达标"""
+        return all(scores.get(level, 0) > 0 for level in ('easy', 'medium', 'hard')), context
+    
     def _calculate_medium(self, health_data: DailyHealthSummary) -> int:
         """
         旧的中难度积分计算（保留兼容性）
@@ -240,28 +312,13 @@ class SleepCalculator(DimensionCalculator):
         logger.info("入睡和起床时间数据暂不可用（旧方法）")
         return 0
     
-    def check_chain_punishment(self, history_data: Dict[str, DailyHealthSummary]) -> Optional[Dict]:
-        """检查连锁惩罚"""
-        if len(history_data) < 3:
-            return None
-        
-        # 获取最近3天的数据
-        recent_dates = sorted(history_data.keys())[-3:]
-        sleep_insufficient_days = 0
-        
-        for date in recent_dates:
-            summary = history_data[date]
-            if summary.sleep_hours and summary.sleep_hours < 6:
-                sleep_insufficient_days += 1
-        
-        # 如果连续3天睡眠不足6小时
-        if sleep_insufficient_days >= 3:
-            return {
-                'type': 'sleep_insufficient',
-                'message': '连续3天睡眠不足6小时',
-                'affects': ['sleep', 'exercise', 'cognition'],
-                'recovery_condition': '连续6天睡够7.5小时',
-                'recovery_points': 5000
-            }
-        
-        return None
\ No newline at end of file
+    def get_chain_rules(self) -> List[Dict]:
+        """睡眠不足相关的连锁规则"""
+        return self.rules['chain_punishment']
+    
+    def check_chain_conditions(self, rule: str, health_data: DailyHealthSummary) -> Tuple[bool, bool]:
+        """触发条件为睡眠不足6小时，修复条件为睡够7.5小时（没有睡眠数据时都不满足）"""
+        sleep_hours = health_data.sleep_hours
+        if not sleep_hours:
+            return False, False
+        return sleep_hours < self.rules['easy']['min_hours'], sleep_hours >= self.rules['easy']['target_hours']
@@ -0,0 +1,166 @@
+"""
+连锁失去反应（惩罚与修复）规则引擎
+每条规则是一个按天推进的滚动计数器，每计算一天只根据前一天结束时的状态推进一步，不需要扫描历史
+
+规则类型：
+- same_day: 当天满足触发条件时屏蔽受影响维度，次日满足修复条件时挽回积分
+- consecutive: 连续trigger_days天满足触发条件后屏蔽受影响维度，直到连续recovery_days天满足修复条件并挽回积分
+- reminder: 最近window_days天中满足触发条件的天数达到trigger_days时提醒，不影响积分
+"""
+from datetime import date
+from typing import Dict, List
+
+from ..models.chain_penalty import ChainCounterState
+from ..models.health_data import DailyHealthSummary
+from ..utils.logger import logger
+
+
+DIFFICULTIES = ['easy', 'medium', 'hard', 'super_hard']
+
+
+def advance_chain(previous: ChainCounterState, day: date, triggered: bool, recovering: bool,
+                  rule: Dict) -> ChainCounterState:
+    """
+    根据前一天结束时的状态和当天的条件，得到当天结束时的状态
+
+    Args:
+        previous: 前一天（或更早）结束时的状态
+        day: 当天日期
+        triggered: 当天是否满足触发条件
+        recovering: 当天是否满足修复条件
+        rule: 规则配置
+
+    Returns:
+        当天结束时的状态
+    """
+    gap = (day - previous.last_scored_date).days if previous.last_scored_date else None
+    consecutive = gap == 1
+
+    # 滑动窗口：按间隔天数左移（未计算的日期记为未触发），超出窗口的位丢弃
+    window_days = rule.get('window_days', rule.get('trigger_days', 1))
+    shift = gap if gap and 0 < gap < window_days else window_days
+    window_mask = ((previous.window_mask << shift) | int(triggered)) & ((1 << window_days) - 1)
+
+    trigger_length = (previous.trigger_length + 1 if consecutive else 1) if triggered else 0
+    recovery_length = 0
+    recovered_points = 0
+    kind = rule['kind']
+
+    if kind == 'same_day':
+        if previous.active and consecutive and recovering:
+            recovered_points = rule['recovery_points']
+        active = triggered
+        blocked = triggered
+    elif kind == 'consecutive':
+        if previous.active:
+            recovery_length = (previous.recovery_length + 1 if consecutive else 1) if recovering else 0
+            if recovery_length >= rule['recovery_days']:
+                active = False
+                recovery_length = 0
+                recovered_points = rule['recovery_points']
+            else:
+                active = True
+        else:
+            active = trigger_length >= rule['trigger_days']
+        blocked = active
+    else:
+        active = bin(window_mask).count('1') >= rule['trigger_days']
+        blocked = False
+
+    return ChainCounterState(
+        rule=previous.rule,
+        dimension=previous.dimension,
+        trigger_length=trigger_length,
+        recovery_length=recovery_length,
+        active=active,
+        window_mask=window_mask,
+        last_scored_date=day,
+        blocked=blocked,
+        recovered_points=recovered_points,
+    )
+
+
+def _advance_all(calculators: Dict, health_summary: DailyHealthSummary, day: date,
+                 states: Dict[str, ChainCounterState]) -> Dict[str, ChainCounterState]:
+    """用当天数据推进所有计算器的所有规则"""
+    advanced = {}
+    for dimension, calculator in calculators.items():
+        for rule in calculator.get_chain_rules():
+            name = rule['rule']
+            previous = states.get(name) or ChainCounterState(rule=name, dimension=dimension.value)
+            triggered, recovering = calculator.check_chain_conditions(name, health_summary)
+            advanced[name] = advance_chain(previous, day, triggered, recovering, rule)
+    return advanced
+
+
+def seed_chain_states(calculators: Dict, history_data: Dict[str, DailyHealthSummary]) -> Dict[str, ChainCounterState]:
+    """
+    没有已保存状态的用户，用之前几天的汇总按日期顺序推进一遍，得到初始状态
+
+    Args:
+        calculators: 维度到计算器的字典
+        history_data: 日期字符串到汇总的映射
+
+    Returns:
+        规则名到状态的字典
+    """
+    states: Dict[str, ChainCounterState] = {}
+    for key in sorted(history_data):
+        summary = history_data[key]
+        states = _advance_all(calculators, summary, summary.date.date(), states)
+    return states
+
+
+def apply_chain_rules(calculators: Dict, dimension_scores: Dict[str, Dict], health_summary: DailyHealthSummary,
+                      user_id: str, day: date, chain_states: Dict[str, ChainCounterState]) -> None:
+    """
+    推进当天的连锁规则计数器，并对各维度积分（应用等级倍数前）应用跨维度屏蔽和修复积分
+
+    屏蔽的维度各级别积分清零并记录blocked_by；挽回的积分记入恢复维度的recovery字段。
+    各规则当天结束时的状态保存在所属维度积分的'chain'字段中。
+
+    Args:
+        calculators: 维度到计算器的字典
+        dimension_scores: 维度名到各级别积分的字典（会被修改）
+        health_summary: 当日健康数据汇总
+        user_id: 用户ID
+        day: 日期
+        chain_states: 规则名到前一天结束时状态的字典
+    """
+    states = _advance_all(calculators, health_summary, day, chain_states)
+
+    blocked_by: Dict[str, List[str]] = {}
+    recovery: Dict[str, int] = {}
+    for calculator in calculators.values():
+        for rule in calculator.get_chain_rules():
+            name = rule['rule']
+            state = states[name]
+            dimension_scores[state.dimension].setdefault('chain', {})[name] = state.to_details()
+
+            if state.blocked:
+                for dimension in rule['affects']:
+                    blocked_by.setdefault(dimension, []).append(name)
+            if state.recovered_points:
+                target = rule.get('recovery_dimension', state.dimension)
+                recovery[target] = recovery.get(target, 0) + state.recovered_points
+                logger.info(f"用户{user_id}在{day}满足修复条件（{rule['recovery_condition']}），挽回{state.recovered_points}分")
+            previous = chain_states.get(name)
+            if state.active and not (previous and previous.active):
+                logger.warning(f"用户{user_id}在{day}触发{rule['message']}")
+
+    for dimension, rules in blocked_by.items():
+        # 没有计算器的维度（如认知能力、疾病预防）暂不计分，只在规则明细中体现
+        scores = dimension_scores.get(dimension)
+        if scores is None:
+            continue
+        for difficulty in DIFFICULTIES + ['total']:
+            scores[difficulty] = 0
+        scores['blocked_by'] = rules
+
+    for dimension, points in recovery.items():
+        scores = dimension_scores.get(dimension)
+        if scores is None:
+            continue
+        scores['recovery'] = scores.get('recovery', 0) + points
+        scores['total'] += points
+
@@ -0,0 +1,66 @@
+"""
+每小时活动位图
+每个用户每天的站立、饮水和活跃各记为一个24位整数（第h位表示h点到h+1点），
+站立小时数、饮水小时数和久坐小时数只需对位图做位运算和计数，不再按小时分组查询原始样本
+"""
+from typing import Optional
+
+import numpy as np
+
+from ..db.configs.global_config import HOURLY_ACTIVITY_CONFIG
+
+
+HOURS_PER_DAY = 24
+SECONDS_PER_HOUR = 3600
+
+
+def hour_range_mask(start_hour: int, end_hour: int) -> int:
+    """[start_hour, end_hour) 各小时的位图"""
+    return ((1 << end_hour) - 1) & ~((1 << start_hour) - 1)
+
+
+def popcount(mask: Optional[int]) -> int:
+    """位图中置位的小时数"""
+    return bin(mask).count('1') if mask else 0
+
+
+def hourly_bitmaps_by_day(user_index: np.ndarray, seconds: np.ndarray, values: np.ndarray,
+                          n_users: int, n_days: int, min_total: float = 0.0) -> np.ndarray:
+    """
+    整批计算各用户日的小时位图：样本按开始时间归入小时，一小时内的值之和为正且不小于min_total的小时置位
+
+    Args:
+        user_index: 各样本的用户下标
+        seconds: 各样本开始时间距第一天0点的秒数（范围外的样本被忽略）
+        values: 各样本的值
+        n_users: 用户数
+        n_days: 天数
+        min_total: 小时内的值之和需达到此值
+
+    Returns:
+        (n_users, n_days) 的int64位图数组
+    """
+    hour_index = np.floor_divide(seconds, SECONDS_PER_HOUR).astype(np.int64)
+    keep = (hour_index >= 0) & (hour_index < n_days * HOURS_PER_DAY)
+    slots = user_index[keep].astype(np.int64) * n_days * HOURS_PER_DAY + hour_index[keep]
+    totals = np.bincount(slots, weights=values[keep], minlength=n_users * n_days * HOURS_PER_DAY)
+
+    hours = ((totals > 0) & (totals >= min_total)).reshape(n_users, n_days, HOURS_PER_DAY).astype(np.int64)
+    return (hours << np.arange(HOURS_PER_DAY, dtype=np.int64)).sum(axis=2)
+
+
+def waking_mask() -> int:
+    """统计久坐的清醒时段位图"""
+    return hour_range_mask(HOURLY_ACTIVITY_CONFIG.waking_start_hour, HOURLY_ACTIVITY_CONFIG.waking_end_hour)
+
+
+def sedentary_hours(stand_bitmap: Optional[int], active_bitmap: Optional[int]) -> Optional[int]:
+    """清醒时段中既没有站立也不活跃的小时数，两种数据都没有时为None"""
+    if stand_bitmap is None and active_bitmap is None:
+        return None
+    return popcount(waking_mask() & ~((stand_bitmap or 0) | (active_bitmap or 0)))
+
+
+def stood_every_waking_hour(stand_bitmap: Optional[int]) -> bool:
+    """清醒时段的每个小时是否都有站立"""
+    return stand_bitmap is not None and waking_mask() & ~stand_bitmap == 0
@@ -0,0 +1,91 @@
+"""
+心率区间计算
+用NumPy数组整批计算多个用户多天的各心率区间时长，不逐个样本循环
+
+每个心率样本从其时间点持续到同一用户同一天的下一个样本（最长max_sample_gap_seconds），
+最后一个样本最长持续到当天结束。区间按最大心率的比例划分，最大心率优先使用用户设置的值，
+否则按年龄估算（220 - 年龄）。
+"""
+from typing import Optional
+
+import numpy as np
+
+from ..db.configs.global_config import HR_ZONE_CONFIG
+
+
+SECONDS_PER_DAY = 86400
+ZONE2_INDEX = 1  # zone_bounds中区间2的下标
+
+
+def resolve_max_heart_rate(max_heart_rate: Optional[int], birth_year: Optional[int], year: int) -> int:
+    """
+    得到用户用于划分区间的最大心率
+
+    Args:
+        max_heart_rate: 用户设置（或测得）的最大心率
+        birth_year: 出生年份
+        year: 计算日期所在的年份
+
+    Returns:
+        最大心率（次/分）
+    """
+    if max_heart_rate:
+        return int(max_heart_rate)
+    age = year - birth_year if birth_year else HR_ZONE_CONFIG.default_age
+    return 220 - age
+
+
+def zone_minutes_by_day(user_index: np.ndarray, seconds: np.ndarray, bpm: np.ndarray,
+                        max_heart_rates: np.ndarray, n_days: int) -> np.ndarray:
+    """
+    计算每个用户每天在各心率区间的分钟数
+
+    Args:
+        user_index: 每个样本所属用户的下标（0..n_users-1）
+        seconds: 每个样本距第一天0点的秒数
+        bpm: 每个样本的心率
+        max_heart_rates: 每个用户的最大心率，长度为n_users
+        n_days: 天数，超出范围的样本被忽略
+
+    Returns:
+        形状为 (n_users, n_days, 区间数) 的分钟数数组
+    """
+    bounds = np.asarray(HR_ZONE_CONFIG.zone_bounds, dtype=np.float64)
+    n_users = len(max_heart_rates)
+    n_zones = len(bounds)
+    n_groups = n_users * n_days
+
+    user_index = np.asarray(user_index, dtype=np.int64)
+    seconds = np.asarray(seconds, dtype=np.float64)
+    bpm = np.asarray(bpm, dtype=np.float64)
+
+    day_index = np.floor_divide(seconds, SECONDS_PER_DAY).astype(np.int64)
+    in_range = (day_index >= 0) & (day_index < n_days) & np.isfinite(bpm)
+    groups = user_index[in_range] * n_days + day_index[in_range]
+    offsets = seconds[in_range] - day_index[in_range] * SECONDS_PER_DAY
+    bpm = bpm[in_range]
+    if groups.size == 0:
+        return np.zeros((n_users, n_days, n_zones))
+
+    # 按(用户日, 时间)排序，每个样本持续到同组的下一个样本，组内最后一个样本持续到当天结束
+    order = np.lexsort((offsets, groups))
+    groups = groups[order]
+    offsets = offsets[order]
+    bpm = bpm[order]
+
+    next_offsets = np.empty_like(offsets)
+    next_offsets[:-1] = offsets[1:]
+    last_in_group = np.ones(groups.size, dtype=bool)
+    last_in_group[:-1] = groups[1:] != groups[:-1]
+    next_offsets[last_in_group] = SECONDS_PER_DAY
+    durations = np.clip(next_offsets - offsets, 0, HR_ZONE_CONFIG.max_sample_gap_seconds)
+
+    # 心率占最大心率的比例落在哪个区间，-1表示低于区间1
+    max_hr = np.asarray(max_heart_rates, dtype=np.float64)[groups // n_days]
+    zones = np.searchsorted(bounds, bpm / max_hr, side='right') - 1
+    valid = zones >= 0
+
+    seconds_in_zone = np.bincount(
+        groups[valid] * n_zones + zones[valid], weights=durations[valid], minlength=n_groups * n_zones
+    )
+    return seconds_in_zone.reshape(n_users, n_days, n_zones) / 60
@@ -0,0 +1,59 @@
+"""
+个人HRV基线
+每计算一天用当天的每日HRV增量更新一次：指数加权平均作为基线，最近若干天的中位数用于过滤异常值
+"""
+from datetime import date
+from statistics import median
+from typing import Optional
+
+from ..models.hrv_baseline import HrvBaselineState
+from ..db.configs.global_config import HRV_BASELINE_CONFIG
+
+
+def resolve_baseline(state: Optional[HrvBaselineState]) -> float:
+    """
+    得到用于比较的基线值
+
+    Args:
+        state: 前一天结束时的基线状态，None表示没有状态
+
+    Returns:
+        有数据的天数达到min_days后为个人基线（指数加权平均），否则为默认基线
+    """
+    if state is None or state.ewma is None or state.sample_days < HRV_BASELINE_CONFIG.min_days:
+        return HRV_BASELINE_CONFIG.default_hrv
+    return round(state.ewma, 2)
+
+
+def update_hrv_baseline(previous: HrvBaselineState, day: date, hrv: Optional[float]) -> HrvBaselineState:
+    """
+    用当天的每日HRV更新基线状态（当天的HRV不影响当天使用的基线）
+
+    Args:
+        previous: 前一天（或更早）结束时的状态
+        day: 当天日期
+        hrv: 当天的每日HRV，None或0表示当天没有数据
+
+    Returns:
+        当天结束时的状态
+    """
+    if not hrv or hrv <= 0:
+        return previous.model_copy(update={'last_scored_date': day, 'updated_at': None})
+
+    window = previous.window
+    sample = float(hrv)
+    if window and previous.sample_days >= HRV_BASELINE_CONFIG.min_days:
+        # 单日异常值（如佩戴不当）只按中位数附近的值计入平均
+        center = median(window)
+        ratio = HRV_BASELINE_CONFIG.outlier_ratio
+        sample = min(max(sample, center * (1 - ratio)), center * (1 + ratio))
+
+    alpha = 2 / (HRV_BASELINE_CONFIG.span_days + 1)
+    ewma = sample if previous.ewma is None else alpha * sample + (1 - alpha) * previous.ewma
+
+    return HrvBaselineState(
+        ewma=round(ewma, 4),
+        window=(window + [round(float(hrv), 2)])[-HRV_BASELINE_CONFIG.window_days:],
+        sample_days=previous.sample_days + 1,
+        last_scored_date=day,
+    )
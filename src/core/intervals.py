@@ -0,0 +1,80 @@
+"""
+区间运算
+对按开始时间排序的样本区间和排除区间做线性扫描（O(n + m)），用于从按时段记录的累计值中扣除某些时段（如运动期间的步数）
+"""
+from typing import List, Sequence, Tuple
+
+
+Interval = Tuple[float, float]
+
+
+def merge_intervals(intervals: Sequence[Interval]) -> List[Interval]:
+    """
+    合并按开始时间排序的区间中重叠或相接的部分
+
+    Args:
+        intervals: 按开始时间排序的 (开始, 结束) 列表
+
+    Returns:
+        互不重叠、按开始时间排序的区间列表
+    """
+    merged: List[Interval] = []
+    for start, end in intervals:
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def remaining_fractions(samples: Sequence[Tuple[float, float, float]], excluded: Sequence[Interval]) -> List[float]:
+    """
+    计算每个样本不落在排除区间内的时长比例
+
+    样本和排除区间都只扫描一遍：排除区间的指针只向前移动，
+    每个样本只检查与其重叠的排除区间。瞬时样本（开始等于结束）落在排除区间内时比例为0。
+
+    Args:
+        samples: 按开始时间排序的 (开始, 结束, 值) 列表
+        excluded: 按开始时间排序的排除区间 (开始, 结束) 列表
+
+    Returns:
+        与samples对应的比例列表（0到1）
+    """
+    cuts = merge_intervals(excluded)
+    fractions: List[float] = []
+    j = 0
+    for start, end, _ in samples:
+        # 样本按开始时间排序，结束不晚于当前样本开始的排除区间与之后的样本也不重叠
+        while j < len(cuts) and cuts[j][1] <= start:
+            j += 1
+
+        if end <= start:
+            inside = j < len(cuts) and cuts[j][0] <= start
+            fractions.append(0.0 if inside else 1.0)
+            continue
+
+        overlap = 0.0
+        k = j
+        while k < len(cuts) and cuts[k][0] < end:
+            overlap += min(end, cuts[k][1]) - max(start, cuts[k][0])
+            k += 1
+        fractions.append(1 - overlap / (end - start))
+    return fractions
+
+
+def subtract_intervals(samples: Sequence[Tuple[float, float, float]], excluded: Sequence[Interval]) -> float:
+    """
+    计算样本值之和，扣除落在排除区间内的部分（按重叠时长比例分摊）
+
+    Args:
+        samples: 按开始时间排序的 (开始, 结束, 值) 列表
+        excluded: 按开始时间排序的排除区间 (开始, 结束) 列表
+
+    Returns:
+        扣除后的总值
+    """
+    fractions = remaining_fractions(samples, excluded)
+    return sum(value * fraction for (_, _, value), fraction in zip(samples, fractions))
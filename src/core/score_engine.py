@@ -3,22 +3,159 @@
 整合所有维度的计算器，提供统一的积分计算接口
 """
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from ..models.health_data import DailyHealthSummary, ScoreDimension
+from ..models.streak import StreakState
+from ..models.hrv_baseline import HrvBaselineState
+from ..models.rolling_state import RollingStates
 from ..services.health_data_service import HealthDataService
 from ..services.score_persistence_service import ScorePersistenceService
+from ..services.dirty_days_service import DirtyDaysService
+from ..services.rolling_state_service import RollingStateService
+from .calculators.base import DimensionCalculator
 from .calculators.sleep_calculator import SleepCalculator
 from .calculators.exercise_calculator import ExerciseCalculator
 from .calculators.diet_calculator import DietCalculator
 from .calculators.mental_calculator import MentalCalculator
 from .score_config import calculate_percentage, DIMENSION_MAX_SCORES
+from .streaks import advance_streak
+from .chain_penalties import apply_chain_rules, seed_chain_states
+from .hrv_baseline import resolve_baseline, update_hrv_baseline
+from .activity_masks import previous_masks
+from ..utils.cache import cached_daily, invalidate_user_dates, TIER_CACHE
+from ..utils.singleflight import coalesce_daily
 from ..utils.logger import logger
 from ..db.postgresql import POSTGRES_POOL
+from ..db.configs.global_config import CACHE_CONFIG
+
+
+def build_calculators() -> Dict[ScoreDimension, DimensionCalculator]:
+    """创建所有维度的计算器"""
+    return {
+        ScoreDimension.SLEEP: SleepCalculator(),
+        ScoreDimension.EXERCISE: ExerciseCalculator(),
+        ScoreDimension.DIET: DietCalculator(),
+        ScoreDimension.MENTAL: MentalCalculator(),
+        # TODO: 添加其他维度计算器
+    }
+
+
+def score_dimensions(calculators: Dict[ScoreDimension, DimensionCalculator],
+                     health_summary: DailyHealthSummary,
+                     history_data: Dict[str, DailyHealthSummary],
+                     user_id: str, date: datetime, user_tier: str,
+                     sleep_analysis: Optional[Dict] = None,
+                     rolling_states: Optional[RollingStates] = None) -> Tuple[Dict[str, Dict], int]:
+    """
+    用已取得的数据计算一个用户一天的各维度积分
+    
+    Args:
+        calculators: 维度到计算器的字典
+        health_summary: 当日健康数据汇总
+        history_data: 之前几天的健康数据汇总（没有连锁规则状态时用于得到初始状态）
+        user_id: 用户ID
+        date: 日期
+        user_tier: 用户等级
+        sleep_analysis: 预先取得的睡眠阶段分析，None时由睡眠计算器自行查询
+        rolling_states: 前一天结束时的滚动状态，None时不计算超难级别、不应用连锁规则并使用默认HRV基线；
+                        计算后当天的状态保存在各维度积分的'streak'、'chain'和'hrv_baseline'字段中
+                        （可用RollingStates.from_scores还原）
+        
+    Returns:
+        (各维度积分字典, 总积分)
+    """
+    dimension_scores = {}
+    total_score = 0
+    day = date.date()
+    baseline_hrv = resolve_baseline(rolling_states.hrv_baseline) if rolling_states is not None else None
+    
+    for dimension, calculator in calculators.items():
+        # 计算基础积分
+        # 为睡眠计算器传递额外参数
+        if dimension == ScoreDimension.SLEEP:
+            scores = calculator.calculate(health_summary, user_id=user_id, date=date,
+                                          sleep_analysis=sleep_analysis)
+        elif dimension == ScoreDimension.EXERCISE:
+            # 每周多样性使用连续达标上下文中保存的前几天的运动类别位图
+            streak = rolling_states.streaks.get(dimension.value) if rolling_states is not None else None
+            scores = calculator.calculate(
+                health_summary, recent_activity_masks=previous_masks(streak.context if streak else None, day)
+            )
+        elif dimension == ScoreDimension.MENTAL:
+            scores = calculator.calculate(health_summary, baseline_hrv=baseline_hrv)
+        else:
+            scores = calculator.calculate(health_summary)
+        
+        # 超难：根据前一天的连续达标状态推进一步
+        streak_rule = calculator.get_streak_rule()
+        if streak_rule and rolling_states is not None:
+            previous = rolling_states.streaks.get(dimension.value) or StreakState(
+                dimension=dimension.value, rule=streak_rule['rule']
+            )
+            qualified, context = calculator.check_streak_qualification(
+                scores, health_summary, day, previous.context
+            )
+            state = advance_streak(previous, day, qualified, streak_rule['continuous_days'], context)
+            if state.unlocked:
+                scores['super_hard'] = streak_rule['base_points']
+                scores['total'] = sum(scores[k] for k in ['easy', 'medium', 'hard', 'super_hard'])
+            scores['streak'] = state.to_details()
+        
+        dimension_scores[dimension.value] = scores
+    
+    if rolling_states is not None:
+        # 连锁失去反应：推进规则计数器，应用跨维度屏蔽和修复积分
+        chain_states = rolling_states.chains
+        if not chain_states and history_data:
+            chain_states = seed_chain_states(calculators, history_data)
+        apply_chain_rules(calculators, dimension_scores, health_summary, user_id, day, chain_states)
+        
+        # 用当天的HRV更新个人基线（当天使用的是更新前的基线）
+        mental_scores = dimension_scores.get(ScoreDimension.MENTAL.value)
+        if mental_scores is not None:
+            baseline = update_hrv_baseline(rolling_states.hrv_baseline or HrvBaselineState(), day, health_summary.hrv)
+            mental_scores['hrv_baseline'] = {**baseline.to_details(), 'baseline': baseline_hrv}
+    
+    # 应用等级倍数
+    for dimension, calculator in calculators.items():
+        scores = dimension_scores[dimension.value]
+        scores['total'] = calculator.apply_level_multiplier(scores['total'], user_tier)
+        total_score += scores['total']
+    
+    return dimension_scores, total_score
+
+
+def has_rolling_state(dimension_scores: Dict[str, Dict]) -> bool:
+    """
+    当天结束时是否有需要随积分记录保存的滚动状态
+    
+    总积分为0的日期（如被连锁规则屏蔽）只有在状态非空时才需要保存，
+    重算之后的日期时从这条记录还原状态；没有记录时还原为空状态，结果相同。
+    """
+    for scores in dimension_scores.values():
+        streak = scores.get('streak') or {}
+        if streak.get('length') or streak.get('context'):
+            return True
+        for counter in (scores.get('chain') or {}).values():
+            if counter['trigger_length'] or counter['recovery_length'] or counter['active'] or counter['window_mask']:
+                return True
+        if (scores.get('hrv_baseline') or {}).get('sample_days'):
+            return True
+    return False
+
+
+def _saves_to_db(engine: 'ScoreEngine', user_id: str, date: datetime, save_to_db: Optional[bool] = None,
+                 user_tier: Optional[str] = None) -> bool:
+    """按calculate_daily_score的参数解析本次计算是否保存到数据库"""
+    return save_to_db if save_to_db is not None else engine.auto_save
 
 
 class ScoreEngine:
     """积分计算引擎"""
     
+    # 没有连锁规则计数器时用于得到初始状态的历史天数，也是增量重算时向后展开的天数
+    HISTORY_DAYS = 7
+    
     def __init__(self, auto_save: bool = True):
         """
         初始化积分引擎
@@ -28,21 +165,21 @@ class ScoreEngine:
         """
         self.health_service = HealthDataService()
         self.persistence_service = ScorePersistenceService()
+        self.dirty_days_service = DirtyDaysService()
+        self.rolling_state_service = RollingStateService()
         self.auto_save = auto_save
         
         # 初始化所有计算器
-        self.calculators = {
-            ScoreDimension.SLEEP: SleepCalculator(),
-            ScoreDimension.EXERCISE: ExerciseCalculator(),
-            ScoreDimension.DIET: DietCalculator(),
-            ScoreDimension.MENTAL: MentalCalculator(),
-            # TODO: 添加其他维度计算器
-        }
+        self.calculators = build_calculators()
         
         # 用户等级（暂时硬编码为BRONZE）
         self.user_level = 'BRONZE'
     
-    def calculate_daily_score(self, user_id: str, date: datetime, save_to_db: Optional[bool] = None) -> Dict:
+    # 保存到数据库的计算每次都执行（不读取缓存），也不与只计算不保存的调用合并
+    @cached_daily("daily_score", bypass=_saves_to_db)
+    @coalesce_daily("daily_score", variant=_saves_to_db)
+    def calculate_daily_score(self, user_id: str, date: datetime, save_to_db: Optional[bool] = None,
+                              user_tier: Optional[str] = None) -> Dict:
         """
         计算指定日期的积分
         
@@ -50,54 +187,32 @@ class ScoreEngine:
             user_id: 用户ID
             date: 日期
             save_to_db: 是否保存到数据库，None时使用auto_save设置
+            user_tier: 已解析的用户等级（范围计算时由调用方传入），None时自动获取
             
         Returns:
             积分结果字典
         """
         # 获取用户等级
-        user_tier = self._get_user_tier(user_id)
+        if user_tier is None:
+            user_tier = self._get_user_tier(user_id)
         
         # 获取当日健康数据汇总
         health_summary = self.health_service.get_daily_summary(user_id, date)
         
-        # 获取历史数据（用于连锁反应检查）
-        history_data = self._get_history_data(user_id, date, days=7)
+        # 获取前一天结束时的滚动状态（连续达标、连锁规则计数器、个人HRV基线）
+        previous = self.rolling_state_service.get_previous_states([user_id], date.date())[user_id]
+        
+        # 没有连锁规则计数器时，用历史数据得到初始状态
+        history_data = {} if previous.chains else self._get_history_data(user_id, date, days=self.HISTORY_DAYS)
         
         # 计算各维度积分
-        dimension_scores = {}
-        dimension_percentages = {}  # 新增：百分比数据
-        total_score = 0
-        
-        for dimension, calculator in self.calculators.items():
-            # 计算基础积分
-            # 为睡眠计算器传递额外参数
-            if dimension == ScoreDimension.SLEEP:
-                scores = calculator.calculate(health_summary, user_id=user_id, date=date)
-            else:
-                scores = calculator.calculate(health_summary)
-            
-            # 检查连锁惩罚
-            punishment = calculator.check_chain_punishment(history_data)
-            if punishment:
-                logger.warning(f"{dimension} 触发连锁惩罚: {punishment['message']}")
-                # TODO: 实现惩罚逻辑
-            
-            # 应用等级倍数
-            scores['total'] = calculator.apply_level_multiplier(scores['total'], user_tier)
-            
-            dimension_scores[dimension.value] = scores
-            total_score += scores['total']
-            
-            # 计算百分比
-            dimension_name = dimension.value
-            percentages = {
-                'easy': calculate_percentage(scores['easy'], dimension_name, 'easy'),
-                'medium': calculate_percentage(scores['medium'], dimension_name, 'medium'),
-                'hard': calculate_percentage(scores['hard'], dimension_name, 'hard'),
-                'super_hard': calculate_percentage(scores['super_hard'], dimension_name, 'super_hard'),
-                'total': calculate_percentage(scores['total'], dimension_name, 'total')
-            }
-            dimension_percentages[dimension_name] = percentages
+        dimension_scores, total_score = score_dimensions(
+            self.calculators, health_summary, history_data, user_id, date, user_tier,
+            rolling_states=previous
+        )
+        
+        # 计算百分比
+        dimension_percentages = self._calculate_dimension_percentages(dimension_scores)
         
         # 构建结果
         result = {
@@ -113,18 +228,108 @@ class ScoreEngine:
         
         # 保存到数据库
         should_save = save_to_db if save_to_db is not None else self.auto_save
-        if should_save and total_score > 0:
+        if should_save:
+            self._save_rolling_states(user_id, date, dimension_scores, previous.latest_scored_date)
+        if should_save:
+            # 没有积分的日期不新建记录，但已有记录（之前算出过积分）要被覆盖
             save_success = self.persistence_service.save_daily_scores(
                 user_id=user_id,
                 date=date,
                 dimension_scores=dimension_scores,
                 total_score=total_score,
-                tier_level=user_tier
+                tier_level=user_tier,
+                health_summary=health_summary.model_dump(mode='json'),
+                update_only=not (total_score > 0 or has_rolling_state(dimension_scores))
             )
             result['saved_to_db'] = save_success
         
         return result
     
+    def _save_rolling_states(self, user_id: str, date: datetime, dimension_scores: Dict[str, Dict],
+                             latest_scored) -> None:
+        """
+        保存当天结束时的滚动状态（连续达标、连锁规则计数器、个人HRV基线）
+        
+        重算早于最新计算日期的某天时，如果当天的状态发生变化，
+        之后已计算的日期会被加入待重算队列，使其状态保持正确
+        """
+        day = date.date()
+        states = RollingStates.from_scores(dimension_scores, day)
+        
+        if latest_scored and latest_scored > day and self.rolling_state_service.has_changed(user_id, day, states):
+            logger.info(f"用户{user_id}在{day}的滚动状态变化，之后的日期加入待重算队列")
+            self.dirty_days_service.mark_dirty(user_id, day + timedelta(days=1), latest_scored)
+        
+        self.rolling_state_service.save_states_bulk({user_id: states})
+    
+    def get_daily_score(self, user_id: str, date: datetime, force_recalculate: bool = False) -> Dict:
+        """
+        获取指定日期的积分（优先读取已持久化的结果）
+        
+        以下情况会重新计算：
+        - 调用方强制重算
+        - 当天尚未结束（数据仍可能变化）
+        - 没有已保存的积分记录
+        - 积分保存之后又有新的原始数据入库
+        - 当天在待重算队列中（删除、去重、训练数据变化或之前日期的滚动状态变化）
+        
+        Args:
+            user_id: 用户ID
+            date: 日期
+            force_recalculate: 是否强制重新计算
+            
+        Returns:
+            积分结果字典，结构与calculate_daily_score一致
+        """
+        if force_recalculate or date.date() >= datetime.now().date():
+            return self.calculate_daily_score(user_id, date)
+        
+        record = self.persistence_service.get_daily_score_record(user_id, date)
+        if not record:
+            return self.calculate_daily_score(user_id, date)
+        
+        if self.dirty_days_service.is_dirty(user_id, date):
+            logger.info(f"用户{user_id}在{date.date()}在待重算队列中，重新计算")
+            return self.calculate_daily_score(user_id, date)
+        
+        latest_ingest = self.health_service.get_latest_ingest_time(user_id, date)
+        if latest_ingest and self._is_after(latest_ingest, record['created_at']):
+            logger.info(f"用户{user_id}在{date.date()}的积分保存后有新数据，重新计算")
+            return self.calculate_daily_score(user_id, date)
+        
+        dimension_scores = record['dimension_scores']
+        return {
+            'user_id': user_id,
+            'date': date.isoformat(),
+            'health_summary': record['health_summary'],
+            'dimension_scores': dimension_scores,
+            'dimension_percentages': self._calculate_dimension_percentages(dimension_scores),
+            'total_score': record['total_score'],
+            'user_level': record['tier_level'],
+            'timestamp': record['created_at'].isoformat() if record['created_at'] else datetime.now().isoformat(),
+            'from_persisted': True
+        }
+    
+    def _calculate_dimension_percentages(self, dimension_scores: Dict[str, Dict]) -> Dict[str, Dict]:
+        """计算各维度各难度积分的百分比"""
+        dimension_percentages = {}
+        for dimension_name, scores in dimension_scores.items():
+            dimension_percentages[dimension_name] = {
+                difficulty: calculate_percentage(scores.get(difficulty, 0), dimension_name, difficulty)
+                for difficulty in ['easy', 'medium', 'hard', 'super_hard', 'total']
+            }
+        return dimension_percentages
+    
+    @staticmethod
+    def _is_after(left: datetime, right: Optional[datetime]) -> bool:
+        """比较两个时间，兼容带时区与不带时区的混合情况"""
+        if right is None:
+            return True
+        if (left.tzinfo is None) != (right.tzinfo is None):
+            left = left.astimezone().replace(tzinfo=None) if left.tzinfo else left
+            right = right.astimezone().replace(tzinfo=None) if right.tzinfo else right
+        return left > right
+    
     def calculate_date_range_scores(self, user_id: str, start_date: datetime, end_date: datetime) -> List[Dict]:
         """
         计算日期范围内的积分
@@ -140,9 +345,12 @@ class ScoreEngine:
         scores = []
         current_date = start_date
         
+        # 整个范围只解析一次用户等级
+        user_tier = self._get_user_tier(user_id)
+        
         while current_date <= end_date:
             try:
-                daily_score = self.calculate_daily_score(user_id, current_date)
+                daily_score = self.calculate_daily_score(user_id, current_date, user_tier=user_tier)
                 scores.append(daily_score)
             except Exception as e:
                 logger.error(f"计算{current_date}积分失败: {e}")
@@ -151,6 +359,69 @@ class ScoreEngine:
         
         return scores
     
+    def rescore_dirty_days(self, limit: Optional[int] = None, user_id: Optional[str] = None) -> Dict:
+        """
+        增量重算：只重算待重算队列中的日期，以及7天历史窗口包含这些日期的后续日期
+        
+        Args:
+            limit: 本次最多处理的队列记录数，None表示全部
+            user_id: 只处理指定用户，None表示所有用户
+            
+        Returns:
+            处理报告
+        """
+        started = datetime.now()
+        claimed = self.dirty_days_service.claim_dirty_days(limit=limit, user_id=user_id)
+        
+        # 展开受影响的日期：脏日期本身及其后history_days天，不超过今天
+        today = datetime.now().date()
+        affected: Dict[str, set] = {}
+        for row in claimed:
+            for offset in range(self.HISTORY_DAYS + 1):
+                day = row['score_date'] + timedelta(days=offset)
+                if day > today:
+                    break
+                affected.setdefault(row['user_id'], set()).add(day)
+        
+        report = {'claimed': len(claimed), 'users': len(affected), 'rescored_days': 0, 'failed_days': 0}
+        succeeded_users = set()
+        
+        for dirty_user, days in affected.items():
+            # 历史数据变化的日期可能仍有缓存的积分结果，先失效再计算
+            invalidate_user_dates(dirty_user, min(days), max(days), namespaces=["daily_score"])
+            user_tier = self._get_user_tier(dirty_user)
+            
+            failed = 0
+            for day in sorted(days):
+                try:
+                    result = self.calculate_daily_score(
+                        dirty_user, datetime.combine(day, datetime.min.time()),
+                        save_to_db=True, user_tier=user_tier
+                    )
+                    if result.get('saved_to_db') is False:
+                        failed += 1
+                        continue
+                    report['rescored_days'] += 1
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"重算用户{dirty_user}在{day}的积分失败: {e}")
+            
+            report['failed_days'] += failed
+            if failed == 0:
+                succeeded_users.add(dirty_user)
+        
+        # 只确认全部重算成功的用户，失败的留在队列中下次重试
+        report['acknowledged'] = self.dirty_days_service.acknowledge(
+            [row for row in claimed if row['user_id'] in succeeded_users]
+        )
+        report['elapsed_seconds'] = round((datetime.now() - started).total_seconds(), 3)
+        
+        logger.info(
+            f"增量重算完成: 队列记录{report['claimed']}条, {report['users']}个用户, "
+            f"重算{report['rescored_days']}天, 失败{report['failed_days']}天"
+        )
+        return report
+    
     def get_available_dimensions(self, user_id: str = "default_user") -> Dict[str, bool]:
         """
         获取可用的积分维度
@@ -196,7 +467,27 @@ class ScoreEngine:
     
     def _get_user_tier(self, user_id: str) -> str:
         """
-        获取用户等级
+        获取用户等级（带短期缓存）
+        
+        Args:
+            user_id: 用户ID
+            
+        Returns:
+            用户等级，默认为Bronze
+        """
+        if CACHE_CONFIG.enabled:
+            tier = TIER_CACHE.get(user_id)
+            if tier is not None:
+                return tier
+        
+        tier = self._query_user_tier(user_id)
+        if CACHE_CONFIG.enabled:
+            TIER_CACHE.set(user_id, tier, CACHE_CONFIG.tier_ttl_seconds)
+        return tier
+    
+    def _query_user_tier(self, user_id: str) -> str:
+        """
+        从数据库查询用户等级
         
         Args:
             user_id: 用户ID
@@ -212,7 +503,7 @@ class ScoreEngine:
             if result and result[0]:
                 return result[0]
             
-            # 如果users表没有记录，从最新的积分记录获取
+            # 如果users表没有记录，从最新的积分记录获取（使用idx_user_scores_user_created索引）
             query = "SELECT tier_level FROM user_scores WHERE user_id = %s ORDER BY created_at DESC LIMIT 1"
             result = POSTGRES_POOL._execute_query(query, (user_id,), fetch_one=True)
             
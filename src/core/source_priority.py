@@ -0,0 +1,75 @@
+"""
+累加型指标的数据源优先级去重
+同时佩戴Apple Watch和携带iPhone时，两个设备会各自记录同一段时间的步数（活动能量、饮水同理），直接求和会重复计算。
+与健康App的做法一致：在每个时间片上只计入优先级最高的数据源，低优先级数据源只计入没有被更高优先级数据源覆盖的部分
+"""
+import heapq
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .intervals import merge_intervals, remaining_fractions
+
+
+# 数据源名称中包含关键词时的优先级（数字越小优先级越高，参照SleepDataSourceManager.SOURCE_PRIORITY）
+ADDITIVE_SOURCE_PRIORITY = {
+    'Apple Watch': 1,  # 手表的运动传感器最准确
+    'Watch': 1,
+    'iPhone': 2,       # 手机计步
+    'iPad': 3,
+}
+
+# 不匹配任何关键词的数据源（第三方应用等）的优先级
+DEFAULT_SOURCE_PRIORITY = 10
+
+
+def source_priority(source_name: Optional[str]) -> int:
+    """数据源的优先级：取名称中包含的关键词的最高优先级"""
+    if not source_name:
+        return DEFAULT_SOURCE_PRIORITY
+    name = source_name.lower()
+    return min(
+        (priority for keyword, priority in ADDITIVE_SOURCE_PRIORITY.items() if keyword.lower() in name),
+        default=DEFAULT_SOURCE_PRIORITY
+    )
+
+
+def source_ranks(source_names: Iterable[Optional[str]]) -> Dict[Optional[str], int]:
+    """
+    为数据源排出互不相同的名次（0为最高），先按优先级，优先级相同的按名称排序
+
+    每个数据源单独一个名次，两部同为手机的设备之间同样只计入一部
+    """
+    ordered = sorted(set(source_names), key=lambda name: (source_priority(name), name or ''))
+    return {name: rank for rank, name in enumerate(ordered)}
+
+
+def deduplicate_by_priority(starts: np.ndarray, ends: np.ndarray, values: np.ndarray,
+                            ranks: np.ndarray) -> np.ndarray:
+    """
+    计算一组样本（同一用户同一天的同类样本）去重后各自计入的值
+
+    按名次从高到低扫描：每个名次的样本扣除已被更高名次样本覆盖的时段（按重叠时长比例），
+    再把这些样本的时段并入已覆盖的时段。同一数据源内的样本不互相扣除
+
+    Args:
+        starts: 各样本的开始时间（秒）
+        ends: 各样本的结束时间（秒）
+        values: 各样本的值
+        ranks: 各样本数据源的名次（见source_ranks）
+
+    Returns:
+        与输入对应的计入值
+    """
+    effective = np.zeros(len(values), dtype=np.float64)
+    if len(values) == 0:
+        return effective
+
+    order = np.lexsort((starts, ranks))
+    boundaries = np.flatnonzero(np.diff(ranks[order])) + 1
+    covered: List = []
+    for group in np.split(order, boundaries):
+        samples = list(zip(starts[group], ends[group], values[group]))
+        effective[group] = values[group] * np.asarray(remaining_fractions(samples, covered))
+        covered = merge_intervals(heapq.merge(covered, [(start, end) for start, end, _ in samples]))
+    return effective
@@ -0,0 +1,42 @@
+"""
+连续达标（streak）状态机
+每计算一天只根据前一天结束时的状态推进一步，不需要扫描历史
+"""
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+from ..models.streak import StreakState
+
+
+def advance_streak(previous: StreakState, day: date, qualified: bool,
+                   continuous_days: int, context: Optional[Dict] = None) -> StreakState:
+    """
+    根据前一天结束时的状态和当天是否达标，得到当天结束时的状态
+
+    Args:
+        previous: 前一天（或更早）结束时的状态
+        day: 当天日期
+        qualified: 当天是否达标
+        continuous_days: 解锁所需的连续天数
+        context: 当天结束时规则的滚动上下文，None时沿用previous.context
+
+    Returns:
+        当天结束时的状态
+    """
+    if qualified:
+        continues = previous.last_qualifying_date == day - timedelta(days=1)
+        length = previous.current_length + 1 if continues else 1
+        last_qualifying_date = day
+    else:
+        length = 0
+        last_qualifying_date = previous.last_qualifying_date
+
+    return StreakState(
+        dimension=previous.dimension,
+        rule=previous.rule,
+        current_length=length,
+        last_qualifying_date=last_qualifying_date,
+        last_scored_date=day,
+        unlocked=length >= continuous_days,
+        context=previous.context if context is None else context,
+    )
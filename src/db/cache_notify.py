@@ -0,0 +1,214 @@
+import json
+import os
+import select
+import threading
+import uuid
+from datetime import date, datetime
+from typing import Iterable, Optional, Union
+
+import psycopg2
+from psycopg2 import sql
+
+# Local import
+from .configs.config_cls import PostgreSQLConfig
+from .configs.global_config import POSTGRES_CONFIG, CACHE_CONFIG
+from ..utils.cache import DAILY_CACHE, TIER_CACHE, invalidate_user_dates, invalidate_user_tier
+from ..utils.logger import logger
+
+
+# Identifies this worker process so it can skip its own notifications
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+# Namespace used to invalidate the user tier cache instead of per-day results
+TIER_NAMESPACE = "user_tier"
+
+
+def _iso(value: Optional[Union[date, datetime]]) -> Optional[str]:
+    """Serializes a date or datetime to an ISO date string."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    return value.isoformat()
+
+
+def build_payload(user_id: str, start_date=None, end_date=None,
+                  namespaces: Optional[Iterable[str]] = None) -> str:
+    """
+    Builds the JSON payload for a cache invalidation notification.
+
+    Args:
+        user_id (str): The user whose cached results are stale.
+        start_date (date or datetime, optional): First affected day. None means all days.
+        end_date (date or datetime, optional): Last affected day. None means start_date.
+        namespaces (Iterable[str], optional): Cache namespaces to invalidate. None means all.
+
+    Returns:
+        str: The payload string.
+    """
+    return json.dumps({
+        "origin": WORKER_ID,
+        "user_id": user_id,
+        "start": _iso(start_date),
+        "end": _iso(end_date),
+        "namespaces": list(namespaces) if namespaces is not None else None,
+    })
+
+
+def notify_invalidation(cursor, user_id: str, start_date=None, end_date=None,
+                        namespaces: Optional[Iterable[str]] = None):
+    """
+    Queues a cache invalidation notification on the given cursor.
+
+    NOTIFY is transactional, so the other workers receive it only once the cursor's
+    transaction commits.
+
+    Args:
+        cursor: An open psycopg2 cursor.
+        user_id (str): The user whose cached results are stale.
+        start_date (date or datetime, optional): First affected day.
+        end_date (date or datetime, optional): Last affected day.
+        namespaces (Iterable[str], optional): Cache namespaces to invalidate.
+    """
+    if not CACHE_CONFIG.notify_enabled:
+        return
+    cursor.execute(
+        "SELECT pg_notify(%s, %s);",
+        (CACHE_CONFIG.notify_channel, build_payload(user_id, start_date, end_date, namespaces))
+    )
+
+
+def handle_payload(payload: str) -> int:
+    """
+    Applies a received invalidation notification to the local cache.
+
+    Args:
+        payload (str): The notification payload.
+
+    Returns:
+        int: The number of evicted cache entries.
+    """
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        logger.error(f"Ignoring malformed cache invalidation payload: {payload}")
+        return 0
+
+    if message.get("origin") == WORKER_ID or not message.get("user_id"):
+        return 0
+
+    namespaces = message.get("namespaces")
+    evicted = 0
+    if namespaces is None or TIER_NAMESPACE in namespaces:
+        evicted += int(invalidate_user_tier(message["user_id"]))
+    if namespaces is None or any(ns != TIER_NAMESPACE for ns in namespaces):
+        evicted += invalidate_user_dates(
+            message["user_id"], message.get("start"), message.get("end"), namespaces=namespaces
+        )
+    return evicted
+
+
+class CacheInvalidationListener(threading.Thread):
+    """
+    A background thread that LISTENs for cache invalidation notifications and evicts the affected keys.
+    """
+    def __init__(self, config: PostgreSQLConfig = POSTGRES_CONFIG,
+                 channel: str = CACHE_CONFIG.notify_channel, poll_timeout: float = 5.0):
+        """
+        Initializes the listener.
+
+        Args:
+            config (PostgreSQLConfig): The configuration used for the dedicated listening connection.
+            channel (str): The notification channel.
+            poll_timeout (float): Seconds to wait for notifications before checking the stop flag.
+        """
+        super().__init__(name="cache-invalidation-listener", daemon=True)
+        self.config = config
+        self.channel = channel
+        self.poll_timeout = poll_timeout
+        self._stop_event = threading.Event()
+
+    def run(self):
+        """Listens until stopped, reconnecting with exponential backoff on errors."""
+        backoff = 1
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                backoff = 1
+                self._listen(conn)
+            except (Exception, psycopg2.Error) as error:
+                logger.error(f"Cache invalidation listener error: {error}. Reconnecting in {backoff}s.")
+                # Notifications may have been missed while disconnected
+                DAILY_CACHE.clear()
+                TIER_CACHE.clear()
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, 60)
+            finally:
+                if conn:
+                    conn.close()
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Stops the listener thread.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the thread to exit.
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout if timeout is not None else self.poll_timeout + 1)
+
+    def _connect(self):
+        """Opens the dedicated autocommit connection used for LISTEN."""
+        conn = psycopg2.connect(
+            dbname=self.config.dbname,
+            user=self.config.user,
+            password=self.config.pwd.get_secret_value(),
+            host=self.config.host,
+            port=self.config.port
+        )
+        conn.set_session(autocommit=True)
+        return conn
+
+    def _listen(self, conn):
+        """Subscribes to the channel and dispatches notifications until stopped."""
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL("LISTEN {};").format(sql.Identifier(self.channel)))
+        logger.debug(f"Listening for cache invalidations on channel {self.channel}.")
+
+        while not self._stop_event.is_set():
+            readable, _, _ = select.select([conn], [], [], self.poll_timeout)
+            if not readable:
+                continue
+            conn.poll()
+            while conn.notifies:
+                notification = conn.notifies.pop(0)
+                handle_payload(notification.payload)
+
+
+_listener: Optional[CacheInvalidationListener] = None
+
+
+def start_cache_listener() -> Optional[CacheInvalidationListener]:
+    """
+    Starts the per-worker listener thread if caching and notifications are enabled.
+
+    Returns:
+        CacheInvalidationListener or None: The running listener.
+    """
+    global _listener
+    if not (CACHE_CONFIG.enabled and CACHE_CONFIG.notify_enabled):
+        return None
+    if _listener is None or not _listener.is_alive():
+        _listener = CacheInvalidationListener()
+        _listener.start()
+    return _listener
+
+
+def stop_cache_listener():
+    """Stops the per-worker listener thread if it is running."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
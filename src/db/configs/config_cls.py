@@ -1,4 +1,4 @@
-from typing import Optional, Literal, Dict
+from typing import Optional, Literal, Dict, List
 from pathlib import Path
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import SecretStr
@@ -82,4 +82,115 @@ class APIConfig(BaseSettings):
     cors_origins: list[str] = ["*"]
     cors_allow_credentials: bool = True
     cors_allow_methods: list[str] = ["*"]
-    cors_allow_headers: list[str] = ["*"]
\ No newline at end of file
+    cors_allow_headers: list[str] = ["*"]
+
+
+class CacheConfig(BaseSettings):
+    """进程内结果缓存配置"""
+    model_config = SettingsConfigDict(env_file=".env", env_prefix="CACHE_", extra="ignore")
+
+    enabled: bool = True
+    max_entries: int = 10000
+    closed_day_ttl_seconds: int = 86400  # 已结束日期：24小时
+    open_day_ttl_seconds: int = 300      # 当天：5分钟
+    tier_ttl_seconds: int = 300          # 用户等级：5分钟
+    
+    # 多worker缓存一致性（PostgreSQL LISTEN/NOTIFY）
+    notify_enabled: bool = True
+    notify_channel: str = "lsp_cache_invalidation"
+    
+    # 合并同一(user_id, date)的并发计算
+    coalesce_enabled: bool = True
+
+class BatchScoringConfig(BaseSettings):
+    """批量积分计算配置"""
+    model_config = SettingsConfigDict(env_file=".env", env_prefix="BATCH_SCORING_", extra="ignore")
+
+    max_workers: int = 0     # 计算进程数，0表示使用CPU核数
+    chunk_size: int = 200    # 每批预取和计算的用户数
+    history_days: int = 7    # 没有连锁规则计数器的用户用于得到初始状态的历史天数
+
+
+class CsvImportConfig(BaseSettings):
+    """CSV并行导入配置"""
+    model_config = SettingsConfigDict(env_file=".env", env_prefix="CSV_IMPORT_", extra="ignore")
+
+    max_workers: int = 0             # 写入进程数，0表示使用CPU核数
+    chunk_size: int = 100000         # 每块的行数（同一次导入中断后续传时沿用第一次的块大小）
+    pending_per_worker: int = 2      # 每个写入进程最多排队的块数（限制已读取未写入的数据量）
+
+class HrvBaselineConfig(BaseSettings):
+    """个人HRV基线配置"""
+    model_config = SettingsConfigDict(env_file=".env", env_prefix="HRV_BASELINE_", extra="ignore")
+
+    span_days: int = 30           # 指数加权平均的跨度（alpha = 2 / (span_days + 1)）
+    window_days: int = 30         # 计算中位数的最近有HRV数据的天数
+    min_days: int = 7             # 有数据的天数达到后才使用个人基线
+    outlier_ratio: float = 0.5    # 更新平均值前，当天HRV被限制在中位数的 (1 ± ratio) 倍以内
+    default_hrv: float = 50.0     # 个人基线建立之前使用的基线（毫秒，一般成年人的平均值）
+
+
+class HeartRateZoneConfig(BaseSettings):
+    """心率区间配置"""
+    model_config = SettingsConfigDict(env_file=".env", env_prefix="HR_ZONE_", extra="ignore")
+
+    zone_bounds: List[float] = [0.5, 0.6, 0.7, 0.8, 0.9]  # 区间1-5的下限（最大心率的比例），低于区间1不计入任何区间
+    default_age: int = 35                 # 用户没有最大心率和出生年份时按此年龄估算（最大心率 = 220 - 年龄）
+    max_sample_gap_seconds: int = 300     # 每个样本持续到下一个样本，但最长按此时长计（未佩戴期间不计时）
+
+
+class HourlyActivityConfig(BaseSettings):
+    """每小时活动位图配置"""
+    model_config = SettingsConfigDict(env_file=".env", env_prefix="HOURLY_ACTIVITY_", extra="ignore")
+
+    active_min_steps: int = 250    # 一小时内步数达到此值（或有运动时间）记为活跃小时
+    waking_start_hour: int = 7     # 统计久坐的清醒时段 [waking_start_hour, waking_end_hour)
+    waking_end_hour: int = 23
+
+
+class UploadConfig(BaseSettings):
+    """健康样本上传配置"""
+    model_config = SettingsConfigDict(env_file=".env", env_prefix="UPLOAD_", extra="ignore")
+
+    max_body_bytes: int = 20 * 1024 * 1024       # 请求体（压缩后）的最大字节数
+    max_decoded_bytes: int = 200 * 1024 * 1024   # 解压后的最大字节数
+    max_samples: int = 100000                    # 每个请求最多的样本数
+    merger_enabled: bool = True                  # 是否在API进程中运行后台合并线程
+    merge_interval_seconds: float = 2.0          # 没有待合并批次时的轮询间隔
+    merge_batch_limit: int = 20                  # 每个合并事务最多处理的批次数
+
+
+class RetentionConfig(BaseSettings):
+    """高频样本保留策略配置"""
+    model_config = SettingsConfigDict(env_file=".env", env_prefix="RETENTION_", extra="ignore")
+
+    raw_days: int = 180              # 原始样本保留的天数，更早的样本压缩为时间桶后删除
+    pause_seconds: float = 0.0       # 每个用户日（事务）之间的停顿，用于降低对线上负载的影响
+    # 压缩的样本类型及其时间桶的秒数（每分钟或每5分钟一个桶）
+    bucket_seconds: Dict[str, int] = {
+        "HKQuantityTypeIdentifierHeartRate": 60,
+        "HKQuantityTypeIdentifierEnvironmentalAudioExposure": 300,
+    }
+
+
+class ArchiveConfig(BaseSettings):
+    """原始样本冷归档（Parquet）配置"""
+    model_config = SettingsConfigDict(env_file=".env", env_prefix="ARCHIVE_", extra="ignore")
+
+    directory: str = str(BASE_PATH.parent.parent.joinpath("data", "archive"))  # 归档文件的根目录
+    keep_months: int = 12            # 数据库中保留的已结束月份数，更早的月份被归档
+    user_buckets: int = 32           # 每月按用户ID哈希分成的文件数（1-256）
+    compression: str = "zstd"        # Parquet压缩算法
+    fetch_rows: int = 100000         # 导出时每次从服务端游标读取的行数，每批写成一个行组（读取时按统计信息跳过）
+    manifest_ttl_seconds: int = 300  # 缓存已归档月份列表的秒数
+
+
+class AnalyticsConfig(BaseSettings):
+    """离线分析（DuckDB）配置"""
+    model_config = SettingsConfigDict(env_file=".env", env_prefix="ANALYTICS_", extra="ignore")
+
+    snapshot_directory: str = str(BASE_PATH.parent.parent.joinpath("data", "snapshots"))  # 快照文件的根目录
+    keep_snapshots: int = 3          # 每张表保留的快照数
+    fetch_rows: int = 100000         # 生成快照时每次从服务端游标读取的行数
+    threads: int = 4                 # DuckDB的线程数
+    memory_limit: str = "2GB"        # DuckDB的内存上限，超出时溢写到临时目录
@@ -1,7 +1,17 @@
 from .config_cls import (
     LoggerConfig,
     PostgreSQLConfig,
-    APIConfig
+    APIConfig,
+    CacheConfig,
+    BatchScoringConfig,
+    CsvImportConfig,
+    HrvBaselineConfig,
+    HeartRateZoneConfig,
+    HourlyActivityConfig,
+    UploadConfig,
+    RetentionConfig,
+    ArchiveConfig,
+    AnalyticsConfig
 )
 
 
@@ -24,3 +34,33 @@ POSTGRES_CONFIG = PostgreSQLConfig(
 
 
 API_CONFIG = APIConfig()
+
+
+CACHE_CONFIG = CacheConfig()
+
+
+BATCH_SCORING_CONFIG = BatchScoringConfig()
+
+
+CSV_IMPORT_CONFIG = CsvImportConfig()
+
+
+HRV_BASELINE_CONFIG = HrvBaselineConfig()
+
+
+HR_ZONE_CONFIG = HeartRateZoneConfig()
+
+
+HOURLY_ACTIVITY_CONFIG = HourlyActivityConfig()
+
+
+UPLOAD_CONFIG = UploadConfig()
+
+
+RETENTION_CONFIG = RetentionConfig()
+
+
+ARCHIVE_CONFIG = ArchiveConfig()
+
+
+ANALYTICS_CONFIG = AnalyticsConfig()
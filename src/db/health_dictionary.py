@@ -0,0 +1,197 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence
+
+# Local import
+from .postgresql import POSTGRES_POOL, PostgreSQLConnectionPool
+from ..utils.logger import logger
+
+
+# Join of a staged (decoded) sample to its source row; NULL parts match as empty strings like the unique index
+SOURCE_JOIN = """
+    LEFT JOIN health_metric_sources src
+      ON COALESCE(src.source_name, '') = COALESCE(s.source_name, '')
+     AND COALESCE(src.source_version, '') = COALESCE(s.source_version, '')
+     AND COALESCE(src.device, '') = COALESCE(s.device, '')
+"""
+
+
+class HealthMetricDictionary:
+    """
+    In-process cache of the health_metric_types dictionary (type name <-> smallint id).
+
+    Type ids never change once assigned, so cached entries stay valid; an unknown name triggers
+    one reload of the (small) table to pick up types added by other processes.
+    """
+    def __init__(self, db_pool: PostgreSQLConnectionPool = POSTGRES_POOL):
+        self.db_pool = db_pool
+        self._ids: Dict[str, int] = {}
+        self._names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def type_id(self, name, create: bool = False) -> Optional[int]:
+        """
+        Returns the id of a sample type.
+
+        Args:
+            name: The type name or a HealthDataType member.
+            create (bool): Add the type to the dictionary if it is not there yet.
+
+        Returns:
+            int or None: The id, or None if the type has never been stored (and create is False).
+        """
+        name = getattr(name, "value", name)
+        type_id = self._ids.get(name)
+        if type_id is None:
+            self.refresh()
+            type_id = self._ids.get(name)
+        if type_id is None and create:
+            row = self.db_pool._execute_query("SELECT health_metric_type_id(%s)", (name,), fetch_one=True)
+            if row and row[0] is not None:
+                type_id = row[0]
+                with self._lock:
+                    self._ids[name] = type_id
+                    self._names[type_id] = name
+        return type_id
+
+    def type_ids(self, names: Iterable) -> List[int]:
+        """
+        Returns the ids of the given sample types, skipping types that have never been stored.
+
+        Args:
+            names: Type names or HealthDataType members.
+        """
+        ids = (self.type_id(name) for name in names)
+        return [type_id for type_id in ids if type_id is not None]
+
+    def type_name(self, type_id: int) -> Optional[str]:
+        """Returns the name of a type id, or None if it is unknown."""
+        if type_id not in self._names:
+            self.refresh()
+        return self._names.get(type_id)
+
+    def refresh(self):
+        """Reloads the whole type dictionary."""
+        rows = self.db_pool._execute_query("SELECT id, name FROM health_metric_types", fetch_all=True)
+        if rows is None:
+            logger.warning("Could not load health_metric_types; type ids are unavailable.")
+            return
+        with self._lock:
+            self._ids = {row[1]: row[0] for row in rows}
+            self._names = {row[0]: row[1] for row in rows}
+
+    def clear(self):
+        """Drops the cached entries (e.g. after the dictionary tables were recreated)."""
+        with self._lock:
+            self._ids = {}
+            self._names = {}
+
+
+def register_names_sql(source: str) -> List[str]:
+    """
+    Builds the statements that add the types and sources of staged samples to the lookup tables.
+
+    Only missing names are inserted, so no sequence values are spent on conflicts
+    (health_metric_types ids are smallints).
+
+    Args:
+        source (str): A table name or subquery with the sample columns of the health_metric view.
+
+    Returns:
+        List[str]: Statements to execute, in order, before insert_samples_sql.
+    """
+    return [
+        f"""
+        INSERT INTO health_metric_types (name)
+        SELECT DISTINCT s.type FROM {source} AS s
+        WHERE s.type IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM health_metric_types t WHERE t.name = s.type)
+        ON CONFLICT DO NOTHING
+        """,
+        f"""
+        INSERT INTO health_metric_sources (source_name, source_version, device)
+        SELECT DISTINCT s.source_name, s.source_version, s.device FROM {source} AS s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM health_metric_sources src
+            WHERE COALESCE(src.source_name, '') = COALESCE(s.source_name, '')
+              AND COALESCE(src.source_version, '') = COALESCE(s.source_version, '')
+              AND COALESCE(src.device, '') = COALESCE(s.device, '')
+        )
+        ON CONFLICT DO NOTHING
+        """,
+    ]
+
+
+def insert_samples_sql(source: str, extra_columns: Sequence[str] = (), returning: Optional[str] = None,
+                       on_conflict: str = "ON CONFLICT DO NOTHING") -> str:
+    """
+    Builds an INSERT ... SELECT that encodes staged samples into health_samples, skipping samples
+    whose natural key is already stored.
+
+    Samples older than the user's compaction watermark whose time bucket is already in
+    health_samples_compacted (i.e. re-imports of compacted samples) are skipped as well, and so are
+    samples of a month whose bucket of users was moved to the cold archive (archived months are closed,
+    except for the types the archive keeps in the database).
+
+    Args:
+        source (str): A table name or subquery with the sample columns of the health_metric view (and extra_columns).
+        extra_columns (Sequence[str]): Further health_samples columns copied as is (e.g. sample_uuid).
+        returning (str): Optional RETURNING list.
+        on_conflict (str): The conflict clause for samples whose natural key is already stored.
+
+    Returns:
+        str: The statement; run the register_names_sql statements first.
+    """
+    extra = "".join(f", {column}" for column in extra_columns)
+    staged_extra = "".join(f", s.{column}" for column in extra_columns)
+    return f"""
+        INSERT INTO health_samples (
+            user_id, type_id, source_id, unit, creation_date, start_date, end_date, value, natural_key{extra}
+        )
+        SELECT s.user_id, t.id, src.id, s.unit, s.creation_date, s.start_date, s.end_date, s.value,
+               health_metric_natural_key(s.user_id, s.type, s.source_name, s.start_date, s.end_date, s.value){staged_extra}
+        FROM {source} AS s
+        JOIN health_metric_types t ON t.name = s.type
+        {SOURCE_JOIN}
+        LEFT JOIN health_retention_state r ON r.user_id = s.user_id AND r.type_id = t.id
+        WHERE (
+            r.user_id IS NULL
+            OR s.start_date >= r.compacted_before
+            OR NOT EXISTS (
+                SELECT 1 FROM health_samples_compacted c
+                WHERE c.user_id = s.user_id AND c.type_id = t.id
+                  AND c.bucket_start <= s.start_date
+                  AND c.bucket_start > s.start_date - make_interval(secs => r.bucket_seconds)
+                  AND COALESCE(c.source_id, 0) = COALESCE(src.id, 0)
+            )
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM health_archive_files a
+            WHERE a.month = date_trunc('month', s.start_date)::date
+              AND a.bucket = health_archive_bucket(s.user_id, a.user_buckets)
+              AND s.type <> ALL(a.kept_types)
+        )
+        {on_conflict}
+        {f"RETURNING {returning}" if returning else ""}
+    """
+
+
+def merge_samples(cursor, source: str, extra_columns: Sequence[str] = (), params: tuple = ()) -> int:
+    """
+    Registers the names of staged samples and inserts the samples into health_samples.
+
+    Args:
+        cursor: An open psycopg2 cursor; the caller commits.
+        source (str): A table name or subquery with the sample columns of the health_metric view (and extra_columns).
+        extra_columns (Sequence[str]): Further health_samples columns copied as is.
+        params (tuple): Parameters of the placeholders in source.
+
+    Returns:
+        int: The number of new samples.
+    """
+    for statement in register_names_sql(source):
+        cursor.execute(statement, params)
+    cursor.execute(insert_samples_sql(source, extra_columns), params)
+    return cursor.rowcount
+
+
+HEALTH_DICTIONARY = HealthMetricDictionary()
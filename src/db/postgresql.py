@@ -3,14 +3,23 @@ from psycopg2 import pool
 from psycopg2.extras import DictCursor
 import threading
 import time
+from datetime import date, datetime, timedelta
 from typing import Union, List
 
 # Local import
 from .configs.config_cls import PostgreSQLConfig
 from .configs.global_config import POSTGRES_CONFIG
+from .cache_notify import notify_invalidation
+from ..utils.cache import invalidate_user_dates
 from ..utils.logger import logger
 
 
+# Tables holding raw health data; writes to them invalidate the derived caches and scores.
+# Both skip rows that are already stored: workouts through its natural-key unique index, and the
+# health_metric view through its INSTEAD OF trigger (which cannot be combined with ON CONFLICT).
+INGEST_TABLES = ("health_metric", "workouts")
+
+
 class PostgreSQLConnectionPool:
     """
     A class to manage a PostgreSQL database connection pool and provide basic CRUD operations.
@@ -134,11 +143,12 @@ class PostgreSQLConnectionPool:
 
         columns_str = ", ".join(columns)
         placeholders = ", ".join(["%s"] * len(values))
-        sql_query = f"INSERT INTO {table_name} ({columns_str}) VALUES ({placeholders});"
+        sql_query = f"INSERT INTO {table_name} ({columns_str}) VALUES ({placeholders}){self._on_conflict(table_name)};"
         
         logger.debug(f"Attempting to insert: {sql_query}, values: {values}")
         self._execute_query(sql_query, values, commit=True)
         logger.debug(f"Data inserted into {table_name}.")
+        self._invalidate_cached_results(table_name, columns, [values])
         return True
 
 
@@ -160,7 +170,7 @@ class PostgreSQLConnectionPool:
 
         columns_str = ", ".join(columns)
         placeholders = ", ".join(["%s"] * len(columns))
-        sql_query = f"INSERT INTO {table_name} ({columns_str}) VALUES ({placeholders});"
+        sql_query = f"INSERT INTO {table_name} ({columns_str}) VALUES ({placeholders}){self._on_conflict(table_name)};"
         
         logger.debug(f"Attempting to bulk insert: {sql_query}, values: {len(values)} rows")
         
@@ -172,6 +182,7 @@ class PostgreSQLConnectionPool:
                     cursor.executemany(sql_query, values)
                     conn.commit()
                     logger.debug(f"Bulk data inserted into {table_name}.")
+                    self._invalidate_cached_results(table_name, columns, values)
                     return True
             else:
                 logger.error("Failed to get a connection from the pool.")
@@ -311,8 +322,237 @@ class PostgreSQLConnectionPool:
         logger.debug(f"Attempting to upsert: {sql_query}, values: {values}")
         self._execute_query(sql_query, values, commit=True)
         logger.debug(f"Data upserted into {table_name}.")
+        self._invalidate_cached_results(table_name, columns, [values])
         return True
 
+    @staticmethod
+    def _on_conflict(table_name: str) -> str:
+        """
+        Returns the ON CONFLICT clause for inserts into table_name.
+
+        Re-imported raw samples hit the natural-key unique index and are skipped, so they do not
+        inflate daily sums. Without a conflict target the clause also works before the index exists.
+        health_metric is a view whose INSTEAD OF trigger already skips duplicates and which does not
+        accept ON CONFLICT.
+        """
+        return " ON CONFLICT DO NOTHING" if table_name in INGEST_TABLES and table_name != "health_metric" else ""
+
+    def _invalidate_cached_results(self, table_name: str, columns: list, rows: List[tuple]):
+        """
+        Invalidates cached daily summaries and scores affected by rows written to health_metric
+        (or workouts), locally and in the other workers via NOTIFY, and queues the affected days for rescoring.
+
+        The queueing runs in its own transaction after the rows were committed; writers that can
+        pass their cursor should use _queue_ingest and _broadcast_ingest instead.
+
+        Args:
+            table_name (str): The name of the table that was written.
+            columns (list): The column names of the written rows.
+            rows (List[tuple]): The written rows.
+        """
+        ranges = self._ingest_ranges(table_name, columns, rows)
+        if not ranges:
+            return
+        for user_id, date_range in ranges.items():
+            invalidate_user_dates(user_id, *(date_range or ()))
+        self._record_ingest_ranges(ranges)
+
+    def _queue_ingest(self, cursor, table_name: str, columns: list, rows: List[tuple]) -> dict:
+        """
+        Queues the days affected by rows written in the caller's transaction for rescoring and
+        drops their cached daily rollups, on the caller's cursor, so that both commit or roll back
+        together with the rows. Errors are raised, not logged.
+
+        Call _broadcast_ingest with the returned ranges after the commit.
+
+        Args:
+            cursor: The open psycopg2 cursor of the writing transaction.
+            table_name (str): The name of the table that was written.
+            columns (list): The column names of the written rows.
+            rows (List[tuple]): The written rows.
+
+        Returns:
+            dict: Mapping of user_id to the inclusive (start, end) date range that was queued.
+        """
+        ranges = self._ingest_ranges(table_name, columns, rows)
+        if ranges:
+            self._mark_dirty_days(cursor, ranges, strict=True)
+            self._invalidate_rollups(cursor, ranges, strict=True)
+        return ranges
+
+    def _broadcast_ingest(self, ranges: dict):
+        """
+        Evicts the cached results of committed ingest ranges locally and notifies the other workers.
+
+        A failed NOTIFY is only logged: the days are already queued and their rollups dropped,
+        and the other workers' cached entries expire with their TTL.
+
+        Args:
+            ranges (dict): The ranges returned by _queue_ingest.
+        """
+        if not ranges:
+            return
+        for user_id, date_range in ranges.items():
+            invalidate_user_dates(user_id, *(date_range or ()))
+        conn = None
+        try:
+            conn = self.get_connection()
+            if conn:
+                with conn.cursor() as cursor:
+                    for user_id, date_range in ranges.items():
+                        notify_invalidation(cursor, user_id, *(date_range or ()))
+                conn.commit()
+        except (Exception, psycopg2.Error) as error:
+            logger.error(f"Error while broadcasting cache invalidations: {error}")
+            if conn:
+                conn.rollback()
+        finally:
+            if conn:
+                self.put_connection(conn)
+
+    def _ingest_ranges(self, table_name: str, columns: list, rows: List[tuple]) -> dict:
+        """
+        Collapses written rows into one date range per user.
+
+        A sample affects the day it falls on and the following day (whose sleep window starts
+        at 18:00 of the previous evening).
+
+        Returns:
+            dict: Mapping of user_id to an inclusive (start, end) date range, or None for all dates;
+            empty if table_name is not an ingest table.
+        """
+        if table_name not in INGEST_TABLES or not rows:
+            return {}
+
+        user_idx = columns.index("user_id") if "user_id" in columns else None
+        start_idx = columns.index("start_date") if "start_date" in columns else None
+        end_idx = columns.index("end_date") if "end_date" in columns else start_idx
+
+        ranges = {}
+        for row in rows:
+            user_id = row[user_idx] if user_idx is not None else "default_user"
+            start = self._as_date(row[start_idx]) if start_idx is not None else None
+            end = self._as_date(row[end_idx]) if end_idx is not None else None
+            if start is None or end is None:
+                ranges[user_id] = None  # Unknown dates: invalidate everything for the user
+                continue
+            if user_id in ranges and ranges[user_id] is None:
+                continue
+            current = ranges.get(user_id)
+            ranges[user_id] = (min(current[0], start), max(current[1], end)) if current else (start, end)
+
+        for user_id, date_range in ranges.items():
+            if date_range is not None:
+                ranges[user_id] = (date_range[0], date_range[1] + timedelta(days=1))
+        return ranges
+
+    def _record_ingest_ranges(self, ranges: dict):
+        """
+        Queues the affected days in score_dirty_days, drops their cached daily rollups and
+        broadcasts cache invalidations to the other workers, in one transaction.
+
+        Args:
+            ranges (dict): Mapping of user_id to an inclusive (start, end) date range, or None for all dates.
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            if conn:
+                with conn.cursor() as cursor:
+                    self._mark_dirty_days(cursor, ranges)
+                    self._invalidate_rollups(cursor, ranges)
+                    for user_id, date_range in ranges.items():
+                        notify_invalidation(cursor, user_id, *(date_range or ()))
+                conn.commit()
+        except (Exception, psycopg2.Error) as error:
+            logger.error(f"Error while recording ingested date ranges: {error}")
+            if conn:
+                conn.rollback()
+        finally:
+            if conn:
+                self.put_connection(conn)
+
+    @staticmethod
+    def _mark_dirty_days(cursor, ranges: dict, strict: bool = False):
+        """
+        Upserts every affected (user_id, day) into score_dirty_days.
+
+        queued_at uses clock_timestamp() so that re-dirtying a day that is being rescored
+        changes its queued_at, and the rescoring job does not acknowledge it.
+        A failure here (e.g. the table has not been created yet) is rolled back to a savepoint
+        so that the cache notifications are still sent, unless strict is set.
+
+        Args:
+            cursor: An open psycopg2 cursor.
+            ranges (dict): Mapping of user_id to an inclusive (start, end) date range, or None for all dates.
+            strict (bool): Raise errors so that the caller's transaction fails with them.
+        """
+        if not strict:
+            cursor.execute("SAVEPOINT mark_dirty_days;")
+        try:
+            for user_id, date_range in ranges.items():
+                if date_range is None:
+                    logger.warning(f"Ingested rows for user {user_id} have no dates; no days were queued for rescoring.")
+                    continue
+                cursor.execute("""
+                    INSERT INTO score_dirty_days (user_id, score_date, queued_at)
+                    SELECT %s, d::date, clock_timestamp()
+                    FROM generate_series(%s::date, %s::date, interval '1 day') AS d
+                    ON CONFLICT (user_id, score_date) DO UPDATE SET queued_at = EXCLUDED.queued_at;
+                """, (user_id, date_range[0], date_range[1]))
+            if not strict:
+                cursor.execute("RELEASE SAVEPOINT mark_dirty_days;")
+        except psycopg2.Error as error:
+            if strict:
+                raise
+            logger.error(f"Error while queueing dirty days for rescoring: {error}")
+            cursor.execute("ROLLBACK TO SAVEPOINT mark_dirty_days;")
+
+    @staticmethod
+    def _invalidate_rollups(cursor, ranges: dict, strict: bool = False):
+        """
+        Deletes the cached daily rollups (values computed from raw samples) of the affected days,
+        so that they are recomputed from the new samples the next time they are read.
+
+        Like _mark_dirty_days, a failure is rolled back to a savepoint unless strict is set.
+
+        Args:
+            cursor: An open psycopg2 cursor.
+            ranges (dict): Mapping of user_id to an inclusive (start, end) date range, or None for all dates.
+            strict (bool): Raise errors so that the caller's transaction fails with them.
+        """
+        if not strict:
+            cursor.execute("SAVEPOINT invalidate_rollups;")
+        try:
+            for user_id, date_range in ranges.items():
+                if date_range is None:
+                    cursor.execute("DELETE FROM daily_health_rollup WHERE user_id = %s;", (user_id,))
+                    continue
+                cursor.execute("""
+                    DELETE FROM daily_health_rollup
+                    WHERE user_id = %s AND rollup_date BETWEEN %s AND %s;
+                """, (user_id, date_range[0], date_range[1]))
+            if not strict:
+                cursor.execute("RELEASE SAVEPOINT invalidate_rollups;")
+        except psycopg2.Error as error:
+            if strict:
+                raise
+            logger.error(f"Error while invalidating daily rollups: {error}")
+            cursor.execute("ROLLBACK TO SAVEPOINT invalidate_rollups;")
+
+    @staticmethod
+    def _as_date(value):
+        """Converts a datetime or ISO-8601 string to a date, returning None if it cannot be parsed."""
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, str):
+            # HealthKit exports use "YYYY-MM-DD HH:MM:SS +0800", so only the date prefix is parsed
+            try:
+                return date.fromisoformat(value.strip()[:10])
+            except ValueError:
+                return None
+        return None
+
 
 POSTGRES_POOL = PostgreSQLConnectionPool()
 
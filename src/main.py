@@ -15,7 +15,11 @@ from .api.score_api import router as score_router
 from .api.auth_middleware import AuthMiddleware
 from .utils.logger import logger
 from .db.postgresql import POSTGRES_POOL
+from .db.cache_notify import start_cache_listener, stop_cache_listener
+from .services.upload_service import start_upload_merger, stop_upload_merger
 from .db.configs.global_config import API_CONFIG
+from .utils.cache import DAILY_CACHE
+from .utils.singleflight import SINGLE_FLIGHT
 
 
 @asynccontextmanager
@@ -32,11 +36,18 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"数据库连接失败: {e}")
 
+    # 启动缓存失效监听线程（多worker之间通过LISTEN/NOTIFY同步缓存）
+    start_cache_listener()
+
+    # 启动上传样本的后台合并线程（多worker通过SKIP LOCKED分担待合并的批次）
+    start_upload_merger()
+
     yield
 
     # 关闭时
     logger.info("LSP积分系统正在关闭...")
-    # 这里可以添加清理代码
+    stop_upload_merger()
+    stop_cache_listener()
 
 
 # 创建FastAPI应用
@@ -93,6 +104,8 @@ async def health_check():
     return {
         "status": "healthy" if db_status == "healthy" else "degraded",
         "services": {"api": "healthy", "database": db_status},
+        "cache": DAILY_CACHE.stats(),
+        "coalescing": SINGLE_FLIGHT.stats(),
     }
 
 
@@ -0,0 +1,59 @@
+"""
+连锁失去反应（惩罚与修复）计数器状态模型
+"""
+from datetime import date, datetime
+from typing import Dict, Optional
+from pydantic import BaseModel
+
+
+class ChainCounterState(BaseModel):
+    """某用户某条连锁规则的滚动计数器状态"""
+    rule: str
+    dimension: str                                # 规则所属（负责判断条件）的维度
+    trigger_length: int = 0                       # 截至last_scored_date连续满足触发条件的天数
+    recovery_length: int = 0                      # 惩罚生效后连续满足修复条件的天数
+    active: bool = False                          # 惩罚/提醒是否生效（当天修复规则表示次日可修复）
+    window_mask: int = 0                          # 最近window_days天是否满足触发条件的位图，最低位为last_scored_date
+    last_scored_date: Optional[date] = None       # 最近一次计算的日期
+    blocked: bool = False                         # last_scored_date当天是否屏蔽了受影响维度
+    recovered_points: int = 0                     # last_scored_date当天挽回的积分
+    updated_at: Optional[datetime] = None
+
+    def to_details(self) -> Dict:
+        """转换为随当日积分保存的明细（可JSON序列化）"""
+        return {
+            'trigger_length': self.trigger_length,
+            'recovery_length': self.recovery_length,
+            'active': self.active,
+            'window_mask': self.window_mask,
+            'blocked': self.blocked,
+            'recovered_points': self.recovered_points,
+        }
+
+    @classmethod
+    def from_details(cls, rule: str, dimension: str, day: date, details: Optional[Dict]) -> "ChainCounterState":
+        """
+        从某天积分明细中保存的计数器信息还原当天结束时的状态
+
+        Args:
+            rule: 规则名
+            dimension: 规则所属的维度
+            day: 明细所属的日期
+            details: to_details的结果，None表示当天没有记录
+
+        Returns:
+            当天结束时的状态
+        """
+        if not details:
+            return cls(rule=rule, dimension=dimension, last_scored_date=day)
+        return cls(
+            rule=rule,
+            dimension=dimension,
+            trigger_length=details.get('trigger_length', 0),
+            recovery_length=details.get('recovery_length', 0),
+            active=details.get('active', False),
+            window_mask=details.get('window_mask', 0),
+            last_scored_date=day,
+            blocked=details.get('blocked', False),
+            recovered_points=details.get('recovered_points', 0),
+        )
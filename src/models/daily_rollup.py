@@ -0,0 +1,27 @@
+"""
+每日健康数据汇总缓存（由原始样本计算、积分计算时直接读取）模型
+"""
+from datetime import date, datetime
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+
+class DailyRollup(BaseModel):
+    """某用户某天由原始样本计算出的汇总值"""
+    user_id: str
+    rollup_date: date
+    heart_rate_samples: int = 0                                   # 当天的心率样本数
+    max_heart_rate: Optional[int] = None                          # 计算时使用的最大心率
+    zone_minutes: List[float] = Field(default_factory=list)       # 各心率区间（1-5）的分钟数
+    zone2_minutes: Optional[int] = None                           # 区间2的分钟数，没有心率样本时为None
+    steps: Optional[int] = None                                   # 按数据源优先级去重后的步数，没有步数样本时为None
+    active_energy: Optional[float] = None                         # 去重后的活动能量（千卡）
+    water_ml: Optional[float] = None                              # 去重后的饮水量（毫升）
+    non_workout_steps: Optional[int] = None                       # 扣除运动期间后的步数，没有步数样本时为None
+    workout_types: Optional[List[str]] = None                     # 当天开始的运动类型，从未导入运动记录的用户为None
+    activity_mask: Optional[int] = None                           # 当天的运动类别位图（见core/activity_masks.py）
+    strength_minutes: Optional[int] = None                        # 当天开始的力量类运动的分钟数，从未导入运动记录的用户为None
+    stand_bitmap: Optional[int] = None                            # 有站立的小时位图（见core/hourly_bitmaps.py），没有站立数据时为None
+    water_bitmap: Optional[int] = None                            # 有饮水记录的小时位图，没有饮水记录时为None
+    active_bitmap: Optional[int] = None                           # 活跃小时位图，没有步数和运动时间数据时为None
+    computed_at: Optional[datetime] = None
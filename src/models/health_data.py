@@ -74,13 +74,21 @@ class DailyHealthSummary(BaseModel):
     deep_sleep_hours: Optional[float] = None
     rem_sleep_hours: Optional[float] = None
     steps: Optional[int] = None
+    non_workout_steps: Optional[int] = None  # 扣除运动期间后的步数（来自每日汇总缓存），易难度步数积分使用
     active_energy: Optional[float] = None
     exercise_minutes: Optional[int] = None
-    stand_hours: Optional[int] = None
+    zone2_minutes: Optional[int] = None  # 心率在区间2的分钟数（来自每日汇总缓存），没有心率样本时为None
+    strength_minutes: Optional[int] = None  # 力量类运动的分钟数（来自每日汇总缓存），从未导入运动记录时为None
+    stand_hours: Optional[int] = None  # 有站立的小时数（站立小时位图的置位数）
+    stand_bitmap: Optional[int] = None  # 有站立的小时位图（见core/hourly_bitmaps.py），久坐连锁规则的修复条件使用
+    sedentary_hours: Optional[int] = None  # 清醒时段中既没有站立也不活跃的小时数，没有站立和活动数据时为None
     avg_heart_rate: Optional[float] = None
     resting_heart_rate: Optional[float] = None
     hrv: Optional[float] = None
     water_ml: Optional[float] = None
+    water_hours: Optional[int] = None  # 有饮水记录的小时数，没有每日汇总缓存时为None
+    workout_types: Optional[List[str]] = None  # 当天完成的运动类型（HKWorkoutActivityType，来自每日汇总缓存）
+    activity_mask: Optional[int] = None  # 当天的运动类别位图（见core/activity_masks.py），从未导入运动记录时为None
     
     
 class HealthDataQuery(BaseModel):
@@ -0,0 +1,44 @@
+"""
+个人HRV基线状态模型
+"""
+from datetime import date, datetime
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
+
+
+class HrvBaselineState(BaseModel):
+    """某用户的HRV基线滚动状态"""
+    ewma: Optional[float] = None                          # 每日HRV的指数加权平均
+    window: List[float] = Field(default_factory=list)     # 最近有数据的若干天的每日HRV（按时间顺序）
+    sample_days: int = 0                                  # 累计有HRV数据的天数
+    last_scored_date: Optional[date] = None               # 最近一次计算的日期
+    updated_at: Optional[datetime] = None
+
+    def to_details(self) -> Dict:
+        """转换为随当日积分保存的明细（可JSON序列化）"""
+        return {
+            'ewma': self.ewma,
+            'window': self.window,
+            'sample_days': self.sample_days,
+        }
+
+    @classmethod
+    def from_details(cls, day: date, details: Optional[Dict]) -> "HrvBaselineState":
+        """
+        从某天积分明细中保存的基线信息还原当天结束时的状态
+
+        Args:
+            day: 明细所属的日期
+            details: to_details的结果，None表示当天没有记录
+
+        Returns:
+            当天结束时的状态
+        """
+        if not details:
+            return cls(last_scored_date=day)
+        return cls(
+            ewma=details.get('ewma'),
+            window=details.get('window') or [],
+            sample_days=details.get('sample_days', 0),
+            last_scored_date=day,
+        )
@@ -0,0 +1,48 @@
+"""
+按天推进的滚动状态集合模型
+"""
+from datetime import date
+from typing import Dict, Optional
+from pydantic import BaseModel, Field
+
+from .streak import StreakState
+from .chain_penalty import ChainCounterState
+from .hrv_baseline import HrvBaselineState
+
+
+class RollingStates(BaseModel):
+    """某用户在某天结束时的全部滚动状态"""
+    streaks: Dict[str, StreakState] = Field(default_factory=dict)         # 维度到连续达标状态
+    chains: Dict[str, ChainCounterState] = Field(default_factory=dict)    # 规则名到连锁规则计数器
+    hrv_baseline: Optional[HrvBaselineState] = None                       # 个人HRV基线
+    latest_scored_date: Optional[date] = None                             # 已保存状态中最晚的计算日期
+
+    def is_empty(self) -> bool:
+        """是否没有任何状态（新用户）"""
+        return not self.streaks and not self.chains and self.hrv_baseline is None
+
+    @classmethod
+    def from_scores(cls, dimension_scores: Dict[str, Dict], day: date) -> "RollingStates":
+        """
+        从某天各维度积分中保存的明细还原当天结束时的状态
+
+        Args:
+            dimension_scores: 维度名到积分（含streak、chain、hrv_baseline明细）的字典
+            day: 日期
+
+        Returns:
+            当天结束时的状态
+        """
+        streaks = {}
+        chains = {}
+        hrv_baseline = None
+        for dimension, scores in dimension_scores.items():
+            if not isinstance(scores, dict):
+                continue
+            if scores.get('streak'):
+                streaks[dimension] = StreakState.from_details(dimension, day, scores['streak'])
+            for rule, details in (scores.get('chain') or {}).items():
+                chains[rule] = ChainCounterState.from_details(rule, dimension, day, details)
+            if 'hrv_baseline' in scores:
+                hrv_baseline = HrvBaselineState.from_details(day, scores['hrv_baseline'])
+        return cls(streaks=streaks, chains=chains, hrv_baseline=hrv_baseline)
@@ -0,0 +1,53 @@
+"""
+连续达标（streak）状态模型
+"""
+from datetime import date, datetime
+from typing import Dict, Optional
+from pydantic import BaseModel, Field
+
+
+class StreakState(BaseModel):
+    """某用户某维度某规则的连续达标状态"""
+    dimension: str
+    rule: str = "super_hard"
+    current_length: int = 0                       # 截至last_scored_date的连续达标天数
+    last_qualifying_date: Optional[date] = None   # 最近一次达标的日期
+    last_scored_date: Optional[date] = None       # 最近一次计算的日期
+    unlocked: bool = False                        # 是否已解锁（连续天数达到要求）
+    context: Dict = Field(default_factory=dict)   # 规则自身需要的滚动上下文（如前两天的运动类型）
+    updated_at: Optional[datetime] = None
+
+    def to_details(self) -> Dict:
+        """转换为随当日积分保存的明细（可JSON序列化）"""
+        return {
+            'rule': self.rule,
+            'length': self.current_length,
+            'qualified': self.last_qualifying_date is not None and self.last_qualifying_date == self.last_scored_date,
+            'unlocked': self.unlocked,
+            'context': self.context,
+        }
+
+    @classmethod
+    def from_details(cls, dimension: str, day: date, details: Optional[Dict]) -> "StreakState":
+        """
+        从某天积分明细中保存的连续达标信息还原当天结束时的状态
+
+        Args:
+            dimension: 维度
+            day: 明细所属的日期
+            details: to_details的结果，None表示当天没有记录
+
+        Returns:
+            当天结束时的状态
+        """
+        if not details:
+            return cls(dimension=dimension, last_scored_date=day)
+        return cls(
+            dimension=dimension,
+            rule=details.get('rule', 'super_hard'),
+            current_length=details.get('length', 0),
+            last_qualifying_date=day if details.get('qualified') else None,
+            last_scored_date=day,
+            unlocked=details.get('unlocked', False),
+            context=details.get('context') or {},
+        )
@@ -0,0 +1,82 @@
+"""
+运动记录（HKWorkout）模型
+"""
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel
+
+
+# HealthKit导出文件中的时间格式，如 "2025-07-01 07:30:00 +0800"
+EXPORT_DATE_FORMAT = "%Y-%m-%d %H:%M:%S %z"
+
+
+class Workout(BaseModel):
+    """一次运动记录"""
+    id: Optional[int] = None
+    user_id: str = "default_user"
+    activity_type: str                              # HKWorkoutActivityType，如 HKWorkoutActivityTypeRunning
+    start_date: datetime
+    end_date: datetime
+    duration_minutes: Optional[float] = None
+    total_energy_kcal: Optional[float] = None
+    total_distance_km: Optional[float] = None
+    avg_heart_rate: Optional[float] = None
+    min_heart_rate: Optional[float] = None
+    max_heart_rate: Optional[float] = None
+    source_name: Optional[str] = None
+    device: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+    @classmethod
+    def from_export_element(cls, element, user_id: str) -> "Workout":
+        """
+        从HealthKit导出文件（export.xml）的Workout元素解析
+
+        能量和心率优先读取子元素WorkoutStatistics（新版导出），没有时读取Workout自身的属性（旧版导出）
+
+        Args:
+            element: Workout元素（xml.etree.ElementTree.Element）
+            user_id: 用户ID
+
+        Returns:
+            运动记录
+        """
+        def number(value: Optional[str]) -> Optional[float]:
+            try:
+                return float(value) if value not in (None, "") else None
+            except ValueError:
+                return None
+
+        stats = {stat.get("type"): stat for stat in element.iter("WorkoutStatistics")}
+        heart_rate = stats.get("HKQuantityTypeIdentifierHeartRate")
+        energy = stats.get("HKQuantityTypeIdentifierActiveEnergyBurned")
+
+        duration = number(element.get("duration"))
+        if duration is not None and element.get("durationUnit") in ("s", "sec"):
+            duration /= 60
+        elif duration is not None and element.get("durationUnit") == "hr":
+            duration *= 60
+
+        distance = number(element.get("totalDistance"))
+        if distance is not None and element.get("totalDistanceUnit") == "m":
+            distance /= 1000
+        elif distance is not None and element.get("totalDistanceUnit") == "mi":
+            distance *= 1.609344
+
+        return cls(
+            user_id=user_id,
+            activity_type=element.get("workoutActivityType"),
+            start_date=datetime.strptime(element.get("startDate"), EXPORT_DATE_FORMAT),
+            end_date=datetime.strptime(element.get("endDate"), EXPORT_DATE_FORMAT),
+            duration_minutes=duration,
+            total_energy_kcal=number(energy.get("sum")) if energy is not None else number(element.get("totalEnergyBurned")),
+            total_distance_km=distance,
+            avg_heart_rate=number(heart_rate.get("average")) if heart_rate is not None else None,
+            min_heart_rate=number(heart_rate.get("minimum")) if heart_rate is not None else None,
+            max_heart_rate=number(heart_rate.get("maximum")) if heart_rate is not None else None,
+            source_name=element.get("sourceName"),
+            device=element.get("device"),
+        )
@@ -0,0 +1,371 @@
+"""
+离线分析服务
+用嵌入式DuckDB在归档文件和数据库快照上做按人群的统计，分析查询不访问线上数据库：
+
+- 快照：定期把user_scores和daily_health_rollup用服务端游标整表导出为Parquet（一次顺序读取），
+  每张表保留最近keep_snapshots个快照，分析时读取最新的一个
+- 归档：直接读取冷归档的Parquet文件（见archive_service.py），month和bucket为分区列
+- 引擎：内存中的DuckDB连接，samples、user_scores、daily_health_rollup注册为视图；
+  还没有快照或归档文件时注册为同结构的空表，报表照常运行并返回空结果
+- 内置报表见REPORTS，参数用$start、$end等命名参数传入
+
+时间列均为UTC。需要duckdb：未安装时无法生成快照和分析
+"""
+import os
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+from ..db.postgresql import POSTGRES_POOL
+from ..db.configs.global_config import ANALYTICS_CONFIG, ARCHIVE_CONFIG
+from ..utils.logger import logger
+
+
+# 快照的表：(列名, DuckDB类型, 数据库中的表达式)；排序列用于压缩和按行组跳过
+SNAPSHOT_TABLES = {
+    "user_scores": {
+        "columns": [
+            ("user_id", "VARCHAR", "user_id"),
+            ("score_date", "DATE", "score_date"),
+            ("dimension", "VARCHAR", "dimension"),
+            ("sub_category", "VARCHAR", "sub_category"),
+            ("difficulty", "VARCHAR", "difficulty"),
+            ("score", "INTEGER", "score"),
+            ("tier_level", "VARCHAR", "tier_level"),
+            ("is_expired", "BOOLEAN", "is_expired"),
+            ("expire_date", "TIMESTAMP", "expire_date AT TIME ZONE 'UTC'"),
+            ("created_at", "TIMESTAMP", "created_at AT TIME ZONE 'UTC'"),
+        ],
+        "order_by": "score_date, user_id",
+    },
+    "daily_health_rollup": {
+        "columns": [
+            ("user_id", "VARCHAR", "user_id"),
+            ("rollup_date", "DATE", "rollup_date"),
+            ("heart_rate_samples", "INTEGER", "heart_rate_samples"),
+            ("max_heart_rate", "INTEGER", "max_heart_rate"),
+            ("zone2_minutes", "INTEGER", "zone2_minutes"),
+            ("steps", "INTEGER", "steps"),
+            ("active_energy", "DOUBLE", "active_energy"),
+            ("water_ml", "DOUBLE", "water_ml"),
+            ("non_workout_steps", "INTEGER", "non_workout_steps"),
+            ("workout_types", "VARCHAR", "workout_types::text"),
+            ("activity_mask", "INTEGER", "activity_mask"),
+            ("stand_bitmap", "INTEGER", "stand_bitmap"),
+            ("water_bitmap", "INTEGER", "water_bitmap"),
+            ("active_bitmap", "INTEGER", "active_bitmap"),
+            ("computed_at", "TIMESTAMP", "computed_at AT TIME ZONE 'UTC'"),
+        ],
+        "order_by": "rollup_date, user_id",
+    },
+}
+
+# 还没有归档文件时samples视图的结构（与归档文件的列和分区列一致）
+SAMPLE_COLUMNS = [
+    ("user_id", "VARCHAR"), ("type", "VARCHAR"), ("source_name", "VARCHAR"), ("source_version", "VARCHAR"),
+    ("device", "VARCHAR"), ("unit", "VARCHAR"), ("creation_date", "TIMESTAMPTZ"), ("start_date", "TIMESTAMPTZ"),
+    ("end_date", "TIMESTAMPTZ"), ("value", "VARCHAR"), ("sample_uuid", "VARCHAR"), ("created_at", "TIMESTAMPTZ"),
+    ("month", "VARCHAR"), ("bucket", "BIGINT"),
+]
+
+# 每个用户在范围内最后一天的等级
+_LATEST_TIER = """
+    SELECT user_id, arg_max(tier_level, score_date) AS tier_level
+    FROM user_scores
+    WHERE dimension = 'total' AND score_date BETWEEN $start AND $end
+    GROUP BY user_id
+"""
+
+# 内置报表：名称 -> (说明, SQL)
+REPORTS = {
+    "dimension_by_tier": (
+        "各等级用户某一维度（$dimension，默认sleep）的日均积分和得分天数占比",
+        """
+        WITH days AS (
+            SELECT user_id, score_date, tier_level
+            FROM user_scores
+            WHERE dimension = 'total' AND score_date BETWEEN $start AND $end
+        ), points AS (
+            SELECT user_id, score_date, SUM(score) AS points
+            FROM user_scores
+            WHERE dimension = $dimension AND score_date BETWEEN $start AND $end
+            GROUP BY user_id, score_date
+        )
+        SELECT d.tier_level,
+               COUNT(DISTINCT d.user_id) AS users,
+               COUNT(*) AS user_days,
+               ROUND(AVG(COALESCE(p.points, 0)), 2) AS avg_daily_points,
+               ROUND(AVG(CASE WHEN p.points IS NULL THEN 0 ELSE 1 END), 3) AS scored_day_ratio
+        FROM days d
+        LEFT JOIN points p USING (user_id, score_date)
+        GROUP BY d.tier_level
+        ORDER BY avg_daily_points DESC
+        """,
+    ),
+    "total_score_by_month": (
+        "按月和等级统计每日总积分的平均值和分位数",
+        """
+        SELECT strftime(score_date, '%Y-%m') AS month, tier_level,
+               COUNT(DISTINCT user_id) AS users,
+               ROUND(AVG(score), 2) AS avg_daily_total,
+               quantile_cont(score, 0.5) AS p50,
+               quantile_cont(score, 0.9) AS p90
+        FROM user_scores
+        WHERE dimension = 'total' AND score_date BETWEEN $start AND $end
+        GROUP BY month, tier_level
+        ORDER BY month, tier_level
+        """,
+    ),
+    "difficulty_mix": (
+        "各维度各难度的得分次数和积分占比",
+        """
+        SELECT dimension, difficulty,
+               COUNT(*) AS awards,
+               SUM(score) AS points,
+               ROUND(SUM(score) / SUM(SUM(score)) OVER (PARTITION BY dimension), 3) AS share_of_dimension
+        FROM user_scores
+        WHERE dimension != 'total' AND score_date BETWEEN $start AND $end
+        GROUP BY dimension, difficulty
+        ORDER BY dimension, points DESC
+        """,
+    ),
+    "activity_by_tier": (
+        "各等级（范围内最后一天的等级）用户的日均步数、Zone 2时长、活动能量、饮水和站立小时",
+        f"""
+        WITH tiers AS ({_LATEST_TIER})
+        SELECT t.tier_level,
+               COUNT(DISTINCT r.user_id) AS users,
+               COUNT(*) AS user_days,
+               ROUND(AVG(r.steps), 0) AS avg_steps,
+               ROUND(AVG(r.zone2_minutes), 1) AS avg_zone2_minutes,
+               ROUND(AVG(r.active_energy), 1) AS avg_active_energy,
+               ROUND(AVG(r.water_ml), 0) AS avg_water_ml,
+               ROUND(AVG(bit_count(r.stand_bitmap)), 1) AS avg_stand_hours
+        FROM daily_health_rollup r
+        JOIN tiers t USING (user_id)
+        WHERE r.rollup_date BETWEEN $start AND $end
+        GROUP BY t.tier_level
+        ORDER BY t.tier_level
+        """,
+    ),
+    "archived_types": (
+        "已归档样本按月份和类型的条数、用户数和数据源数",
+        """
+        SELECT month, type,
+               COUNT(*) AS samples,
+               COUNT(DISTINCT user_id) AS users,
+               COUNT(DISTINCT source_name) AS sources
+        FROM samples
+        WHERE start_date >= CAST($start AS TIMESTAMPTZ) AND start_date < CAST($end AS TIMESTAMPTZ) + INTERVAL 1 DAY
+        GROUP BY month, type
+        ORDER BY month, samples DESC
+        """,
+    ),
+}
+
+
+def _require_duckdb():
+    if duckdb is None:
+        raise RuntimeError("离线分析需要安装duckdb")
+
+
+def _quote(path: Path) -> str:
+    return "'" + str(path).replace("'", "''") + "'"
+
+
+def latest_snapshot(table: str, directory: str = ANALYTICS_CONFIG.snapshot_directory) -> Optional[Path]:
+    """一张表最新的快照文件，没有快照时返回None"""
+    snapshots = sorted(Path(directory).joinpath(table).glob(f"{table}-*.parquet"))
+    return snapshots[-1] if snapshots else None
+
+
+class AnalyticsSnapshotService:
+    """把分析用到的表导出为Parquet快照"""
+
+    def __init__(self, directory: str = ANALYTICS_CONFIG.snapshot_directory,
+                 keep_snapshots: int = ANALYTICS_CONFIG.keep_snapshots,
+                 fetch_rows: int = ANALYTICS_CONFIG.fetch_rows):
+        """
+        Args:
+            directory: 快照目录
+            keep_snapshots: 每张表保留的快照数
+            fetch_rows: 每次从服务端游标读取的行数
+        """
+        self.directory = Path(directory)
+        self.keep_snapshots = keep_snapshots
+        self.fetch_rows = fetch_rows
+
+    def run(self, tables: Optional[Sequence[str]] = None) -> Dict[str, int]:
+        """
+        为各表生成一个新快照
+
+        Args:
+            tables: 表名列表（默认SNAPSHOT_TABLES中的全部表）
+
+        Returns:
+            表名 -> 快照的行数
+        """
+        _require_duckdb()
+        report = {}
+        for table in tables or SNAPSHOT_TABLES:
+            if table not in SNAPSHOT_TABLES:
+                raise ValueError(f"不支持的快照表: {table}")
+            report[table] = self.snapshot(table)
+        return report
+
+    def snapshot(self, table: str) -> int:
+        """
+        导出一张表：数据库中顺序读取写入临时的DuckDB文件，排序后写为Parquet，再改名为正式快照
+
+        Returns:
+            快照的行数
+        """
+        _require_duckdb()
+        spec = SNAPSHOT_TABLES[table]
+        columns = spec["columns"]
+        target_dir = self.directory.joinpath(table)
+        target_dir.mkdir(parents=True, exist_ok=True)
+        stamp = f"{datetime.now():%Y%m%d%H%M%S}"
+        target = target_dir.joinpath(f"{table}-{stamp}.parquet")
+        tmp_parquet = target_dir.joinpath(f"{table}-{stamp}.parquet.tmp")
+        tmp_db = target_dir.joinpath(f"{table}-{stamp}.duckdb.tmp")
+        started = time.perf_counter()
+
+        conn = POSTGRES_POOL.get_connection()
+        if conn is None:
+            raise RuntimeError("获取数据库连接失败")
+        local = duckdb.connect(str(tmp_db))
+        rows = 0
+        try:
+            local.execute(f"CREATE TABLE {table} ({', '.join(f'{name} {kind}' for name, kind, _ in columns)})")
+            with conn.cursor(name=f"analytics_snapshot_{table}") as cursor:
+                cursor.itersize = self.fetch_rows
+                cursor.execute(f"SELECT {', '.join(expression for _, _, expression in columns)} FROM {table}")
+                while True:
+                    chunk = cursor.fetchmany(self.fetch_rows)
+                    if not chunk:
+                        break
+                    frame = pd.DataFrame(chunk, columns=[name for name, _, _ in columns])
+                    local.register("chunk", frame)
+                    local.execute(f"INSERT INTO {table} SELECT * FROM chunk")
+                    local.unregister("chunk")
+                    rows += len(chunk)
+            conn.rollback()
+            local.execute(f"""
+                COPY (SELECT * FROM {table} ORDER BY {spec['order_by']})
+                TO {_quote(tmp_parquet)} (FORMAT PARQUET, COMPRESSION ZSTD)
+            """)
+            os.replace(tmp_parquet, target)
+        except Exception as e:
+            logger.error(f"生成{table}快照失败: {e}")
+            conn.rollback()
+            if tmp_parquet.exists():
+                tmp_parquet.unlink()
+            raise
+        finally:
+            POSTGRES_POOL.put_connection(conn)
+            local.close()
+            for file in (tmp_db, Path(f"{tmp_db}.wal")):
+                if file.exists():
+                    file.unlink()
+
+        self._prune(table)
+        logger.info(f"{table}快照: {rows}行, 耗时{time.perf_counter() - started:.1f}秒 ({target})")
+        return rows
+
+    def _prune(self, table: str):
+        """只保留最近keep_snapshots个快照"""
+        snapshots = sorted(self.directory.joinpath(table).glob(f"{table}-*.parquet"))
+        for old in snapshots[:-self.keep_snapshots] if self.keep_snapshots > 0 else []:
+            old.unlink()
+
+
+class AnalyticsEngine:
+    """在归档文件和最新快照上执行分析查询的DuckDB引擎"""
+
+    def __init__(self, archive_directory: str = ARCHIVE_CONFIG.directory,
+                 snapshot_directory: str = ANALYTICS_CONFIG.snapshot_directory,
+                 threads: int = ANALYTICS_CONFIG.threads, memory_limit: str = ANALYTICS_CONFIG.memory_limit):
+        """
+        Args:
+            archive_directory: 冷归档目录
+            snapshot_directory: 快照目录
+            threads: DuckDB的线程数
+            memory_limit: DuckDB的内存上限
+        """
+        _require_duckdb()
+        self.archive_directory = Path(archive_directory)
+        self.snapshot_directory = snapshot_directory
+        self.connection = duckdb.connect()
+        self.connection.execute(f"SET threads = {int(threads)}")
+        self.connection.execute(f"SET memory_limit = {_quote(memory_limit)}")
+        self.connection.execute("SET TimeZone = 'UTC'")
+        self.sources = self._register_views()
+
+    def query(self, sql: str, params: Optional[Dict] = None) -> pd.DataFrame:
+        """执行一条SQL，params为命名参数（SQL中写作$name）"""
+        return self.connection.execute(sql, params or {}).df()
+
+    def report(self, name: str, start: date, end: date, **params) -> pd.DataFrame:
+        """
+        运行一个内置报表
+
+        Args:
+            name: REPORTS中的报表名称
+            start: 开始日期
+            end: 结束日期（含）
+            **params: 报表的其他参数（如dimension）
+
+        Returns:
+            报表结果
+        """
+        if name not in REPORTS:
+            raise ValueError(f"未知的报表: {name}，可用的报表: {', '.join(REPORTS)}")
+        sql = REPORTS[name][1]
+        params = {"dimension": "sleep", **params, "start": start, "end": end}
+        # 只传入SQL中用到的参数
+        return self.query(sql, {key: value for key, value in params.items() if f"${key}" in sql})
+
+    def close(self):
+        self.connection.close()
+
+    def _register_views(self) -> Dict[str, str]:
+        """
+        注册samples和各快照表的视图
+
+        Returns:
+            视图名 -> 数据来源（文件路径，或"empty"表示还没有数据）
+        """
+        sources = {}
+        archive_glob = self.archive_directory.joinpath("month=*", "bucket=*", "*.parquet")
+        if any(self.archive_directory.glob("month=*/bucket=*/*.parquet")):
+            self.connection.execute(f"""
+                CREATE VIEW samples AS
+                SELECT * FROM read_parquet({_quote(archive_glob)}, hive_partitioning = true)
+            """)
+            sources["samples"] = str(archive_glob)
+        else:
+            self._create_empty("samples", SAMPLE_COLUMNS)
+            sources["samples"] = "empty"
+
+        for table, spec in SNAPSHOT_TABLES.items():
+            path = latest_snapshot(table, self.snapshot_directory)
+            if path is None:
+                self._create_empty(table, [(name, kind) for name, kind, _ in spec["columns"]])
+                sources[table] = "empty"
+                logger.warning(f"{table}还没有快照，请先运行 scripts/run_analytics.py snapshot")
+            else:
+                self.connection.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet({_quote(path)})")
+                sources[table] = str(path)
+        return sources
+
+    def _create_empty(self, name: str, columns: List[tuple]):
+        self.connection.execute(f"CREATE TABLE {name} ({', '.join(f'{column} {kind}' for column, kind in columns)})")
@@ -0,0 +1,369 @@
+"""
+原始样本冷归档服务
+早于保留月数的整月原始样本导出为Parquet文件后从health_samples删除，读取时与数据库合并：
+
+- 每个月一个REPEATABLE READ事务：在同一快照中用服务端游标导出（按用户哈希桶分文件，
+  文件内按用户和时间排序），再删除该月的样本并登记到health_archive_files，删除的恰好是导出的样本；
+  导出期间新写入的样本留在数据库中，读取时两边合并
+- 文件先写到临时路径，事务提交前改名；事务失败时删除本次写入的文件
+- 已归档的月份不再接受重复导入的样本（见db/health_dictionary.py），定期归档时跳过已按当前桶数归档的月份
+- 睡眠样本（KEPT_TYPES）不归档：睡眠分期分析和数据源选择只读取数据库，重算已归档月份的积分时睡眠不受影响
+- 读取按月份和用户哈希桶只打开相关文件，按user_id、type、start_date下推过滤（按行组统计信息跳过）
+
+需要pyarrow：未安装时无法归档，读取时忽略已归档的文件并记录错误
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from ..db.health_dictionary import HEALTH_DICTIONARY
+from ..db.postgresql import POSTGRES_POOL
+from ..db.configs.global_config import ARCHIVE_CONFIG
+from ..models.health_data import HealthDataType
+from ..utils.logger import logger
+
+
+# 归档文件的列：health_metric视图的解码列（时间为UTC）
+ARCHIVE_COLUMNS = [
+    "user_id", "type", "source_name", "source_version", "device", "unit",
+    "creation_date", "start_date", "end_date", "value", "sample_uuid", "created_at",
+]
+
+# 留在数据库中不归档的类型（按类型读取原始样本、不经过ARCHIVE_READER的读取路径用到的类型）
+KEPT_TYPES = [HealthDataType.SLEEP_ANALYSIS.value]
+
+# 读取时返回的列
+READ_COLUMNS = ["user_id", "type", "source_name", "start_date", "end_date", "value"]
+
+
+def user_bucket(user_id: str, buckets: int) -> int:
+    """用户所在的哈希桶，与SQL函数health_archive_bucket一致"""
+    return hashlib.md5(user_id.encode("utf-8")).digest()[0] % buckets
+
+
+def _month_start(day) -> date:
+    return date(day.year, day.month, 1)
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _archive_schema():
+    timestamp = pa.timestamp("us", tz="UTC")
+    return pa.schema([
+        ("user_id", pa.string()),
+        ("type", pa.string()),
+        ("source_name", pa.string()),
+        ("source_version", pa.string()),
+        ("device", pa.string()),
+        ("unit", pa.string()),
+        ("creation_date", timestamp),
+        ("start_date", timestamp),
+        ("end_date", timestamp),
+        ("value", pa.string()),
+        ("sample_uuid", pa.string()),
+        ("created_at", timestamp),
+    ])
+
+
+class HealthArchiveService:
+    """原始样本冷归档服务"""
+
+    def __init__(self, directory: str = ARCHIVE_CONFIG.directory, user_buckets: int = ARCHIVE_CONFIG.user_buckets,
+                 compression: str = ARCHIVE_CONFIG.compression, fetch_rows: int = ARCHIVE_CONFIG.fetch_rows):
+        """
+        Args:
+            directory: 归档目录
+            user_buckets: 每个月按用户哈希分成的文件数
+            compression: Parquet压缩算法
+            fetch_rows: 每次从服务端游标读取的行数（每批写成一个行组）
+        """
+        self.directory = Path(directory)
+        self.user_buckets = user_buckets
+        self.compression = compression
+        self.fetch_rows = fetch_rows
+
+    def run(self, keep_months: int = ARCHIVE_CONFIG.keep_months, today: Optional[date] = None) -> Dict[str, int]:
+        """
+        归档早于最近keep_months个月（不含当月）的所有月份，已按当前桶数归档的月份被跳过
+
+        Returns:
+            统计信息：months（有样本的月份数）、files、rows
+        """
+        if pq is None:
+            raise RuntimeError("归档需要安装pyarrow")
+        month = _month_start(today or date.today())
+        for _ in range(keep_months):
+            month = _month_start(month - timedelta(days=1))
+        report = {"months": 0, "files": 0, "rows": 0}
+
+        first = self._first_month(month, HEALTH_DICTIONARY.type_ids(KEPT_TYPES))
+        archived = self._archived_months()
+        while first is not None and first < month:
+            if first not in archived:
+                files, rows = self.archive_month(first)
+                if rows:
+                    report["months"] += 1
+                    report["files"] += files
+                    report["rows"] += rows
+            first = _next_month(first)
+        logger.info(f"归档完成: {report['months']}个月, {report['files']}个文件, {report['rows']}条样本")
+        return report
+
+    def archive_month(self, month: date):
+        """
+        导出并删除一个月内开始的全部原始样本（一个事务）
+
+        Returns:
+            (写入的文件数, 归档的样本数)
+        """
+        if pq is None:
+            raise RuntimeError("归档需要安装pyarrow")
+        month = _month_start(month)
+        end = _next_month(month)
+        run_id = f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}"
+        written = []  # [桶, 临时路径, 相对路径, 行数, 最早开始, 最晚开始]，开始时间为UTC
+        kept_type_ids = HEALTH_DICTIONARY.type_ids(KEPT_TYPES)
+        started = time.perf_counter()
+
+        conn = POSTGRES_POOL.get_connection()
+        if conn is None:
+            raise RuntimeError("获取数据库连接失败")
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            self._export(conn, month, end, kept_type_ids, run_id, written)
+            exported = sum(file[3] for file in written)
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    DELETE FROM health_samples
+                    WHERE start_date >= %s AND start_date < %s AND user_id IS NOT NULL
+                    AND type_id <> ALL(%s::smallint[])
+                """, (month, end, kept_type_ids))
+                if cursor.rowcount != exported:
+                    raise RuntimeError(f"删除的样本数({cursor.rowcount})与导出的样本数({exported})不一致")
+                for bucket, tmp_path, path, rows, min_start, max_start in written:
+                    os.replace(tmp_path, self.directory / path)
+                    min_start, max_start = (pd.Timestamp(moment).tz_localize("UTC").to_pydatetime()
+                                            for moment in (min_start, max_start))
+                    cursor.execute("""
+                        INSERT INTO health_archive_files (
+                            month, bucket, user_buckets, path, row_count, size_bytes, min_start, max_start, kept_types
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """, (month, int(bucket), self.user_buckets, path, rows,
+                          (self.directory / path).stat().st_size, min_start, max_start, KEPT_TYPES))
+            conn.commit()
+        except Exception as e:
+            logger.error(f"归档{month:%Y-%m}失败: {e}")
+            conn.rollback()
+            for _, tmp_path, path, *_ in written:
+                for file in (tmp_path, self.directory / path):
+                    if file.exists():
+                        file.unlink()
+            raise
+        finally:
+            POSTGRES_POOL.put_connection(conn)
+
+        if written:
+            ARCHIVE_READER.clear()
+            logger.info(f"归档{month:%Y-%m}: {len(written)}个文件, {exported}条样本, "
+                        f"耗时{time.perf_counter() - started:.1f}秒")
+        return len(written), exported
+
+    def _export(self, conn, month: date, end: date, kept_type_ids: List[int], run_id: str, written: List[list]):
+        """用服务端游标按(桶, 用户, 开始时间)顺序读取该月的样本，每个桶写一个临时文件并登记到written"""
+        schema = _archive_schema()
+        writer = current = None
+
+        try:
+            with conn.cursor(name=f"health_archive_{run_id.replace('-', '_')}") as cursor:
+                cursor.itersize = self.fetch_rows
+                cursor.execute("""
+                    SELECT health_archive_bucket(h.user_id, %s) AS bucket,
+                           h.user_id, t.name, src.source_name, src.source_version, src.device, h.unit,
+                           h.creation_date AT TIME ZONE 'UTC', h.start_date AT TIME ZONE 'UTC',
+                           h.end_date AT TIME ZONE 'UTC', h.value, h.sample_uuid::text,
+                           h.created_at AT TIME ZONE 'UTC'
+                    FROM health_samples h
+                    JOIN health_metric_types t ON t.id = h.type_id
+                    LEFT JOIN health_metric_sources src ON src.id = h.source_id
+                    WHERE h.start_date >= %s AND h.start_date < %s AND h.user_id IS NOT NULL
+                    AND h.type_id <> ALL(%s::smallint[])
+                    ORDER BY bucket, h.user_id, h.start_date
+                """, (self.user_buckets, month, end, kept_type_ids))
+                while True:
+                    rows = cursor.fetchmany(self.fetch_rows)
+                    if not rows:
+                        break
+                    frame = pd.DataFrame(rows, columns=["bucket"] + ARCHIVE_COLUMNS)
+                    for bucket, part in frame.groupby("bucket", sort=False):
+                        if bucket != current:
+                            if writer is not None:
+                                writer.close()
+                            path = f"month={month:%Y-%m}/bucket={bucket:03d}/part-{run_id}.parquet"
+                            tmp_path = self.directory / f"{path}.tmp"
+                            tmp_path.parent.mkdir(parents=True, exist_ok=True)
+                            written.append([bucket, tmp_path, path, 0, None, None])
+                            writer = pq.ParquetWriter(str(tmp_path), schema, compression=self.compression)
+                            current = bucket
+                        writer.write_table(pa.Table.from_pandas(part[ARCHIVE_COLUMNS], schema=schema,
+                                                                preserve_index=False))
+                        entry = written[-1]
+                        entry[3] += len(part)
+                        if entry[4] is None:
+                            entry[4] = part["start_date"].iloc[0]
+                        entry[5] = part["start_date"].iloc[-1]
+        finally:
+            if writer is not None:
+                writer.close()
+
+    @staticmethod
+    def _first_month(before: date, kept_type_ids: List[int]) -> Optional[date]:
+        """最早一条需要归档的原始样本所在的月份（早于before时），不归档的类型（睡眠）不计入"""
+        row = POSTGRES_POOL._execute_query("""
+            SELECT MIN(start_date) FROM health_samples
+            WHERE start_date < %s AND user_id IS NOT NULL AND type_id <> ALL(%s::smallint[])
+        """, (before, kept_type_ids), fetch_one=True)
+        if row is None:
+            raise RuntimeError("读取最早的样本失败")
+        return _month_start(row[0]) if row[0] else None
+
+    def _archived_months(self) -> Set[date]:
+        """已按当前桶数归档的月份（归档事务中写入的样本留在数据库中，不再重复归档）"""
+        rows = POSTGRES_POOL._execute_query(
+            "SELECT DISTINCT month FROM health_archive_files WHERE user_buckets = %s",
+            (self.user_buckets,), fetch_all=True
+        )
+        if rows is None:
+            raise RuntimeError("读取已归档的月份失败")
+        return {row[0] for row in rows}
+
+
+class HealthArchiveReader:
+    """
+    已归档样本的读取，与数据库中的样本合并使用
+
+    归档清单按ttl_seconds缓存；范围内没有归档月份时不读取任何文件
+    """
+
+    def __init__(self, directory: str = ARCHIVE_CONFIG.directory,
+                 ttl_seconds: float = ARCHIVE_CONFIG.manifest_ttl_seconds):
+        self.directory = Path(directory)
+        self.ttl_seconds = ttl_seconds
+        self._files: Optional[Dict[date, List[tuple]]] = None
+        self._loaded_at = 0.0
+        self._timezone: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def read_samples(self, user_ids: Iterable[str], types: Iterable[str],
+                     start: datetime, end: datetime) -> Optional[pd.DataFrame]:
+        """
+        读取已归档的、与[start, end)相交的样本（start_date < end且end_date >= start）
+
+        Args:
+            user_ids: 用户ID列表
+            types: 类型名称列表
+            start: 开始时间（数据库会话时区的本地时间）
+            end: 结束时间
+
+        Returns:
+            列为user_id、type、source_name、start_date、end_date（缺失时为start_date）、value的DataFrame，
+            时间为数据库会话时区的带时区时间；范围内没有归档文件时返回None
+        """
+        user_ids = list(user_ids)
+        paths = self._paths(user_ids, start, end)
+        if not paths:
+            return None
+        if pq is None:
+            logger.error(f"有{len(paths)}个归档文件需要读取，但没有安装pyarrow，已归档的样本被忽略")
+            return None
+
+        start, end = self.localize(start), self.localize(end)
+        filters = [("user_id", "in", user_ids), ("start_date", "<", end.tz_convert("UTC").to_pydatetime())]
+        types = [getattr(t, "value", t) for t in types]
+        if types:
+            filters.append(("type", "in", types))
+        tables = []
+        for path in paths:
+            try:
+                tables.append(pq.read_table(self.directory / path, columns=READ_COLUMNS,
+                                            filters=filters, memory_map=True))
+            except Exception as e:
+                logger.error(f"读取归档文件{path}失败: {e}")
+        if not tables:
+            return None
+
+        frame = pa.concat_tables(tables).to_pandas()
+        for column in ("start_date", "end_date"):
+            frame[column] = frame[column].dt.tz_convert(self._session_timezone())
+        frame["end_date"] = frame["end_date"].fillna(frame["start_date"])
+        return frame[frame["end_date"] >= start].reset_index(drop=True)
+
+    def localize(self, moment: datetime) -> pd.Timestamp:
+        """数据库会话时区的本地时间转为带时区时间（与SQL中timestamp转timestamptz一致）"""
+        moment = pd.Timestamp(moment)
+        if moment.tzinfo is not None:
+            return moment.tz_convert(self._session_timezone())
+        return moment.tz_localize(self._session_timezone(), ambiguous=True, nonexistent="shift_forward")
+
+    def clear(self):
+        """丢弃缓存的归档清单"""
+        with self._lock:
+            self._files = None
+
+    def _paths(self, user_ids: List[str], start: datetime, end: datetime) -> List[str]:
+        """与范围相交的归档月份中，这些用户所在桶的文件（相对路径）"""
+        files = self._manifest()
+        if not files:
+            return []
+        # 前一个月开始的样本可能跨过start
+        month = _month_start(start - timedelta(days=1))
+        paths = []
+        end = pd.Timestamp(end)
+        while pd.Timestamp(month) < end:
+            for bucket, user_buckets, path in files.get(month, ()):
+                if any(user_bucket(user_id, user_buckets) == bucket for user_id in user_ids):
+                    paths.append(path)
+            month = _next_month(month)
+        return paths
+
+    def _manifest(self) -> Dict[date, List[tuple]]:
+        with self._lock:
+            if self._files is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+                return self._files
+        rows = POSTGRES_POOL._execute_query(
+            "SELECT month, bucket, user_buckets, path FROM health_archive_files", fetch_all=True
+        )
+        if rows is None:
+            # 表不存在或数据库不可用：不缓存，下次重试
+            return {}
+        files: Dict[date, List[tuple]] = {}
+        for row in rows:
+            files.setdefault(row[0], []).append((row[1], row[2], row[3]))
+        with self._lock:
+            self._files = files
+            self._loaded_at = time.monotonic()
+        return files
+
+    def _session_timezone(self) -> str:
+        if self._timezone is None:
+            row = POSTGRES_POOL._execute_query("SELECT current_setting('TimeZone')", fetch_one=True)
+            self._timezone = row[0] if row else "UTC"
+        return self._timezone
+
+
+ARCHIVE_READER = HealthArchiveReader()
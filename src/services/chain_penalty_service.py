@@ -0,0 +1,112 @@
+"""
+连锁规则计数器服务
+负责读取和保存每个用户每条连锁失去反应规则的滚动计数器状态
+"""
+from datetime import datetime
+from typing import Dict, List
+from psycopg2.extras import execute_values
+from ..db.postgresql import POSTGRES_POOL
+from ..models.chain_penalty import ChainCounterState
+from ..utils.logger import logger
+
+
+class ChainPenaltyService:
+    """连锁规则计数器服务"""
+
+    def get_states(self, user_ids: List[str]) -> Dict[str, Dict[str, ChainCounterState]]:
+        """
+        读取用户已保存的最新状态
+
+        Args:
+            user_ids: 用户ID列表
+
+        Returns:
+            用户ID到 {规则名: 状态} 的字典
+        """
+        states: Dict[str, Dict[str, ChainCounterState]] = {user_id: {} for user_id in user_ids}
+        if not user_ids:
+            return states
+
+        try:
+            rows = POSTGRES_POOL._execute_query("""
+                SELECT user_id, rule, dimension, trigger_length, recovery_length, active,
+                       window_mask, last_scored_date, blocked, recovered_points, updated_at
+                FROM user_chain_counters
+                WHERE user_id = ANY(%s)
+            """, (list(user_ids),), fetch_all=True) or []
+            for row in rows:
+                states.setdefault(row['user_id'], {})[row['rule']] = ChainCounterState(
+                    rule=row['rule'],
+                    dimension=row['dimension'],
+                    trigger_length=row['trigger_length'],
+                    recovery_length=row['recovery_length'],
+                    active=row['active'],
+                    window_mask=row['window_mask'],
+                    last_scored_date=row['last_scored_date'],
+                    blocked=row['blocked'],
+                    recovered_points=row['recovered_points'],
+                    updated_at=row['updated_at'],
+                )
+        except Exception as e:
+            logger.error(f"读取连锁规则计数器失败: {e}")
+        return states
+
+    def save_states(self, user_id: str, states: List[ChainCounterState]) -> bool:
+        """保存一个用户的状态"""
+        return self.save_states_bulk({user_id: states}) == len(states)
+
+    def save_states_bulk(self, states_by_user: Dict[str, List[ChainCounterState]]) -> int:
+        """
+        批量保存状态，已保存的状态只会被同一天或更晚的状态覆盖
+
+        Args:
+            states_by_user: 用户ID到状态列表的字典
+
+        Returns:
+            保存的行数
+        """
+        rows = [
+            (user_id, state.rule, state.dimension, state.trigger_length, state.recovery_length, state.active,
+             state.window_mask, state.last_scored_date, state.blocked, state.recovered_points, datetime.now())
+            for user_id, states in states_by_user.items()
+            for state in states
+        ]
+        if not rows:
+            return 0
+
+        conn = None
+        cursor = None
+        try:
+            conn = POSTGRES_POOL.get_connection()
+            cursor = conn.cursor()
+            execute_values(cursor, """
+                INSERT INTO user_chain_counters
+                (user_id, rule, dimension, trigger_length, recovery_length, active,
+                 window_mask, last_scored_date, blocked, recovered_points, updated_at)
+                VALUES %s
+                ON CONFLICT (user_id, rule)
+                DO UPDATE SET
+                    dimension = EXCLUDED.dimension,
+                    trigger_length = EXCLUDED.trigger_length,
+                    recovery_length = EXCLUDED.recovery_length,
+                    active = EXCLUDED.active,
+                    window_mask = EXCLUDED.window_mask,
+                    last_scored_date = EXCLUDED.last_scored_date,
+                    blocked = EXCLUDED.blocked,
+                    recovered_points = EXCLUDED.recovered_points,
+                    updated_at = EXCLUDED.updated_at
+                WHERE user_chain_counters.last_scored_date IS NULL
+                   OR EXCLUDED.last_scored_date >= user_chain_counters.last_scored_date
+            """, rows, page_size=1000)
+            conn.commit()
+            return len(rows)
+        except Exception as e:
+            logger.error(f"保存连锁规则计数器失败: {e}")
+            if conn:
+                conn.rollback()
+            return 0
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                POSTGRES_POOL.put_connection(conn)
@@ -0,0 +1,264 @@
+"""
+CSV并行导入服务
+按块读取HealthKit导出的CSV（显式列类型），在写入进程中做向量化的空值和时间格式规范化，
+每个写入进程COPY到自己的暂存表，全部块写完后用集合语句合并到health_samples
+（类型和来源编码为字典id，ON CONFLICT DO NOTHING，自然键已存在的样本不会重复写入）
+
+导入可续传：每块写入暂存表与记录该块已完成在同一事务中提交（csv_import_chunks），
+重新运行同一文件的导入时跳过已完成的块，从第一个未完成块的行偏移继续读取
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Dict, Optional, Set, Tuple
+
+import pandas as pd
+
+from ..db.health_dictionary import merge_samples
+from ..db.postgresql import POSTGRES_POOL
+from ..db.configs.global_config import CSV_IMPORT_CONFIG
+from .export_import_service import COPY_COLUMNS
+from ..utils.logger import logger
+
+
+# CSV中读取的列，全部按字符串读取（不让pandas推断类型），user_id列可以没有
+CSV_DTYPES = {
+    "type": "string", "source_name": "string", "source_version": "string", "unit": "string",
+    "creation_date": "string", "start_date": "string", "end_date": "string", "value": "string",
+    "device": "string", "user_id": "string",
+}
+DATE_COLUMNS = ["creation_date", "start_date", "end_date"]
+
+# 时间末尾的UTC偏移（HealthKit导出的 +0800、ISO格式的 +08:00 或 Z）
+UTC_OFFSET_PATTERN = r"\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?\s*(?:Z|[+-]\d{2}(?::?\d{2})?)$"
+
+# 写入进程中的暂存表名（由进程池初始化函数创建）
+_WORKER_STAGING_TABLE = None
+
+
+def _init_worker(import_id: str):
+    """进程池初始化：每个写入进程创建一张自己的暂存表"""
+    global _WORKER_STAGING_TABLE
+    _WORKER_STAGING_TABLE = f"health_metric_staging_{import_id[:12]}_{os.getpid()}"
+    POSTGRES_POOL._execute_query(f"""
+        CREATE TABLE IF NOT EXISTS {_WORKER_STAGING_TABLE} AS
+        SELECT {", ".join(COPY_COLUMNS)} FROM health_metric WITH NO DATA
+    """, commit=True)
+
+
+def normalize_chunk(chunk: pd.DataFrame, user_id: str) -> Tuple[pd.DataFrame, int]:
+    """
+    向量化规范化一块CSV数据
+
+    去掉首尾空白，空字符串记为空值；带UTC偏移的时间转为UTC的ISO格式，不带偏移的时间保持为本地时间
+    （不带偏移写入，COPY时按数据库会话时区解释，与SQL中timestamp转timestamptz一致），无法解析的记为空值；
+    缺少type或start_date的行被丢弃。CSV没有user_id列（或为空）时使用传入的user_id
+
+    Returns:
+        (按COPY_COLUMNS排列的数据, 丢弃的行数)
+    """
+    frame = pd.DataFrame(index=chunk.index)
+    for column in COPY_COLUMNS:
+        values = chunk[column] if column in chunk.columns else pd.Series(pd.NA, index=chunk.index, dtype="string")
+        values = values.str.strip()
+        frame[column] = values.mask((values == "").fillna(False))
+
+    for column in DATE_COLUMNS:
+        # 不带偏移的时间按UTC解析不会改变数值，格式化时不加偏移即为原本的本地时间
+        parsed = pd.to_datetime(frame[column], errors="coerce", utc=True, format="mixed")
+        has_offset = frame[column].str.contains(UTC_OFFSET_PATTERN, regex=True).fillna(False).astype(bool)
+        text = parsed.dt.strftime("%Y-%m-%d %H:%M:%S").astype("string")
+        frame[column] = text.mask(has_offset, text + "+00:00")
+
+    frame["user_id"] = frame["user_id"].fillna(user_id)
+    valid = frame["type"].notna() & frame["start_date"].notna()
+    return frame[valid], int((~valid).sum())
+
+
+def _stage_chunk(import_id: str, chunk_index: int, row_offset: int, chunk: pd.DataFrame,
+                 user_id: str) -> Dict[str, int]:
+    """
+    规范化一块数据并COPY到本进程的暂存表（在写入进程中运行），与块完成记录在同一事务中提交
+
+    Returns:
+        chunk_index、rows（写入的行数）和skipped（丢弃的行数）
+    """
+    frame, skipped = normalize_chunk(chunk, user_id)
+    buffer = io.StringIO()
+    frame.to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+
+    conn = POSTGRES_POOL.get_connection()
+    if conn is None:
+        raise RuntimeError("获取数据库连接失败")
+    try:
+        with conn.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {_WORKER_STAGING_TABLE} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+            cursor.execute("""
+                INSERT INTO csv_import_chunks (import_id, chunk_index, row_offset, row_count, staging_table)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (import_id, chunk_index, row_offset, len(frame), _WORKER_STAGING_TABLE))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        POSTGRES_POOL.put_connection(conn)
+    return {"chunk_index": chunk_index, "rows": len(frame), "skipped": skipped}
+
+
+class CsvImportService:
+    """CSV并行导入服务"""
+
+    def __init__(self, max_workers: Optional[int] = None, chunk_size: Optional[int] = None):
+        self.max_workers = max_workers or CSV_IMPORT_CONFIG.max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size or CSV_IMPORT_CONFIG.chunk_size
+
+    @staticmethod
+    def import_id_for(path: str) -> str:
+        """由文件路径、大小和修改时间得到导入ID，同一文件重新运行时得到同一ID（用于续传）"""
+        stat = os.stat(path)
+        key = f"{os.path.abspath(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def import_csv(self, path: str, user_id: str = "default_user", import_id: Optional[str] = None) -> Dict:
+        """
+        导入一个CSV文件
+
+        Args:
+            path: CSV路径（表头包含type、start_date等列）
+            user_id: CSV没有user_id列时导入到的用户ID
+            import_id: 导入ID，默认由文件得到；相同ID的导入会从上次中断的块继续
+
+        Returns:
+            统计信息：import_id、chunks、resumed_chunks、rows、skipped、merged（新写入health_metric的行数，
+            其余为已有的重复样本）、seconds、rows_per_second
+        """
+        import_id = import_id or self.import_id_for(path)
+        chunk_size, merged, done = self._start(import_id, path)
+        report = {"import_id": import_id, "chunks": 0, "resumed_chunks": len(done), "rows": 0, "skipped": 0,
+                  "merged": 0}
+        if merged:
+            logger.info(f"导入{import_id}已完成合并，跳过")
+            return report
+
+        # 从第一个未完成的块开始读取（之后已完成的块读取后跳过）；
+        # 用函数判断要跳过的行，pandas不会把要跳过的行号展开成集合
+        first_pending = 0
+        while first_pending in done:
+            first_pending += 1
+        skip = first_pending * chunk_size
+        reader = pd.read_csv(
+            path, dtype=CSV_DTYPES, usecols=lambda column: column in CSV_DTYPES, keep_default_na=False,
+            chunksize=chunk_size, skiprows=lambda i: 0 < i <= skip
+        )
+
+        started = time.perf_counter()
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(import_id,)) as executor:
+            pending: Set[Future] = set()
+            for chunk_index, chunk in enumerate(reader, start=first_pending):
+                if chunk_index in done:
+                    continue
+                # 限制已读取但未写入的块数，读取速度快于写入时内存不会增长
+                while len(pending) >= self.max_workers * CSV_IMPORT_CONFIG.pending_per_worker:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._collect(finished, report, started)
+                pending.add(executor.submit(
+                    _stage_chunk, import_id, chunk_index, chunk_index * chunk_size, chunk, user_id
+                ))
+            finished, _ = wait(pending)
+            self._collect(finished, report, started)
+
+        report["merged"] = self._merge(import_id)
+        report["seconds"] = round(time.perf_counter() - started, 3)
+        report["rows_per_second"] = round(report["rows"] / report["seconds"], 1) if report["seconds"] > 0 else 0.0
+        logger.info(f"CSV导入完成: 写入{report['rows']}行（续传跳过{report['resumed_chunks']}块）, "
+                    f"合并{report['merged']}行, 丢弃{report['skipped']}行, 耗时{report['seconds']}秒, "
+                    f"{report['rows_per_second']}行/秒")
+        return report
+
+    @staticmethod
+    def _collect(finished: Set[Future], report: Dict, started: float):
+        """汇总已完成的块并报告进度（某块失败时抛出异常，已完成的块下次续传）"""
+        for future in finished:
+            result = future.result()
+            report["chunks"] += 1
+            report["rows"] += result["rows"]
+            report["skipped"] += result["skipped"]
+        elapsed = time.perf_counter() - started
+        logger.info(f"已写入{report['chunks']}块、{report['rows']}行，{report['rows'] / max(elapsed, 1e-9):.0f}行/秒")
+
+    def _start(self, import_id: str, path: str) -> Tuple[int, bool, Set[int]]:
+        """
+        登记导入并读取续传状态
+
+        Returns:
+            (块大小（续传时沿用第一次的值）, 是否已合并, 已完成的块下标)
+        """
+        POSTGRES_POOL._execute_query("""
+            INSERT INTO csv_imports (import_id, source_path, chunk_size)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (import_id) DO NOTHING
+        """, (import_id, os.path.abspath(path), self.chunk_size), commit=True)
+        row = POSTGRES_POOL._execute_query(
+            "SELECT chunk_size, merged_at FROM csv_imports WHERE import_id = %s", (import_id,), fetch_one=True
+        )
+        if row is None:
+            raise RuntimeError(f"登记导入{import_id}失败")
+        chunks = POSTGRES_POOL._execute_query(
+            "SELECT chunk_index FROM csv_import_chunks WHERE import_id = %s", (import_id,), fetch_all=True
+        ) or []
+        return row["chunk_size"], row["merged_at"] is not None, {chunk["chunk_index"] for chunk in chunks}
+
+    @staticmethod
+    def _merge(import_id: str) -> int:
+        """
+        将本次导入的所有暂存表用集合语句合并到health_samples（跳过自然键已存在的样本），
+        标记导入完成、删除暂存表并把合并的用户日期加入待重算队列（同一事务），之后按合并的用户和日期范围使缓存失效
+
+        Returns:
+            新写入的行数
+        """
+        tables = [row["staging_table"] for row in POSTGRES_POOL._execute_query(
+            "SELECT DISTINCT staging_table FROM csv_import_chunks WHERE import_id = %s", (import_id,), fetch_all=True
+        ) or []]
+        columns = ", ".join(COPY_COLUMNS)
+        staged = " UNION ALL ".join(f"SELECT {columns} FROM {table}" for table in tables)
+
+        conn = POSTGRES_POOL.get_connection()
+        if conn is None:
+            raise RuntimeError("获取数据库连接失败")
+        try:
+            with conn.cursor() as cursor:
+                ranges = []
+                merged = 0
+                if tables:
+                    cursor.execute(f"""
+                        SELECT user_id, MIN(start_date), MAX(COALESCE(end_date, start_date))
+                        FROM ({staged}) AS staged
+                        GROUP BY user_id
+                    """)
+                    ranges = cursor.fetchall()
+                    merged = merge_samples(cursor, f"({staged})")
+                cursor.execute("UPDATE csv_imports SET merged_at = CURRENT_TIMESTAMP WHERE import_id = %s", (import_id,))
+                for table in tables:
+                    cursor.execute(f"DROP TABLE IF EXISTS {table}")
+                # 待重算的日期和每日汇总缓存的删除与样本一起提交
+                ranges = POSTGRES_POOL._queue_ingest(cursor, "health_metric", ["user_id", "start_date", "end_date"], ranges)
+            conn.commit()
+        except Exception as e:
+            logger.error(f"合并导入{import_id}的暂存表失败: {e}")
+            conn.rollback()
+            raise
+        finally:
+            POSTGRES_POOL.put_connection(conn)
+
+        POSTGRES_POOL._broadcast_ingest(ranges)
+        return merged
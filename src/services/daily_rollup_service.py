@@ -0,0 +1,533 @@
+"""
+每日汇总缓存服务
+按(用户, 日期)缓存由原始样本计算出的汇总值（如心率区间时长），积分计算只读取缓存，不再扫描原始样本
+
+缓存行在对应日期有新数据入库时被删除（见PostgreSQLConnectionPool._record_ingest_ranges），下次读取时重新计算。
+计算开始后又有新数据入库的用户日（score_dirty_days.queued_at不早于计算开始时间）和还没结束的日期只返回、不写入缓存。
+"""
+import json
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from ..db.health_dictionary import HEALTH_DICTIONARY
+from ..db.postgresql import POSTGRES_POOL
+from ..models.daily_rollup import DailyRollup
+from ..models.health_data import HealthDataType
+from ..core.hr_zones import SECONDS_PER_DAY, ZONE2_INDEX, resolve_max_heart_rate, zone_minutes_by_day
+from ..core.intervals import merge_intervals, subtract_intervals
+from ..core.activity_masks import STRENGTH_MASK, activity_mask
+from ..core.source_priority import deduplicate_by_priority, source_ranks
+from ..core.hourly_bitmaps import hourly_bitmaps_by_day
+from ..db.configs.global_config import HOURLY_ACTIVITY_CONFIG, RETENTION_CONFIG
+from .archive_service import ARCHIVE_READER
+from ..utils.logger import logger
+
+
+class DailyRollupService:
+    """每日汇总缓存服务"""
+
+    # 汇总内容变化时加1，版本较低的缓存行视为缺失并重新计算
+    ROLLUP_VERSION = 6
+
+    def get_rollups(self, user_ids: List[str], start_date: datetime,
+                    end_date: datetime) -> Dict[Tuple[str, str], DailyRollup]:
+        """
+        获取多个用户在日期范围内的每日汇总，缺失的用户日从原始样本计算后写入缓存
+
+        Args:
+            user_ids: 用户ID列表
+            start_date: 开始日期
+            end_date: 结束日期（含）
+
+        Returns:
+            (user_id, 'YYYY-MM-DD') 到汇总的字典，包含范围内的每一个用户和日期
+        """
+        first_day = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        last_day = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+
+        rollups = self._load(user_ids, first_day, last_day)
+
+        n_days = (last_day - first_day).days + 1
+        missing_users = [
+            user_id for user_id in user_ids
+            if any((user_id, (first_day + timedelta(days=i)).strftime('%Y-%m-%d')) not in rollups
+                   for i in range(n_days))
+        ]
+        if missing_users:
+            computed_since = self._db_now()
+            computed = self._compute(missing_users, first_day, n_days)
+            new_rollups = {key: rollup for key, rollup in computed.items() if key not in rollups}
+            if computed_since is not None:
+                self._save(list(new_rollups.values()), computed_since)
+            rollups.update(new_rollups)
+        return rollups
+
+    def _load(self, user_ids: List[str], first_day: datetime, last_day: datetime) -> Dict[Tuple[str, str], DailyRollup]:
+        """读取已缓存的汇总"""
+        rollups = {}
+        try:
+            rows = POSTGRES_POOL._execute_query("""
+                SELECT user_id, rollup_date, heart_rate_samples, max_heart_rate,
+                       zone_minutes, zone2_minutes, steps, active_energy, water_ml, non_workout_steps,
+                       workout_types, activity_mask, strength_minutes, stand_bitmap, water_bitmap, active_bitmap,
+                       computed_at
+                FROM daily_health_rollup
+                WHERE user_id = ANY(%s)
+                AND rollup_date BETWEEN %s AND %s
+                AND rollup_version >= %s
+            """, (user_ids, first_day.date(), last_day.date(), self.ROLLUP_VERSION), fetch_all=True) or []
+            for row in rows:
+                rollups[(row['user_id'], row['rollup_date'].isoformat())] = DailyRollup(
+                    user_id=row['user_id'],
+                    rollup_date=row['rollup_date'],
+                    heart_rate_samples=row['heart_rate_samples'],
+                    max_heart_rate=row['max_heart_rate'],
+                    zone_minutes=row['zone_minutes'] or [],
+                    zone2_minutes=row['zone2_minutes'],
+                    steps=row['steps'],
+                    active_energy=row['active_energy'],
+                    water_ml=row['water_ml'],
+                    non_workout_steps=row['non_workout_steps'],
+                    workout_types=row['workout_types'],
+                    activity_mask=row['activity_mask'],
+                    strength_minutes=row['strength_minutes'],
+                    stand_bitmap=row['stand_bitmap'],
+                    water_bitmap=row['water_bitmap'],
+                    active_bitmap=row['active_bitmap'],
+                    computed_at=row['computed_at'],
+                )
+        except Exception as e:
+            logger.error(f"读取每日汇总缓存失败: {e}")
+        return rollups
+
+    def _compute(self, user_ids: List[str], first_day: datetime, n_days: int) -> Dict[Tuple[str, str], DailyRollup]:
+        """从原始样本计算各用户日的汇总值"""
+        rollups = {}
+        for i, user_id in enumerate(user_ids):
+            for d in range(n_days):
+                day = (first_day + timedelta(days=d)).date()
+                rollups[(user_id, day.isoformat())] = DailyRollup(user_id=user_id, rollup_date=day)
+
+        try:
+            workouts, workout_types = self._query_workouts(user_ids, first_day, n_days)
+            self._compute_heart_rate_zones(user_ids, first_day, n_days, rollups)
+            self._compute_additive_totals(user_ids, first_day, n_days, rollups, workouts)
+            self._compute_activity_masks(user_ids, first_day, n_days, rollups, workouts, workout_types)
+            self._compute_hourly_bitmaps(user_ids, first_day, n_days, rollups)
+        except Exception as e:
+            logger.error(f"计算每日汇总失败: {e}")
+            return {}
+        return rollups
+
+    def _query_samples(self, user_ids: List[str], first_day: datetime, n_days: int, data_type: str,
+                       excluded_category: Optional[str] = None, with_sources: bool = False):
+        """
+        读取一类原始样本，返回 (用户下标, 开始秒数, 结束秒数, 值) 的数组
+
+        用户下标和距第一天0点的秒数在查询中算好，结果直接转为数组。
+        传入excluded_category时按类别样本读取：值等于excluded_category的记为0，其余记为1。
+        with_sources为True时同时返回各样本的数据源名称列表
+
+        按字典id读取health_samples（不经过health_metric视图的连接），类型从未出现过时返回空数组。
+        有保留策略的类型同时读取压缩层，已归档的月份同时读取归档文件
+        """
+        type_id = HEALTH_DICTIONARY.type_id(data_type)
+        if type_id is None:
+            empty = np.empty((0, 4), dtype=np.float64)
+            return (empty, []) if with_sources else empty
+        if excluded_category is None:
+            value, value_filter, value_params = "CAST(h.value AS FLOAT)", "AND h.value ~ '^[0-9.]+$'", ()
+        else:
+            value, value_filter, value_params = "CASE WHEN h.value = %s THEN 0 ELSE 1 END", "", (excluded_category,)
+        end = first_day + timedelta(days=n_days)
+        sample_sql = f"""
+            SELECT h.user_id, h.start_date, COALESCE(h.end_date, h.start_date) AS end_date,
+                   {value} AS value, h.source_id
+            FROM health_samples h
+            WHERE h.user_id = ANY(%s)
+            AND h.type_id = %s
+            AND h.start_date < %s
+            AND COALESCE(h.end_date, h.start_date) >= %s
+            {value_filter}
+        """
+        params = value_params + (user_ids, type_id, end, first_day)
+        if excluded_category is None and getattr(data_type, "value", data_type) in RETENTION_CONFIG.bucket_seconds:
+            # 超过保留期的样本已压缩为时间桶（见retention_service.py），每个桶按一个平均值样本读取
+            sample_sql += """
+            UNION ALL
+            SELECT c.user_id, c.bucket_start, c.bucket_end, c.avg_value, c.source_id
+            FROM health_samples_compacted c
+            WHERE c.user_id = ANY(%s)
+            AND c.type_id = %s
+            AND c.bucket_start < %s
+            AND c.bucket_end >= %s
+            """
+            params += (user_ids, type_id, end, first_day)
+        rows = POSTGRES_POOL._execute_query(f"""
+            SELECT array_position(%s::text[], s.user_id::text) - 1 AS user_index,
+                   EXTRACT(EPOCH FROM (s.start_date - %s::timestamp)) AS start_seconds,
+                   EXTRACT(EPOCH FROM (s.end_date - %s::timestamp)) AS end_seconds,
+                   s.value
+                   {", src.source_name" if with_sources else ""}
+            FROM ({sample_sql}) AS s
+            {"LEFT JOIN health_metric_sources src ON src.id = s.source_id" if with_sources else ""}
+        """, (user_ids, first_day, first_day) + params, fetch_all=True)
+        if rows is None:
+            raise RuntimeError(f"读取{data_type}样本失败")
+        samples = np.array([row[:4] for row in rows], dtype=np.float64).reshape(-1, 4)
+        sources = [row[4] for row in rows] if with_sources else None
+
+        archived = ARCHIVE_READER.read_samples(user_ids, [data_type], first_day, end)
+        if archived is not None and len(archived):
+            archived_samples, archived_sources = self._archived_samples(archived, user_ids, first_day,
+                                                                        excluded_category)
+            samples = np.vstack([samples, archived_samples])
+            if with_sources:
+                sources += archived_sources
+        return (samples, sources) if with_sources else samples
+
+    @staticmethod
+    def _archived_samples(archived, user_ids: List[str], first_day: datetime,
+                          excluded_category: Optional[str]) -> Tuple[np.ndarray, List[str]]:
+        """已归档的样本转为与_query_samples相同的 (用户下标, 开始秒数, 结束秒数, 值) 数组，值的口径与查询一致"""
+        if excluded_category is None:
+            numeric = archived["value"].str.fullmatch(r"[0-9.]+").eq(True)
+            archived = archived[numeric]
+            values = pd.to_numeric(archived["value"], errors="coerce").to_numpy(dtype=np.float64)
+        else:
+            values = (archived["value"] != excluded_category).to_numpy(dtype=np.float64)
+        base = ARCHIVE_READER.localize(first_day)
+        user_index = {user_id: index for index, user_id in enumerate(user_ids)}
+        samples = np.column_stack([
+            archived["user_id"].map(user_index).to_numpy(dtype=np.float64),
+            (archived["start_date"] - base).dt.total_seconds().to_numpy(dtype=np.float64),
+            (archived["end_date"] - base).dt.total_seconds().to_numpy(dtype=np.float64),
+            values,
+        ]).reshape(-1, 4)
+        return samples, archived["source_name"].tolist()
+
+    def _query_deduplicated(self, user_ids: List[str], first_day: datetime, n_days: int,
+                            data_type: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        读取一类累加型样本并按数据源优先级去重（见core/source_priority.py）
+
+        与每日汇总的口径一致，只保留完全落在当天的样本；值列替换为去重后计入的值
+
+        Returns:
+            (按(用户, 天, 开始时间)排序的 (用户下标, 开始秒数, 结束秒数, 计入值) 数组, 对应的天下标)
+        """
+        samples, sources = self._query_samples(user_ids, first_day, n_days, data_type, with_sources=True)
+        ranks_by_source = source_ranks(sources)
+        ranks = np.array([ranks_by_source[source] for source in sources], dtype=np.int64)
+
+        day_index = np.floor_divide(samples[:, 1], SECONDS_PER_DAY).astype(np.int64)
+        within_day = (samples[:, 1] >= 0) & (day_index < n_days) & \
+            (samples[:, 2] <= (day_index + 1) * SECONDS_PER_DAY)
+        samples, day_index, ranks = samples[within_day], day_index[within_day], ranks[within_day]
+
+        order = np.lexsort((samples[:, 1], day_index, samples[:, 0]))
+        samples, day_index, ranks = samples[order], day_index[order], ranks[order]
+        groups = samples[:, 0].astype(np.int64) * n_days + day_index
+        for group in np.split(np.arange(len(samples)), np.flatnonzero(np.diff(groups)) + 1):
+            if group.size > 0 and np.any(ranks[group] != ranks[group[0]]):
+                samples[group, 3] = deduplicate_by_priority(
+                    samples[group, 1], samples[group, 2], samples[group, 3], ranks[group]
+                )
+        return samples, day_index
+
+    def _query_workouts(self, user_ids: List[str], first_day: datetime, n_days: int) -> Tuple[np.ndarray, List[str]]:
+        """
+        读取与日期范围重叠的运动记录
+
+        Returns:
+            ((用户下标, 开始秒数, 结束秒数) 的数组, 对应的运动类型列表)，按(用户, 开始时间)排序
+        """
+        rows = POSTGRES_POOL._execute_query("""
+            SELECT array_position(%s::text[], w.user_id::text) - 1 AS user_index,
+                   EXTRACT(EPOCH FROM (w.start_date - %s::timestamp)) AS start_seconds,
+                   EXTRACT(EPOCH FROM (w.end_date - %s::timestamp)) AS end_seconds,
+                   w.activity_type
+            FROM workouts w
+            WHERE w.user_id = ANY(%s)
+            AND w.start_date < %s
+            AND w.end_date >= %s
+            ORDER BY user_index, start_seconds
+        """, (user_ids, first_day, first_day, user_ids, first_day + timedelta(days=n_days), first_day), fetch_all=True)
+        if rows is None:
+            raise RuntimeError("读取运动记录失败")
+        intervals = np.array([row[:3] for row in rows], dtype=np.float64).reshape(-1, 3)
+        return intervals, [row[3] for row in rows]
+
+    def _compute_heart_rate_zones(self, user_ids: List[str], first_day: datetime, n_days: int,
+                                  rollups: Dict[Tuple[str, str], DailyRollup]):
+        """从原始心率样本计算各用户日的心率区间时长"""
+        max_heart_rates = self._get_max_heart_rates(user_ids, first_day.year)
+        samples = self._query_samples(user_ids, first_day, n_days, HealthDataType.HEART_RATE.value)
+        samples = samples[samples[:, 1] >= 0]
+
+        user_index = samples[:, 0].astype(np.int64)
+        seconds = samples[:, 1]
+        zone_minutes = zone_minutes_by_day(user_index, seconds, samples[:, 3], max_heart_rates, n_days)
+        day_index = np.floor_divide(seconds, SECONDS_PER_DAY).astype(np.int64)
+        counts = np.bincount(user_index * n_days + day_index, minlength=len(user_ids) * n_days)
+        counts = counts.reshape(len(user_ids), n_days)
+
+        for i, user_id in enumerate(user_ids):
+            for d in range(n_days):
+                rollup = rollups[(user_id, (first_day + timedelta(days=d)).strftime('%Y-%m-%d'))]
+                rollup.max_heart_rate = int(max_heart_rates[i])
+                rollup.heart_rate_samples = int(counts[i, d])
+                if counts[i, d] > 0:
+                    rollup.zone_minutes = [round(float(m), 1) for m in zone_minutes[i, d]]
+                    rollup.zone2_minutes = int(zone_minutes[i, d, ZONE2_INDEX])
+
+    def _compute_additive_totals(self, user_ids: List[str], first_day: datetime, n_days: int,
+                                 rollups: Dict[Tuple[str, str], DailyRollup], workouts: np.ndarray):
+        """
+        计算各用户日去重后的步数、活动能量和饮水量，以及扣除运动期间后的步数
+
+        多个数据源记录同一时段时只计入优先级最高的数据源；没有对应样本的用户日为None
+        """
+        n_users = len(user_ids)
+        for data_type, field in (
+            (HealthDataType.STEP_COUNT.value, "steps"),
+            (HealthDataType.ACTIVE_ENERGY_BURNED.value, "active_energy"),
+            (HealthDataType.DIETARY_WATER.value, "water_ml"),
+        ):
+            samples, day_index = self._query_deduplicated(user_ids, first_day, n_days, data_type)
+            slots = samples[:, 0].astype(np.int64) * n_days + day_index
+            totals = np.bincount(slots, weights=samples[:, 3], minlength=n_users * n_days)
+            present = np.bincount(slots, minlength=n_users * n_days) > 0
+            for slot in np.flatnonzero(present):
+                user_index, day = divmod(int(slot), n_days)
+                rollup = rollups[(user_ids[user_index], (first_day + timedelta(days=day)).strftime('%Y-%m-%d'))]
+                total = float(totals[slot])
+                setattr(rollup, field, int(round(total)) if field == "steps" else round(total, 1))
+            if field == "steps":
+                self._compute_non_workout_steps(user_ids, first_day, n_days, rollups, workouts, samples, day_index)
+
+    def _compute_non_workout_steps(self, user_ids: List[str], first_day: datetime, n_days: int,
+                                   rollups: Dict[Tuple[str, str], DailyRollup], workouts: np.ndarray,
+                                   steps: np.ndarray, day_index: np.ndarray):
+        """
+        由去重后的步数样本计算各用户日扣除运动期间后的步数
+
+        步数样本已按(用户, 天, 开始时间)排序，按用户日切分后每组与该用户的运动时段做一次线性扫描；
+        每个用户的运动时段只合并一次，合并后开始和结束时间都单调递增，
+        每组只二分出与该组样本时间窗重叠的运动时段参与扫描。
+        与运动时段部分重叠的样本按重叠时长比例扣除
+        """
+        groups = steps[:, 0].astype(np.int64) * n_days + day_index
+        boundaries = np.flatnonzero(np.diff(groups)) + 1
+
+        workout_users = workouts[:, 0].astype(np.int64)
+        merged: Dict[int, Tuple[np.ndarray, np.ndarray, List[Tuple[float, float]]]] = {}
+
+        for group in np.split(np.arange(len(steps)), boundaries):
+            if group.size == 0:
+                continue
+            user_index = int(steps[group[0], 0])
+            day = int(groups[group[0]]) - user_index * n_days
+            if user_index not in merged:
+                lo, hi = np.searchsorted(workout_users, [user_index, user_index + 1])
+                cuts = merge_intervals([(start, end) for start, end in workouts[lo:hi, 1:3]])
+                merged[user_index] = (np.array([c[0] for c in cuts]), np.array([c[1] for c in cuts]), cuts)
+            starts, ends, cuts = merged[user_index]
+            # 结束不晚于窗口开始、或开始晚于窗口结束的时段与本组样本都不重叠（瞬时样本可能落在时段开始处）
+            lo = int(np.searchsorted(ends, steps[group, 1].min(), side='right'))
+            hi = int(np.searchsorted(starts, steps[group, 2].max(), side='right'))
+            total = subtract_intervals([tuple(row) for row in steps[group, 1:4]], cuts[lo:hi])
+            rollup = rollups[(user_ids[user_index], (first_day + timedelta(days=day)).strftime('%Y-%m-%d'))]
+            rollup.non_workout_steps = int(round(total))
+
+    def _compute_activity_masks(self, user_ids: List[str], first_day: datetime, n_days: int,
+                                rollups: Dict[Tuple[str, str], DailyRollup], workouts: np.ndarray,
+                                workout_types: List[str]):
+        """
+        计算各用户日的运动类型、运动类别位图和力量类运动的分钟数（运动按开始时间归入当天）
+
+        从未导入过运动记录的用户为None（不参与依赖运动类型的规则），其余用户没有运动的日期为0
+        """
+        rows = POSTGRES_POOL._execute_query("""
+            SELECT u.user_id
+            FROM unnest(%s::text[]) AS u(user_id)
+            WHERE EXISTS (SELECT 1 FROM workouts w WHERE w.user_id = u.user_id)
+        """, (user_ids,), fetch_all=True)
+        if rows is None:
+            raise RuntimeError("读取运动记录用户失败")
+        for user_id in {row['user_id'] for row in rows}:
+            for d in range(n_days):
+                rollup = rollups[(user_id, (first_day + timedelta(days=d)).strftime('%Y-%m-%d'))]
+                rollup.workout_types = []
+                rollup.activity_mask = 0
+                rollup.strength_minutes = 0
+
+        day_index = np.floor_divide(workouts[:, 1], SECONDS_PER_DAY).astype(np.int64)
+        for (user_index, start, end), day, workout_type in zip(workouts, day_index, workout_types):
+            if not 0 <= day < n_days:
+                continue
+            rollup = rollups[(user_ids[int(user_index)], (first_day + timedelta(days=int(day))).strftime('%Y-%m-%d'))]
+            if workout_type not in rollup.workout_types:
+                rollup.workout_types.append(workout_type)
+            mask = activity_mask([workout_type])
+            rollup.activity_mask |= mask
+            if mask & STRENGTH_MASK:
+                rollup.strength_minutes += int((end - start) // 60)
+
+    def _hourly_bitmaps(self, samples: np.ndarray, n_users: int, n_days: int,
+                        min_total: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+        """由一类样本计算各用户日的小时位图，同时返回各用户日是否有该类样本"""
+        samples = samples[(samples[:, 1] >= 0) & (samples[:, 1] < n_days * SECONDS_PER_DAY)]
+        user_index = samples[:, 0].astype(np.int64)
+        bitmaps = hourly_bitmaps_by_day(user_index, samples[:, 1], samples[:, 3], n_users, n_days, min_total)
+        day_index = np.floor_divide(samples[:, 1], SECONDS_PER_DAY).astype(np.int64)
+        present = np.bincount(user_index * n_days + day_index, minlength=n_users * n_days) > 0
+        return bitmaps, present.reshape(n_users, n_days)
+
+    def _compute_hourly_bitmaps(self, user_ids: List[str], first_day: datetime, n_days: int,
+                                rollups: Dict[Tuple[str, str], DailyRollup]):
+        """
+        计算各用户日的站立、饮水和活跃小时位图（样本按开始时间归入小时），没有对应样本的用户日为None
+
+        站立优先使用Apple Watch的站立小时记录（不含未站立的记录），没有时回退到站立时间大于0的小时；
+        活跃小时为步数达到active_min_steps或有运动时间的小时
+        """
+        n_users = len(user_ids)
+        stand, has_stand = self._hourly_bitmaps(
+            self._query_samples(user_ids, first_day, n_days, HealthDataType.STAND_HOUR.value,
+                                excluded_category="HKCategoryValueAppleStandHourIdle"),
+            n_users, n_days
+        )
+        stand_time, has_stand_time = self._hourly_bitmaps(
+            self._query_samples(user_ids, first_day, n_days, HealthDataType.STAND_TIME.value), n_users, n_days
+        )
+        water, has_water = self._hourly_bitmaps(
+            self._query_samples(user_ids, first_day, n_days, HealthDataType.DIETARY_WATER.value), n_users, n_days
+        )
+        walking, has_steps = self._hourly_bitmaps(
+            self._query_samples(user_ids, first_day, n_days, HealthDataType.STEP_COUNT.value),
+            n_users, n_days, min_total=HOURLY_ACTIVITY_CONFIG.active_min_steps
+        )
+        exercising, has_exercise = self._hourly_bitmaps(
+            self._query_samples(user_ids, first_day, n_days, HealthDataType.EXERCISE_TIME.value), n_users, n_days
+        )
+
+        stand = np.where(has_stand, stand, stand_time)
+        has_stand = has_stand | has_stand_time
+        active = walking | exercising
+        has_active = has_steps | has_exercise
+
+        for i, user_id in enumerate(user_ids):
+            for d in range(n_days):
+                rollup = rollups[(user_id, (first_day + timedelta(days=d)).strftime('%Y-%m-%d'))]
+                rollup.stand_bitmap = int(stand[i, d]) if has_stand[i, d] else None
+                rollup.water_bitmap = int(water[i, d]) if has_water[i, d] else None
+                rollup.active_bitmap = int(active[i, d]) if has_active[i, d] else None
+
+    def _get_max_heart_rates(self, user_ids: List[str], year: int) -> np.ndarray:
+        """获取各用户的最大心率（用户表中没有设置时按年龄估算）"""
+        settings = {}
+        try:
+            rows = POSTGRES_POOL._execute_query("""
+                SELECT user_id, max_heart_rate, birth_year
+                FROM users
+                WHERE user_id = ANY(%s)
+            """, (user_ids,), fetch_all=True) or []
+            settings = {row['user_id']: (row['max_heart_rate'], row['birth_year']) for row in rows}
+        except Exception as e:
+            logger.warning(f"读取用户最大心率失败，使用默认年龄估算: {e}")
+        return np.array(
+            [resolve_max_heart_rate(*settings.get(user_id, (None, None)), year) for user_id in user_ids],
+            dtype=np.float64
+        )
+
+    @staticmethod
+    def _db_now() -> Optional[datetime]:
+        """数据库的当前时间（与score_dirty_days.queued_at同一时钟），读取失败时返回None"""
+        row = POSTGRES_POOL._execute_query("SELECT clock_timestamp()", fetch_one=True)
+        return row[0] if row else None
+
+    def _save(self, rollups: List[DailyRollup], computed_since: datetime) -> int:
+        """
+        批量写入缓存
+
+        跳过还没结束的日期，以及computed_since之后又有新数据入库的用户日（入库删除缓存行发生在读取样本之后，
+        写入的会是旧值）
+
+        Args:
+            rollups: 计算出的汇总
+            computed_since: 开始读取样本前的数据库时间
+        """
+        today = computed_since.date()
+        rollups = [r for r in rollups if r.rollup_date < today]
+        if not rollups:
+            return 0
+
+        conn = None
+        cursor = None
+        try:
+            conn = POSTGRES_POOL.get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT user_id, score_date FROM score_dirty_days
+                WHERE user_id = ANY(%s)
+                AND score_date BETWEEN %s AND %s
+                AND queued_at >= %s
+            """, (sorted({r.user_id for r in rollups}), min(r.rollup_date for r in rollups),
+                  max(r.rollup_date for r in rollups), computed_since))
+            changed = {(row[0], row[1]) for row in cursor.fetchall()}
+            rows = [
+                (r.user_id, r.rollup_date, self.ROLLUP_VERSION, r.heart_rate_samples, r.max_heart_rate,
+                 json.dumps(r.zone_minutes), r.zone2_minutes, r.steps, r.active_energy, r.water_ml, r.non_workout_steps,
+                 json.dumps(r.workout_types) if r.workout_types is not None else None, r.activity_mask,
+                 r.strength_minutes, r.stand_bitmap, r.water_bitmap, r.active_bitmap, datetime.now())
+                for r in rollups
+                if (r.user_id, r.rollup_date) not in changed
+            ]
+            if not rows:
+                conn.rollback()
+                return 0
+            execute_values(cursor, """
+                INSERT INTO daily_health_rollup
+                (user_id, rollup_date, rollup_version, heart_rate_samples, max_heart_rate,
+                 zone_minutes, zone2_minutes, steps, active_energy, water_ml, non_workout_steps,
+                 workout_types, activity_mask, strength_minutes, stand_bitmap, water_bitmap, active_bitmap, computed_at)
+                VALUES %s
+                ON CONFLICT (user_id, rollup_date)
+                DO UPDATE SET
+                    rollup_version = EXCLUDED.rollup_version,
+                    heart_rate_samples = EXCLUDED.heart_rate_samples,
+                    max_heart_rate = EXCLUDED.max_heart_rate,
+                    zone_minutes = EXCLUDED.zone_minutes,
+                    zone2_minutes = EXCLUDED.zone2_minutes,
+                    steps = EXCLUDED.steps,
+                    active_energy = EXCLUDED.active_energy,
+                    water_ml = EXCLUDED.water_ml,
+                    non_workout_steps = EXCLUDED.non_workout_steps,
+                    workout_types = EXCLUDED.workout_types,
+                    activity_mask = EXCLUDED.activity_mask,
+                    strength_minutes = EXCLUDED.strength_minutes,
+                    stand_bitmap = EXCLUDED.stand_bitmap,
+                    water_bitmap = EXCLUDED.water_bitmap,
+                    active_bitmap = EXCLUDED.active_bitmap,
+                    computed_at = EXCLUDED.computed_at
+            """, rows, page_size=1000)
+            conn.commit()
+            return len(rows)
+        except Exception as e:
+            logger.error(f"保存每日汇总缓存失败: {e}")
+            if conn:
+                conn.rollback()
+            return 0
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                POSTGRES_POOL.put_connection(conn)
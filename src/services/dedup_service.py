@@ -0,0 +1,206 @@
+"""
+健康数据去重服务
+对已有的health_metric做在线去重：按id分块补算自然键、删除重复样本（保留id最小的一条），
+最后并发创建自然键唯一索引。每块一个短事务，去重期间导入和查询不受影响
+（用于迁移到字典编码的health_samples之前的旧表；health_samples的自然键本身唯一）
+
+删除的样本会改变当天的汇总，按删除样本的(用户, 日期范围)使缓存失效并加入待重算队列
+"""
+import time
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2
+
+from ..db.postgresql import POSTGRES_POOL
+from ..utils.logger import logger
+
+
+UNIQUE_INDEX = "uq_health_metric_natural_key"
+LOOKUP_INDEX = "idx_health_metric_natural_key"
+# 迁移到字典编码存储（health_samples）后的自然键唯一索引，迁移时已去重
+SAMPLES_UNIQUE_INDEX = "uq_health_samples_natural_key"
+
+
+class HealthMetricDedupService:
+    """健康数据去重服务"""
+
+    def __init__(self, batch_size: int = 50000, pause_seconds: float = 0.0):
+        """
+        Args:
+            batch_size: 每块的id范围大小
+            pause_seconds: 每块之间的停顿，用于降低对线上负载的影响
+        """
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+
+    def run(self, max_attempts: int = 3) -> Dict[str, int]:
+        """
+        补算自然键、删除重复样本并创建唯一索引
+
+        创建唯一索引期间新写入的重复样本会使创建失败，此时删除失败的索引并对新增的样本再去重一次
+
+        Returns:
+            统计信息：backfilled、deleted、attempts、unique_index（是否已创建）
+        """
+        report = {"backfilled": 0, "deleted": 0, "attempts": 0, "unique_index": 0}
+        if self._index_is_valid(SAMPLES_UNIQUE_INDEX) and not self._is_table("health_metric"):
+            logger.info("样本已存储在health_samples（自然键唯一），无需去重")
+            report["unique_index"] = 1
+            return report
+        if self._index_is_valid(UNIQUE_INDEX):
+            logger.info("自然键唯一索引已存在，无需去重")
+            report["unique_index"] = 1
+            return report
+
+        report["backfilled"] = self.backfill_keys()
+        self._execute_concurrently(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {LOOKUP_INDEX} ON health_metric(natural_key)")
+
+        while report["attempts"] < max_attempts:
+            report["attempts"] += 1
+            report["deleted"] += self.delete_duplicates()
+            if self._execute_concurrently(
+                f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {UNIQUE_INDEX} ON health_metric(natural_key)"
+            ) and self._index_is_valid(UNIQUE_INDEX):
+                report["unique_index"] = 1
+                break
+            logger.warning(f"创建自然键唯一索引失败（第{report['attempts']}次），重新去重后重试")
+            self._execute_concurrently(f"DROP INDEX CONCURRENTLY IF EXISTS {UNIQUE_INDEX}")
+
+        if report["unique_index"]:
+            self._execute_concurrently(f"DROP INDEX CONCURRENTLY IF EXISTS {LOOKUP_INDEX}")
+        logger.info(f"健康数据去重完成: 补算{report['backfilled']}条自然键, 删除{report['deleted']}条重复样本, "
+                    f"唯一索引{'已创建' if report['unique_index'] else '未创建'}")
+        return report
+
+    def backfill_keys(self) -> int:
+        """按id分块为还没有自然键的样本补算自然键（新写入的样本由触发器计算）"""
+        first_id, last_id = self._id_bounds()
+        if first_id is None:
+            return 0
+
+        updated = 0
+        started = time.perf_counter()
+        for low in range(first_id, last_id + 1, self.batch_size):
+            high = low + self.batch_size - 1
+            count = self._execute_chunk("""
+                UPDATE health_metric
+                SET natural_key = health_metric_natural_key(user_id, type, source_name, start_date, end_date, value)
+                WHERE id BETWEEN %s AND %s
+                AND natural_key IS NULL
+            """, (low, high))
+            updated += count
+            self._progress("补算自然键", high, first_id, last_id, started)
+        return updated
+
+    def delete_duplicates(self, start_id: Optional[int] = None) -> int:
+        """
+        按id分块删除重复样本：块内每个样本如果有自然键相同且id更小的样本则删除
+
+        Args:
+            start_id: 只检查id不小于此值的样本（默认检查全部）
+
+        Returns:
+            删除的样本数
+        """
+        first_id, last_id = self._id_bounds()
+        if first_id is None:
+            return 0
+        first_id = max(first_id, start_id or first_id)
+
+        deleted = 0
+        started = time.perf_counter()
+        for low in range(first_id, last_id + 1, self.batch_size):
+            high = low + self.batch_size - 1
+            rows = self._execute_chunk("""
+                DELETE FROM health_metric h
+                WHERE h.id BETWEEN %s AND %s
+                AND EXISTS (
+                    SELECT 1 FROM health_metric o
+                    WHERE o.natural_key = h.natural_key
+                    AND o.id < h.id
+                )
+                RETURNING h.user_id, h.start_date, h.end_date
+            """, (low, high), returning=True)
+            deleted += len(rows)
+            if rows:
+                POSTGRES_POOL._invalidate_cached_results(
+                    "health_metric", ["user_id", "start_date", "end_date"], self._summarize(rows)
+                )
+            self._progress("删除重复样本", high, first_id, last_id, started)
+        return deleted
+
+    @staticmethod
+    def _summarize(rows: List[Tuple]) -> List[Tuple]:
+        """把删除的样本合并为每个用户一行的(用户, 最早开始, 最晚结束)"""
+        ranges = {}
+        for user_id, start, end in rows:
+            end = end or start
+            current = ranges.get(user_id)
+            ranges[user_id] = (min(current[0], start), max(current[1], end)) if current else (start, end)
+        return [(user_id, start, end) for user_id, (start, end) in ranges.items()]
+
+    def _execute_chunk(self, sql: str, params: Tuple, returning: bool = False):
+        """在一个短事务中执行一块，返回影响的行数（returning时返回行）"""
+        conn = POSTGRES_POOL.get_connection()
+        if conn is None:
+            raise RuntimeError("获取数据库连接失败")
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                result = [tuple(row) for row in cursor.fetchall()] if returning else cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            POSTGRES_POOL.put_connection(conn)
+        if self.pause_seconds:
+            time.sleep(self.pause_seconds)
+        return result
+
+    @staticmethod
+    def _execute_concurrently(sql: str) -> bool:
+        """在自动提交模式下执行CONCURRENTLY的索引语句（不能在事务中执行）"""
+        conn = POSTGRES_POOL.get_connection()
+        if conn is None:
+            raise RuntimeError("获取数据库连接失败")
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(sql)
+            return True
+        except psycopg2.Error as e:
+            logger.error(f"执行索引语句失败: {e}")
+            return False
+        finally:
+            conn.autocommit = False
+            POSTGRES_POOL.put_connection(conn)
+
+    @staticmethod
+    def _id_bounds() -> Tuple[Optional[int], Optional[int]]:
+        row = POSTGRES_POOL._execute_query("SELECT MIN(id), MAX(id) FROM health_metric", fetch_one=True)
+        return (row[0], row[1]) if row else (None, None)
+
+    @staticmethod
+    def _index_is_valid(name: str) -> bool:
+        row = POSTGRES_POOL._execute_query("""
+            SELECT i.indisvalid
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = %s
+        """, (name,), fetch_one=True)
+        return bool(row and row[0])
+
+    @staticmethod
+    def _is_table(name: str) -> bool:
+        row = POSTGRES_POOL._execute_query(
+            "SELECT relkind = 'r' FROM pg_class WHERE oid = to_regclass(%s)", (name,), fetch_one=True
+        )
+        return bool(row and row[0])
+
+    @staticmethod
+    def _progress(step: str, high: int, first_id: int, last_id: int, started: float):
+        done = min(high, last_id) - first_id + 1
+        total = last_id - first_id + 1
+        elapsed = time.perf_counter() - started
+        logger.info(f"{step}: {done}/{total} ({done / total:.0%}), {done / max(elapsed, 1e-9):.0f}行/秒")
@@ -0,0 +1,189 @@
+"""
+健康样本字典编码迁移服务
+把旧的health_metric表（每行保存类型、来源等字符串）在线迁移到health_samples（类型和来源为字典id），
+最后把health_metric替换为同名的兼容视图：
+
+- 按id分块复制，每块一个短事务：先登记块中新的类型和来源，再编码写入（ON CONFLICT DO NOTHING，
+  旧表中自然键重复的样本只保留一条，跳过重复样本的块按(用户, 日期范围)使缓存失效并加入待重算队列）
+- 切换在一个事务中完成：锁住旧表的写入，补复制分块复制之后新写入的样本，旧表改名为health_metric_legacy，
+  创建视图。切换期间查询不受影响
+- 分块复制期间对旧表已有样本的修改和删除不会同步，迁移应在不修改已有样本时运行
+- 可重复运行：health_metric已是视图时只按需删除旧表
+"""
+import time
+from typing import Dict, List, Optional, Tuple
+
+from ..db.health_dictionary import HEALTH_DICTIONARY, merge_samples
+from ..db.postgresql import POSTGRES_POOL
+from ..utils.logger import logger
+
+
+LEGACY_TABLE = "health_metric_legacy"
+
+
+class HealthMetricDictionaryMigration:
+    """健康样本字典编码迁移服务"""
+
+    def __init__(self, batch_size: int = 100000, pause_seconds: float = 0.0):
+        """
+        Args:
+            batch_size: 每块的id范围大小
+            pause_seconds: 每块之间的停顿，用于降低对线上负载的影响
+        """
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+
+    def run(self, start_id: Optional[int] = None, drop_legacy: bool = False) -> Dict[str, int]:
+        """
+        复制旧表中的样本并切换为视图
+
+        Args:
+            start_id: 从该id开始复制（用于续传，默认从头开始；已复制的样本会被跳过）
+            drop_legacy: 切换后删除旧表
+
+        Returns:
+            统计信息：copied、skipped（自然键重复的样本）、switched（是否已切换为视图）、dropped
+        """
+        report = {"copied": 0, "skipped": 0, "switched": 0, "dropped": 0}
+        kind = self._relkind("health_metric")
+        if kind == "r":
+            extra_columns = self._extra_columns()
+            first_id, last_id = self._id_bounds()
+            if first_id is not None:
+                first_id = max(first_id, start_id or first_id)
+                copied, skipped = self._copy_range(first_id, last_id, extra_columns)
+                report["copied"] += copied
+                report["skipped"] += skipped
+            copied, skipped = self._switch(last_id, extra_columns)
+            report["copied"] += copied
+            report["skipped"] += skipped
+            report["switched"] = 1
+        elif kind == "v":
+            logger.info("health_metric已是视图，无需迁移")
+            report["switched"] = 1
+        else:
+            logger.error("health_metric不存在，请先运行init_database.py创建表结构")
+            return report
+
+        if drop_legacy and report["switched"] and self._relkind(LEGACY_TABLE) == "r":
+            POSTGRES_POOL._execute_query(f"DROP TABLE {LEGACY_TABLE}", commit=True)
+            POSTGRES_POOL._execute_query("DROP FUNCTION IF EXISTS set_health_metric_natural_key()", commit=True)
+            report["dropped"] = 1
+        HEALTH_DICTIONARY.clear()
+        logger.info(f"字典编码迁移完成: 复制{report['copied']}条样本, 跳过{report['skipped']}条重复样本, "
+                    f"{'已' if report['switched'] else '未'}切换为视图")
+        return report
+
+    def _copy_range(self, first_id: int, last_id: int, extra_columns: List[str]) -> Tuple[int, int]:
+        """按id分块复制，每块一个事务"""
+        copied = skipped = 0
+        started = time.perf_counter()
+        for low in range(first_id, last_id + 1, self.batch_size):
+            high = low + self.batch_size - 1
+            conn = POSTGRES_POOL.get_connection()
+            if conn is None:
+                raise RuntimeError("获取数据库连接失败")
+            try:
+                with conn.cursor() as cursor:
+                    chunk_copied, chunk_skipped, ranges = self._copy_chunk(cursor, low, high, extra_columns)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                POSTGRES_POOL.put_connection(conn)
+            self._invalidate(ranges)
+            copied += chunk_copied
+            skipped += chunk_skipped
+            self._progress(high, first_id, last_id, started)
+            if self.pause_seconds:
+                time.sleep(self.pause_seconds)
+        return copied, skipped
+
+    @staticmethod
+    def _copy_chunk(cursor, low: int, high: int, extra_columns: List[str]) -> Tuple[int, int, List[Tuple]]:
+        """
+        复制id在[low, high]内的样本
+
+        Returns:
+            (新写入的样本数, 跳过的样本数, 有跳过的样本时块中各用户的(用户, 最早开始, 最晚结束))
+        """
+        source = "(SELECT * FROM health_metric WHERE id BETWEEN %s AND %s)"
+        cursor.execute(f"SELECT COUNT(*) FROM {source} AS s", (low, high))
+        total = cursor.fetchone()[0]
+        if not total:
+            return 0, 0, []
+        copied = merge_samples(cursor, source, extra_columns, params=(low, high))
+        ranges = []
+        if copied < total:
+            # 跳过的样本可能是旧表中的重复样本，去掉后当天的汇总会变化
+            cursor.execute(f"""
+                SELECT user_id, MIN(start_date), MAX(COALESCE(end_date, start_date))
+                FROM {source} AS s
+                GROUP BY user_id
+            """, (low, high))
+            ranges = [tuple(row) for row in cursor.fetchall()]
+        return copied, total - copied, ranges
+
+    def _switch(self, last_id: Optional[int], extra_columns: List[str]) -> Tuple[int, int]:
+        """
+        锁住旧表的写入，补复制last_id之后的样本，旧表改名并创建兼容视图（一个事务）
+
+        Returns:
+            (补复制写入的样本数, 跳过的样本数)
+        """
+        conn = POSTGRES_POOL.get_connection()
+        if conn is None:
+            raise RuntimeError("获取数据库连接失败")
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("LOCK TABLE health_metric IN EXCLUSIVE MODE")
+                cursor.execute("SELECT MAX(id) FROM health_metric")
+                max_id = cursor.fetchone()[0]
+                copied, skipped, ranges = 0, 0, []
+                if max_id is not None and (last_id is None or max_id > last_id):
+                    copied, skipped, ranges = self._copy_chunk(cursor, (last_id or 0) + 1, max_id, extra_columns)
+                cursor.execute(f"ALTER TABLE health_metric RENAME TO {LEGACY_TABLE}")
+                cursor.execute("SELECT create_health_metric_view()")
+            conn.commit()
+        except Exception as e:
+            logger.error(f"切换health_metric为视图失败: {e}")
+            conn.rollback()
+            raise
+        finally:
+            POSTGRES_POOL.put_connection(conn)
+        self._invalidate(ranges)
+        return copied, skipped
+
+    @staticmethod
+    def _invalidate(ranges: List[Tuple]):
+        if ranges:
+            POSTGRES_POOL._invalidate_cached_results("health_metric", ["user_id", "start_date", "end_date"], ranges)
+
+    @staticmethod
+    def _extra_columns() -> List[str]:
+        """除编码列外原样复制的列：created_at，以及旧表已有时的sample_uuid"""
+        rows = POSTGRES_POOL._execute_query("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = 'health_metric' AND column_name IN ('created_at', 'sample_uuid')
+        """, fetch_all=True) or []
+        return sorted(row[0] for row in rows)
+
+    @staticmethod
+    def _relkind(name: str) -> Optional[str]:
+        row = POSTGRES_POOL._execute_query(
+            "SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (name,), fetch_one=True
+        )
+        return row[0] if row else None
+
+    @staticmethod
+    def _id_bounds() -> Tuple[Optional[int], Optional[int]]:
+        row = POSTGRES_POOL._execute_query("SELECT MIN(id), MAX(id) FROM health_metric", fetch_one=True)
+        return (row[0], row[1]) if row else (None, None)
+
+    @staticmethod
+    def _progress(high: int, first_id: int, last_id: int, started: float):
+        done = min(high, last_id) - first_id + 1
+        total = last_id - first_id + 1
+        elapsed = time.perf_counter() - started
+        logger.info(f"复制样本: {done}/{total} ({done / total:.0%}), {done / max(elapsed, 1e-9):.0f}行/秒")
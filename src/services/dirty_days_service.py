@@ -0,0 +1,138 @@
+"""
+待重算日期队列服务
+记录原始数据发生变化的(用户, 日期)，供增量重算积分使用
+"""
+from datetime import datetime, date
+from typing import Dict, List, Optional, Union
+from psycopg2.extras import execute_values
+from ..db.postgresql import POSTGRES_POOL
+from ..utils.logger import logger
+
+
+class DirtyDaysService:
+    """待重算日期队列服务"""
+
+    def mark_dirty(self, user_id: str, start_date: Union[datetime, date],
+                   end_date: Optional[Union[datetime, date]] = None) -> bool:
+        """
+        手动将日期范围加入待重算队列（数据入库时会自动加入，删除或修正数据后可调用）
+
+        Args:
+            user_id: 用户ID
+            start_date: 开始日期
+            end_date: 结束日期（含），None时等于start_date
+
+        Returns:
+            是否成功
+        """
+        conn = None
+        cursor = None
+        try:
+            conn = POSTGRES_POOL.get_connection()
+            cursor = conn.cursor()
+            POSTGRES_POOL._mark_dirty_days(cursor, {user_id: (start_date, end_date or start_date)})
+            conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"加入待重算队列失败: {e}")
+            if conn:
+                conn.rollback()
+            return False
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                POSTGRES_POOL.put_connection(conn)
+
+    def claim_dirty_days(self, limit: Optional[int] = None, user_id: Optional[str] = None) -> List[Dict]:
+        """
+        取出待重算的日期（按入队时间从早到晚），取出时不删除
+
+        重算完成后需调用acknowledge，只有queued_at未变化的记录才会被删除，
+        重算期间又有新数据入库的日期会留在队列中。
+
+        Args:
+            limit: 最多取出的条数，None表示全部
+            user_id: 只取指定用户，None表示所有用户
+
+        Returns:
+            记录列表，每项包含user_id、score_date和queued_at
+        """
+        query = "SELECT user_id, score_date, queued_at FROM score_dirty_days"
+        params = []
+        if user_id:
+            query += " WHERE user_id = %s"
+            params.append(user_id)
+        query += " ORDER BY queued_at"
+        if limit:
+            query += " LIMIT %s"
+            params.append(limit)
+
+        rows = POSTGRES_POOL._execute_query(query, tuple(params), fetch_all=True) or []
+        return [
+            {'user_id': row['user_id'], 'score_date': row['score_date'], 'queued_at': row['queued_at']}
+            for row in rows
+        ]
+
+    def acknowledge(self, claimed: List[Dict]) -> int:
+        """
+        从队列中删除已重算的日期
+
+        Args:
+            claimed: claim_dirty_days返回的记录
+
+        Returns:
+            删除的条数
+        """
+        if not claimed:
+            return 0
+
+        conn = None
+        cursor = None
+        try:
+            conn = POSTGRES_POOL.get_connection()
+            cursor = conn.cursor()
+            execute_values(cursor, """
+                DELETE FROM score_dirty_days d
+                USING (VALUES %s) AS v(user_id, score_date, queued_at)
+                WHERE d.user_id = v.user_id
+                AND d.score_date = v.score_date::date
+                AND d.queued_at = v.queued_at::timestamptz
+            """, [(row['user_id'], row['score_date'], row['queued_at']) for row in claimed], page_size=1000)
+            deleted = cursor.rowcount
+            conn.commit()
+            return deleted
+        except Exception as e:
+            logger.error(f"确认待重算日期失败: {e}")
+            if conn:
+                conn.rollback()
+            return 0
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                POSTGRES_POOL.put_connection(conn)
+
+    def is_dirty(self, user_id: str, day: Union[datetime, date]) -> bool:
+        """
+        指定用户日是否在待重算队列中（原始数据删除、去重、训练数据或滚动状态变化都会入队）
+
+        Args:
+            user_id: 用户ID
+            day: 日期
+
+        Returns:
+            是否在队列中
+        """
+        if isinstance(day, datetime):
+            day = day.date()
+        result = POSTGRES_POOL._execute_query(
+            "SELECT 1 FROM score_dirty_days WHERE user_id = %s AND score_date = %s",
+            (user_id, day), fetch_one=True
+        )
+        return result is not None
+
+    def get_pending_count(self) -> int:
+        """获取队列中待重算的日期数"""
+        result = POSTGRES_POOL._execute_query("SELECT COUNT(*) FROM score_dirty_days", fetch_one=True)
+        return int(result[0]) if result else 0
@@ -0,0 +1,251 @@
+"""
+HealthKit导出文件导入服务
+流式读取Apple健康导出的zip（或解压后的export.xml），边解析边通过COPY写入health_metric，
+内存占用与导出文件大小无关
+
+- Record元素（数量型和类别型样本，包括Correlation中的样本）写入health_metric
+- Workout元素写入workouts表（见WorkoutService）
+- 每chunk_size条样本COPY到一张临时暂存表，再用INSERT ... SELECT ... ON CONFLICT DO NOTHING编码写入health_samples并提交，
+  重复导入时已有的样本（自然键相同）被跳过；提交后按本批的(用户, 日期范围)使缓存失效并加入待重算队列
+"""
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ..db.health_dictionary import merge_samples
+from ..db.postgresql import POSTGRES_POOL
+from ..models.workout import Workout
+from .workout_service import WorkoutService
+from ..utils.logger import logger
+
+
+# health_metric中由导入写入的列（与COPY的列顺序一致）
+COPY_COLUMNS = [
+    "type", "source_name", "source_version", "unit", "creation_date",
+    "start_date", "end_date", "value", "device", "user_id",
+]
+
+# Record元素的属性名，与COPY_COLUMNS中除user_id外的列一一对应
+RECORD_ATTRIBUTES = [
+    "type", "sourceName", "sourceVersion", "unit", "creationDate",
+    "startDate", "endDate", "value", "device",
+]
+
+# COPY文本格式中需要转义的字符
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def open_export(path: str):
+    """
+    打开导出文件：zip直接读取其中的export.xml成员（不解压到磁盘），否则按xml文件打开
+
+    Returns:
+        二进制文件对象
+    """
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        members = [name for name in archive.namelist() if name.rsplit("/", 1)[-1] == "export.xml"]
+        if not members:
+            archive.close()
+            raise ValueError(f"{path}中没有export.xml")
+        return archive.open(members[0])
+    return open(path, "rb")
+
+
+def iter_export_elements(stream) -> Iterator[ET.Element]:
+    """
+    增量解析导出文件，依次产出结束的Record和Workout元素
+
+    元素在产出后被清理：根元素的直接子元素结束后立即从根元素移除，
+    因此任意时刻内存中只有当前正在解析的一个顶层元素
+    """
+    depth = 0
+    root = None
+    for event, element in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            depth += 1
+            continue
+
+        depth -= 1
+        if element.tag in ("Record", "Workout"):
+            yield element
+        if depth == 1:
+            # 顶层元素（及其子元素）已处理完
+            root.clear()
+
+
+class ExportImportService:
+    """HealthKit导出文件导入服务"""
+
+    def __init__(self):
+        self.workout_service = WorkoutService()
+
+    def import_export(self, path: str, user_id: str, chunk_size: int = 50000,
+                      progress_interval: float = 10.0) -> Dict[str, float]:
+        """
+        导入一个导出文件
+
+        Args:
+            path: 导出的zip或export.xml路径
+            user_id: 导入到的用户ID
+            chunk_size: 每个COPY（事务）的样本数
+            progress_interval: 打印进度的间隔秒数
+
+        Returns:
+            统计信息：records（解析的样本数）、inserted（新写入的样本数，其余为已有的重复样本）、
+            workouts、skipped、seconds、records_per_second
+        """
+        stats = {"records": 0, "inserted": 0, "workouts": 0, "skipped": 0}
+        pending_workouts: List[Workout] = []
+        started = time.monotonic()
+        last_report = started
+
+        with open_export(path) as stream:
+            rows = self._rows(iter_export_elements(stream), user_id, pending_workouts, stats)
+            while True:
+                ranges: Dict[str, Tuple[str, str]] = {}
+                result = self._copy_chunk(islice(self._track_ranges(rows, ranges), chunk_size))
+                if result is None:
+                    break
+                copied, inserted = result
+                stats["records"] += copied
+                stats["inserted"] += inserted
+                self._invalidate(ranges)
+
+                if pending_workouts:
+                    stats["workouts"] += self.workout_service.save_workouts(pending_workouts)
+                    pending_workouts.clear()
+
+                now = time.monotonic()
+                if copied < chunk_size or now - last_report >= progress_interval:
+                    last_report = now
+                    logger.info(f"已导入{stats['records']}条样本（新增{stats['inserted']}条）、"
+                                f"{stats['workouts']}条运动记录，{stats['records'] / max(now - started, 1e-9):.0f}条/秒")
+                if copied < chunk_size:
+                    break
+
+        if pending_workouts:
+            stats["workouts"] += self.workout_service.save_workouts(pending_workouts)
+
+        stats["seconds"] = time.monotonic() - started
+        stats["records_per_second"] = stats["records"] / max(stats["seconds"], 1e-9)
+        return stats
+
+    @staticmethod
+    def _rows(elements: Iterator[ET.Element], user_id: str, pending_workouts: List[Workout],
+              stats: Dict[str, float]) -> Iterator[Tuple[Optional[str], ...]]:
+        """将Record元素转换为health_metric行，Workout元素解析后放入pending_workouts"""
+        for element in elements:
+            if element.tag == "Workout":
+                try:
+                    pending_workouts.append(Workout.from_export_element(element, user_id))
+                except Exception as e:
+                    logger.warning(f"跳过无法解析的运动记录: {e}")
+                    stats["skipped"] += 1
+                continue
+
+            attributes = element.attrib
+            if not attributes.get("type") or not attributes.get("startDate"):
+                stats["skipped"] += 1
+                continue
+            yield tuple(attributes.get(name) for name in RECORD_ATTRIBUTES) + (user_id,)
+
+    @staticmethod
+    def _track_ranges(rows: Iterator[Tuple], ranges: Dict[str, Tuple[str, str]]) -> Iterator[Tuple]:
+        """透传行，同时记录每个用户的最早开始和最晚结束时间（导出时间字符串格式固定，可按字符串比较日期）"""
+        start_idx = COPY_COLUMNS.index("start_date")
+        end_idx = COPY_COLUMNS.index("end_date")
+        user_idx = COPY_COLUMNS.index("user_id")
+        for row in rows:
+            start, end = row[start_idx][:10], (row[end_idx] or row[start_idx])[:10]
+            current = ranges.get(row[user_idx])
+            ranges[row[user_idx]] = (min(current[0], start), max(current[1], end)) if current else (start, end)
+            yield row
+
+    @staticmethod
+    def _copy_chunk(rows: Iterator[Tuple]) -> Optional[Tuple[int, int]]:
+        """
+        用一个COPY把一批行写入临时暂存表，再合并到health_metric（跳过自然键已存在的样本）并提交
+
+        Returns:
+            (COPY的行数, 新写入的行数)，没有行时返回None
+        """
+        stream = CopyStream(rows)
+        if not stream.peek():
+            return None
+
+        conn = None
+        try:
+            conn = POSTGRES_POOL.get_connection()
+            columns = ", ".join(COPY_COLUMNS)
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    CREATE TEMP TABLE health_metric_import ON COMMIT DROP AS
+                    SELECT {columns} FROM health_metric WITH NO DATA
+                """)
+                cursor.copy_expert(f"COPY health_metric_import ({columns}) FROM STDIN", stream, size=1 << 16)
+                inserted = merge_samples(cursor, "health_metric_import")
+            conn.commit()
+            return stream.rows, inserted
+        except Exception as e:
+            logger.error(f"COPY写入健康数据失败: {e}")
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if conn:
+                POSTGRES_POOL.put_connection(conn)
+
+    @staticmethod
+    def _invalidate(ranges: Dict[str, Tuple[str, str]]):
+        """按本批写入的用户和日期范围使缓存失效"""
+        rows = [(user_id, start, end) for user_id, (start, end) in ranges.items()]
+        POSTGRES_POOL._invalidate_cached_results("health_metric", ["user_id", "start_date", "end_date"], rows)
+
+
+class CopyStream:
+    """
+    把行的迭代器包装为copy_expert读取的文件对象
+
+    按COPY的读取大小逐行生成文本格式数据，不在内存中保留整个批次
+    """
+
+    def __init__(self, rows: Iterator[Tuple]):
+        self._rows = rows
+        self._buffer = ""
+        self.rows = 0
+
+    def peek(self) -> bool:
+        """是否还有数据（会预读一行）"""
+        if not self._buffer:
+            self._fill(1)
+        return bool(self._buffer)
+
+    def read(self, size: int = -1) -> str:
+        self._fill(size)
+        if size < 0 or size >= len(self._buffer):
+            chunk, self._buffer = self._buffer, ""
+        else:
+            chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    def readline(self, size: int = -1) -> str:
+        return self.read(size)
+
+    def _fill(self, size: int):
+        """从迭代器读取行，直到缓冲区达到size个字符或行已读完"""
+        parts = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = "\t".join("\\N" if value is None else value.translate(COPY_ESCAPES) for value in row) + "\n"
+            parts.append(line)
+            length += len(line)
+            self.rows += 1
+        self._buffer = "".join(parts)
@@ -4,18 +4,35 @@
 """
 
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import pandas as pd
 from ..models.health_data import HealthDataRecord, DailyHealthSummary, HealthDataQuery, HealthDataType
+from ..db.health_dictionary import HEALTH_DICTIONARY
 from ..db.postgresql import POSTGRES_POOL
+from ..models.daily_rollup import DailyRollup
+from .archive_service import ARCHIVE_READER
+from .daily_rollup_service import DailyRollupService
+from ..core.hourly_bitmaps import popcount, sedentary_hours
+from ..utils.cache import cached_daily
+from ..utils.singleflight import coalesce_daily
 from ..utils.logger import logger
 
 
 class HealthDataService:
     """健康数据服务类"""
 
+    # 每日汇总中直接聚合原始样本的指标及其聚合方式
+    # 步数、活动能量和饮水量按数据源优先级去重后存在每日汇总缓存中（见DailyRollupService），不在此直接求和
+    SUMMARY_AGGREGATIONS = {
+        HealthDataType.EXERCISE_TIME: "sum",
+        HealthDataType.HEART_RATE: "avg",
+        HealthDataType.RESTING_HEART_RATE: "avg",
+        HealthDataType.HEART_RATE_VARIABILITY: "avg",
+    }
+
     def __init__(self):
         self.db_pool = POSTGRES_POOL
+        self.rollup_service = DailyRollupService()
 
     def get_health_data(self, query: HealthDataQuery) -> List[HealthDataRecord]:
         """
@@ -65,6 +82,8 @@ class HealthDataService:
 
         return records
 
+    @cached_daily("daily_summary")
+    @coalesce_daily("daily_summary")
     def get_daily_summary(self, user_id: str, date: datetime) -> DailyHealthSummary:
         """
         获取指定日期的健康数据汇总
@@ -87,38 +106,19 @@ class HealthDataService:
             summary.sleep_hours = sleep_data.get("total_hours", 0)
             # TODO: 深度睡眠和REM睡眠需要更详细的数据
 
-        # 获取步数
-        steps = self._get_aggregated_value(user_id, HealthDataType.STEP_COUNT, start_date, end_date, "sum")
-        summary.steps = int(steps) if steps else None
+        # 获取运动时间、心率和HRV
+        for data_type, aggregation in self.SUMMARY_AGGREGATIONS.items():
+            value = self._get_aggregated_value(user_id, data_type, start_date, end_date, aggregation)
+            if value is not None:
+                self._set_summary_value(summary, data_type, value)
 
-        # 获取活动能量
-        active_energy = self._get_aggregated_value(
-            user_id, HealthDataType.ACTIVE_ENERGY_BURNED, start_date, end_date, "sum"
+        # 去重后的步数、活动能量和饮水量，Zone 2时长、扣除运动期间后的步数、运动类别和每小时位图（站立、饮水、久坐）：
+        # 读取每日汇总缓存，缺失时由原始样本计算一次
+        rollup = self.rollup_service.get_rollups([user_id], start_date, start_date).get(
+            (user_id, start_date.strftime("%Y-%m-%d"))
         )
-        summary.active_energy = active_energy
-
-        # 获取运动时间
-        exercise_time = self._get_aggregated_value(user_id, HealthDataType.EXERCISE_TIME, start_date, end_date, "sum")
-        summary.exercise_minutes = int(exercise_time) if exercise_time else None
-
-        # 获取站立小时数
-        stand_hours = self._get_stand_hours(user_id, start_date, end_date)
-        summary.stand_hours = stand_hours
-
-        # 获取心率数据
-        avg_hr = self._get_aggregated_value(user_id, HealthDataType.HEART_RATE, start_date, end_date, "avg")
-        summary.avg_heart_rate = avg_hr
-
-        resting_hr = self._get_aggregated_value(user_id, HealthDataType.RESTING_HEART_RATE, start_date, end_date, "avg")
-        summary.resting_heart_rate = resting_hr
-
-        # 获取HRV
-        hrv = self._get_aggregated_value(user_id, HealthDataType.HEART_RATE_VARIABILITY, start_date, end_date, "avg")
-        summary.hrv = hrv
-
-        # 获取饮水量
-        water = self._get_aggregated_value(user_id, HealthDataType.DIETARY_WATER, start_date, end_date, "sum")
-        summary.water_ml = water
+        if rollup:
+            self._apply_rollup(summary, rollup)
 
         return summary
 
@@ -146,6 +146,146 @@ class HealthDataService:
 
         return summaries
 
+    def get_daily_summaries_bulk(
+        self, user_ids: List[str], start_date: datetime, end_date: datetime
+    ) -> Dict[Tuple[str, str], DailyHealthSummary]:
+        """
+        批量获取多个用户在日期范围内的每日汇总
+
+        与get_daily_summary口径一致，但每类指标只用一条按(用户, 日期)分组的查询，
+        供批量积分计算使用。调用方应按用户分批传入user_ids以控制单次查询的数据量。
+
+        Args:
+            user_ids: 用户ID列表
+            start_date: 开始日期
+            end_date: 结束日期（含）
+
+        Returns:
+            (user_id, 'YYYY-MM-DD') 到汇总的字典，包含范围内的每一个用户和日期
+        """
+        first_day = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        last_day = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        user_ids = list(user_ids)
+
+        summaries = {}
+        for user_id in user_ids:
+            current = first_day
+            while current <= last_day:
+                summaries[(user_id, current.strftime("%Y-%m-%d"))] = DailyHealthSummary(date=current)
+                current += timedelta(days=1)
+
+        if not user_ids:
+            return summaries
+
+        # 求和与平均值指标（health_samples按字典id过滤和分组，超过保留期的心率从压缩层读取，
+        # 已归档月份的样本从归档文件读取后按(用户, 日期, 类型)合并）
+        type_ids = HEALTH_DICTIONARY.type_ids(self.SUMMARY_AGGREGATIONS)
+        samples, sample_params = self._sample_values(user_ids, type_ids, first_day, last_day + timedelta(days=1))
+        query = f"""
+        SELECT h.user_id, d::date AS day, h.type_id,
+               SUM(h.total) AS total,
+               SUM(h.n) AS n
+        FROM generate_series(%s::timestamp, %s::timestamp, interval '1 day') AS d
+        JOIN ({samples}) AS h
+          ON h.start_date >= d
+         AND h.end_date <= d + interval '1 day'
+        GROUP BY h.user_id, day, h.type_id
+        """
+        try:
+            rows = (self.db_pool._execute_query(
+                query, (first_day, last_day) + sample_params, fetch_all=True
+            ) if type_ids else None) or []
+            stats = {}  # (用户, 日期, 类型) -> [和, 样本数]
+            for row in rows:
+                data_type = HealthDataType(HEALTH_DICTIONARY.type_name(row["type_id"]))
+                stats[(row["user_id"], row["day"].isoformat(), data_type)] = [float(row["total"] or 0), int(row["n"])]
+
+            archived = self._archived_values(user_ids, self.SUMMARY_AGGREGATIONS, first_day,
+                                             last_day + timedelta(days=1))
+            if archived is not None:
+                day = archived["start_date"].dt.normalize()
+                archived = archived[archived["end_date"] <= day + pd.Timedelta(days=1)]
+                grouped = archived.groupby(
+                    [archived["user_id"], archived["start_date"].dt.strftime("%Y-%m-%d"), archived["type"]]
+                )["value"].agg(["sum", "count"])
+                for (user_id, day, type_name), total, n in zip(grouped.index, grouped["sum"], grouped["count"]):
+                    entry = stats.setdefault((user_id, day, HealthDataType(type_name)), [0.0, 0])
+                    entry[0] += float(total)
+                    entry[1] += int(n)
+
+            for (user_id, day, data_type), (total, n) in stats.items():
+                summary = summaries.get((user_id, day))
+                value = self._aggregate(self.SUMMARY_AGGREGATIONS[data_type], total, n)
+                if summary is not None and value is not None:
+                    self._set_summary_value(summary, data_type, float(value))
+        except Exception as e:
+            logger.error(f"批量获取聚合数据失败: {e}")
+
+        # 睡眠：与_get_sleep_data相同，取截断到当天的最早开始和最晚结束时间的跨度
+        query = """
+        SELECT h.user_id, d::date AS day,
+               EXTRACT(EPOCH FROM (
+                   MAX(LEAST(h.end_date, d + interval '1 day')) - MIN(GREATEST(h.start_date, d))
+               )) / 3600 AS total_hours
+        FROM generate_series(%s::timestamp, %s::timestamp, interval '1 day') AS d
+        JOIN health_samples h
+          ON h.end_date > d
+         AND h.start_date < d + interval '1 day'
+        WHERE h.type_id = %s
+        AND h.user_id = ANY(%s)
+        GROUP BY h.user_id, day
+        """
+        try:
+            rows = self.db_pool._execute_query(
+                query, (first_day, last_day, HEALTH_DICTIONARY.type_id(HealthDataType.SLEEP_ANALYSIS), user_ids),
+                fetch_all=True
+            ) or []
+            for row in rows:
+                summary = summaries.get((row["user_id"], row["day"].isoformat()))
+                if summary is not None:
+                    summary.sleep_hours = self._normalize_sleep_hours(row["user_id"], summary.date, row["total_hours"])
+        except Exception as e:
+            logger.error(f"批量获取睡眠数据失败: {e}")
+
+        # 去重后的步数、活动能量和饮水量，Zone 2时长、运动类别和每小时位图等：
+        # 读取每日汇总缓存，缺失的用户日由原始样本整批计算一次
+        for key, rollup in self.rollup_service.get_rollups(user_ids, first_day, last_day).items():
+            if key in summaries:
+                self._apply_rollup(summaries[key], rollup)
+
+        return summaries
+
+    def get_latest_ingest_time(self, user_id: str, date: datetime) -> Optional[datetime]:
+        """
+        获取影响指定日期积分的原始数据的最近入库时间
+
+        积分计算会用到前一天18:00之后的睡眠数据，因此窗口从前一天18:00开始
+
+        Args:
+            user_id: 用户ID
+            date: 日期
+
+        Returns:
+            最近一条相关数据的created_at，没有数据时返回None
+        """
+        day_start = date.replace(hour=0, minute=0, second=0, microsecond=0)
+        window_start = day_start - timedelta(hours=6)
+        window_end = day_start + timedelta(days=1)
+
+        query = """
+        SELECT MAX(created_at)
+        FROM health_samples
+        WHERE user_id = %s
+        AND start_date < %s
+        AND end_date > %s
+        """
+
+        result = self.db_pool._execute_query(query, (user_id, window_end, window_start), fetch_one=True)
+
+        if result and result[0]:
+            return result[0]
+        return None
+
     def _get_sleep_data(self, user_id: str, start_date: datetime, end_date: datetime) -> Optional[Dict]:
         """获取睡眠数据"""
         # 简化方法：取最早开始和最晚结束时间，计算跨度
@@ -179,24 +319,119 @@ class HealthDataService:
             fetch_one=True
         )
 
-        if result and result['total_hours'] and result['total_hours'] > 0:
-            # 确保睡眠时间合理（通常3-12小时）
-            total_hours = float(result['total_hours'])
-            if total_hours > 12:
-                # 如果超过12小时，可能是数据问题，取一个合理值
-                logger.warning(f"用户{user_id}在{start_date.date()}的睡眠时间异常: {total_hours:.1f}小时")
-                total_hours = 8.0  # 默认8小时
-            elif total_hours < 1:
-                # 少于1小时可能是午睡，忽略
-                return None
-                
-            return {
-                "sleep_start": result['sleep_start'], 
-                "sleep_end": result['sleep_end'], 
-                "total_hours": round(total_hours, 1)
-            }
+        if result:
+            total_hours = self._normalize_sleep_hours(user_id, start_date, result['total_hours'])
+            if total_hours is not None:
+                return {
+                    "sleep_start": result['sleep_start'], 
+                    "sleep_end": result['sleep_end'], 
+                    "total_hours": total_hours
+                }
         return None
 
+    @staticmethod
+    def _normalize_sleep_hours(user_id: str, date: datetime, total_hours) -> Optional[float]:
+        """校正睡眠跨度，过滤午睡和异常值"""
+        if not total_hours or total_hours <= 0:
+            return None
+
+        # 确保睡眠时间合理（通常3-12小时）
+        total_hours = float(total_hours)
+        if total_hours > 12:
+            # 如果超过12小时，可能是数据问题，取一个合理值
+            logger.warning(f"用户{user_id}在{date.date()}的睡眠时间异常: {total_hours:.1f}小时")
+            total_hours = 8.0  # 默认8小时
+        elif total_hours < 1:
+            # 少于1小时可能是午睡，忽略
+            return None
+
+        return round(total_hours, 1)
+
+    @staticmethod
+    def _apply_rollup(summary: DailyHealthSummary, rollup: DailyRollup):
+        """将每日汇总缓存中的值写入汇总"""
+        summary.steps = rollup.steps or None
+        summary.active_energy = rollup.active_energy
+        summary.water_ml = rollup.water_ml
+        summary.zone2_minutes = rollup.zone2_minutes
+        summary.strength_minutes = rollup.strength_minutes
+        summary.non_workout_steps = rollup.non_workout_steps
+        summary.workout_types = rollup.workout_types
+        summary.activity_mask = rollup.activity_mask
+        summary.stand_hours = popcount(rollup.stand_bitmap) or None
+        summary.stand_bitmap = rollup.stand_bitmap
+        summary.water_hours = popcount(rollup.water_bitmap) if rollup.water_bitmap is not None else None
+        summary.sedentary_hours = sedentary_hours(rollup.stand_bitmap, rollup.active_bitmap)
+
+    @staticmethod
+    def _set_summary_value(summary: DailyHealthSummary, data_type: HealthDataType, value: float):
+        """将聚合值写入汇总中对应的字段"""
+        if data_type == HealthDataType.STEP_COUNT:
+            summary.steps = int(value) if value else None
+        elif data_type == HealthDataType.ACTIVE_ENERGY_BURNED:
+            summary.active_energy = value
+        elif data_type == HealthDataType.EXERCISE_TIME:
+            summary.exercise_minutes = int(value) if value else None
+        elif data_type == HealthDataType.HEART_RATE:
+            summary.avg_heart_rate = value
+        elif data_type == HealthDataType.RESTING_HEART_RATE:
+            summary.resting_heart_rate = value
+        elif data_type == HealthDataType.HEART_RATE_VARIABILITY:
+            summary.hrv = value
+        elif data_type == HealthDataType.DIETARY_WATER:
+            summary.water_ml = value
+
+    @staticmethod
+    def _aggregate(aggregation: str, total: float, n: int, low=None, high=None) -> Optional[float]:
+        """由和、样本数、最小和最大值计算聚合（压缩层和归档文件合并后只有这些量），没有样本时返回None"""
+        if not n:
+            return None
+        return {"sum": total, "avg": total / n, "min": low, "max": high, "count": n}[aggregation]
+
+    @staticmethod
+    def _archived_values(user_ids: List[str], data_types, start: datetime, end: datetime) -> Optional[pd.DataFrame]:
+        """已归档的、在[start, end)内开始的数值样本，时间为本地时间（见archive_service.py）"""
+        archived = ARCHIVE_READER.read_samples(user_ids, data_types, start, end)
+        if archived is None or archived.empty:
+            return None
+        archived = archived.assign(
+            value=pd.to_numeric(archived["value"], errors="coerce"),
+            start_date=archived["start_date"].dt.tz_localize(None),
+            end_date=archived["end_date"].dt.tz_localize(None),
+        ).dropna(subset=["value"])
+        return archived[archived["start_date"] >= pd.Timestamp(start)]
+
+    @staticmethod
+    def _sample_values(user_ids: List[str], type_ids: List[int], start: datetime, end: datetime) -> Tuple[str, tuple]:
+        """
+        在[start, end)内开始的样本值的子查询：原始样本每条一行，压缩层每个时间桶一行
+
+        列为user_id、type_id、start_date、end_date、total（值的和）、n（样本数）、low、high（最小和最大值）
+
+        Returns:
+            (子查询, 参数)
+        """
+        query = """
+        SELECT user_id, type_id, start_date, end_date, CAST(value AS FLOAT) AS total, 1 AS n,
+               CAST(value AS FLOAT) AS low, CAST(value AS FLOAT) AS high
+        FROM health_samples
+        WHERE user_id = ANY(%s)
+        AND type_id = ANY(%s)
+        AND start_date >= %s
+        AND start_date < %s
+        AND value IS NOT NULL
+        AND value != ''
+        UNION ALL
+        SELECT user_id, type_id, bucket_start, bucket_end, sum_value, sample_count, min_value, max_value
+        FROM health_samples_compacted
+        WHERE user_id = ANY(%s)
+        AND type_id = ANY(%s)
+        AND bucket_start >= %s
+        AND bucket_start < %s
+        """
+        params = (user_ids, type_ids, start, end)
+        return query, params + params
+
     def _get_aggregated_value(
         self,
         user_id: str,
@@ -205,64 +440,36 @@ class HealthDataService:
         end_date: datetime,
         aggregation: str = "sum",
     ) -> Optional[float]:
-        """获取聚合值"""
+        """获取聚合值（aggregation为sum、avg、min、max或count），原始样本和压缩层合并计算"""
+        samples, sample_params = self._sample_values(
+            [user_id], HEALTH_DICTIONARY.type_ids([data_type]), start_date, end_date
+        )
         query = f"""
-        SELECT {aggregation}(CAST(value AS FLOAT))
-        FROM health_metric
-        WHERE type = %s
-        AND user_id = %s
-        AND start_date >= %s
-        AND end_date <= %s
-        AND value IS NOT NULL
-        AND value != ''
+        SELECT SUM(h.total), SUM(h.n), MIN(h.low), MAX(h.high)
+        FROM ({samples}) AS h
+        WHERE h.end_date <= %s
         """
 
         try:
-            result = self.db_pool._execute_query(
-                query, (data_type.value, user_id, start_date, end_date), fetch_one=True
-            )
-
-            if result and result[0] is not None:
-                return float(result[0])
+            result = self.db_pool._execute_query(query, sample_params + (end_date,), fetch_one=True)
+            if result is None:
+                return None
+            total, n, low, high = float(result[0] or 0), int(result[1] or 0), result[2], result[3]
+
+            # 已归档月份的样本
+            archived = self._archived_values([user_id], [data_type], start_date, end_date)
+            if archived is not None:
+                values = archived.loc[archived["end_date"] <= pd.Timestamp(end_date), "value"]
+                if len(values):
+                    total += float(values.sum())
+                    n += len(values)
+                    low = values.min() if low is None else min(low, values.min())
+                    high = values.max() if high is None else max(high, values.max())
+
+            value = self._aggregate(aggregation, total, n, low, high)
+            if value is not None:
+                return float(value)
         except Exception as e:
             logger.error(f"获取聚合数据失败 {data_type.value}: {e}")
 
         return None
-
-    def _get_stand_hours(self, user_id: str, start_date: datetime, end_date: datetime) -> Optional[int]:
-        """获取站立小时数"""
-        query = """
-        SELECT COUNT(DISTINCT DATE_TRUNC('hour', start_date))
-        FROM health_metric
-        WHERE type = %s
-        AND user_id = %s
-        AND start_date >= %s
-        AND end_date <= %s
-        """
-
-        result = self.db_pool._execute_query(
-            query, (HealthDataType.STAND_HOUR.value, user_id, start_date, end_date), fetch_one=True
-        )
-
-        if result and result[0]:
-            return int(result[0])
-
-        # 如果没有STAND_HOUR数据，尝试从STAND_TIME计算
-        query = """
-        SELECT COUNT(DISTINCT DATE_TRUNC('hour', start_date))
-        FROM health_metric
-        WHERE type = %s
-        AND user_id = %s
-        AND start_date >= %s
-        AND end_date <= %s
-        AND CAST(value AS FLOAT) > 0
-        """
-
-        result = self.db_pool._execute_query(
-            query, (HealthDataType.STAND_TIME.value, user_id, start_date, end_date), fetch_one=True
-        )
-
-        if result and result[0]:
-            return int(result[0])
-
-        return None
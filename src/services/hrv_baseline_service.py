@@ -0,0 +1,101 @@
+"""
+个人HRV基线服务
+负责读取和保存每个用户的HRV基线滚动状态
+"""
+import json
+from datetime import datetime
+from typing import Dict, List, Optional
+from psycopg2.extras import execute_values
+from ..db.postgresql import POSTGRES_POOL
+from ..models.hrv_baseline import HrvBaselineState
+from ..core.hrv_baseline import resolve_baseline
+from ..utils.logger import logger
+
+
+class HrvBaselineService:
+    """个人HRV基线服务"""
+
+    def get_states(self, user_ids: List[str]) -> Dict[str, HrvBaselineState]:
+        """
+        读取用户已保存的最新基线状态
+
+        Args:
+            user_ids: 用户ID列表
+
+        Returns:
+            用户ID到状态的字典，没有状态的用户没有对应项
+        """
+        states: Dict[str, HrvBaselineState] = {}
+        if not user_ids:
+            return states
+
+        try:
+            rows = POSTGRES_POOL._execute_query("""
+                SELECT user_id, ewma, window_values, sample_days, last_scored_date, updated_at
+                FROM user_hrv_baselines
+                WHERE user_id = ANY(%s)
+            """, (list(user_ids),), fetch_all=True) or []
+            for row in rows:
+                states[row['user_id']] = HrvBaselineState(
+                    ewma=row['ewma'],
+                    window=row['window_values'] or [],
+                    sample_days=row['sample_days'],
+                    last_scored_date=row['last_scored_date'],
+                    updated_at=row['updated_at'],
+                )
+        except Exception as e:
+            logger.error(f"读取HRV基线失败: {e}")
+        return states
+
+    def get_baseline(self, user_id: str) -> float:
+        """获取用户当前的HRV基线（没有个人基线时为默认基线）"""
+        return resolve_baseline(self.get_states([user_id]).get(user_id))
+
+    def save_states_bulk(self, states_by_user: Dict[str, Optional[HrvBaselineState]]) -> int:
+        """
+        批量保存基线状态，已保存的状态只会被同一天或更晚的状态覆盖
+
+        Args:
+            states_by_user: 用户ID到状态的字典
+
+        Returns:
+            保存的行数
+        """
+        rows = [
+            (user_id, state.ewma, json.dumps(state.window), state.sample_days, state.last_scored_date, datetime.now())
+            for user_id, state in states_by_user.items() if state is not None
+        ]
+        if not rows:
+            return 0
+
+        conn = None
+        cursor = None
+        try:
+            conn = POSTGRES_POOL.get_connection()
+            cursor = conn.cursor()
+            execute_values(cursor, """
+                INSERT INTO user_hrv_baselines
+                (user_id, ewma, window_values, sample_days, last_scored_date, updated_at)
+                VALUES %s
+                ON CONFLICT (user_id)
+                DO UPDATE SET
+                    ewma = EXCLUDED.ewma,
+                    window_values = EXCLUDED.window_values,
+                    sample_days = EXCLUDED.sample_days,
+                    last_scored_date = EXCLUDED.last_scored_date,
+                    updated_at = EXCLUDED.updated_at
+                WHERE user_hrv_baselines.last_scored_date IS NULL
+                   OR EXCLUDED.last_scored_date >= user_hrv_baselines.last_scored_date
+            """, rows, page_size=1000)
+            conn.commit()
+            return len(rows)
+        except Exception as e:
+            logger.error(f"保存HRV基线失败: {e}")
+            if conn:
+                conn.rollback()
+            return 0
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                POSTGRES_POOL.put_connection(conn)
@@ -0,0 +1,182 @@
+"""
+高频样本保留策略服务
+心率、环境音量等类型每个用户每天有数千条样本，积分计算只需要聚合值。
+超过保留天数的原始样本按(数据源, 时间桶)压缩为min/max/sum/count写入health_samples_compacted，再删除原始样本：
+
+- 每个(用户, 类型, 日)一个短事务，用一条DELETE ... RETURNING把删除的样本直接聚合写入压缩层
+  （时间桶已存在时合并），中断后重新运行从剩余的原始样本继续
+- 每个用户日的事务同时推进压缩水位（health_retention_state），处理完的(用户, 类型)再推进到截止时间；之后重复导入的、落在已有时间桶中的
+  旧样本在写入时被跳过（见db/health_dictionary.py），不会与压缩层重复计算
+- 读取时原始样本和压缩层合并读取（见HealthDataService和DailyRollupService），旧日期的聚合值不变，
+  心率区间按每个时间桶的平均心率计算
+"""
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from ..db.health_dictionary import HEALTH_DICTIONARY
+from ..db.postgresql import POSTGRES_POOL
+from ..db.configs.global_config import RETENTION_CONFIG
+from ..utils.logger import logger
+
+
+# 与每日汇总读取样本时相同的数值过滤，非数值的样本保留原样
+NUMERIC_VALUE = "value ~ '^[0-9.]+$'"
+
+# 压缩水位只前进不后退
+UPSERT_WATERMARK = """
+    INSERT INTO health_retention_state (user_id, type_id, compacted_before, bucket_seconds)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (user_id, type_id) DO UPDATE SET
+        compacted_before = GREATEST(health_retention_state.compacted_before, EXCLUDED.compacted_before),
+        bucket_seconds = EXCLUDED.bucket_seconds,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+
+class HealthRetentionService:
+    """高频样本保留策略服务"""
+
+    def __init__(self, raw_days: int = RETENTION_CONFIG.raw_days,
+                 bucket_seconds: Optional[Dict[str, int]] = None,
+                 pause_seconds: float = RETENTION_CONFIG.pause_seconds):
+        """
+        Args:
+            raw_days: 原始样本保留的天数
+            bucket_seconds: 压缩的样本类型及其时间桶的秒数（默认取RETENTION_CONFIG）
+            pause_seconds: 每个事务之间的停顿
+        """
+        self.raw_days = raw_days
+        self.bucket_seconds = bucket_seconds or RETENTION_CONFIG.bucket_seconds
+        self.pause_seconds = pause_seconds
+
+    def run(self, now: Optional[datetime] = None, user_id: Optional[str] = None) -> Dict[str, int]:
+        """
+        压缩所有策略类型中早于保留期的原始样本
+
+        Args:
+            now: 当前时间（默认为现在），早于 now - raw_days 当天0点的样本被压缩
+            user_id: 只处理该用户（默认处理全部用户）
+
+        Returns:
+            统计信息：days（处理的用户日数）、samples（删除的原始样本数）、buckets（写入或合并的时间桶数）
+        """
+        now = now or datetime.now()
+        cutoff = (now - timedelta(days=self.raw_days)).replace(hour=0, minute=0, second=0, microsecond=0)
+        report = {"days": 0, "samples": 0, "buckets": 0}
+        started = time.perf_counter()
+
+        for type_name, bucket_seconds in self.bucket_seconds.items():
+            type_id = HEALTH_DICTIONARY.type_id(type_name)
+            if type_id is None:
+                continue
+            for uid in ([user_id] if user_id else self._user_ids()):
+                compacted = False
+                end = None
+                while True:
+                    # 从上一个处理完的日之后查找，不再扫过刚删除的样本
+                    day = self._first_raw_day(uid, type_id, end, cutoff)
+                    if day is None:
+                        break
+                    end = min(day + timedelta(days=1), cutoff)
+                    samples, buckets = self.compact_day(uid, type_id, bucket_seconds, day, end)
+                    report["days"] += 1
+                    report["samples"] += samples
+                    report["buckets"] += buckets
+                    compacted = True
+                    if self.pause_seconds:
+                        time.sleep(self.pause_seconds)
+                if compacted:
+                    self._advance_watermark(uid, type_id, cutoff, bucket_seconds)
+            logger.info(f"{type_name}压缩进度: {report['days']}个用户日, 删除{report['samples']}条原始样本, "
+                        f"耗时{time.perf_counter() - started:.1f}秒")
+        return report
+
+    @staticmethod
+    def compact_day(user_id: str, type_id: int, bucket_seconds: int, start: datetime, end: datetime):
+        """
+        把一个用户一种类型在[start, end)内开始的原始样本压缩为时间桶并删除，同一事务内把压缩水位推进到end
+
+        水位与删除一起提交，批次中途中断时已压缩的日期之后重复导入的旧样本同样会被跳过
+
+        Returns:
+            (删除的原始样本数, 写入或合并的时间桶数)
+        """
+        conn = POSTGRES_POOL.get_connection()
+        if conn is None:
+            raise RuntimeError("获取数据库连接失败")
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    WITH moved AS (
+                        DELETE FROM health_samples
+                        WHERE user_id = %s AND type_id = %s
+                        AND start_date >= %s AND start_date < %s
+                        AND {NUMERIC_VALUE}
+                        RETURNING source_id, unit, start_date, COALESCE(end_date, start_date) AS end_date,
+                                  CAST(value AS DOUBLE PRECISION) AS value
+                    ), buckets AS (
+                        INSERT INTO health_samples_compacted AS c (
+                            user_id, type_id, source_id, bucket_start, bucket_end, bucket_seconds, unit,
+                            sample_count, min_value, max_value, sum_value
+                        )
+                        SELECT %s, %s, source_id,
+                               to_timestamp(floor(EXTRACT(EPOCH FROM start_date) / %s) * %s) AS bucket_start,
+                               MAX(end_date), %s, MAX(unit), COUNT(*), MIN(value), MAX(value), SUM(value)
+                        FROM moved
+                        GROUP BY source_id, bucket_start
+                        ON CONFLICT (user_id, type_id, bucket_start, (COALESCE(source_id, 0))) DO UPDATE SET
+                            bucket_end = GREATEST(c.bucket_end, EXCLUDED.bucket_end),
+                            sample_count = c.sample_count + EXCLUDED.sample_count,
+                            min_value = LEAST(c.min_value, EXCLUDED.min_value),
+                            max_value = GREATEST(c.max_value, EXCLUDED.max_value),
+                            sum_value = c.sum_value + EXCLUDED.sum_value,
+                            compacted_at = CURRENT_TIMESTAMP
+                        RETURNING sample_count
+                    )
+                    SELECT (SELECT COUNT(*) FROM moved), (SELECT COUNT(*) FROM buckets)
+                """, (user_id, type_id, start, end, user_id, type_id, bucket_seconds, bucket_seconds, bucket_seconds))
+                samples, buckets = cursor.fetchone()
+                cursor.execute(UPSERT_WATERMARK, (user_id, type_id, end, bucket_seconds))
+            conn.commit()
+        except Exception as e:
+            logger.error(f"压缩用户{user_id}的样本失败 (类型{type_id}, {start:%Y-%m-%d}): {e}")
+            conn.rollback()
+            raise
+        finally:
+            POSTGRES_POOL.put_connection(conn)
+        return samples, buckets
+
+    @staticmethod
+    def _first_raw_day(user_id: str, type_id: int, after: Optional[datetime], cutoff: datetime) -> Optional[datetime]:
+        """在[after, cutoff)内开始的最早一条（数值）原始样本所在日的0点"""
+        row = POSTGRES_POOL._execute_query(f"""
+            SELECT date_trunc('day', MIN(start_date))
+            FROM health_samples
+            WHERE user_id = %s AND type_id = %s AND start_date >= COALESCE(%s::timestamp, '-infinity') AND start_date < %s
+            AND {NUMERIC_VALUE}
+        """, (user_id, type_id, after, cutoff), fetch_one=True)
+        if row is None:
+            raise RuntimeError("读取待压缩的样本失败")
+        return row[0].replace(tzinfo=None) if row[0] else None
+
+    @staticmethod
+    def _user_ids() -> List[str]:
+        """有样本的用户（沿(user_id, ...)索引跳跃扫描，不读取全部样本）"""
+        rows = POSTGRES_POOL._execute_query("""
+            WITH RECURSIVE users AS (
+                (SELECT user_id FROM health_samples WHERE user_id IS NOT NULL ORDER BY user_id LIMIT 1)
+                UNION ALL
+                SELECT (SELECT h.user_id FROM health_samples h WHERE h.user_id > users.user_id ORDER BY h.user_id LIMIT 1)
+                FROM users
+                WHERE users.user_id IS NOT NULL
+            )
+            SELECT user_id FROM users WHERE user_id IS NOT NULL
+        """, fetch_all=True)
+        if rows is None:
+            raise RuntimeError("读取用户列表失败")
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def _advance_watermark(user_id: str, type_id: int, cutoff: datetime, bucket_seconds: int):
+        POSTGRES_POOL._execute_query(UPSERT_WATERMARK, (user_id, type_id, cutoff, bucket_seconds), commit=True)
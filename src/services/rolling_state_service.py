@@ -0,0 +1,101 @@
+"""
+滚动状态服务
+统一读取和保存按天推进的各类状态（连续达标、连锁规则计数器、个人HRV基线）
+"""
+from datetime import date, timedelta
+from typing import Dict, List
+
+from ..models.rolling_state import RollingStates
+from .streak_service import StreakService
+from .chain_penalty_service import ChainPenaltyService
+from .hrv_baseline_service import HrvBaselineService
+from .score_persistence_service import ScorePersistenceService
+
+
+class RollingStateService:
+    """滚动状态服务"""
+
+    def __init__(self):
+        self.streak_service = StreakService()
+        self.chain_service = ChainPenaltyService()
+        self.hrv_baseline_service = HrvBaselineService()
+        self.persistence_service = ScorePersistenceService()
+
+    def get_previous_states(self, user_ids: List[str], day: date) -> Dict[str, RollingStates]:
+        """
+        获取计算某天积分所需的前一天结束时的状态
+
+        按天顺序计算时直接使用各状态表中保存的最新状态；
+        重算已计算过的日期时，改用前一天积分记录中保存的明细（一次行查询）。
+
+        Args:
+            user_ids: 用户ID列表
+            day: 要计算的日期
+
+        Returns:
+            用户ID到状态的字典，latest_scored_date为已保存状态中最晚的计算日期
+        """
+        streaks = self.streak_service.get_states(user_ids)
+        chains = self.chain_service.get_states(user_ids)
+        baselines = self.hrv_baseline_service.get_states(user_ids)
+
+        results = {}
+        for user_id in user_ids:
+            states = RollingStates(
+                streaks=streaks.get(user_id, {}),
+                chains=chains.get(user_id, {}),
+                hrv_baseline=baselines.get(user_id),
+            )
+            scored_dates = [state.last_scored_date for state in states.streaks.values()]
+            scored_dates += [state.last_scored_date for state in states.chains.values()]
+            if states.hrv_baseline:
+                scored_dates.append(states.hrv_baseline.last_scored_date)
+            states.latest_scored_date = max(filter(None, scored_dates), default=None)
+            results[user_id] = states
+
+        # 已保存状态计算过当天或之后的用户需要从前一天的积分记录还原
+        rescoring = [
+            user_id for user_id, states in results.items()
+            if states.latest_scored_date and states.latest_scored_date >= day
+        ]
+        if rescoring:
+            previous_day = day - timedelta(days=1)
+            previous_scores = self.persistence_service.get_day_dimension_scores(rescoring, previous_day)
+            for user_id in rescoring:
+                restored = RollingStates.from_scores(previous_scores.get(user_id, {}), previous_day)
+                restored.latest_scored_date = results[user_id].latest_scored_date
+                results[user_id] = restored
+        return results
+
+    def has_changed(self, user_id: str, day: date, states: RollingStates) -> bool:
+        """
+        重算某天后的状态与该天已保存的积分记录中的状态是否不同
+
+        Args:
+            user_id: 用户ID
+            day: 日期
+            states: 重算得到的当天结束时的状态
+
+        Returns:
+            是否不同（之后已计算的日期需要重算）
+        """
+        saved = self.persistence_service.get_day_dimension_scores([user_id], day).get(user_id, {})
+        exclude = {'latest_scored_date'}
+        return RollingStates.from_scores(saved, day).model_dump(exclude=exclude) != states.model_dump(exclude=exclude)
+
+    def save_states_bulk(self, states_by_user: Dict[str, RollingStates]) -> None:
+        """
+        批量保存各用户当天结束时的状态（只覆盖同一天或更早的已保存状态）
+
+        Args:
+            states_by_user: 用户ID到状态的字典
+        """
+        self.streak_service.save_states_bulk(
+            {user_id: list(states.streaks.values()) for user_id, states in states_by_user.items()}
+        )
+        self.chain_service.save_states_bulk(
+            {user_id: list(states.chains.values()) for user_id, states in states_by_user.items()}
+        )
+        self.hrv_baseline_service.save_states_bulk(
+            {user_id: states.hrv_baseline for user_id, states in states_by_user.items()}
+        )
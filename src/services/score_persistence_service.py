@@ -4,9 +4,12 @@
 """
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple
+from psycopg2.extras import execute_values
 from ..db.postgresql import POSTGRES_POOL
+from ..db.cache_notify import notify_invalidation, TIER_NAMESPACE
 from ..models.health_data import DifficultyLevel
 from ..core.score_config import calculate_percentage
+from ..utils.cache import invalidate_user_dates, invalidate_user_tier
 from ..utils.logger import logger
 import json
 
@@ -50,6 +53,14 @@ class ScorePersistenceService:
             return record[field_index] if len(record) > field_index else None
         return None
     
+    # 维度积分明细的子类别
+    SUB_CATEGORY_MAP = {
+        'sleep': 'duration',
+        'exercise': 'activity',
+        'diet': 'nutrition',
+        'mental': 'wellbeing'
+    }
+    
     def __init__(self):
         """初始化服务"""
         pass
@@ -74,20 +85,27 @@ class ScorePersistenceService:
     
     def save_daily_scores(self, user_id: str, date: datetime, 
                          dimension_scores: Dict[str, Dict], 
-                         total_score: int, tier_level: str = "Bronze") -> bool:
+                         total_score: int, tier_level: str = "Bronze",
+                         health_summary: Optional[Dict] = None, update_only: bool = False) -> bool:
         """
         保存每日积分汇总和明细
         
+        重算时先在同一事务中删除当天已有的维度明细，降为0的级别（被连锁规则屏蔽、去重后步数减少等）不会残留
+        
         Args:
             user_id: 用户ID
             date: 积分日期
             dimension_scores: 各维度积分详情
             total_score: 总积分
             tier_level: 用户等级
+            health_summary: 当日健康数据汇总（可JSON序列化），随总积分记录一起保存供读取路径复用
+            update_only: 只更新已有的总积分记录（没有记录时不写入），用于重算后没有积分的日期
             
         Returns:
             是否保存成功
         """
+        conn = None
+        cursor = None
         try:
             # 开始事务
             conn = POSTGRES_POOL.get_connection()
@@ -97,30 +115,49 @@ class ScorePersistenceService:
             expire_date = self.calculate_expire_date(date, tier_level)
             
             # 保存总积分记录
+            total_details = {"dimension_scores": dimension_scores}
+            if health_summary is not None:
+                total_details["health_summary"] = health_summary
+            if update_only:
+                cursor.execute("""
+                    UPDATE user_scores
+                    SET score = %s, expire_date = %s, tier_level = %s, details = %s, created_at = %s
+                    WHERE user_id = %s AND score_date = %s AND dimension = 'total' AND difficulty = 'all'
+                """, (
+                    total_score, expire_date, tier_level, json.dumps(total_details), datetime.now(),
+                    user_id, date.date()
+                ))
+            else:
+                cursor.execute("""
+                    INSERT INTO user_scores 
+                    (user_id, score_date, dimension, sub_category, difficulty, score, 
+                     expire_date, tier_level, details, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (user_id, score_date, dimension, difficulty) 
+                    DO UPDATE SET 
+                        score = EXCLUDED.score,
+                        expire_date = EXCLUDED.expire_date,
+                        tier_level = EXCLUDED.tier_level,
+                        details = EXCLUDED.details,
+                        created_at = EXCLUDED.created_at
+                """, (
+                    user_id, date.date(), 'total', 'daily_total', 'all',
+                    total_score, expire_date, tier_level,
+                    json.dumps(total_details),
+                    datetime.now()
+                ))
+            
+            # 删除当天已有的维度明细，之后只写入仍大于0的级别
             cursor.execute("""
-                INSERT INTO user_scores 
-                (user_id, score_date, dimension, sub_category, difficulty, score, 
-                 expire_date, tier_level, details, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (user_id, score_date, dimension, difficulty) 
-                DO UPDATE SET 
-                    score = EXCLUDED.score,
-                    expire_date = EXCLUDED.expire_date,
-                    tier_level = EXCLUDED.tier_level,
-                    details = EXCLUDED.details,
-                    created_at = EXCLUDED.created_at
-            """, (
-                user_id, date.date(), 'total', 'daily_total', 'all',
-                total_score, expire_date, tier_level,
-                json.dumps({"dimension_scores": dimension_scores}),
-                datetime.now()
-            ))
+                DELETE FROM user_scores
+                WHERE user_id = %s AND score_date = %s AND dimension <> 'total'
+            """, (user_id, date.date()))
             
             # 保存各维度积分明细
             for dimension, scores in dimension_scores.items():
                 if scores['total'] > 0:
                     # 保存每个难度级别的积分
-                    for difficulty in ['easy', 'medium', 'hard', 'super_hard']:
+                    for difficulty in ['easy', 'medium', 'hard', 'super_hard', 'recovery']:
                         if scores.get(difficulty, 0) > 0:
                             self._save_dimension_score(
                                 cursor, user_id, date, dimension, 
@@ -128,9 +165,13 @@ class ScorePersistenceService:
                                 expire_date, tier_level, scores.get('details', {})
                             )
             
+            # 通知其他worker失效缓存（随事务提交后送达）
+            notify_invalidation(cursor, user_id, date, namespaces=["daily_score"])
+            
             # 提交事务
             conn.commit()
             logger.info(f"成功保存用户 {user_id} 在 {date.date()} 的积分")
+            invalidate_user_dates(user_id, date, namespaces=["daily_score"])
             return True
             
         except Exception as e:
@@ -144,19 +185,208 @@ class ScorePersistenceService:
             if conn:
                 POSTGRES_POOL.put_connection(conn)
     
+    def save_daily_scores_batch(self, results: List[Dict]) -> int:
+        """
+        批量保存多个用户多天的积分（单个事务内用批量upsert写入）
+        
+        与save_daily_scores一致：先删除这些用户日已有的维度明细；带update_only的结果只更新已有的总积分记录
+        
+        Args:
+            results: 积分结果列表，每项包含user_id、date、dimension_scores、
+                     total_score、tier_level和可选的health_summary、update_only
+            
+        Returns:
+            成功保存的用户日数
+        """
+        if not results:
+            return 0
+        
+        rows = []
+        updates = []
+        date_ranges: Dict[str, Tuple[datetime, datetime]] = {}
+        now = datetime.now()
+        for result in results:
+            user_id = result['user_id']
+            date = result['date']
+            tier_level = result.get('tier_level', 'Bronze')
+            expire_date = self.calculate_expire_date(date, tier_level)
+            
+            total_details = {"dimension_scores": result['dimension_scores']}
+            if result.get('health_summary') is not None:
+                total_details["health_summary"] = result['health_summary']
+            if result.get('update_only'):
+                updates.append((
+                    user_id, date.date(), result['total_score'], expire_date, tier_level,
+                    json.dumps(total_details), now
+                ))
+            else:
+                rows.append((
+                    user_id, date.date(), 'total', 'daily_total', 'all',
+                    result['total_score'], expire_date, tier_level,
+                    json.dumps(total_details), now
+                ))
+            
+            for dimension, scores in result['dimension_scores'].items():
+                if scores['total'] > 0:
+                    for difficulty in ['easy', 'medium', 'hard', 'super_hard', 'recovery']:
+                        if scores.get(difficulty, 0) > 0:
+                            rows.append((
+                                user_id, date.date(), dimension,
+                                self.SUB_CATEGORY_MAP.get(dimension, 'general'), difficulty,
+                                scores[difficulty], expire_date, tier_level,
+                                json.dumps(scores.get('details', {})), now
+                            ))
+            
+            first, last = date_ranges.get(user_id, (date, date))
+            date_ranges[user_id] = (min(first, date), max(last, date))
+        
+        conn = None
+        cursor = None
+        try:
+            conn = POSTGRES_POOL.get_connection()
+            cursor = conn.cursor()
+            
+            execute_values(cursor, """
+                DELETE FROM user_scores s
+                USING (VALUES %s) AS v(user_id, score_date)
+                WHERE s.user_id = v.user_id
+                AND s.score_date = v.score_date::date
+                AND s.dimension <> 'total'
+            """, [(result['user_id'], result['date'].date()) for result in results], page_size=1000)
+            
+            if updates:
+                execute_values(cursor, """
+                    UPDATE user_scores s
+                    SET score = v.score, expire_date = v.expire_date::timestamptz, tier_level = v.tier_level,
+                        details = v.details::jsonb, created_at = v.created_at
+                    FROM (VALUES %s) AS v(user_id, score_date, score, expire_date, tier_level, details, created_at)
+                    WHERE s.user_id = v.user_id
+                    AND s.score_date = v.score_date::date
+                    AND s.dimension = 'total'
+                    AND s.difficulty = 'all'
+                """, updates, page_size=1000)
+            
+            if rows:
+                execute_values(cursor, """
+                    INSERT INTO user_scores 
+                    (user_id, score_date, dimension, sub_category, difficulty, score, 
+                     expire_date, tier_level, details, created_at)
+                    VALUES %s
+                    ON CONFLICT (user_id, score_date, dimension, difficulty) 
+                    DO UPDATE SET 
+                        score = EXCLUDED.score,
+                        sub_category = EXCLUDED.sub_category,
+                        expire_date = EXCLUDED.expire_date,
+                        tier_level = EXCLUDED.tier_level,
+                        details = EXCLUDED.details,
+                        created_at = EXCLUDED.created_at
+                """, rows, page_size=1000)
+            
+            # 每个用户发送一条覆盖其日期范围的失效通知
+            for user_id, (first, last) in date_ranges.items():
+                notify_invalidation(cursor, user_id, first, last, namespaces=["daily_score"])
+            
+            conn.commit()
+            logger.info(f"批量保存了 {len(date_ranges)} 个用户的 {len(results)} 条每日积分")
+            for user_id, (first, last) in date_ranges.items():
+                invalidate_user_dates(user_id, first, last, namespaces=["daily_score"])
+            return len(results)
+            
+        except Exception as e:
+            logger.error(f"批量保存积分失败: {e}")
+            if conn:
+                conn.rollback()
+            return 0
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                POSTGRES_POOL.put_connection(conn)
+    
+    def get_daily_score_record(self, user_id: str, date: datetime) -> Optional[Dict]:
+        """
+        读取已持久化的每日总积分记录
+        
+        Args:
+            user_id: 用户ID
+            date: 积分日期
+            
+        Returns:
+            包含total_score、dimension_scores、health_summary、tier_level、created_at的字典，
+            没有记录或记录不完整时返回None
+        """
+        try:
+            record = POSTGRES_POOL.select_data(
+                table_name="user_scores",
+                columns=["score", "details", "tier_level", "created_at"],
+                conditions="user_id = %s AND score_date = %s AND dimension = 'total' AND difficulty = 'all'",
+                params=(user_id, date.date()),
+                fetch_one=True
+            )
+            
+            if not record:
+                return None
+            
+            details = record['details'] or {}
+            if isinstance(details, str):
+                details = json.loads(details)
+            
+            # 旧记录没有保存health_summary，无法直接复用
+            if 'dimension_scores' not in details or 'health_summary' not in details:
+                return None
+            
+            return {
+                'total_score': record['score'],
+                'dimension_scores': details['dimension_scores'],
+                'health_summary': details['health_summary'],
+                'tier_level': record['tier_level'] or 'Bronze',
+                'created_at': record['created_at']
+            }
+            
+        except Exception as e:
+            logger.error(f"读取每日积分记录失败: {e}")
+            return None
+    
+    def get_day_dimension_scores(self, user_ids: List[str], day) -> Dict[str, Dict[str, Dict]]:
+        """
+        批量读取某天总积分记录中保存的各维度积分明细
+        
+        Args:
+            user_ids: 用户ID列表
+            day: 日期
+            
+        Returns:
+            用户ID到各维度积分字典的映射，当天没有记录的用户没有对应项
+        """
+        results = {}
+        if not user_ids:
+            return results
+        
+        try:
+            rows = POSTGRES_POOL._execute_query("""
+                SELECT user_id, details
+                FROM user_scores
+                WHERE user_id = ANY(%s)
+                AND score_date = %s
+                AND dimension = 'total'
+                AND difficulty = 'all'
+            """, (list(user_ids), day), fetch_all=True) or []
+            for row in rows:
+                details = row['details'] or {}
+                if isinstance(details, str):
+                    details = json.loads(details)
+                results[row['user_id']] = details.get('dimension_scores', {})
+        except Exception as e:
+            logger.error(f"批量读取每日积分明细失败: {e}")
+        return results
+    
     def _save_dimension_score(self, cursor, user_id: str, date: datetime,
                              dimension: str, difficulty: str, score: int,
                              expire_date: Optional[datetime], tier_level: str,
                              details: Dict) -> None:
         """保存维度积分明细"""
         # 根据维度确定子类别
-        sub_category_map = {
-            'sleep': 'duration',
-            'exercise': 'activity',
-            'diet': 'nutrition',
-            'mental': 'wellbeing'
-        }
-        sub_category = sub_category_map.get(dimension, 'general')
+        sub_category = self.SUB_CATEGORY_MAP.get(dimension, 'general')
         
         cursor.execute("""
             INSERT INTO user_scores 
@@ -467,6 +697,46 @@ class ScorePersistenceService:
             if conn:
                 POSTGRES_POOL.put_connection(conn)
     
+    def update_user_tier(self, user_id: str, tier_level: str) -> bool:
+        """
+        更新用户等级并使各worker中的等级缓存失效
+        
+        Args:
+            user_id: 用户ID
+            tier_level: 新的用户等级
+            
+        Returns:
+            是否更新成功
+        """
+        conn = None
+        cursor = None
+        try:
+            conn = POSTGRES_POOL.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                INSERT INTO users (user_id, level)
+                VALUES (%s, %s)
+                ON CONFLICT (user_id) DO UPDATE SET level = EXCLUDED.level
+            """, (user_id, tier_level))
+            notify_invalidation(cursor, user_id, namespaces=[TIER_NAMESPACE])
+            
+            conn.commit()
+            invalidate_user_tier(user_id)
+            logger.info(f"用户 {user_id} 等级更新为 {tier_level}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"更新用户等级失败: {e}")
+            if conn:
+                conn.rollback()
+            return False
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                POSTGRES_POOL.put_connection(conn)
+    
     def get_user_tier_stats(self, user_id: str) -> Dict:
         """
         获取用户等级相关统计
@@ -6,6 +6,7 @@ from datetime import datetime, timedelta, time
 from typing import Dict, List, Optional, Tuple
 from ..db.postgresql import POSTGRES_POOL
 from .sleep_data_source_manager import SleepDataSourceManager
+from ..utils.singleflight import coalesce_daily
 from ..utils.logger import logger
 
 
@@ -77,6 +78,7 @@ class SleepAnalysisService:
             logger.error(f"获取睡眠阶段数据失败: {e}")
             return []
     
+    @coalesce_daily("sleep_stages")
     def analyze_sleep_stages(self, user_id: str, date: datetime,
                             source_filter: Optional[str] = None) -> Dict:
         """
@@ -99,6 +101,20 @@ class SleepAnalysisService:
             sleep_data = self.get_sleep_stages_data(user_id, date, source_filter)
             used_source = source_filter
         
+        return self.summarize_sleep_records(date, sleep_data, used_source)
+    
+    def summarize_sleep_records(self, date: datetime, sleep_data: List[Dict], used_source: str) -> Dict:
+        """
+        根据一晚的睡眠记录计算各阶段时长和入睡/起床时间（不访问数据库）
+        
+        Args:
+            date: 日期
+            sleep_data: 按start_date排序的睡眠记录列表
+            used_source: 记录所属的数据源
+        
+        Returns:
+            包含各阶段时长和睡眠时间的分析结果
+        """
         if not sleep_data:
             return {
                 'date': date.date().isoformat(),
@@ -192,7 +208,18 @@ class SleepAnalysisService:
             包含入睡时间、起床时间和评分的详情
         """
         analysis = self.analyze_sleep_stages(user_id, date, source_filter)
+        return self.evaluate_sleep_time_targets(analysis)
+    
+    def evaluate_sleep_time_targets(self, analysis: Dict) -> Dict:
+        """
+        根据睡眠分析结果判断入睡和起床时间是否达标（不访问数据库）
+        
+        Args:
+            analysis: analyze_sleep_stages或summarize_sleep_records的返回结果
         
+        Returns:
+            包含入睡时间、起床时间和评分的详情
+        """
         if not analysis['has_data']:
             return {
                 'has_data': False,
@@ -230,6 +257,60 @@ class SleepAnalysisService:
         
         return result
     
+    def analyze_sleep_stages_bulk(self, user_ids: List[str], start_date: datetime, end_date: datetime,
+                                  source_filter: str) -> Dict[Tuple[str, str], Dict]:
+        """
+        批量分析多个用户在日期范围内每晚的睡眠阶段
+        
+        一次查询取回所有用户的睡眠记录，按(用户, 日期)分组后逐晚分析，
+        每晚的时间窗口与get_sleep_stages_data一致（前一天18:00到当天12:00）
+        
+        Args:
+            user_ids: 用户ID列表
+            start_date: 开始日期
+            end_date: 结束日期（含）
+            source_filter: 数据源过滤器（如 'Oura'）
+        
+        Returns:
+            (user_id, 'YYYY-MM-DD') 到分析结果的字典，包含范围内的每一个用户和日期
+        """
+        first_day = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        last_day = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        
+        query = """
+            SELECT h.*, d::date AS night
+            FROM generate_series(%s::timestamp, %s::timestamp, interval '1 day') AS d
+            JOIN health_metric h
+              ON h.start_date >= d - interval '6 hours'
+             AND h.end_date <= d + interval '12 hours'
+            WHERE h.type = %s
+            AND h.user_id = ANY(%s)
+            AND h.source_name = %s
+            ORDER BY h.user_id, night, h.start_date
+        """
+        
+        grouped: Dict[Tuple[str, str], List[Dict]] = {}
+        try:
+            rows = POSTGRES_POOL._execute_query(
+                query,
+                (first_day, last_day, 'HKCategoryTypeIdentifierSleepAnalysis', list(user_ids), source_filter),
+                fetch_all=True
+            ) or []
+            for row in rows:
+                grouped.setdefault((row['user_id'], row['night'].isoformat()), []).append(row)
+        except Exception as e:
+            logger.error(f"批量获取睡眠阶段数据失败: {e}")
+        
+        results = {}
+        for user_id in user_ids:
+            current = first_day
+            while current <= last_day:
+                key = (user_id, current.strftime('%Y-%m-%d'))
+                results[key] = self.summarize_sleep_records(current, grouped.get(key, []), source_filter)
+                current += timedelta(days=1)
+        
+        return results
+    
     def get_monthly_sleep_analysis(self, user_id: str, year: int, month: int,
                                   source_filter: Optional[str] = None) -> List[Dict]:
         """
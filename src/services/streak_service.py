@@ -0,0 +1,194 @@
+"""
+连续达标状态服务
+负责读取、保存和重建每个用户每个维度的连续达标（streak）状态
+"""
+import json
+from datetime import datetime
+from typing import Dict, List
+from psycopg2.extras import execute_values
+from ..db.postgresql import POSTGRES_POOL
+from ..models.health_data import DailyHealthSummary
+from ..models.streak import StreakState
+from ..core.streaks import advance_streak
+from ..utils.logger import logger
+
+
+class StreakService:
+    """连续达标状态服务"""
+
+    def get_states(self, user_ids: List[str]) -> Dict[str, Dict[str, StreakState]]:
+        """
+        读取用户已保存的最新状态
+
+        Args:
+            user_ids: 用户ID列表
+
+        Returns:
+            用户ID到 {维度: 状态} 的字典
+        """
+        states: Dict[str, Dict[str, StreakState]] = {user_id: {} for user_id in user_ids}
+        if not user_ids:
+            return states
+
+        try:
+            rows = POSTGRES_POOL._execute_query("""
+                SELECT user_id, dimension, rule, current_length, last_qualifying_date,
+                       last_scored_date, unlocked, context, updated_at
+                FROM user_streaks
+                WHERE user_id = ANY(%s)
+            """, (list(user_ids),), fetch_all=True) or []
+            for row in rows:
+                states.setdefault(row['user_id'], {})[row['dimension']] = StreakState(
+                    dimension=row['dimension'],
+                    rule=row['rule'],
+                    current_length=row['current_length'],
+                    last_qualifying_date=row['last_qualifying_date'],
+                    last_scored_date=row['last_scored_date'],
+                    unlocked=row['unlocked'],
+                    context=row['context'] or {},
+                    updated_at=row['updated_at'],
+                )
+        except Exception as e:
+            logger.error(f"读取连续达标状态失败: {e}")
+        return states
+
+    def save_states(self, user_id: str, states: List[StreakState]) -> bool:
+        """保存一个用户的状态"""
+        return self.save_states_bulk({user_id: states}) == len(states)
+
+    def save_states_bulk(self, states_by_user: Dict[str, List[StreakState]]) -> int:
+        """
+        批量保存状态，已保存的状态只会被同一天或更晚的状态覆盖
+
+        Args:
+            states_by_user: 用户ID到状态列表的字典
+
+        Returns:
+            保存的行数
+        """
+        rows = self._state_rows(states_by_user)
+        if not rows:
+            return 0
+
+        conn = None
+        cursor = None
+        try:
+            conn = POSTGRES_POOL.get_connection()
+            cursor = conn.cursor()
+            self._upsert_rows(cursor, rows)
+            conn.commit()
+            return len(rows)
+        except Exception as e:
+            logger.error(f"保存连续达标状态失败: {e}")
+            if conn:
+                conn.rollback()
+            return 0
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                POSTGRES_POOL.put_connection(conn)
+
+    @staticmethod
+    def _state_rows(states_by_user: Dict[str, List[StreakState]]) -> List[tuple]:
+        return [
+            (user_id, state.dimension, state.rule, state.current_length, state.last_qualifying_date,
+             state.last_scored_date, state.unlocked, json.dumps(state.context), datetime.now())
+            for user_id, states in states_by_user.items()
+            for state in states
+        ]
+
+    @staticmethod
+    def _upsert_rows(cursor, rows: List[tuple]):
+        execute_values(cursor, """
+            INSERT INTO user_streaks
+            (user_id, dimension, rule, current_length, last_qualifying_date,
+             last_scored_date, unlocked, context, updated_at)
+            VALUES %s
+            ON CONFLICT (user_id, dimension, rule)
+            DO UPDATE SET
+                current_length = EXCLUDED.current_length,
+                last_qualifying_date = EXCLUDED.last_qualifying_date,
+                last_scored_date = EXCLUDED.last_scored_date,
+                unlocked = EXCLUDED.unlocked,
+                context = EXCLUDED.context,
+                updated_at = EXCLUDED.updated_at
+            WHERE user_streaks.last_scored_date IS NULL
+               OR EXCLUDED.last_scored_date >= user_streaks.last_scored_date
+        """, rows, page_size=1000)
+
+    def rebuild(self, user_id: str, calculators: Dict) -> Dict[str, StreakState]:
+        """
+        从已保存的每日积分记录重建一个用户的全部状态（状态丢失或规则变化时使用）
+
+        有保存达标标记的日期直接使用标记，否则根据当天保存的各级别积分和健康数据汇总重新判断。
+
+        Args:
+            user_id: 用户ID
+            calculators: 维度到计算器的字典
+
+        Returns:
+            维度到重建后状态的字典，保存失败时为空（已保存的状态不变）
+        """
+        rows = POSTGRES_POOL._execute_query("""
+            SELECT score_date, details
+            FROM user_scores
+            WHERE user_id = %s
+            AND dimension = 'total'
+            AND difficulty = 'all'
+            ORDER BY score_date
+        """, (user_id,), fetch_all=True) or []
+
+        states: Dict[str, StreakState] = {}
+        for row in rows:
+            details = row['details'] or {}
+            if isinstance(details, str):
+                details = json.loads(details)
+            dimension_scores = details.get('dimension_scores', {})
+            summary = details.get('health_summary')
+            health_data = DailyHealthSummary(**summary) if summary else None
+
+            for dimension, calculator in calculators.items():
+                rule = calculator.get_streak_rule()
+                scores = dimension_scores.get(dimension.value)
+                if not rule or not scores:
+                    continue
+
+                previous = states.get(dimension.value) or StreakState(dimension=dimension.value, rule=rule['rule'])
+                saved = scores.get('streak')
+                if saved:
+                    qualified, context = saved.get('qualified', False), saved.get('context') or {}
+                else:
+                    qualified, context = calculator.check_streak_qualification(
+                        scores, health_data, row['score_date'], previous.context
+                    )
+                states[dimension.value] = advance_streak(
+                    previous, row['score_date'], qualified, rule['continuous_days'], context
+                )
+
+        if states and not self._replace_states(user_id, list(states.values())):
+            return {}
+        logger.info(f"重建了用户{user_id}的{len(states)}个连续达标状态")
+        return states
+
+    def _replace_states(self, user_id: str, states: List[StreakState]) -> bool:
+        """用重建结果覆盖一个用户已保存的全部状态（删除和写入在同一事务中，中途失败时保留原状态）"""
+        conn = None
+        cursor = None
+        try:
+            conn = POSTGRES_POOL.get_connection()
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM user_streaks WHERE user_id = %s", (user_id,))
+            self._upsert_rows(cursor, self._state_rows({user_id: states}))
+            conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"覆盖用户{user_id}的连续达标状态失败: {e}")
+            if conn:
+                conn.rollback()
+            return False
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                POSTGRES_POOL.put_connection(conn)
@@ -0,0 +1,214 @@
+"""
+HealthKit增量同步服务
+服务端按(用户, 来源, 类型)保存同步锚点（客户端HKAnchoredObjectQuery的锚点，按不透明字符串保存）。
+客户端读取锚点，从该锚点查询新增样本和已删除对象，再把增量连同新锚点一起提交：
+
+- 提交的起始锚点必须与服务端保存的一致（否则返回冲突和当前锚点，客户端从当前锚点重新查询）
+- 新增样本写入health_samples（ON CONFLICT DO NOTHING），删除对象按样本UUID删除，锚点前移，三者在同一事务中
+- 重复提交已应用的增量（新锚点等于保存的锚点）直接返回，不重复写入
+- 提交后按新增和删除样本的(用户, 日期范围)使缓存失效、删除汇总并加入待重算队列
+"""
+import io
+import re
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from ..db.health_dictionary import insert_samples_sql, register_names_sql
+from ..db.postgresql import POSTGRES_POOL
+from ..db.configs.global_config import UPLOAD_CONFIG
+from .export_import_service import COPY_COLUMNS
+from .upload_service import samples_frame, validate_samples
+from ..utils.logger import logger
+
+
+UUID_PATTERN = r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+SYNC_COLUMNS = COPY_COLUMNS + ["sample_uuid"]
+
+
+class HealthSyncService:
+    """HealthKit增量同步服务"""
+
+    @staticmethod
+    def get_anchors(user_id: str, source_name: Optional[str] = None, sample_type: Optional[str] = None) -> List[Dict]:
+        """
+        查询用户的同步锚点
+
+        Args:
+            user_id: 用户ID
+            source_name: 只返回该来源的锚点
+            sample_type: 只返回该类型的锚点
+        """
+        conditions = ["user_id = %s"]
+        params = [user_id]
+        if source_name:
+            conditions.append("source_name = %s")
+            params.append(source_name)
+        if sample_type:
+            conditions.append("type = %s")
+            params.append(sample_type)
+        rows = POSTGRES_POOL._execute_query(f"""
+            SELECT source_name, type, anchor, samples_added, samples_deleted, updated_at
+            FROM health_sync_anchors
+            WHERE {" AND ".join(conditions)}
+            ORDER BY source_name, type
+        """, tuple(params), fetch_all=True) or []
+        return [dict(row) for row in rows]
+
+    def apply_delta(self, user_id: str, source_name: str, sample_type: str, since_anchor: Optional[str],
+                    anchor: str, samples=None, deleted: Optional[List[str]] = None) -> Dict:
+        """
+        原子地应用一个增量
+
+        Args:
+            user_id: 用户ID
+            source_name: 来源（设备或应用）
+            sample_type: HealthKit样本类型
+            since_anchor: 增量的起始锚点（第一次同步为None）
+            anchor: 应用后的新锚点
+            samples: 新增样本（对象数组或按列的对象），来源和类型缺省时取增量的来源和类型
+            deleted: 已删除样本的UUID
+
+        Returns:
+            status（applied、already_applied或conflict）、anchor（当前锚点）、
+            received、inserted、rejected、deleted
+
+        Raises:
+            ValueError: 样本或UUID无效
+        """
+        frame, rejected = self._prepare_samples(samples, user_id, source_name, sample_type)
+        deleted = list(dict.fromkeys(deleted or []))
+        if not all(re.fullmatch(UUID_PATTERN, value or "") for value in deleted):
+            raise ValueError("删除对象必须是样本UUID")
+        if len(frame) + len(deleted) > UPLOAD_CONFIG.max_samples:
+            raise ValueError(f"每次最多同步{UPLOAD_CONFIG.max_samples}个样本")
+
+        result = {"anchor": anchor, "received": len(frame), "inserted": 0, "rejected": rejected, "deleted": 0}
+        conn = POSTGRES_POOL.get_connection()
+        if conn is None:
+            raise RuntimeError("获取数据库连接失败")
+        ranges = []
+        try:
+            with conn.cursor() as cursor:
+                # 锁住锚点行，同一(用户, 来源, 类型)的增量串行应用
+                cursor.execute("""
+                    INSERT INTO health_sync_anchors (user_id, source_name, type)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT DO NOTHING
+                """, (user_id, source_name, sample_type))
+                cursor.execute("""
+                    SELECT anchor FROM health_sync_anchors
+                    WHERE user_id = %s AND source_name = %s AND type = %s
+                    FOR UPDATE
+                """, (user_id, source_name, sample_type))
+                stored = cursor.fetchone()[0]
+
+                if stored == anchor and stored is not None:
+                    conn.rollback()
+                    return {**result, "status": "already_applied", "received": 0, "rejected": 0}
+                if stored != since_anchor:
+                    conn.rollback()
+                    return {**result, "status": "conflict", "anchor": stored, "received": 0, "rejected": 0}
+
+                if not frame.empty:
+                    result["inserted"], inserted_ranges = self._insert(cursor, frame)
+                    ranges.extend(inserted_ranges)
+                if deleted:
+                    cursor.execute("""
+                        DELETE FROM health_samples
+                        WHERE user_id = %s
+                          AND type_id = (SELECT id FROM health_metric_types WHERE name = %s)
+                          AND sample_uuid = ANY(%s::uuid[])
+                        RETURNING user_id, start_date, end_date
+                    """, (user_id, sample_type, deleted))
+                    removed = cursor.fetchall()
+                    result["deleted"] = len(removed)
+                    ranges.extend(removed)
+
+                cursor.execute("""
+                    UPDATE health_sync_anchors
+                    SET anchor = %s,
+                        samples_added = samples_added + %s,
+                        samples_deleted = samples_deleted + %s,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE user_id = %s AND source_name = %s AND type = %s
+                """, (anchor, result["inserted"], result["deleted"], user_id, source_name, sample_type))
+                # 待重算的日期和每日汇总缓存的删除与样本一起提交
+                ranges = POSTGRES_POOL._queue_ingest(cursor, "health_metric", ["user_id", "start_date", "end_date"], ranges)
+            conn.commit()
+        except Exception as e:
+            logger.error(f"应用同步增量失败 (用户{user_id}, {source_name}, {sample_type}): {e}")
+            conn.rollback()
+            raise
+        finally:
+            POSTGRES_POOL.put_connection(conn)
+
+        POSTGRES_POOL._broadcast_ingest(ranges)
+        return {**result, "status": "applied"}
+
+    @staticmethod
+    def _prepare_samples(samples, user_id: str, source_name: str, sample_type: str) -> Tuple[pd.DataFrame, int]:
+        """
+        校验增量中的新增样本：缺省的来源和类型取增量的值，类型不一致或UUID无效的样本被拒绝
+
+        Returns:
+            (按SYNC_COLUMNS排列的有效样本, 拒绝的样本数)
+        """
+        frame = samples_frame(samples if samples is not None else [], extra_columns=("sample_uuid",))
+        for column, default in (("type", sample_type), ("source_name", source_name)):
+            if column not in frame.columns:
+                frame[column] = pd.Series(pd.NA, index=frame.index, dtype="string")
+            frame[column] = frame[column].fillna(default)
+        uuids = frame["sample_uuid"].str.strip() if "sample_uuid" in frame.columns \
+            else pd.Series(pd.NA, index=frame.index, dtype="string")
+
+        valid, rejected = validate_samples(frame, user_id)
+        uuids = uuids.loc[valid.index]
+        bad = (valid["type"] != sample_type) | (uuids.notna() & ~uuids.str.fullmatch(UUID_PATTERN).fillna(False))
+        return valid[~bad].assign(sample_uuid=uuids[~bad]), rejected + int(bad.sum())
+
+    @staticmethod
+    def _insert(cursor, frame: pd.DataFrame):
+        """
+        COPY样本到临时表再编码写入health_samples
+
+        自然键已存在的样本（先经export.xml、CSV或/health/records导入）不重复写入，但补上sample_uuid，
+        之后手机上删除该样本时墓碑才能删除它；只有新写入的样本计入新写入的行数和日期范围
+
+        Returns:
+            (新写入的行数, 各用户的(用户, 最早开始, 最晚结束))
+        """
+        buffer = io.StringIO()
+        frame[SYNC_COLUMNS].to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        columns = ", ".join(SYNC_COLUMNS)
+        cursor.execute(f"""
+            CREATE TEMP TABLE health_metric_sync ON COMMIT DROP AS
+            SELECT {columns} FROM health_metric WITH NO DATA
+        """)
+        cursor.copy_expert(f"COPY health_metric_sync ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+        for statement in register_names_sql("health_metric_sync"):
+            cursor.execute(statement)
+        # ON CONFLICT DO UPDATE不能在一条语句中两次更新同一行，增量中自然键重复的样本只写入一条
+        staged = """(
+            SELECT DISTINCT ON (health_metric_natural_key(user_id, type, source_name, start_date, end_date, value)) *
+            FROM health_metric_sync
+        )"""
+        insert = insert_samples_sql(
+            staged, ["sample_uuid"],
+            returning="user_id, start_date, end_date, xmax = 0 AS inserted",
+            on_conflict="""
+            ON CONFLICT (natural_key) DO UPDATE
+            SET sample_uuid = COALESCE(health_samples.sample_uuid, EXCLUDED.sample_uuid)
+            WHERE health_samples.sample_uuid IS NULL
+            """,
+        )
+        cursor.execute(f"""
+            WITH written AS ({insert})
+            SELECT user_id, MIN(start_date), MAX(COALESCE(end_date, start_date)), COUNT(*)
+            FROM written
+            WHERE inserted
+            GROUP BY user_id
+        """)
+        rows = cursor.fetchall()
+        return sum(row[3] for row in rows), [row[:3] for row in rows]
@@ -0,0 +1,320 @@
+"""
+健康样本上传服务
+设备通过POST /lsp/api/v1/health/records批量上传HealthKit样本（NDJSON或按列的JSON，可gzip压缩）
+
+- 校验整批向量化完成（与CSV导入共用normalize_chunk），不为每个样本构造pydantic模型
+- 有效样本COPY到UNLOGGED暂存表health_metric_upload，与批次记录在同一事务中提交后立即确认
+- 后台合并线程定期认领待合并的批次（FOR UPDATE SKIP LOCKED，多个worker不会重复合并），
+  用集合语句编码写入health_samples（ON CONFLICT DO NOTHING去重），提交后按批次的(用户, 日期范围)
+  使缓存失效、删除汇总并加入待重算队列
+"""
+import io
+import json
+import threading
+import uuid
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from ..db.health_dictionary import merge_samples
+from ..db.postgresql import POSTGRES_POOL
+from ..db.configs.global_config import UPLOAD_CONFIG
+from .csv_import_service import normalize_chunk
+from .export_import_service import COPY_COLUMNS, RECORD_ATTRIBUTES
+from ..utils.logger import logger
+
+
+# 也接受HealthKit导出的属性名（startDate等），对应到COPY_COLUMNS中的列；uuid为HealthKit样本的UUID（同步时使用）
+ATTRIBUTE_COLUMNS = {**dict(zip(RECORD_ATTRIBUTES, COPY_COLUMNS)), "uuid": "sample_uuid"}
+
+# health_metric中长度受限的列（超长的样本被拒绝，否则整批COPY会失败）
+COLUMN_LIMITS = {
+    "type": 255, "source_name": 255, "source_version": 50, "unit": 50, "value": 255, "device": 255,
+}
+
+
+def decode_body(body: bytes, content_encoding: Optional[str] = None) -> bytes:
+    """
+    按Content-Encoding解压请求体，解压后的大小限制为max_decoded_bytes
+
+    Raises:
+        ValueError: 压缩格式错误或解压后过大
+    """
+    if not content_encoding or content_encoding.lower() == "identity":
+        return body
+    if content_encoding.lower() != "gzip":
+        raise ValueError(f"不支持的Content-Encoding: {content_encoding}")
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, UPLOAD_CONFIG.max_decoded_bytes)
+    except zlib.error as e:
+        raise ValueError(f"gzip数据无效: {e}")
+    if decompressor.unconsumed_tail:
+        raise ValueError(f"解压后的数据超过{UPLOAD_CONFIG.max_decoded_bytes}字节")
+    return data
+
+
+def parse_samples(data: bytes, content_type: Optional[str] = None) -> pd.DataFrame:
+    """
+    把请求体解析为按列的样本表（全部为字符串列）
+
+    - application/x-ndjson：每行一个样本对象
+    - application/json：按列的对象 {"type": [...], "start_date": [...], ...}，
+      也可以放在 {"samples": {...}} 中；samples为对象数组时按行解析
+
+    数字按原始文本保留（不经过float），与导出文件中的值一致，自然键去重不受格式影响
+
+    Raises:
+        ValueError: 格式错误
+    """
+    try:
+        text = data.decode("utf-8")
+        if content_type and "ndjson" in content_type.lower():
+            payload = [json.loads(line, parse_float=str, parse_int=str) for line in text.splitlines() if line.strip()]
+        else:
+            payload = json.loads(text, parse_float=str, parse_int=str)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"JSON格式错误: {e}")
+
+    if isinstance(payload, dict) and "samples" in payload:
+        payload = payload["samples"]
+    return samples_frame(payload)
+
+
+def samples_frame(payload, extra_columns: Tuple[str, ...] = ()) -> pd.DataFrame:
+    """
+    把已解码的样本（对象数组或按列的对象）转换为字符串列的样本表
+
+    Args:
+        payload: 对象数组或按列的对象
+        extra_columns: 除COPY_COLUMNS外保留的列
+
+    Raises:
+        ValueError: 格式错误
+    """
+    if isinstance(payload, list):
+        if not all(isinstance(record, dict) for record in payload):
+            raise ValueError("每个样本必须是JSON对象")
+        frame = pd.DataFrame.from_records(payload)
+    elif isinstance(payload, dict):
+        lengths = {len(values) for values in payload.values() if isinstance(values, list)}
+        if len(lengths) > 1 or not all(isinstance(values, list) for values in payload.values()):
+            raise ValueError("按列上传时每一列必须是长度相同的数组")
+        frame = pd.DataFrame(payload)
+    else:
+        raise ValueError("请求体必须是样本数组、按列的对象或NDJSON")
+
+    for attribute, column in ATTRIBUTE_COLUMNS.items():
+        if attribute != column and attribute in frame.columns:
+            # 同一批中两种命名都有时合并为一列
+            values = frame.pop(attribute)
+            frame[column] = frame[column].fillna(values) if column in frame.columns else values
+    keep = COPY_COLUMNS + list(extra_columns)
+    frame = frame[[column for column in keep if column in frame.columns]]
+    return frame.astype("string")
+
+
+def validate_samples(frame: pd.DataFrame, user_id: str) -> Tuple[pd.DataFrame, int]:
+    """
+    向量化校验样本：规范化空值和时间（同CSV导入），丢弃缺少type或start_date以及字段超长的样本
+
+    样本总是写入当前用户，忽略请求中的user_id
+
+    Returns:
+        (按COPY_COLUMNS排列的有效样本, 拒绝的样本数)
+    """
+    frame, rejected = normalize_chunk(frame.drop(columns="user_id", errors="ignore"), user_id)
+    too_long = pd.Series(False, index=frame.index)
+    for column, limit in COLUMN_LIMITS.items():
+        too_long |= (frame[column].str.len() > limit).fillna(False)
+    return frame[~too_long], rejected + int(too_long.sum())
+
+
+class HealthRecordUploadService:
+    """健康样本上传服务"""
+
+    def receive(self, user_id: str, body: bytes, content_type: Optional[str] = None,
+                content_encoding: Optional[str] = None) -> Dict:
+        """
+        解析、校验并暂存一个上传批次
+
+        Returns:
+            batch_id、accepted（暂存的样本数）、rejected（未通过校验的样本数）和status
+
+        Raises:
+            ValueError: 请求体无效、样本数超过限制或没有有效样本
+        """
+        frame = parse_samples(decode_body(body, content_encoding), content_type)
+        if len(frame) > UPLOAD_CONFIG.max_samples:
+            raise ValueError(f"每次最多上传{UPLOAD_CONFIG.max_samples}个样本，本次{len(frame)}个")
+
+        samples, rejected = validate_samples(frame, user_id)
+        if samples.empty:
+            raise ValueError(f"没有有效的样本（拒绝{rejected}个）")
+
+        batch_id = str(uuid.uuid4())
+        self._stage(batch_id, user_id, samples, rejected)
+        return {"batch_id": batch_id, "accepted": len(samples), "rejected": rejected, "status": "pending"}
+
+    @staticmethod
+    def _stage(batch_id: str, user_id: str, samples: pd.DataFrame, rejected: int):
+        """COPY样本到暂存表并登记批次（同一事务）"""
+        buffer = io.StringIO()
+        samples.insert(0, "batch_id", batch_id)
+        samples.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+
+        conn = POSTGRES_POOL.get_connection()
+        if conn is None:
+            raise RuntimeError("获取数据库连接失败")
+        try:
+            with conn.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY health_metric_upload (batch_id, {', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                    buffer
+                )
+                cursor.execute("""
+                    INSERT INTO health_metric_uploads (batch_id, user_id, sample_count, rejected_count)
+                    VALUES (%s, %s, %s, %s)
+                """, (batch_id, user_id, len(samples), rejected))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            POSTGRES_POOL.put_connection(conn)
+
+    @staticmethod
+    def get_batch(user_id: str, batch_id: str) -> Optional[Dict]:
+        """查询当前用户的一个上传批次"""
+        try:
+            uuid.UUID(batch_id)
+        except ValueError:
+            return None
+        row = POSTGRES_POOL._execute_query("""
+            SELECT batch_id, sample_count, rejected_count, status, inserted_count, received_at, merged_at
+            FROM health_metric_uploads
+            WHERE batch_id = %s AND user_id = %s
+        """, (batch_id, user_id), fetch_one=True)
+        return dict(row) if row else None
+
+    @staticmethod
+    def merge_pending(limit: int = UPLOAD_CONFIG.merge_batch_limit) -> int:
+        """
+        认领最多limit个待合并的批次并合并到health_samples（一个事务）
+
+        暂存表是UNLOGGED的，数据库崩溃后其中的数据被清空，这些批次标记为lost，由客户端重新上传
+
+        Returns:
+            合并的批次数
+        """
+        conn = POSTGRES_POOL.get_connection()
+        if conn is None:
+            raise RuntimeError("获取数据库连接失败")
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT batch_id FROM health_metric_uploads
+                    WHERE status = 'pending'
+                    ORDER BY received_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                """, (limit,))
+                batch_ids: List[str] = [row[0] for row in cursor.fetchall()]
+                if not batch_ids:
+                    conn.commit()
+                    return 0
+
+                cursor.execute("""
+                    SELECT user_id, MIN(start_date), MAX(COALESCE(end_date, start_date))
+                    FROM health_metric_upload
+                    WHERE batch_id = ANY(%s::uuid[])
+                    GROUP BY user_id
+                """, (batch_ids,))
+                ranges = cursor.fetchall()
+
+                for batch_id in batch_ids:
+                    cursor.execute("SELECT EXISTS (SELECT 1 FROM health_metric_upload WHERE batch_id = %s)", (batch_id,))
+                    if not cursor.fetchone()[0]:
+                        cursor.execute("""
+                            UPDATE health_metric_uploads SET status = 'lost', merged_at = CURRENT_TIMESTAMP
+                            WHERE batch_id = %s
+                        """, (batch_id,))
+                        logger.warning(f"上传批次{batch_id}的暂存数据已丢失，需要客户端重新上传")
+                        continue
+                    inserted = merge_samples(
+                        cursor, "(SELECT * FROM health_metric_upload WHERE batch_id = %s)", params=(batch_id,)
+                    )
+                    cursor.execute("""
+                        UPDATE health_metric_uploads
+                        SET status = 'merged', inserted_count = %s, merged_at = CURRENT_TIMESTAMP
+                        WHERE batch_id = %s
+                    """, (inserted, batch_id))
+
+                cursor.execute("DELETE FROM health_metric_upload WHERE batch_id = ANY(%s::uuid[])", (batch_ids,))
+                # 待重算的日期和每日汇总缓存的删除与样本一起提交
+                ranges = POSTGRES_POOL._queue_ingest(cursor, "health_metric", ["user_id", "start_date", "end_date"], ranges)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            POSTGRES_POOL.put_connection(conn)
+
+        POSTGRES_POOL._broadcast_ingest(ranges)
+        logger.debug(f"合并了{len(batch_ids)}个上传批次")
+        return len(batch_ids)
+
+
+class UploadMerger(threading.Thread):
+    """后台合并线程：有待合并的批次时连续合并，没有时按间隔轮询"""
+
+    def __init__(self, interval: float = UPLOAD_CONFIG.merge_interval_seconds,
+                 limit: int = UPLOAD_CONFIG.merge_batch_limit):
+        super().__init__(name="health-upload-merger", daemon=True)
+        self.interval = interval
+        self.limit = limit
+        self._stop_event = threading.Event()
+
+    def run(self):
+        backoff = self.interval
+        while not self._stop_event.is_set():
+            try:
+                merged = HealthRecordUploadService.merge_pending(self.limit)
+                backoff = self.interval
+            except Exception as e:
+                logger.error(f"合并上传批次失败: {e}，{backoff}秒后重试")
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+            if merged < self.limit:
+                self._stop_event.wait(self.interval)
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout if timeout is not None else self.interval + 1)
+
+
+_merger: Optional[UploadMerger] = None
+
+
+def start_upload_merger() -> Optional[UploadMerger]:
+    """在当前进程中启动后台合并线程（配置关闭时不启动）"""
+    global _merger
+    if not UPLOAD_CONFIG.merger_enabled:
+        return None
+    if _merger is None or not _merger.is_alive():
+        _merger = UploadMerger()
+        _merger.start()
+    return _merger
+
+
+def stop_upload_merger():
+    """停止后台合并线程"""
+    global _merger
+    if _merger is not None:
+        _merger.stop()
+        _merger = None
@@ -0,0 +1,89 @@
+"""
+运动记录服务
+负责保存和读取HKWorkout运动记录，保存后与健康数据入库一样使相关日期的缓存失效并加入待重算队列
+"""
+from datetime import datetime
+from typing import List
+from psycopg2.extras import execute_values
+from ..db.postgresql import POSTGRES_POOL
+from ..models.workout import Workout
+from ..utils.logger import logger
+
+
+class WorkoutService:
+    """运动记录服务"""
+
+    COLUMNS = [
+        "user_id", "activity_type", "start_date", "end_date", "duration_minutes", "total_energy_kcal",
+        "total_distance_km", "avg_heart_rate", "min_heart_rate", "max_heart_rate", "source_name", "device",
+    ]
+
+    def save_workouts(self, workouts: List[Workout]) -> int:
+        """
+        批量保存运动记录，同一用户同一类型同一时段的记录会被更新（重复导入不产生重复记录）
+
+        Args:
+            workouts: 运动记录列表
+
+        Returns:
+            保存的条数
+        """
+        rows = [tuple(getattr(workout, column) for column in self.COLUMNS) for workout in workouts]
+        if not rows:
+            return 0
+
+        conn = None
+        cursor = None
+        try:
+            conn = POSTGRES_POOL.get_connection()
+            cursor = conn.cursor()
+            execute_values(cursor, f"""
+                INSERT INTO workouts ({", ".join(self.COLUMNS)})
+                VALUES %s
+                ON CONFLICT (user_id, activity_type, start_date, end_date)
+                DO UPDATE SET
+                    duration_minutes = EXCLUDED.duration_minutes,
+                    total_energy_kcal = EXCLUDED.total_energy_kcal,
+                    total_distance_km = EXCLUDED.total_distance_km,
+                    avg_heart_rate = EXCLUDED.avg_heart_rate,
+                    min_heart_rate = EXCLUDED.min_heart_rate,
+                    max_heart_rate = EXCLUDED.max_heart_rate,
+                    source_name = EXCLUDED.source_name,
+                    device = EXCLUDED.device
+            """, rows, page_size=1000)
+            conn.commit()
+        except Exception as e:
+            logger.error(f"保存运动记录失败: {e}")
+            if conn:
+                conn.rollback()
+            return 0
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                POSTGRES_POOL.put_connection(conn)
+
+        POSTGRES_POOL._invalidate_cached_results("workouts", self.COLUMNS, rows)
+        return len(rows)
+
+    def get_workouts(self, user_id: str, start_date: datetime, end_date: datetime) -> List[Workout]:
+        """
+        获取开始时间在范围内的运动记录
+
+        Args:
+            user_id: 用户ID
+            start_date: 开始时间
+            end_date: 结束时间（不含）
+
+        Returns:
+            按开始时间排序的运动记录
+        """
+        rows = POSTGRES_POOL._execute_query(f"""
+            SELECT id, {", ".join(self.COLUMNS)}, created_at
+            FROM workouts
+            WHERE user_id = %s
+            AND start_date >= %s
+            AND start_date < %s
+            ORDER BY start_date
+        """, (user_id, start_date, end_date), fetch_all=True) or []
+        return [Workout(**dict(row)) for row in rows]
@@ -0,0 +1,349 @@
+"""
+进程内LRU+TTL缓存
+用于缓存按(user_id, date)计算的每日汇总和积分结果
+"""
+import functools
+import threading
+import time
+from collections import OrderedDict
+from datetime import date as date_type, datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from ..db.configs.global_config import CACHE_CONFIG
+from .logger import logger
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    """带容量上限和单条过期时间的线程安全LRU缓存"""
+
+    def __init__(self, max_entries: int = 10000):
+        """
+        初始化缓存
+
+        Args:
+            max_entries: 最大缓存条数，超过后淘汰最久未使用的条目
+        """
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """读取缓存，过期或不存在时返回default"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            expire_at, value = entry
+            if expire_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        """写入缓存，ttl为秒数"""
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def delete(self, key: Hashable) -> bool:
+        """删除单个缓存条目"""
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+                return True
+            return False
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+            self._on_clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total * 100, 2) if total else 0.0
+            }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _store(self, key: Hashable, value: Any, ttl: float) -> None:
+        """写入条目并按容量淘汰（调用方需持有锁）"""
+        if key in self._data:
+            self._data.move_to_end(key)
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._on_set(key)
+
+        while len(self._data) > self.max_entries:
+            oldest_key = next(iter(self._data))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        """删除条目（调用方需持有锁）"""
+        self._data.pop(key, None)
+
+    def _on_set(self, key: Hashable) -> None:
+        """写入后的扩展点（调用方持有锁）"""
+        pass
+
+    def _on_clear(self) -> None:
+        """清空后的扩展点（调用方持有锁）"""
+        pass
+
+
+class DailyResultCache(TTLCache):
+    """
+    按(user_id, 日期)组织的结果缓存
+
+    缓存键格式为 (namespace, user_id, date, ...)，额外维护(user_id, date)到键的索引，
+    以便数据入库或积分保存时按用户和日期范围精确失效。
+    正在计算的(user_id, date)另有失效计数，计算期间发生失效时不写入计算结果
+    """
+
+    def __init__(self, max_entries: int = 10000,
+                 closed_day_ttl: float = 86400, open_day_ttl: float = 300):
+        """
+        初始化缓存
+
+        Args:
+            max_entries: 最大缓存条数
+            closed_day_ttl: 已结束日期的缓存秒数
+            open_day_ttl: 当天（数据仍在变化）的缓存秒数
+        """
+        super().__init__(max_entries)
+        self.closed_day_ttl = closed_day_ttl
+        self.open_day_ttl = open_day_ttl
+        self._index: Dict[Tuple[str, date_type], Set[Hashable]] = {}
+        # 正在计算的(user_id, date) -> [进行中的计算数, 失效计数]
+        self._pending: Dict[Tuple[str, date_type], List[int]] = {}
+
+    def ttl_for(self, day: date_type) -> float:
+        """根据日期是否已结束选择TTL"""
+        return self.closed_day_ttl if day < datetime.now().date() else self.open_day_ttl
+
+    def begin(self, user_id: str, day: date_type) -> int:
+        """
+        开始计算某个用户日的结果
+
+        Returns:
+            当前的失效计数，计算结束后传给finish
+        """
+        with self._lock:
+            pending = self._pending.setdefault((user_id, day), [0, 0])
+            pending[0] += 1
+            return pending[1]
+
+    def finish(self, user_id: str, day: date_type, generation: int,
+               key: Optional[Hashable] = None, value: Any = None) -> bool:
+        """
+        结束计算，如果计算期间该用户日没有失效则写入结果
+
+        Args:
+            user_id: 用户ID
+            day: 日期
+            generation: begin返回的失效计数
+            key: 缓存键，None表示计算失败、不写入
+            value: 计算结果
+
+        Returns:
+            是否写入了缓存
+        """
+        ttl = self.ttl_for(day)
+        with self._lock:
+            index_key = (user_id, day)
+            pending = self._pending[index_key]
+            pending[0] -= 1
+            current = pending[1] == generation
+            if pending[0] == 0:
+                del self._pending[index_key]
+
+            if key is None or not current or ttl <= 0 or self.max_entries <= 0:
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def invalidate(self, user_id: str, start_date: Optional[date_type] = None,
+                   end_date: Optional[date_type] = None,
+                   namespaces: Optional[Iterable[str]] = None) -> int:
+        """
+        使指定用户在日期范围内的缓存失效
+
+        Args:
+            user_id: 用户ID
+            start_date: 开始日期（含），None表示该用户全部日期
+            end_date: 结束日期（含），None时等于start_date
+            namespaces: 只失效这些命名空间，None表示全部
+
+        Returns:
+            失效的条目数
+        """
+        namespaces = set(namespaces) if namespaces is not None else None
+        removed = 0
+
+        with self._lock:
+            if start_date is None:
+                index_keys = [k for k in self._index if k[0] == user_id]
+                pending_keys = [k for k in self._pending if k[0] == user_id]
+            else:
+                end_date = end_date or start_date
+                index_keys = []
+                day = start_date
+                while day <= end_date:
+                    index_keys.append((user_id, day))
+                    day += timedelta(days=1)
+                pending_keys = [k for k in index_keys if k in self._pending]
+
+            # 正在计算的结果可能基于失效前的数据，不论命名空间都不再写入
+            for pending_key in pending_keys:
+                self._pending[pending_key][1] += 1
+
+            for index_key in index_keys:
+                for key in list(self._index.get(index_key, ())):
+                    if namespaces is None or key[0] in namespaces:
+                        self._remove(key)
+                        removed += 1
+
+        if removed:
+            logger.debug(f"缓存失效: 用户{user_id} {start_date}~{end_date}，共{removed}条")
+        return removed
+
+    def _remove(self, key: Hashable) -> None:
+        super()._remove(key)
+        index_key = (key[1], key[2])
+        keys = self._index.get(index_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._index[index_key]
+
+    def _on_set(self, key: Hashable) -> None:
+        self._index.setdefault((key[1], key[2]), set()).add(key)
+
+    def _on_clear(self) -> None:
+        self._index.clear()
+        for pending in self._pending.values():
+            pending[1] += 1
+
+
+def to_date(value: Any) -> Optional[date_type]:
+    """把datetime/date/ISO字符串转换为date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date_type):
+        return value
+    if isinstance(value, str):
+        # HealthKit导出格式为"YYYY-MM-DD HH:MM:SS +0800"，只解析日期部分
+        try:
+            return date_type.fromisoformat(value.strip()[:10])
+        except ValueError:
+            return None
+    return None
+
+
+def cached_daily(namespace: str, cache: Optional[DailyResultCache] = None,
+                 bypass: Optional[Callable[..., bool]] = None) -> Callable:
+    """
+    按(user_id, date)缓存方法结果的装饰器
+
+    被装饰的方法签名需为 (self, user_id, date, ...)，其余参数会并入缓存键。
+    返回值会被多个调用方共享，调用方不应修改。
+
+    Args:
+        namespace: 缓存命名空间（如 'daily_summary'、'daily_score'）
+        cache: 使用的缓存实例，默认为全局DAILY_CACHE
+        bypass: 以被装饰方法的参数调用，返回True时不读写缓存（如调用有写库等副作用）
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(self, user_id: str, date: datetime, *args, **kwargs):
+            target = cache if cache is not None else DAILY_CACHE
+            if not CACHE_CONFIG.enabled or (bypass is not None and bypass(self, user_id, date, *args, **kwargs)):
+                return func(self, user_id, date, *args, **kwargs)
+
+            day = to_date(date)
+            key = (namespace, user_id, day, args, tuple(sorted(kwargs.items())))
+            value = target.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+            generation = target.begin(user_id, day)
+            try:
+                value = func(self, user_id, date, *args, **kwargs)
+            except BaseException:
+                target.finish(user_id, day, generation)
+                raise
+            target.finish(user_id, day, generation, key, value)
+            return value
+
+        wrapper.cache_namespace = namespace
+        return wrapper
+
+    return decorator
+
+
+def invalidate_user_dates(user_id: str, start_date: Any = None, end_date: Any = None,
+                          namespaces: Optional[Iterable[str]] = None) -> int:
+    """
+    数据入库或积分保存后调用的失效钩子
+
+    Args:
+        user_id: 用户ID
+        start_date: 受影响的开始日期（datetime/date/ISO字符串），None表示全部日期
+        end_date: 受影响的结束日期，None时等于start_date
+        namespaces: 只失效这些命名空间，None表示全部
+
+    Returns:
+        失效的条目数
+    """
+    start = to_date(start_date) if start_date is not None else None
+    end = to_date(end_date) if end_date is not None else None
+    if start_date is not None and start is None:
+        # 无法解析日期时保守处理，失效该用户全部缓存
+        return DAILY_CACHE.invalidate(user_id, namespaces=namespaces)
+    return DAILY_CACHE.invalidate(user_id, start, end, namespaces=namespaces)
+
+
+def invalidate_user_tier(user_id: str) -> bool:
+    """
+    用户等级变化后调用的失效钩子
+
+    Args:
+        user_id: 用户ID
+
+    Returns:
+        是否删除了缓存条目
+    """
+    return TIER_CACHE.delete(user_id)
+
+
+DAILY_CACHE = DailyResultCache(
+    max_entries=CACHE_CONFIG.max_entries,
+    closed_day_ttl=CACHE_CONFIG.closed_day_ttl_seconds,
+    open_day_ttl=CACHE_CONFIG.open_day_ttl_seconds
+)
+
+# 用户等级缓存：user_id -> tier
+TIER_CACHE = TTLCache(max_entries=CACHE_CONFIG.max_entries)
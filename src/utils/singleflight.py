@@ -0,0 +1,111 @@
+"""
+并发请求合并（single-flight）
+同一时刻对同一(函数, user_id, date)的多个调用只执行一次，其余调用等待并共享结果
+"""
+import functools
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable
+
+from ..db.configs.global_config import CACHE_CONFIG
+from .cache import to_date
+
+
+class _InFlightCall:
+    """正在执行中的调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """按键合并并发调用的执行器"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _InFlightCall] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Any:
+        """
+        执行func，若相同key的调用正在执行则等待其结果
+
+        Args:
+            key: 合并键
+            func: 实际执行的函数
+
+        Returns:
+            func的返回值（异常也会传递给所有等待者）
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _InFlightCall()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取合并统计信息"""
+        with self._lock:
+            total = self.executions + self.coalesced
+            return {
+                'in_flight': len(self._calls),
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'coalesced_rate': round(self.coalesced / total * 100, 2) if total else 0.0
+            }
+
+
+def coalesce_daily(namespace: str, flight: SingleFlight = None,
+                   variant: Callable[..., Hashable] = None) -> Callable:
+    """
+    按(namespace, user_id, date)合并并发调用的装饰器
+
+    被装饰的方法签名需为 (self, user_id, date, ...)，其余参数会并入合并键。
+
+    Args:
+        namespace: 合并键的命名空间（通常为函数名）
+        flight: 使用的SingleFlight实例，默认为全局SINGLE_FLIGHT
+        variant: 以被装饰方法的参数调用，返回值并入合并键（如由实例设置决定的行为）
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(self, user_id: str, date: datetime, *args, **kwargs):
+            if not CACHE_CONFIG.coalesce_enabled:
+                return func(self, user_id, date, *args, **kwargs)
+
+            key = (namespace, user_id, to_date(date), args, tuple(sorted(kwargs.items())))
+            if variant is not None:
+                key += (variant(self, user_id, date, *args, **kwargs),)
+            return (flight or SINGLE_FLIGHT).do(key, func, self, user_id, date, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+SINGLE_FLIGHT = SingleFlight()
@@ -44,6 +44,41 @@ class TestSuiteRunner:
                 "script": "test_score_percentage_complete.py",
                 "description": "测试积分百分比计算功能"
             },
+            {
+                "name": "区间运算测试",
+                "script": "test_intervals.py",
+                "description": "验证区间扣除和数据源优先级去重"
+            },
+            {
+                "name": "连锁规则测试",
+                "script": "test_chain_penalties.py",
+                "description": "验证连锁规则的触发、修复和跨维度屏蔽"
+            },
+            {
+                "name": "结果缓存测试",
+                "script": "test_cache.py",
+                "description": "验证结果缓存的淘汰、过期、失效和并发请求合并"
+            },
+            {
+                "name": "运动维度中难度测试",
+                "script": "test_exercise_calculator.py",
+                "description": "验证区间2与力量类运动时长合计的计分"
+            },
+            {
+                "name": "每日汇总辅助计算测试",
+                "script": "test_rollup_helpers.py",
+                "description": "验证心率区间时长、运动类别位图和每小时位图的计算"
+            },
+            {
+                "name": "连续达标与HRV基线测试",
+                "script": "test_rolling_states.py",
+                "description": "验证连续达标和个人HRV基线的逐天推进、中断和重算"
+            },
+            {
+                "name": "上传解析测试",
+                "script": "test_upload_service.py",
+                "description": "验证上传请求体的解压、解析和样本校验"
+            },
             {
                 "name": "集成测试",
                 "script": "test_integration_complete.py",
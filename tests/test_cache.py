@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+结果缓存与并发请求合并测试
+验证LRU淘汰、TTL过期、当天与已结束日期的TTL、按(用户, 日期)失效、计算期间失效，以及多线程下同一用户日只计算一次（不需要数据库）
+"""
+
+import sys
+import time
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# 添加src目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+class CacheTest:
+    """结果缓存与并发请求合并测试类"""
+
+    def __init__(self):
+        self.test_results = []
+        self.passed_tests = 0
+        self.failed_tests = 0
+
+    def run_all_tests(self):
+        """运行所有缓存测试"""
+        print("🧪 结果缓存与并发请求合并测试")
+        print("=" * 60)
+
+        test_functions = [
+            ("LRU淘汰", self._test_lru_eviction),
+            ("TTL过期", self._test_ttl_expiry),
+            ("当天与已结束日期的TTL", self._test_open_closed_day_ttl),
+            ("按用户日期失效", self._test_invalidation),
+            ("缓存装饰器", self._test_cached_daily),
+            ("计算期间失效", self._test_invalidation_during_compute),
+            ("并发请求合并", self._test_single_flight),
+            ("合并装饰器", self._test_coalesce_daily),
+        ]
+
+        for test_name, test_func in test_functions:
+            print(f"\n📋 {test_name}")
+            print("-" * 40)
+            try:
+                test_func()
+            except Exception as e:
+                self._record_test_result(
+                    test_name=test_name,
+                    passed=False,
+                    message=f"测试异常: {str(e)}"
+                )
+
+        self._print_summary()
+        return self.failed_tests == 0
+
+    def _test_lru_eviction(self):
+        """超过容量时淘汰最久未使用的条目，读取会刷新使用顺序"""
+        from src.utils.cache import TTLCache
+
+        cache = TTLCache(max_entries=3)
+        for key in ['a', 'b', 'c']:
+            cache.set(key, key.upper(), ttl=60)
+        cache.get('a')
+        cache.set('d', 'D', ttl=60)
+
+        passed = (
+            cache.get('b') is None and cache.get('a') == 'A' and cache.get('d') == 'D'
+            and len(cache) == 3 and cache.stats()['evictions'] == 1
+        )
+        self._record_test_result(
+            test_name="淘汰最久未使用",
+            passed=passed,
+            message=f"剩余: {sorted(cache._data)}, 统计: {cache.stats()}"
+        )
+
+        # 覆盖已有的键不淘汰其他条目
+        cache.set('c', 'C2', ttl=60)
+        self._record_test_result(
+            test_name="覆盖已有条目",
+            passed=len(cache) == 3 and cache.get('c') == 'C2' and cache.stats()['evictions'] == 1,
+            message=f"剩余: {sorted(cache._data)}"
+        )
+
+        disabled = TTLCache(max_entries=0)
+        disabled.set('a', 1, ttl=60)
+        self._record_test_result(
+            test_name="容量为0时不缓存",
+            passed=len(disabled) == 0 and disabled.get('a') is None,
+            message=f"条目数: {len(disabled)}"
+        )
+
+    def _test_ttl_expiry(self):
+        """过期的条目读取时删除并计为未命中，ttl不大于0时不写入"""
+        from src.utils.cache import TTLCache
+
+        cache = TTLCache(max_entries=10)
+        cache.set('short', 1, ttl=0.05)
+        cache.set('long', 2, ttl=60)
+        cache.set('zero', 3, ttl=0)
+        time.sleep(0.1)
+
+        passed = (
+            cache.get('short', 'expired') == 'expired' and cache.get('long') == 2
+            and cache.get('zero') is None and len(cache) == 1
+        )
+        self._record_test_result(
+            test_name="过期和不写入",
+            passed=passed,
+            message=f"剩余: {sorted(cache._data)}, 统计: {cache.stats()}"
+        )
+
+    def _test_open_closed_day_ttl(self):
+        """当天的结果用较短的TTL，已结束日期的结果用较长的TTL"""
+        from src.utils.cache import DailyResultCache, cached_daily
+
+        cache = DailyResultCache(max_entries=100, closed_day_ttl=60, open_day_ttl=0.05)
+        today = datetime.now().date()
+        yesterday = today - timedelta(days=1)
+        self._record_test_result(
+            test_name="TTL选择",
+            passed=cache.ttl_for(today) == 0.05 and cache.ttl_for(yesterday) == 60,
+            message=f"当天: {cache.ttl_for(today)}秒, 昨天: {cache.ttl_for(yesterday)}秒"
+        )
+
+        calls = []
+
+        class Service:
+            @cached_daily('test_summary', cache=cache)
+            def get_summary(self, user_id, date):
+                calls.append(date.date())
+                return {'user_id': user_id, 'date': date.date()}
+
+        service = Service()
+        now = datetime.now()
+        for _ in range(2):
+            service.get_summary('u1', now)
+            service.get_summary('u1', now - timedelta(days=1))
+        time.sleep(0.1)
+        service.get_summary('u1', now)
+        service.get_summary('u1', now - timedelta(days=1))
+
+        # 当天在过期后重新计算，昨天一直命中缓存
+        passed = calls == [today, yesterday, today]
+        self._record_test_result(
+            test_name="当天过期后重新计算",
+            passed=passed,
+            message=f"实际计算的日期: {[str(d) for d in calls]}"
+        )
+
+    def _test_invalidation(self):
+        """只失效指定用户在日期范围（和命名空间）内的条目，索引随条目删除"""
+        from src.utils.cache import DailyResultCache
+
+        cache = DailyResultCache(max_entries=100)
+        start = datetime(2025, 7, 1).date()
+        for user_id in ['u1', 'u2']:
+            for offset in range(5):
+                day = start + timedelta(days=offset)
+                for namespace in ['daily_summary', 'daily_score']:
+                    cache.set((namespace, user_id, day, (), ()), offset, ttl=60)
+
+        removed = cache.invalidate('u1', start + timedelta(days=1), start + timedelta(days=2))
+        remaining_u1 = sorted({key[2] for key in cache._data if key[1] == 'u1'})
+        passed = (
+            removed == 4 and len(cache) == 16
+            and remaining_u1 == [start, start + timedelta(days=3), start + timedelta(days=4)]
+            and ('u1', start + timedelta(days=1)) not in cache._index
+            and ('u2', start + timedelta(days=1)) in cache._index
+        )
+        self._record_test_result(
+            test_name="日期范围",
+            passed=passed,
+            message=f"失效{removed}条, u1剩余日期: {[str(d) for d in remaining_u1]}"
+        )
+
+        removed = cache.invalidate('u1', start, namespaces=['daily_score'])
+        self._record_test_result(
+            test_name="只失效指定命名空间",
+            passed=(
+                removed == 1 and cache.get(('daily_summary', 'u1', start, (), ())) == 0
+                and cache.get(('daily_score', 'u1', start, (), ())) is None
+            ),
+            message=f"失效{removed}条"
+        )
+
+        removed = cache.invalidate('u1')
+        self._record_test_result(
+            test_name="失效用户全部日期",
+            passed=(
+                removed == 5 and all(key[1] == 'u2' for key in cache._data) and len(cache) == 10
+                and all(index_key[0] == 'u2' for index_key in cache._index)
+            ),
+            message=f"失效{removed}条, 剩余{len(cache)}条"
+        )
+
+        # LRU淘汰和过期删除的条目同样从索引中移除
+        small = DailyResultCache(max_entries=2)
+        for offset in range(3):
+            small.set(('daily_summary', 'u1', start + timedelta(days=offset), (), ()), offset, ttl=60)
+        self._record_test_result(
+            test_name="淘汰后索引一致",
+            passed=('u1', start) not in small._index and len(small._index) == 2 and small.invalidate('u1', start) == 0,
+            message=f"索引: {sorted(small._index)}"
+        )
+
+    def _test_cached_daily(self):
+        """其余参数并入缓存键；失效后重新计算"""
+        from src.utils.cache import DailyResultCache, cached_daily
+
+        cache = DailyResultCache(max_entries=100)
+        calls = []
+
+        class Service:
+            @cached_daily('test_score', cache=cache)
+            def get_score(self, user_id, date, tier='Bronze'):
+                calls.append((user_id, tier))
+                return len(calls)
+
+        service = Service()
+        day = datetime(2025, 7, 1, 8, 30)
+        first = service.get_score('u1', day)
+        same_day = service.get_score('u1', day.replace(hour=20))
+        other_tier = service.get_score('u1', day, tier='GOLD')
+        cache.invalidate('u1', day.date())
+        after_invalidate = service.get_score('u1', day)
+
+        passed = (
+            first == same_day == 1 and other_tier == 2 and after_invalidate == 3
+            and Service.get_score.cache_namespace == 'test_score'
+        )
+        self._record_test_result(
+            test_name="缓存键与失效",
+            passed=passed,
+            message=f"调用: {calls}"
+        )
+
+        # 保存到数据库的调用每次都执行，既不读取也不写入缓存
+        class Engine:
+            def __init__(self, auto_save):
+                self.auto_save = auto_save
+
+            @cached_daily('test_save', cache=cache,
+                          bypass=lambda engine, user_id, date, save_to_db=None: (
+                              save_to_db if save_to_db is not None else engine.auto_save))
+            def calculate(self, user_id, date, save_to_db=None):
+                calls.append((user_id, 'save'))
+                return len(calls)
+
+        calls.clear()
+        saving, reading = Engine(auto_save=True), Engine(auto_save=False)
+        saved = [saving.calculate('u1', day), saving.calculate('u1', day)]
+        read = [reading.calculate('u1', day), reading.calculate('u1', day)]
+        saved_again = reading.calculate('u1', day, save_to_db=True)
+        passed = saved == [1, 2] and read == [3, 3] and saved_again == 4
+        self._record_test_result(
+            test_name="保存时不使用缓存",
+            passed=passed,
+            message=f"保存: {saved}, 只计算: {read}, 显式保存: {saved_again}"
+        )
+
+    def _test_invalidation_during_compute(self):
+        """计算期间该用户日失效时，基于旧数据的结果不写入缓存；其他用户日不受影响"""
+        from src.utils.cache import DailyResultCache, cached_daily
+
+        cache = DailyResultCache(max_entries=100)
+        day = datetime(2025, 7, 1)
+        invalidate_during = set()
+
+        class Service:
+            @cached_daily('test_summary', cache=cache)
+            def get_summary(self, user_id, date):
+                # 模拟计算读取数据库后、写入缓存前有新数据入库
+                if user_id in invalidate_during:
+                    cache.invalidate(user_id, date.date())
+                return f"{user_id}-old"
+
+        service = Service()
+        invalidate_during.add('u1')
+        service.get_summary('u1', day)
+        service.get_summary('u2', day)
+        passed = (
+            len(cache) == 1 and ('u1', day.date()) not in cache._index and ('u2', day.date()) in cache._index
+            and not cache._pending
+        )
+        self._record_test_result(
+            test_name="失效的计算结果不写入",
+            passed=passed,
+            message=f"缓存: {sorted(cache._index)}, 进行中: {cache._pending}"
+        )
+
+        # 按用户失效全部日期和清空缓存同样生效
+        generation = cache.begin('u3', day.date())
+        cache.invalidate('u3')
+        stored_after_user = cache.finish('u3', day.date(), generation, ('test_summary', 'u3', day.date()), 'old')
+        generation = cache.begin('u3', day.date())
+        cache.clear()
+        stored_after_clear = cache.finish('u3', day.date(), generation, ('test_summary', 'u3', day.date()), 'old')
+        generation = cache.begin('u3', day.date())
+        cache.invalidate('u3', day.date() + timedelta(days=1))
+        stored_other_day = cache.finish('u3', day.date(), generation, ('test_summary', 'u3', day.date()), 'new')
+        passed = not stored_after_user and not stored_after_clear and stored_other_day and not cache._pending
+        self._record_test_result(
+            test_name="按用户失效与清空",
+            passed=passed,
+            message=f"按用户失效后写入: {stored_after_user}, 清空后写入: {stored_after_clear}, "
+                    f"其他日期失效后写入: {stored_other_day}"
+        )
+
+        # 计算异常时结束计数，不写入缓存
+        class Failing:
+            @cached_daily('test_failing', cache=cache)
+            def get_summary(self, user_id, date):
+                raise ValueError("计算失败")
+
+        try:
+            Failing().get_summary('u4', day)
+        except ValueError:
+            pass
+        self._record_test_result(
+            test_name="计算异常",
+            passed=not cache._pending and ('u4', day.date()) not in cache._index,
+            message=f"进行中: {cache._pending}"
+        )
+
+    def _test_single_flight(self):
+        """多个线程同时请求同一个键时只执行一次，所有线程得到同一结果；异常同样传递给等待者"""
+        from src.utils.singleflight import SingleFlight
+
+        flight = SingleFlight()
+        threads_count = 8
+        executions = []
+        barrier = threading.Barrier(threads_count)
+        results = [None] * threads_count
+
+        def compute():
+            executions.append(threading.current_thread().name)
+            time.sleep(0.2)
+            return {'value': 42}
+
+        def worker(i):
+            barrier.wait()
+            results[i] = flight.do(('daily_score', 'u1', '2025-07-01'), compute)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = flight.stats()
+        passed = (
+            len(executions) == 1 and all(result is results[0] for result in results)
+            and stats['executions'] == 1 and stats['coalesced'] == threads_count - 1 and stats['in_flight'] == 0
+        )
+        self._record_test_result(
+            test_name="同一键只执行一次",
+            passed=passed,
+            message=f"执行{len(executions)}次, 统计: {stats}"
+        )
+
+        # 执行结束后的新请求重新执行，不同的键互不等待
+        flight.do(('daily_score', 'u1', '2025-07-01'), compute)
+        flight.do(('daily_score', 'u2', '2025-07-01'), compute)
+        self._record_test_result(
+            test_name="完成后重新执行",
+            passed=len(executions) == 3,
+            message=f"执行{len(executions)}次"
+        )
+
+        errors = []
+        barrier = threading.Barrier(4)
+
+        def failing():
+            time.sleep(0.2)
+            raise ValueError("计算失败")
+
+        def failing_worker():
+            barrier.wait()
+            try:
+                flight.do('failing', failing)
+            except ValueError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=failing_worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._record_test_result(
+            test_name="异常传递给等待者",
+            passed=errors == ["计算失败"] * 4 and flight.stats()['in_flight'] == 0,
+            message=f"异常: {errors}"
+        )
+
+    def _test_coalesce_daily(self):
+        """同一用户同一天（不同时刻）的并发调用合并，不同用户分别执行"""
+        from src.utils.singleflight import SingleFlight, coalesce_daily
+
+        flight = SingleFlight()
+        calls = []
+        lock = threading.Lock()
+
+        class Service:
+            @coalesce_daily('calculate_daily_score', flight=flight)
+            def calculate(self, user_id, date):
+                with lock:
+                    calls.append(user_id)
+                time.sleep(0.2)
+                return user_id
+
+        service = Service()
+        requests = [('u1', datetime(2025, 7, 1, hour)) for hour in range(6)] + [('u2', datetime(2025, 7, 1))]
+        barrier = threading.Barrier(len(requests))
+        results = {}
+
+        def worker(i, user_id, date):
+            barrier.wait()
+            results[i] = service.calculate(user_id, date)
+
+        threads = [threading.Thread(target=worker, args=(i, *request)) for i, request in enumerate(requests)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        passed = sorted(calls) == ['u1', 'u2'] and [results[i] for i in range(len(requests))] == [r[0] for r in requests]
+        self._record_test_result(
+            test_name="按用户日合并",
+            passed=passed,
+            message=f"实际执行: {sorted(calls)}, 统计: {flight.stats()}"
+        )
+
+        # variant返回值不同的并发调用（如一个保存到数据库、一个不保存）分别执行
+        class Engine:
+            def __init__(self, auto_save):
+                self.auto_save = auto_save
+
+            @coalesce_daily('calculate_daily_score', flight=flight,
+                            variant=lambda engine, user_id, date: engine.auto_save)
+            def calculate(self, user_id, date):
+                with lock:
+                    calls.append((user_id, self.auto_save))
+                time.sleep(0.2)
+                return self.auto_save
+
+        calls.clear()
+        engines = [Engine(True), Engine(True), Engine(False)]
+        barrier = threading.Barrier(len(engines))
+        results = {}
+
+        def engine_worker(i):
+            barrier.wait()
+            results[i] = engines[i].calculate('u1', datetime(2025, 7, 1))
+
+        threads = [threading.Thread(target=engine_worker, args=(i,)) for i in range(len(engines))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        passed = sorted(calls) == [('u1', False), ('u1', True)] and [results[i] for i in range(3)] == [True, True, False]
+        self._record_test_result(
+            test_name="按variant区分",
+            passed=passed,
+            message=f"实际执行: {sorted(calls)}"
+        )
+
+    def _record_test_result(self, test_name: str, passed: bool, message: str):
+        """记录测试结果"""
+        self.test_results.append({"test_name": test_name, "passed": passed, "message": message})
+
+        if passed:
+            self.passed_tests += 1
+            print(f"✅ {test_name}: {message}")
+        else:
+            self.failed_tests += 1
+            print(f"❌ {test_name}: {message}")
+
+    def _print_summary(self):
+        """打印测试摘要"""
+        total_tests = self.passed_tests + self.failed_tests
+
+        print("\n" + "=" * 60)
+        print("📊 结果缓存测试摘要")
+        print("=" * 60)
+        print(f"总测试数: {total_tests}")
+        print(f"通过测试: {self.passed_tests}")
+        print(f"失败测试: {self.failed_tests}")
+
+
+def main():
+    """主函数"""
+    test = CacheTest()
+    success = test.run_all_tests()
+
+    if success:
+        print("\n🎉 结果缓存与并发请求合并行为正确！")
+        return 0
+    else:
+        print("\n⚠️  结果缓存或并发请求合并存在错误")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
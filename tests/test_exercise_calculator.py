@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+运动维度中难度测试
+验证区间2时长、力量类运动时长和运动时间回退的计分（不需要数据库）
+"""
+
+import sys
+import logging
+from datetime import datetime
+from pathlib import Path
+
+# 添加src目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+class ExerciseCalculatorTest:
+    """运动维度中难度测试类"""
+
+    def __init__(self):
+        self.test_results = []
+        self.passed_tests = 0
+        self.failed_tests = 0
+
+    def run_all_tests(self):
+        """运行所有运动维度中难度测试"""
+        print("🧪 运动维度中难度测试")
+        print("=" * 60)
+
+        # 计分时会为每项输出日志，测试时关闭
+        from src.utils.logger import logger
+        logger.setLevel(logging.WARNING)
+
+        test_functions = [
+            ("区间2与力量运动", self._test_zone2_and_strength),
+            ("没有心率数据", self._test_exercise_minutes_fallback),
+        ]
+
+        for test_name, test_func in test_functions:
+            print(f"\n📋 {test_name}")
+            print("-" * 40)
+            try:
+                test_func()
+            except Exception as e:
+                self._record_test_result(
+                    test_name=test_name,
+                    passed=False,
+                    message=f"测试异常: {str(e)}"
+                )
+
+        self._print_summary()
+        return self.failed_tests == 0
+
+    def _medium(self, **fields) -> int:
+        """用给定的汇总字段计算运动中难度积分"""
+        from src.core.calculators.exercise_calculator import ExerciseCalculator
+        from src.models.health_data import DailyHealthSummary
+
+        summary = DailyHealthSummary(date=datetime(2025, 7, 1), **fields)
+        return ExerciseCalculator()._calculate_medium(summary)
+
+    def _test_zone2_and_strength(self):
+        """有心率数据时，力量类运动的时长与区间2时长相加后再换算为30分钟的积分块"""
+        cases = [
+            # (说明, 字段, 期望积分)
+            ("只有力量训练", {'zone2_minutes': 0, 'strength_minutes': 60, 'exercise_minutes': 70}, 1600),
+            ("只有区间2", {'zone2_minutes': 45, 'strength_minutes': 0}, 800),
+            ("区间2与力量合计满一块", {'zone2_minutes': 20, 'strength_minutes': 10}, 800),
+            ("合计最多4块", {'zone2_minutes': 100, 'strength_minutes': 90}, 3200),
+            ("从未导入运动记录", {'zone2_minutes': 65, 'strength_minutes': None}, 1600),
+            ("都不足30分钟", {'zone2_minutes': 10, 'strength_minutes': 15}, 0),
+        ]
+        for name, fields, expected in cases:
+            score = self._medium(**fields)
+            self._record_test_result(
+                test_name=name,
+                passed=score == expected,
+                message=f"{fields} -> {score}分 (期望: {expected})"
+            )
+
+    def _test_exercise_minutes_fallback(self):
+        """没有心率样本时按运动时间计分，力量运动已包含在运动时间内不重复计入"""
+        cases = [
+            ("运动时间", {'exercise_minutes': 95}, 2400),
+            ("运动时间已包含力量运动", {'exercise_minutes': 60, 'strength_minutes': 60}, 1600),
+            ("没有数据", {}, 0),
+        ]
+        for name, fields, expected in cases:
+            score = self._medium(**fields)
+            self._record_test_result(
+                test_name=name,
+                passed=score == expected,
+                message=f"{fields} -> {score}分 (期望: {expected})"
+            )
+
+    def _record_test_result(self, test_name: str, passed: bool, message: str):
+        """记录测试结果"""
+        self.test_results.append({"test_name": test_name, "passed": passed, "message": message})
+
+        if passed:
+            self.passed_tests += 1
+            print(f"✅ {test_name}: {message}")
+        else:
+            self.failed_tests += 1
+            print(f"❌ {test_name}: {message}")
+
+    def _print_summary(self):
+        """打印测试摘要"""
+        total_tests = self.passed_tests + self.failed_tests
+
+        print("\n" + "=" * 60)
+        print("📊 运动维度中难度测试摘要")
+        print("=" * 60)
+        print(f"总测试数: {total_tests}")
+        print(f"通过测试: {self.passed_tests}")
+        print(f"失败测试: {self.failed_tests}")
+
+
+def main():
+    """主函数"""
+    test = ExerciseCalculatorTest()
+    success = test.run_all_tests()
+
+    if success:
+        print("\n🎉 运动维度中难度计分正确！")
+        return 0
+    else:
+        print("\n⚠️  运动维度中难度计分存在错误")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+区间运算与数据源优先级去重测试
+用手工构造的样本验证重叠、部分重叠、瞬时样本和运动期间按比例扣除的结果（不访问数据库）
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# 添加src目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+class IntervalsTest:
+    """区间运算与数据源优先级去重测试类"""
+
+    def __init__(self):
+        self.test_results = []
+        self.passed_tests = 0
+        self.failed_tests = 0
+
+    def run_all_tests(self):
+        """运行所有区间运算测试"""
+        print("🧪 区间运算与数据源优先级去重测试")
+        print("=" * 60)
+
+        test_functions = [
+            ("区间合并", self._test_merge_intervals),
+            ("剩余时长比例", self._test_remaining_fractions),
+            ("运动期间步数扣除", self._test_workout_proration),
+            ("数据源名次", self._test_source_ranks),
+            ("手表与手机重叠去重", self._test_watch_iphone_overlap),
+            ("瞬时样本去重", self._test_zero_length_samples),
+        ]
+
+        for test_name, test_func in test_functions:
+            print(f"\n📋 {test_name}")
+            print("-" * 40)
+            try:
+                test_func()
+            except Exception as e:
+                self._record_test_result(
+                    test_name=test_name,
+                    passed=False,
+                    message=f"测试异常: {str(e)}"
+                )
+
+        self._print_summary()
+        return self.failed_tests == 0
+
+    def _test_merge_intervals(self):
+        """重叠和相接的区间合并，空区间（结束不晚于开始）被丢弃"""
+        from src.core.intervals import merge_intervals
+
+        cases = [
+            ("重叠", [(0, 10), (5, 20)], [(0, 20)]),
+            ("相接", [(0, 10), (10, 20)], [(0, 20)]),
+            ("包含", [(0, 30), (5, 10), (12, 20)], [(0, 30)]),
+            ("不相交", [(0, 10), (11, 20)], [(0, 10), (11, 20)]),
+            ("空区间", [(0, 0), (5, 5), (6, 8)], [(6, 8)]),
+        ]
+        for name, intervals, expected in cases:
+            merged = merge_intervals(intervals)
+            self._record_test_result(
+                test_name=f"合并-{name}",
+                passed=merged == expected,
+                message=f"{intervals} -> {merged} (期望: {expected})"
+            )
+
+    def _test_remaining_fractions(self):
+        """部分重叠按重叠时长扣除，跨越多个排除区间时逐个累加"""
+        from src.core.intervals import remaining_fractions
+
+        cases = [
+            ("无重叠", [(0, 100, 1)], [(200, 300)], [1.0]),
+            ("完全覆盖", [(100, 200, 1)], [(0, 300)], [0.0]),
+            ("部分重叠", [(0, 100, 1)], [(50, 150)], [0.5]),
+            ("跨越两个排除区间", [(0, 100, 1)], [(10, 20), (60, 80)], [0.7]),
+            ("排除区间重叠时只扣除一次", [(0, 100, 1)], [(0, 40), (20, 50)], [0.5]),
+            ("多个样本共用排除区间", [(0, 100, 1), (50, 150, 1), (200, 300, 1)], [(90, 110)], [0.9, 0.8, 1.0]),
+        ]
+        for name, samples, excluded, expected in cases:
+            fractions = remaining_fractions(samples, excluded)
+            self._record_test_result(
+                test_name=f"比例-{name}",
+                passed=np.allclose(fractions, expected),
+                message=f"{fractions} (期望: {expected})"
+            )
+
+    def _test_workout_proration(self):
+        """运动期间的步数按样本与运动时段的重叠比例扣除"""
+        from src.core.intervals import subtract_intervals
+
+        # 三段各10分钟的步数样本，运动从第5分钟到第25分钟
+        samples = [(0, 600, 600.0), (600, 1200, 300.0), (1200, 1800, 120.0)]
+        workouts = [(300, 1500)]
+        total = subtract_intervals(samples, workouts)
+        expected = 300.0 + 0.0 + 60.0
+        self._record_test_result(
+            test_name="跨越运动开始和结束的样本",
+            passed=abs(total - expected) < 1e-9,
+            message=f"扣除后 {total} 步 (期望: {expected})"
+        )
+
+        # 两段重叠的运动合并后扣除，没有运动时不扣除
+        total = subtract_intervals(samples, [(0, 900), (600, 1200)])
+        self._record_test_result(
+            test_name="重叠的运动时段",
+            passed=abs(total - 120.0) < 1e-9,
+            message=f"扣除后 {total} 步 (期望: 120.0)"
+        )
+        total = subtract_intervals(samples, [])
+        self._record_test_result(
+            test_name="没有运动",
+            passed=abs(total - 1020.0) < 1e-9,
+            message=f"扣除后 {total} 步 (期望: 1020.0)"
+        )
+
+    def _test_source_ranks(self):
+        """手表优先于手机，手机优先于第三方应用；同为手机的两个设备名次不同"""
+        from src.core.source_priority import DEFAULT_SOURCE_PRIORITY, source_priority, source_ranks
+
+        ranks = source_ranks(["Bob’s iPhone", "Alice's iPhone", "Bob's Apple Watch", "MyFitnessPal", None])
+        passed = (
+            ranks["Bob's Apple Watch"] == 0
+            and ranks["Alice's iPhone"] == 1 and ranks["Bob’s iPhone"] == 2
+            and ranks["MyFitnessPal"] > ranks["Bob’s iPhone"]
+            and len(set(ranks.values())) == len(ranks)
+        )
+        self._record_test_result(
+            test_name="名次",
+            passed=passed,
+            message=f"{ranks}"
+        )
+        priorities = {name: source_priority(name) for name in ["bob's apple WATCH", "Strava", None]}
+        passed = (
+            priorities["bob's apple WATCH"] == 1
+            and priorities["Strava"] == DEFAULT_SOURCE_PRIORITY
+            and priorities[None] == DEFAULT_SOURCE_PRIORITY
+        )
+        self._record_test_result(
+            test_name="关键词不区分大小写",
+            passed=passed,
+            message=f"{priorities}"
+        )
+
+    def _test_watch_iphone_overlap(self):
+        """手机样本只计入没有被手表覆盖的时段，同一数据源内的样本不互相扣除"""
+        from src.core.source_priority import deduplicate_by_priority
+
+        watch, phone, app = 0, 1, 2
+        # 手表 0-600 100步、300-900 60步（同源重叠）；手机 0-1200 240步（900秒被覆盖）；
+        # 第三方 1000-1400 40步（1000-1200被手机覆盖）
+        starts = np.array([0.0, 300.0, 0.0, 1000.0])
+        ends = np.array([600.0, 900.0, 1200.0, 1400.0])
+        values = np.array([100.0, 60.0, 240.0, 40.0])
+        ranks = np.array([watch, watch, phone, app])
+        effective = deduplicate_by_priority(starts, ends, values, ranks)
+
+        expected = np.array([100.0, 60.0, 60.0, 20.0])
+        self._record_test_result(
+            test_name="部分重叠",
+            passed=np.allclose(effective, expected),
+            message=f"计入值: {effective.tolist()} (期望: {expected.tolist()})"
+        )
+
+        # 输入顺序不影响结果
+        order = np.array([3, 2, 1, 0])
+        shuffled = deduplicate_by_priority(starts[order], ends[order], values[order], ranks[order])
+        self._record_test_result(
+            test_name="输入顺序无关",
+            passed=np.allclose(shuffled, expected[order]),
+            message=f"计入值: {shuffled.tolist()} (期望: {expected[order].tolist()})"
+        )
+
+        empty = deduplicate_by_priority(np.array([]), np.array([]), np.array([]), np.array([], dtype=np.int64))
+        self._record_test_result(
+            test_name="没有样本",
+            passed=len(empty) == 0,
+            message=f"计入值: {empty.tolist()}"
+        )
+
+    def _test_zero_length_samples(self):
+        """瞬时样本落在更高名次覆盖的时段内时不计入，落在覆盖时段结束处或之外时全部计入"""
+        from src.core.source_priority import deduplicate_by_priority
+
+        # 手表 100-200；手机瞬时样本在 150（覆盖内）、100（覆盖开始处）、200（覆盖结束处）、300（覆盖外）
+        starts = np.array([100.0, 150.0, 100.0, 200.0, 300.0])
+        ends = np.array([200.0, 150.0, 100.0, 200.0, 300.0])
+        values = np.array([10.0, 5.0, 5.0, 5.0, 5.0])
+        ranks = np.array([0, 1, 1, 1, 1])
+        effective = deduplicate_by_priority(starts, ends, values, ranks)
+
+        expected = np.array([10.0, 0.0, 0.0, 5.0, 5.0])
+        self._record_test_result(
+            test_name="瞬时样本",
+            passed=np.allclose(effective, expected),
+            message=f"计入值: {effective.tolist()} (期望: {expected.tolist()})"
+        )
+
+        # 瞬时的高名次样本不覆盖任何时段
+        effective = deduplicate_by_priority(np.array([150.0, 100.0]), np.array([150.0, 200.0]),
+                                            np.array([3.0, 10.0]), np.array([0, 1]))
+        self._record_test_result(
+            test_name="瞬时样本不覆盖时段",
+            passed=np.allclose(effective, [3.0, 10.0]),
+            message=f"计入值: {effective.tolist()} (期望: [3.0, 10.0])"
+        )
+
+    def _record_test_result(self, test_name: str, passed: bool, message: str):
+        """记录测试结果"""
+        self.test_results.append({"test_name": test_name, "passed": passed, "message": message})
+
+        if passed:
+            self.passed_tests += 1
+            print(f"✅ {test_name}: {message}")
+        else:
+            self.failed_tests += 1
+            print(f"❌ {test_name}: {message}")
+
+    def _print_summary(self):
+        """打印测试摘要"""
+        total_tests = self.passed_tests + self.failed_tests
+
+        print("\n" + "=" * 60)
+        print("📊 区间运算测试摘要")
+        print("=" * 60)
+        print(f"总测试数: {total_tests}")
+        print(f"通过测试: {self.passed_tests}")
+        print(f"失败测试: {self.failed_tests}")
+
+
+def main():
+    """主函数"""
+    test = IntervalsTest()
+    success = test.run_all_tests()
+
+    if success:
+        print("\n🎉 区间运算与数据源优先级去重结果正确！")
+        return 0
+    else:
+        print("\n⚠️  区间运算或数据源优先级去重存在错误")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
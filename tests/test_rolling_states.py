@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+连续达标与个人HRV基线测试
+逐天推进状态，验证中断、重置、重算较早日期，以及指数加权平均、中位数限制和最少天数（不需要数据库）
+"""
+
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+# 添加src目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+class RollingStatesTest:
+    """连续达标与个人HRV基线测试类"""
+
+    START = date(2025, 7, 1)
+
+    def __init__(self):
+        self.test_results = []
+        self.passed_tests = 0
+        self.failed_tests = 0
+
+    def run_all_tests(self):
+        """运行所有滚动状态测试"""
+        print("🧪 连续达标与个人HRV基线测试")
+        print("=" * 60)
+
+        test_functions = [
+            ("连续达标解锁", self._test_streak_unlock),
+            ("连续达标中断", self._test_streak_gap_and_reset),
+            ("重算较早日期的连续达标", self._test_streak_rescore),
+            ("HRV基线指数加权平均", self._test_hrv_ewma),
+            ("HRV基线最少天数", self._test_hrv_min_days),
+            ("HRV异常值限制", self._test_hrv_median_clamp),
+            ("重算较早日期的HRV基线", self._test_hrv_rescore),
+        ]
+
+        for test_name, test_func in test_functions:
+            print(f"\n📋 {test_name}")
+            print("-" * 40)
+            try:
+                test_func()
+            except Exception as e:
+                self._record_test_result(
+                    test_name=test_name,
+                    passed=False,
+                    message=f"测试异常: {str(e)}"
+                )
+
+        self._print_summary()
+        return self.failed_tests == 0
+
+    def _advance_days(self, previous, outcomes, start: date, continuous_days: int = 3):
+        """从previous开始逐天推进连续达标状态，outcomes为每天是否达标（None表示当天没有计算）"""
+        from src.core.streaks import advance_streak
+
+        states = []
+        for offset, qualified in enumerate(outcomes):
+            if qualified is None:
+                continue
+            previous = advance_streak(previous, start + timedelta(days=offset), qualified, continuous_days)
+            states.append(previous)
+        return states
+
+    def _test_streak_unlock(self):
+        """连续达标天数达到要求时解锁；context为None时沿用前一天的上下文"""
+        from src.core.streaks import advance_streak
+        from src.models.streak import StreakState
+
+        initial = StreakState(dimension='exercise', context={'types': ['run']})
+        states = self._advance_days(initial, [True, True, True, True], self.START)
+        lengths = [state.current_length for state in states]
+        unlocked = [state.unlocked for state in states]
+        self._record_test_result(
+            test_name="连续4天达标",
+            passed=lengths == [1, 2, 3, 4] and unlocked == [False, False, True, True],
+            message=f"长度: {lengths}, 解锁: {unlocked}"
+        )
+
+        kept = states[-1].context
+        replaced = advance_streak(states[-1], self.START + timedelta(days=4), True, 3, {'types': ['swim']}).context
+        self._record_test_result(
+            test_name="滚动上下文",
+            passed=kept == {'types': ['run']} and replaced == {'types': ['swim']},
+            message=f"沿用: {kept}, 替换: {replaced}"
+        )
+
+    def _test_streak_gap_and_reset(self):
+        """未达标的日期清零但保留最近达标日期；中间有未计算的日期时重新从1开始"""
+        from src.models.streak import StreakState
+
+        initial = StreakState(dimension='sleep')
+        states = self._advance_days(initial, [True, True, False, True], self.START)
+        failed = states[2]
+        passed = (
+            [state.current_length for state in states] == [1, 2, 0, 1]
+            and not failed.unlocked and failed.last_qualifying_date == self.START + timedelta(days=1)
+            and failed.last_scored_date == self.START + timedelta(days=2)
+        )
+        self._record_test_result(
+            test_name="未达标清零",
+            passed=passed,
+            message=f"长度: {[state.current_length for state in states]}, "
+                    f"未达标日的最近达标日期: {failed.last_qualifying_date}"
+        )
+
+        # 第3天没有计算（如没有数据），第4天达标时不与前两天连续
+        states = self._advance_days(initial, [True, True, None, True], self.START)
+        self._record_test_result(
+            test_name="中间缺少一天",
+            passed=[state.current_length for state in states] == [1, 2, 1] and not states[-1].unlocked,
+            message=f"长度: {[state.current_length for state in states]}"
+        )
+
+        # 已解锁后中断一天即失去解锁
+        states = self._advance_days(initial, [True, True, True, False, True], self.START)
+        self._record_test_result(
+            test_name="解锁后中断",
+            passed=[state.unlocked for state in states] == [False, False, True, False, False],
+            message=f"解锁: {[state.unlocked for state in states]}"
+        )
+
+    def _test_streak_rescore(self):
+        """重算较早的一天时从前一天保存的明细还原状态，之后的日期依次重算得到新的结果"""
+        from src.models.streak import StreakState
+
+        initial = StreakState(dimension='exercise')
+        original = self._advance_days(initial, [True, True, True, True, True], self.START)
+
+        # 从第2天的明细还原，第3天结果不变时重算得到相同的状态
+        restored = StreakState.from_details('exercise', self.START + timedelta(days=1), original[1].to_details())
+        same = self._advance_days(restored, [True, True, True], self.START + timedelta(days=2))
+        self._record_test_result(
+            test_name="结果不变时状态一致",
+            passed=[s.model_dump() for s in same] == [s.model_dump() for s in original[2:]],
+            message=f"长度: {[s.current_length for s in same]}"
+        )
+
+        # 第3天改为未达标（如补录的数据使其不达标），之后的日期重新计数
+        changed = self._advance_days(restored, [False, True, True], self.START + timedelta(days=2))
+        self._record_test_result(
+            test_name="较早日期改为未达标",
+            passed=[s.current_length for s in changed] == [0, 1, 2] and not changed[-1].unlocked,
+            message=f"原长度: {[s.current_length for s in original]}, 重算后: {[s.current_length for s in changed]}"
+        )
+
+    def _hrv_days(self, values, previous=None, start: date = None):
+        """从previous开始逐天更新HRV基线，返回每天结束时的状态"""
+        from src.core.hrv_baseline import update_hrv_baseline
+        from src.models.hrv_baseline import HrvBaselineState
+
+        previous = previous or HrvBaselineState()
+        start = start or self.START
+        states = []
+        for offset, hrv in enumerate(values):
+            previous = update_hrv_baseline(previous, start + timedelta(days=offset), hrv)
+            states.append(previous)
+        return states
+
+    def _test_hrv_ewma(self):
+        """第一天的HRV作为初始平均值，之后按alpha = 2 / (span + 1)加权；没有数据的日期不改变平均值"""
+        from src.db.configs.global_config import HRV_BASELINE_CONFIG
+
+        alpha = 2 / (HRV_BASELINE_CONFIG.span_days + 1)
+        states = self._hrv_days([40.0, 60.0, None, 0, 50.0])
+        expected = 40.0
+        expected_ewmas = [40.0]
+        for hrv in [60.0, None, 0, 50.0]:
+            if hrv:
+                expected = alpha * hrv + (1 - alpha) * expected
+            expected_ewmas.append(round(expected, 4))
+
+        passed = (
+            [s.ewma for s in states] == expected_ewmas
+            and [s.sample_days for s in states] == [1, 2, 2, 2, 3]
+            and states[-1].window == [40.0, 60.0, 50.0]
+            and states[3].last_scored_date == self.START + timedelta(days=3)
+        )
+        self._record_test_result(
+            test_name="加权平均与缺失日期",
+            passed=passed,
+            message=f"平均值: {[s.ewma for s in states]} (期望: {expected_ewmas}), "
+                    f"天数: {[s.sample_days for s in states]}"
+        )
+
+        # 中位数窗口只保留最近window_days个有数据的日期
+        states = self._hrv_days([float(day) for day in range(1, HRV_BASELINE_CONFIG.window_days + 6)])
+        window = states[-1].window
+        self._record_test_result(
+            test_name="中位数窗口长度",
+            passed=len(window) == HRV_BASELINE_CONFIG.window_days and window[0] == 6.0,
+            message=f"窗口: {len(window)}天，从{window[0]}开始"
+        )
+
+    def _test_hrv_min_days(self):
+        """有数据的天数达到min_days之前使用默认基线，之后使用个人基线"""
+        from src.core.hrv_baseline import resolve_baseline
+        from src.db.configs.global_config import HRV_BASELINE_CONFIG
+
+        min_days = HRV_BASELINE_CONFIG.min_days
+        default = HRV_BASELINE_CONFIG.default_hrv
+        states = self._hrv_days([80.0] * min_days)
+        baselines = [resolve_baseline(s) for s in states]
+        expected = [default] * (min_days - 1) + [80.0]
+        self._record_test_result(
+            test_name="最少天数",
+            passed=baselines == expected and resolve_baseline(None) == default,
+            message=f"基线: {baselines} (期望: {expected})"
+        )
+
+        # 没有数据的日期不计入天数
+        states = self._hrv_days([80.0] * (min_days - 1) + [None])
+        self._record_test_result(
+            test_name="缺失日期不计入天数",
+            passed=resolve_baseline(states[-1]) == default and states[-1].sample_days == min_days - 1,
+            message=f"天数: {states[-1].sample_days}, 基线: {resolve_baseline(states[-1])}"
+        )
+
+    def _test_hrv_median_clamp(self):
+        """达到min_days后，当天HRV在计入平均前被限制在窗口中位数的 (1 ± ratio) 倍以内，窗口保存原始值"""
+        from src.db.configs.global_config import HRV_BASELINE_CONFIG
+
+        min_days = HRV_BASELINE_CONFIG.min_days
+        ratio = HRV_BASELINE_CONFIG.outlier_ratio
+        alpha = 2 / (HRV_BASELINE_CONFIG.span_days + 1)
+        states = self._hrv_days([60.0] * min_days + [300.0, 1.0])
+
+        high = alpha * 60.0 * (1 + ratio) + (1 - alpha) * 60.0
+        low = alpha * 60.0 * (1 - ratio) + (1 - alpha) * high
+        passed = (
+            states[min_days].ewma == round(high, 4) and states[min_days + 1].ewma == round(low, 4)
+            and states[-1].window[-2:] == [300.0, 1.0]
+        )
+        self._record_test_result(
+            test_name="限制异常值",
+            passed=passed,
+            message=f"平均值: {states[min_days].ewma}, {states[min_days + 1].ewma} "
+                    f"(期望: {round(high, 4)}, {round(low, 4)})"
+        )
+
+        # 达到min_days之前不限制
+        states = self._hrv_days([60.0, 300.0])
+        expected = round(alpha * 300.0 + (1 - alpha) * 60.0, 4)
+        self._record_test_result(
+            test_name="最少天数前不限制",
+            passed=states[-1].ewma == expected,
+            message=f"平均值: {states[-1].ewma} (期望: {expected})"
+        )
+
+    def _test_hrv_rescore(self):
+        """重算较早的一天时从前一天保存的明细还原状态，得到与逐天计算相同的结果；当天数据变化时之后的基线随之变化"""
+        from src.models.hrv_baseline import HrvBaselineState
+
+        values = [55.0, 62.0, None, 48.0, 70.0, 65.0, 58.0, 61.0, 52.0, 90.0]
+        original = self._hrv_days(values)
+
+        restored = HrvBaselineState.from_details(self.START + timedelta(days=4), original[4].to_details())
+        same = self._hrv_days(values[5:], previous=restored, start=self.START + timedelta(days=5))
+        self._record_test_result(
+            test_name="结果不变时状态一致",
+            passed=[s.model_dump() for s in same] == [s.model_dump() for s in original[5:]],
+            message=f"平均值: {[s.ewma for s in same]}"
+        )
+
+        changed = self._hrv_days([None] + values[6:], previous=restored, start=self.START + timedelta(days=5))
+        passed = (
+            changed[0].ewma == original[4].ewma and changed[-1].sample_days == original[-1].sample_days - 1
+            and changed[-1].ewma != original[-1].ewma
+        )
+        self._record_test_result(
+            test_name="较早日期的数据被删除",
+            passed=passed,
+            message=f"原平均值: {original[-1].ewma}, 重算后: {changed[-1].ewma}"
+        )
+
+    def _record_test_result(self, test_name: str, passed: bool, message: str):
+        """记录测试结果"""
+        self.test_results.append({"test_name": test_name, "passed": passed, "message": message})
+
+        if passed:
+            self.passed_tests += 1
+            print(f"✅ {test_name}: {message}")
+        else:
+            self.failed_tests += 1
+            print(f"❌ {test_name}: {message}")
+
+    def _print_summary(self):
+        """打印测试摘要"""
+        total_tests = self.passed_tests + self.failed_tests
+
+        print("\n" + "=" * 60)
+        print("📊 连续达标与个人HRV基线测试摘要")
+        print("=" * 60)
+        print(f"总测试数: {total_tests}")
+        print(f"通过测试: {self.passed_tests}")
+        print(f"失败测试: {self.failed_tests}")
+
+
+def main():
+    """主函数"""
+    test = RollingStatesTest()
+    success = test.run_all_tests()
+
+    if success:
+        print("\n🎉 连续达标与个人HRV基线按天推进结果正确！")
+        return 0
+    else:
+        print("\n⚠️  连续达标或个人HRV基线存在错误")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+每日汇总辅助计算测试
+用手工构造的样本验证心率区间时长、运动类别位图和每小时位图的计算（不访问数据库）
+"""
+
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+
+# 添加src目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+class RollupHelpersTest:
+    """每日汇总辅助计算测试类"""
+
+    def __init__(self):
+        self.test_results = []
+        self.passed_tests = 0
+        self.failed_tests = 0
+
+    def run_all_tests(self):
+        """运行所有每日汇总辅助计算测试"""
+        print("🧪 每日汇总辅助计算测试")
+        print("=" * 60)
+
+        test_functions = [
+            ("心率区间时长", self._test_hr_zones),
+            ("运动类别位图", self._test_activity_masks),
+            ("前几天的运动位图", self._test_previous_masks),
+            ("每小时位图", self._test_hourly_bitmaps),
+            ("清醒时段与久坐小时", self._test_sedentary_hours),
+        ]
+
+        for test_name, test_func in test_functions:
+            print(f"\n📋 {test_name}")
+            print("-" * 40)
+            try:
+                test_func()
+            except Exception as e:
+                self._record_test_result(
+                    test_name=test_name,
+                    passed=False,
+                    message=f"测试异常: {str(e)}"
+                )
+
+        self._print_summary()
+        return self.failed_tests == 0
+
+    def _test_hr_zones(self):
+        """心率区间时长：样本持续到下一个样本（有上限），每天最后一个样本最长到当天结束，按用户最大心率划分，按天分组"""
+        from src.core.hr_zones import resolve_max_heart_rate, zone_minutes_by_day, ZONE2_INDEX
+        from src.db.configs.global_config import HR_ZONE_CONFIG
+
+        gap = HR_ZONE_CONFIG.max_sample_gap_seconds
+        # 用户0（最大心率200）：第0天8:00起每60秒一个130次/分的样本共31个，最后一个样本持续gap秒
+        # 用户1（最大心率150）：第1天一个100次/分的样本（区间2），第0天的样本为区间1
+        start = 8 * 3600
+        user_index = np.array([0] * 31 + [1, 1])
+        seconds = np.concatenate([start + 60 * np.arange(31), [3600, 86400 + 3600]])
+        bpm = np.array([130.0] * 31 + [80.0, 100.0])
+        minutes = zone_minutes_by_day(user_index, seconds, bpm, np.array([200.0, 150.0]), n_days=2)
+
+        expected_zone2 = np.array([[30 + gap / 60, 0], [0, gap / 60]])
+        passed = minutes.shape == (2, 2, len(HR_ZONE_CONFIG.zone_bounds)) and \
+            np.allclose(minutes[:, :, ZONE2_INDEX], expected_zone2) and \
+            np.isclose(minutes[1, 0, 0], gap / 60) and np.isclose(minutes.sum(), expected_zone2.sum() + gap / 60)
+        self._record_test_result(
+            test_name="区间2分钟数",
+            passed=passed,
+            message=f"区间2: {minutes[:, :, ZONE2_INDEX].tolist()} (期望: {expected_zone2.tolist()})"
+        )
+
+        # 用户0（最大心率200，区间下限为100/120/140/160/180）三天的样本：
+        # 第0天10:00和11:00两个区间2样本（间隔超过gap时各计gap秒），23:59:30一个区间2样本只计到当天结束；
+        # 第1天00:00:10一个区间1样本，00:00:40的无效心率被忽略，该样本持续到00:01:10低于区间1的样本；
+        # 第1天23:58:30一个区间5样本；第3天和第0天之前的样本超出范围
+        seconds = np.array([
+            10 * 3600, 11 * 3600, 86370,
+            86400 + 10, 86400 + 40, 86400 + 70, 86400 + 86310,
+            3 * 86400 + 3600, -30,
+        ], dtype=np.float64)
+        bpm = np.array([120.0, 120.0, 120.0, 100.0, np.nan, 99.0, 180.0, 120.0, 120.0])
+        minutes = zone_minutes_by_day(np.zeros(len(seconds), dtype=np.int64), seconds, bpm,
+                                      np.array([200.0]), n_days=3)
+
+        expected = np.zeros((1, 3, len(HR_ZONE_CONFIG.zone_bounds)))
+        expected[0, 0, ZONE2_INDEX] = (2 * gap + 30) / 60
+        expected[0, 1, 0] = 1.0
+        expected[0, 1, 4] = 1.5
+        self._record_test_result(
+            test_name="间隔上限与每天最后一个样本",
+            passed=np.allclose(minutes, expected),
+            message=f"分钟数: {minutes[0].tolist()} (期望: {expected[0].tolist()})"
+        )
+
+        empty = zone_minutes_by_day(np.array([], dtype=np.int64), np.array([]), np.array([]),
+                                    np.array([200.0, 180.0]), n_days=2)
+        self._record_test_result(
+            test_name="没有样本",
+            passed=empty.shape == (2, 2, len(HR_ZONE_CONFIG.zone_bounds)) and not empty.any(),
+            message=f"形状: {empty.shape}"
+        )
+
+        max_heart_rates = [
+            resolve_max_heart_rate(190, 1985, 2025),
+            resolve_max_heart_rate(None, 1985, 2025),
+            resolve_max_heart_rate(None, None, 2025),
+        ]
+        expected_max = [190, 180, 220 - HR_ZONE_CONFIG.default_age]
+        self._record_test_result(
+            test_name="最大心率",
+            passed=max_heart_rates == expected_max,
+            message=f"{max_heart_rates} (期望: {expected_max})"
+        )
+
+    def _test_activity_masks(self):
+        """运动类型映射为类别位，未知类型记为other；按大类判断是否覆盖"""
+        from src.core.activity_masks import ACTIVITY_CATEGORIES, STRENGTH_MASK, activity_mask, covers_groups
+
+        mask = activity_mask([
+            'HKWorkoutActivityTypeRunning', 'HKWorkoutActivityTypeHiking',
+            'HKWorkoutActivityTypeCoreTraining', 'HKWorkoutActivityTypeUnderwaterDiving',
+        ])
+        expected = (ACTIVITY_CATEGORIES['running'] | ACTIVITY_CATEGORIES['walking']
+                    | ACTIVITY_CATEGORIES['core'] | ACTIVITY_CATEGORIES['other'])
+        passed = (
+            mask == expected and mask & STRENGTH_MASK and activity_mask([]) == 0
+            and covers_groups(mask, ['aerobic', 'strength']) and not covers_groups(mask, ['flexibility'])
+        )
+        self._record_test_result(
+            test_name="类别与大类",
+            passed=bool(passed),
+            message=f"位图: {mask:#x} (期望: {expected:#x})"
+        )
+
+    def _test_previous_masks(self):
+        """前一天结束时的上下文按与当天相隔的天数平移，超出保存天数的位图被丢弃"""
+        from src.core.activity_masks import RECENT_DAYS, next_context, previous_masks
+
+        day = date(2025, 7, 10)
+        saved = [1, 2, 4, 8, 16, 32, 64]  # as_of当天到前6天的位图
+
+        def context(gap):
+            return {'as_of': (day - timedelta(days=gap)).isoformat(), 'masks': saved}
+
+        cases = [
+            ("相隔1天", context(1), saved[:RECENT_DAYS - 1]),
+            ("相隔3天", context(3), [0, 0] + saved[:RECENT_DAYS - 3]),
+            ("相隔7天", context(7), [0] * (RECENT_DAYS - 1)),
+            ("相隔超过7天", context(10), [0] * (RECENT_DAYS - 1)),
+            ("上下文晚于当天", context(-2), [0] * (RECENT_DAYS - 1)),
+            ("没有上下文", None, [0] * (RECENT_DAYS - 1)),
+        ]
+        for name, ctx, expected in cases:
+            masks = previous_masks(ctx, day)
+            self._record_test_result(
+                test_name=name,
+                passed=masks == expected,
+                message=f"{masks} (期望: {expected})"
+            )
+
+        # 当天的上下文在下一天还原为 [当天, 前1天, ...]
+        previous = previous_masks(context(1), day)
+        following = previous_masks(next_context(previous, day, 128), day + timedelta(days=1))
+        expected = [128] + previous[:RECENT_DAYS - 2]
+        self._record_test_result(
+            test_name="逐天推进",
+            passed=following == expected,
+            message=f"{following} (期望: {expected})"
+        )
+
+    def _test_hourly_bitmaps(self):
+        """每小时位图：样本按开始时间归入小时，小时内的值之和达到阈值才置位，按天分组"""
+        from src.core.hourly_bitmaps import hourly_bitmaps_by_day, popcount
+
+        # 用户0：第0天9点两个150步的样本（合计300）、10点一个100步的样本；第1天0点一个300步的样本
+        # 用户1：第0天23点一个300步的样本，范围外（负秒数）的样本被忽略
+        user_index = np.array([0, 0, 0, 0, 1, 1])
+        seconds = np.array([9 * 3600, 9 * 3600 + 1800, 10 * 3600, 86400, 23 * 3600, -60], dtype=np.float64)
+        steps = np.array([150.0, 150.0, 100.0, 300.0, 300.0, 300.0])
+        bitmaps = hourly_bitmaps_by_day(user_index, seconds, steps, n_users=2, n_days=2, min_total=250)
+
+        expected = np.array([[1 << 9, 1 << 0], [1 << 23, 0]])
+        passed = np.array_equal(bitmaps, expected) and popcount(int(bitmaps[0, 0] | (1 << 5))) == 2
+        self._record_test_result(
+            test_name="活跃小时位图",
+            passed=passed,
+            message=f"位图: {bitmaps.tolist()} (期望: {expected.tolist()})"
+        )
+
+        # min_total为0时只要求小时内的值之和为正；达到阈值的边界；整点开始的样本归入该小时；超出天数的样本被忽略
+        seconds = np.array([3600, 2 * 3600, 2 * 3600 + 10, 3 * 3600 - 1, 3 * 3600, 2 * 86400], dtype=np.float64)
+        values = np.array([0.0, 249.0, 1.0, 0.5, 249.0, 300.0])
+        user_index = np.zeros(len(seconds), dtype=np.int64)
+        any_value = hourly_bitmaps_by_day(user_index, seconds, values, n_users=1, n_days=2)
+        threshold = hourly_bitmaps_by_day(user_index, seconds, values, n_users=1, n_days=2, min_total=250)
+        passed = (
+            any_value.tolist() == [[(1 << 2) | (1 << 3), 0]]
+            and threshold.tolist() == [[1 << 2, 0]]
+        )
+        self._record_test_result(
+            test_name="阈值与小时边界",
+            passed=passed,
+            message=f"不设阈值: {any_value.tolist()}, 阈值250: {threshold.tolist()}"
+        )
+
+    def _test_sedentary_hours(self):
+        """久坐小时只统计清醒时段内既没有站立也不活跃的小时"""
+        from src.core.hourly_bitmaps import hour_range_mask, sedentary_hours, stood_every_waking_hour, waking_mask
+        from src.db.configs.global_config import HOURLY_ACTIVITY_CONFIG
+
+        start, end = HOURLY_ACTIVITY_CONFIG.waking_start_hour, HOURLY_ACTIVITY_CONFIG.waking_end_hour
+        waking = waking_mask()
+        self._record_test_result(
+            test_name="清醒时段位图",
+            passed=waking == sum(1 << hour for hour in range(start, end)) and hour_range_mask(0, 0) == 0,
+            message=f"{waking:#x}: {start}点~{end}点"
+        )
+
+        # 站立为清醒时段的前8个小时，活跃为第6~12个小时（与站立重叠3个小时），另有清醒时段外的站立和活跃
+        stand = hour_range_mask(start, start + 8) | (1 << (start - 1))
+        active = hour_range_mask(start + 5, start + 12) | (1 << end)
+        cases = [
+            ("站立与活跃", (stand, active), end - start - 12),
+            ("只有站立", (stand, None), end - start - 8),
+            ("只有活跃", (None, active), end - start - 7),
+            ("全天没有", (0, 0), end - start),
+            ("没有数据", (None, None), None),
+        ]
+        for name, (stand_bitmap, active_bitmap), expected in cases:
+            hours = sedentary_hours(stand_bitmap, active_bitmap)
+            self._record_test_result(
+                test_name=name,
+                passed=hours == expected,
+                message=f"久坐{hours}小时 (期望: {expected})"
+            )
+
+        passed = (
+            stood_every_waking_hour(waking) and stood_every_waking_hour(hour_range_mask(0, 24))
+            and not stood_every_waking_hour(waking & ~(1 << (end - 1))) and not stood_every_waking_hour(None)
+        )
+        self._record_test_result(
+            test_name="清醒时段每小时都站立",
+            passed=passed,
+            message=f"清醒时段位图: {waking:#x}"
+        )
+
+    def _record_test_result(self, test_name: str, passed: bool, message: str):
+        """记录测试结果"""
+        self.test_results.append({"test_name": test_name, "passed": passed, "message": message})
+
+        if passed:
+            self.passed_tests += 1
+            print(f"✅ {test_name}: {message}")
+        else:
+            self.failed_tests += 1
+            print(f"❌ {test_name}: {message}")
+
+    def _print_summary(self):
+        """打印测试摘要"""
+        total_tests = self.passed_tests + self.failed_tests
+
+        print("\n" + "=" * 60)
+        print("📊 每日汇总辅助计算测试摘要")
+        print("=" * 60)
+        print(f"总测试数: {total_tests}")
+        print(f"通过测试: {self.passed_tests}")
+        print(f"失败测试: {self.failed_tests}")
+
+
+def main():
+    """主函数"""
+    test = RollupHelpersTest()
+    success = test.run_all_tests()
+
+    if success:
+        print("\n🎉 每日汇总辅助计算结果正确！")
+        return 0
+    else:
+        print("\n⚠️  每日汇总辅助计算存在错误")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+健康样本上传解析测试
+验证请求体解压、NDJSON和按列JSON的解析、两种字段命名的合并、样本校验以及时间规范化（不需要数据库）
+"""
+
+import sys
+import gzip
+import json
+from pathlib import Path
+
+import pandas as pd
+
+# 添加src目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+class UploadServiceTest:
+    """健康样本上传解析测试类"""
+
+    STEP_TYPE = "HKQuantityTypeIdentifierStepCount"
+
+    def __init__(self):
+        self.test_results = []
+        self.passed_tests = 0
+        self.failed_tests = 0
+
+    def run_all_tests(self):
+        """运行所有上传解析测试"""
+        print("🧪 健康样本上传解析测试")
+        print("=" * 60)
+
+        test_functions = [
+            ("请求体解压", self._test_decode_body),
+            ("NDJSON与按列JSON", self._test_parse_formats),
+            ("字段命名", self._test_mixed_naming),
+            ("格式错误", self._test_invalid_payloads),
+            ("样本校验", self._test_validate_samples),
+            ("时间规范化", self._test_normalize_dates),
+        ]
+
+        for test_name, test_func in test_functions:
+            print(f"\n📋 {test_name}")
+            print("-" * 40)
+            try:
+                test_func()
+            except Exception as e:
+                self._record_test_result(
+                    test_name=test_name,
+                    passed=False,
+                    message=f"测试异常: {str(e)}"
+                )
+
+        self._print_summary()
+        return self.failed_tests == 0
+
+    def _raises_value_error(self, func, *args) -> str:
+        """调用func，返回ValueError的信息，没有抛出时返回空字符串"""
+        try:
+            func(*args)
+        except ValueError as e:
+            return str(e) or "ValueError"
+        return ""
+
+    def _test_decode_body(self):
+        """gzip解压后的大小不超过max_decoded_bytes；不压缩的请求体原样返回；不支持的编码和损坏的数据被拒绝"""
+        from src.services.upload_service import decode_body
+        from src.db.configs.global_config import UPLOAD_CONFIG
+
+        body = b'{"type": ["a"]}' * 100
+        passed = (
+            decode_body(body) is body and decode_body(body, "identity") is body
+            and decode_body(gzip.compress(body), "GZIP") == body
+        )
+        self._record_test_result(
+            test_name="gzip与不压缩",
+            passed=passed,
+            message=f"解压后{len(decode_body(gzip.compress(body), 'gzip'))}字节"
+        )
+
+        original_limit = UPLOAD_CONFIG.max_decoded_bytes
+        try:
+            # 压缩后很小但解压后超过限制的请求体（如压缩炸弹）被拒绝，恰好等于限制时接受
+            UPLOAD_CONFIG.max_decoded_bytes = 1000
+            too_large = self._raises_value_error(decode_body, gzip.compress(b"0" * 1001), "gzip")
+            at_limit = decode_body(gzip.compress(b"0" * 1000), "gzip")
+        finally:
+            UPLOAD_CONFIG.max_decoded_bytes = original_limit
+        self._record_test_result(
+            test_name="解压后的大小限制",
+            passed=bool(too_large) and len(at_limit) == 1000,
+            message=f"超过限制: {too_large or '未拒绝'}, 等于限制: {len(at_limit)}字节"
+        )
+
+        errors = [
+            self._raises_value_error(decode_body, body, "br"),
+            self._raises_value_error(decode_body, b"not gzip data", "gzip"),
+        ]
+        self._record_test_result(
+            test_name="不支持的编码与损坏的数据",
+            passed=all(errors),
+            message=f"{errors}"
+        )
+
+    def _test_parse_formats(self):
+        """NDJSON（忽略空行）、按列的对象和samples中的对象数组得到相同的字符串列，数字保留原始文本"""
+        from src.services.upload_service import parse_samples
+
+        # 按原始文本构造请求体，1.50不应变为1.5
+        first = f'{{"type": "{self.STEP_TYPE}", "start_date": "2025-07-01 08:00:00 +0800", "value": 1.50}}'
+        second = f'{{"type": "{self.STEP_TYPE}", "start_date": "2025-07-01 09:00:00 +0800", "value": 120}}'
+        ndjson = f"{first}\n\n{second}\n".encode()
+        columnar = (
+            f'{{"type": ["{self.STEP_TYPE}", "{self.STEP_TYPE}"], '
+            f'"start_date": ["2025-07-01 08:00:00 +0800", "2025-07-01 09:00:00 +0800"], "value": [1.50, 120]}}'
+        ).encode()
+        wrapped = f'{{"samples": [{first}, {second}]}}'.encode()
+
+        frames = {
+            "NDJSON": parse_samples(ndjson, "application/x-ndjson; charset=utf-8"),
+            "按列": parse_samples(columnar, "application/json"),
+            "samples对象数组": parse_samples(wrapped, None),
+        }
+        for name, frame in frames.items():
+            passed = (
+                list(frame.columns) == ["type", "start_date", "value"] and len(frame) == 2
+                and frame["value"].tolist() == ["1.50", "120"]
+                and all(str(dtype) == "string" for dtype in frame.dtypes)
+            )
+            self._record_test_result(
+                test_name=name,
+                passed=passed,
+                message=f"列: {list(frame.columns)}, 值: {frame['value'].tolist()}"
+            )
+
+    def _test_mixed_naming(self):
+        """同一批中HealthKit属性名（startDate）与列名（start_date）混用时合并为一列，未知字段被丢弃"""
+        from src.services.upload_service import parse_samples
+
+        payload = json.dumps([
+            {"type": self.STEP_TYPE, "startDate": "2025-07-01 08:00:00 +0800", "sourceName": "Watch", "extra": 1},
+            {"type": self.STEP_TYPE, "start_date": "2025-07-01 09:00:00 +0800", "source_name": "iPhone"},
+        ]).encode()
+        frame = parse_samples(payload, "application/json")
+        passed = (
+            frame["start_date"].tolist() == ["2025-07-01 08:00:00 +0800", "2025-07-01 09:00:00 +0800"]
+            and frame["source_name"].tolist() == ["Watch", "iPhone"]
+            and not {"startDate", "sourceName", "extra"} & set(frame.columns)
+        )
+        self._record_test_result(
+            test_name="混用两种命名",
+            passed=passed,
+            message=f"列: {list(frame.columns)}, start_date: {frame['start_date'].tolist()}"
+        )
+
+    def _test_invalid_payloads(self):
+        """格式错误的请求体抛出ValueError"""
+        from src.services.upload_service import parse_samples
+
+        cases = [
+            ("JSON格式错误", b'{"type": [', "application/json"),
+            ("NDJSON中的错误行", b'{"type": "a"}\nnot json', "application/x-ndjson"),
+            ("列长度不同", b'{"type": ["a", "b"], "start_date": ["2025-07-01"]}', "application/json"),
+            ("列不是数组", b'{"type": "a"}', "application/json"),
+            ("样本不是对象", b'[{"type": "a"}, 1]', "application/json"),
+            ("不是数组或对象", b'"samples"', "application/json"),
+            ("不是UTF-8", b'\xff\xfe', "application/json"),
+        ]
+        for name, body, content_type in cases:
+            error = self._raises_value_error(parse_samples, body, content_type)
+            self._record_test_result(
+                test_name=name,
+                passed=bool(error),
+                message=error or "未抛出ValueError"
+            )
+
+    def _test_validate_samples(self):
+        """缺少type或start_date、时间无法解析以及字段超长的样本被拒绝；样本总是写入当前用户"""
+        from src.services.upload_service import COLUMN_LIMITS, parse_samples, validate_samples
+        from src.services.export_import_service import COPY_COLUMNS
+
+        payload = json.dumps({
+            "type": [self.STEP_TYPE, None, self.STEP_TYPE, self.STEP_TYPE, self.STEP_TYPE, "  "],
+            "start_date": ["2025-07-01 08:00:00 +0800", "2025-07-01 08:00:00 +0800", "not a date",
+                           "2025-07-01 09:00:00 +0800", "2025-07-01 10:00:00 +0800", "2025-07-01 10:00:00 +0800"],
+            "source_version": ["1", "1", "1", "x" * (COLUMN_LIMITS["source_version"] + 1),
+                               "x" * COLUMN_LIMITS["source_version"], "1"],
+            "user_id": ["other_user"] * 6,
+        }).encode()
+        samples, rejected = validate_samples(parse_samples(payload, "application/json"), "current_user")
+
+        passed = (
+            rejected == 4 and list(samples.columns) == COPY_COLUMNS
+            and samples["start_date"].tolist() == ["2025-07-01 00:00:00+00:00", "2025-07-01 02:00:00+00:00"]
+            and samples["user_id"].tolist() == ["current_user"] * 2
+        )
+        self._record_test_result(
+            test_name="拒绝无效样本",
+            passed=passed,
+            message=f"有效{len(samples)}个, 拒绝{rejected}个, 用户: {samples['user_id'].tolist()}, "
+                    f"时间: {samples['start_date'].tolist()}"
+        )
+
+    def _test_normalize_dates(self):
+        """带UTC偏移的时间转为UTC；不带偏移的时间保持本地时间且不加偏移，写入时按数据库会话时区解释"""
+        from src.services.csv_import_service import normalize_chunk
+
+        values = [
+            "2025-07-01 08:00:00 +0800", "2025-07-01T08:00:00+08:00", "2025-07-01T00:30:00Z",
+            "2025-06-30 20:00:00 -0400", "2025-07-01 08:00:00", "2025-07-01T23:30:00", "2025-07-01", "not a date",
+        ]
+        chunk = pd.DataFrame({
+            "type": pd.Series([self.STEP_TYPE] * len(values), dtype="string"),
+            "start_date": pd.Series(values, dtype="string"),
+        })
+        frame, skipped = normalize_chunk(chunk, "current_user")
+
+        expected = [
+            "2025-07-01 00:00:00+00:00", "2025-07-01 00:00:00+00:00", "2025-07-01 00:30:00+00:00",
+            "2025-07-01 00:00:00+00:00", "2025-07-01 08:00:00", "2025-07-01 23:30:00", "2025-07-01 00:00:00",
+        ]
+        self._record_test_result(
+            test_name="带偏移与本地时间",
+            passed=frame["start_date"].tolist() == expected and skipped == 1,
+            message=f"{frame['start_date'].tolist()}, 丢弃{skipped}行"
+        )
+
+    def _record_test_result(self, test_name: str, passed: bool, message: str):
+        """记录测试结果"""
+        self.test_results.append({"test_name": test_name, "passed": passed, "message": message})
+
+        if passed:
+            self.passed_tests += 1
+            print(f"✅ {test_name}: {message}")
+        else:
+            self.failed_tests += 1
+            print(f"❌ {test_name}: {message}")
+
+    def _print_summary(self):
+        """打印测试摘要"""
+        total_tests = self.passed_tests + self.failed_tests
+
+        print("\n" + "=" * 60)
+        print("📊 健康样本上传解析测试摘要")
+        print("=" * 60)
+        print(f"总测试数: {total_tests}")
+        print(f"通过测试: {self.passed_tests}")
+        print(f"失败测试: {self.failed_tests}")
+
+
+def main():
+    """主函数"""
+    test = UploadServiceTest()
+    success = test.run_all_tests()
+
+    if success:
+        print("\n🎉 健康样本上传解析结果正确！")
+        return 0
+    else:
+        print("\n⚠️  健康样本上传解析存在错误")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())